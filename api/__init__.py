@@ -1,4 +1,6 @@
-"""api 包初始化（导出 ApiClient）。"""
+"""api 包初始化（导出同步 / 异步客户端与会话池）。"""
 from .api_client import ApiClient
+from .async_client import AsyncApiClient
+from .pool import SessionPool, shared_pool
 
-__all__ = ["ApiClient"]
+__all__ = ["ApiClient", "AsyncApiClient", "SessionPool", "shared_pool"]
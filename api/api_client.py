@@ -1,9 +1,16 @@
 """简单的 API 客户端封装：支持真实请求或在未配置时返回 mock 回复。"""
+import itertools
+import json
+import re
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 
 import requests
 
+from .cache import ResponseCache, cache_key, shared_cache
+from .pool import SessionPool, shared_pool
+from .resilience import BreakerRegistry, RetryPolicy, parse_retry_after, shared_breakers
+
 
 class ApiClient:
     # 内置API服务商配置
@@ -16,15 +23,26 @@ class ApiClient:
         }
     }
 
-    def __init__(self, cfg: Dict[str, Any]):
-        """初始化客户端，cfg 应为 `config.get_config()` 的返回值或类似字典。"""
+    def __init__(self, cfg: Dict[str, Any], pool: SessionPool | None = None, breakers: BreakerRegistry | None = None,
+                 cache: ResponseCache | None = None):
+        """初始化客户端，cfg 应为 `config.get_config()` 的返回值或类似字典。
+
+        未指定 ``pool`` / ``breakers`` 时使用进程内共用的会话池与熔断器表，临时创建的
+        客户端（如测试连接）同样复用已有的长连接、共享端点的熔断状态。回复缓存默认
+        关闭：``cfg["response_cache"]`` 为真（或传入 ``cache``）时才启用。
+        """
         self.cfg = cfg
+        self.pool = pool or shared_pool(cfg)
+        self.breakers = breakers or shared_breakers(cfg)
+        self.cache = cache if cache is not None else (shared_cache(cfg) if cfg.get("response_cache") else None)
 
-    def call_model(self, prompt: str, context: List[Dict[str, Any]] | None = None, cfg: Dict[str, Any] | None = None) -> str:
+    def call_model(self, prompt: str, context: List[Dict[str, Any]] | None = None, cfg: Dict[str, Any] | None = None,
+                   use_cache: bool = True) -> str:
         """调用大模型 API。
 
         如果未配置 `api_key` 或 `provider`，返回本地 mock 回复，便于离线开发与测试。
-        返回字符串（模型回复）。
+        返回字符串（模型回复）。启用了回复缓存时，相同的请求直接返回缓存的回复；
+        ``use_cache=False`` 或模型配置 ``response_cache: false`` 时绕过缓存。
         """
         context = context or []
         # 使用传入的cfg或默认的self.cfg
@@ -42,6 +60,188 @@ class ApiClient:
             return f"[ERROR] 不支持的API服务商: {provider}"
 
         provider_config = self.PROVIDERS[provider]
+        base_url = self._endpoint(provider_config, api_cfg)
+        headers = provider_config["headers"](api_key)
+        payload = self._build_payload(prompt, context, provider_config["payload_format"], provider, api_cfg)
+        cache = self._cache_for(api_cfg, use_cache)
+        key = cache_key(base_url, payload) if cache else None
+        if cache:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        try:
+            with self.pool.session(base_url) as session:
+                resp = self._send(session, base_url, payload, headers, timeout, api_cfg)
+                resp.raise_for_status()
+                data = resp.json()
+            reply = self._parse_response(data, provider_config["payload_format"])
+        except requests.exceptions.HTTPError as e:
+            return self._http_error_text(e)
+        except Exception as e:
+            return f"[ERROR] API调用失败: {e}"
+        if cache and not reply.startswith("[ERROR]"):
+            cache.put(key, reply)
+        return reply
+
+    def stream_model(self, prompt: str, context: List[Dict[str, Any]] | None = None, cfg: Dict[str, Any] | None = None,
+                     use_cache: bool = True) -> Iterator[str]:
+        """流式调用大模型 API，逐段产出回复文本（增量）。
+
+        OpenAI 兼容接口以 ``stream: true`` 请求，解析服务器推送事件（SSE）中的
+        ``choices[0].delta.content``；其他格式或服务器不支持流式时退化为一次性产出
+        完整回复。错误与 `call_model` 一样以 ``[ERROR] ...`` 文本产出，不抛异常。
+        缓存命中时一次性产出缓存的回复；完整接收且没有错误的回复写入缓存。
+        """
+        context = context or []
+        api_cfg = cfg or self.cfg
+        provider = api_cfg.get("provider", "")
+        api_key = api_cfg.get("api_key", "")
+        timeout = api_cfg.get("timeout", 30)
+
+        # Mock 模式：按词分段产出，模拟逐字出现
+        if not provider or not api_key:
+            time.sleep(0.3)
+            for piece in re.findall(r"\S+\s*|\s+", f"[MOCK REPLY] 接收到: {prompt[:200]}"):
+                yield piece
+                time.sleep(0.02)
+            return
+
+        if provider not in self.PROVIDERS:
+            yield f"[ERROR] 不支持的API服务商: {provider}"
+            return
+
+        provider_config = self.PROVIDERS[provider]
+        if provider_config["payload_format"] != "openai":
+            yield self.call_model(prompt, context, api_cfg, use_cache=use_cache)
+            return
+
+        headers = provider_config["headers"](api_key)
+        url = self._endpoint(provider_config, api_cfg)
+        payload = self._build_payload(prompt, context, "openai", provider, api_cfg)
+        cache = self._cache_for(api_cfg, use_cache)
+        key = cache_key(url, payload) if cache else None
+        if cache:
+            cached = cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        payload["stream"] = True
+        parts: List[str] = []
+        try:
+            # timeout 对流式请求是两次收到数据之间的最长等待，而不是整个回复的总时长
+            # 只重试建立流之前的失败；开始产出增量后出错不再重发
+            with self.pool.session(url) as session, self._send(session, url, payload, headers, timeout, api_cfg, stream=True) as resp:
+                resp.raise_for_status()
+                if "text/event-stream" not in resp.headers.get("Content-Type", ""):
+                    # 服务器忽略了 stream 参数，直接返回了完整 JSON
+                    parts.append(self._parse_response(resp.json(), "openai"))
+                    yield parts[-1]
+                else:
+                    for delta in self._iter_sse_deltas(resp.iter_lines(decode_unicode=True)):
+                        parts.append(delta)
+                        yield delta
+        except requests.exceptions.HTTPError as e:
+            yield self._http_error_text(e)
+        except Exception as e:
+            # 已经产出部分回复时另起一行追加错误，保留已收到的内容
+            yield ("\n" if parts else "") + f"[ERROR] API调用失败: {e}"
+        else:
+            if cache and parts and not any(p.startswith("[ERROR]") for p in parts):
+                cache.put(key, "".join(parts))
+
+    def _cache_for(self, api_cfg: Dict[str, Any], use_cache: bool) -> ResponseCache | None:
+        """全局启用了缓存，且本次调用与模型配置都没有关闭时返回缓存。"""
+        if self.cache is None or not use_cache or api_cfg.get("response_cache") is False:
+            return None
+        return self.cache
+
+    def _send(self, session: requests.Session, url: str, payload: Dict[str, Any], headers: Dict[str, str], timeout: float,
+              api_cfg: Dict[str, Any], stream: bool = False) -> requests.Response:
+        """POST 并按重试策略处理可重试的状态码（429 / 5xx 等）与连接错误、超时。
+
+        每次请求前经过该端点的熔断器：打开时抛出 CircuitOpenError。5xx 与网络错误
+        计为失败，其余响应计为成功。返回最后一次的响应（可能仍是错误状态，由调用方
+        ``raise_for_status``）；网络错误重试用尽时抛出最后一次的异常。
+        """
+        policy = RetryPolicy.from_config({**self.cfg, **api_cfg})
+        breaker = self.breakers.get(api_cfg.get("base_url") or url)
+        deadline = time.monotonic() + policy.deadline
+        retry = 0
+        while True:
+            error = None
+            resp = None
+            with breaker.attempt():
+                try:
+                    resp = session.post(url, json=payload, headers=headers, timeout=min(timeout, max(deadline - time.monotonic(), 1.0)), stream=stream)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    breaker.record_failure(str(e))
+                    error = e
+                except Exception as e:
+                    breaker.record_failure(str(e))
+                    raise
+                else:
+                    if resp.status_code >= 500:
+                        breaker.record_failure(f"HTTP {resp.status_code}")
+                    else:
+                        breaker.record_success()
+                    if resp.status_code not in policy.retry_statuses:
+                        return resp
+
+            retry_after = parse_retry_after(resp.headers.get("Retry-After")) if resp is not None else None
+            wait = policy.backoff(retry, retry_after)
+            retry += 1
+            # 次数用尽，或剩余时间不够等到下一次（含服务器要求的 Retry-After）
+            if retry >= policy.max_attempts or time.monotonic() + wait >= deadline:
+                if error is not None:
+                    raise error
+                return resp
+            if resp is not None:
+                resp.close()
+            time.sleep(wait)
+
+    @staticmethod
+    def _iter_sse_deltas(lines: Iterable[str | bytes]) -> Iterator[str]:
+        """把 OpenAI 兼容的 SSE 行流解析为文本增量，遇到 ``data: [DONE]`` 结束。
+
+        一个事件由若干 ``data:`` 行组成、以空行结束；注释行（以 ``:`` 开头）与
+        ``event:``/``id:`` 等字段忽略。没有增量文本的事件（如只含 role 的首个事件、
+        finish_reason）不产出。
+        """
+        data: List[str] = []
+        # 末尾补一个空行，把没有以空行结束的最后一个事件也派发出去
+        for line in itertools.chain(lines, [""]):
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", errors="replace")
+            line = line.rstrip("\r")
+            if line:
+                if line.startswith("data:"):
+                    value = line[5:]
+                    data.append(value[1:] if value.startswith(" ") else value)
+                continue
+            if not data:
+                continue
+            raw = "\n".join(data)
+            data = []
+            if raw.strip() == "[DONE]":
+                return
+            try:
+                event = json.loads(raw)
+            except ValueError:
+                continue
+            if not isinstance(event, dict):
+                continue
+            if event.get("error"):
+                err = event["error"]
+                yield f"[ERROR] API调用失败: {err.get('message', err) if isinstance(err, dict) else err}"
+                return
+            for choice in event.get("choices") or []:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+    @staticmethod
+    def _endpoint(provider_config: Dict[str, Any], api_cfg: Dict[str, Any]) -> str:
         base_url = api_cfg.get("base_url", provider_config.get("base_url", ""))
 
         # 为不同格式添加正确的端点路径
@@ -51,26 +251,18 @@ class ApiClient:
         elif provider_config["payload_format"] == "gemini":
             # Gemini API的端点格式可能不同，这里先保持原样
             pass
+        return base_url
 
-        headers = provider_config["headers"](api_key)
-        payload = self._build_payload(prompt, context, provider_config["payload_format"], provider, api_cfg)
-
+    @staticmethod
+    def _http_error_text(e: "requests.exceptions.HTTPError") -> str:
+        # 提供更详细的错误信息
+        error_detail = ""
         try:
-            resp = requests.post(base_url, json=payload, headers=headers, timeout=timeout)
-            resp.raise_for_status()
-            data = resp.json()
-            return self._parse_response(data, provider_config["payload_format"])
-        except requests.exceptions.HTTPError as e:
-            # 提供更详细的错误信息
-            error_detail = ""
-            try:
-                error_data = e.response.json()
-                error_detail = f" - {error_data.get('error', {}).get('message', str(error_data))}"
-            except:
-                error_detail = f" - Status: {e.response.status_code}"
-            return f"[ERROR] API调用失败: {e}{error_detail}"
-        except Exception as e:
-            return f"[ERROR] API调用失败: {e}"
+            error_data = e.response.json()
+            error_detail = f" - {error_data.get('error', {}).get('message', str(error_data))}"
+        except:
+            error_detail = f" - Status: {e.response.status_code}"
+        return f"[ERROR] API调用失败: {e}{error_detail}"
 
     def _build_payload(self, prompt: str, context: List[Dict[str, Any]], format_type: str, provider: str, api_cfg: Dict[str, Any] | None = None) -> Dict[str, Any]:
         """根据不同的API格式构建请求payload。"""
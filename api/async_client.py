@@ -0,0 +1,239 @@
+"""asyncio 原生的模型客户端（``core.ports.ModelClientPort`` 的异步实现）。
+
+同步的 ``ApiClient.call_model`` 在事件循环里调用会阻塞整个循环：中继服务器上一个
+慢请求会卡住所有已连接的客户端。这里直接在 asyncio 流上实现 HTTP/1.1（按主机复用
+keep-alive 连接），payload 构建与响应解析沿用 ``ApiClient``，不引入额外依赖。
+
+- ``max_concurrency``：同时在途的上游请求上限，超出的调用排队等待；
+- ``max_idle_per_host``：每个主机保留的空闲长连接数；
+- 取消：调用所在任务被取消时，正在使用的连接直接关闭、不放回池中；
+- 重试与熔断：与 ``ApiClient`` 相同的 ``RetryPolicy`` 与按 base_url 的熔断器（共用同一张
+  熔断器表），退避等待用 ``asyncio.sleep``，不占用并发名额。
+"""
+import asyncio
+import json
+import ssl
+import time
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from core.ports import Message
+
+from .api_client import ApiClient
+from .resilience import RetryPolicy, parse_retry_after
+
+
+class AsyncApiClient:
+    def __init__(self, cfg: Dict[str, Any], max_concurrency: int | None = None, max_idle_per_host: int = 32, api: ApiClient | None = None):
+        self.cfg = cfg
+        # payload 构建 / 响应解析 / 端点拼接 / 熔断器表与同步客户端共用
+        self.api = api or ApiClient(cfg)
+        self.max_concurrency = int(max_concurrency or cfg.get("async_max_concurrency", 256))
+        self.max_idle_per_host = max_idle_per_host
+        self._slots: asyncio.Semaphore | None = None
+        self._idle: Dict[Tuple[str, str, int], List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._ssl: ssl.SSLContext | None = None
+        self._in_flight = 0
+        self._peak = 0
+        self._connections = 0
+
+    async def send_chat(self, messages: List[Message], cfg: Dict[str, Any] | None = None) -> str:
+        """ModelClientPort：最后一条消息为本次提问，之前的为上下文。"""
+        if not messages:
+            return "[ERROR] 没有要发送的消息"
+        context = [{"role": m.role, "content": m.content} for m in messages[:-1]]
+        return await self.call_model(messages[-1].content, context=context, cfg=cfg)
+
+    async def call_model(self, prompt: str, context: List[Dict[str, Any]] | None = None, cfg: Dict[str, Any] | None = None) -> str:
+        """与 ``ApiClient.call_model`` 行为一致的协程版本（错误以 ``[ERROR]`` 文本返回）。
+
+        ``timeout`` 为每次请求（排队之后）的时长上限，重试按 ``RetryPolicy`` 进行。
+        """
+        context = context or []
+        api_cfg = cfg or self.cfg
+        provider = api_cfg.get("provider", "")
+        api_key = api_cfg.get("api_key", "")
+        timeout = api_cfg.get("timeout", 30)
+
+        # Mock 模式
+        if not provider or not api_key:
+            await asyncio.sleep(0.3)
+            return f"[MOCK REPLY] 接收到: {prompt[:200]}"
+
+        if provider not in self.api.PROVIDERS:
+            return f"[ERROR] 不支持的API服务商: {provider}"
+
+        provider_config = self.api.PROVIDERS[provider]
+        url = self.api._endpoint(provider_config, api_cfg)
+        headers = provider_config["headers"](api_key)
+        payload = self.api._build_payload(prompt, context, provider_config["payload_format"], provider, api_cfg)
+
+        try:
+            status, reason, _, body = await self._send(url, payload, headers, timeout, api_cfg)
+        except asyncio.TimeoutError:
+            return f"[ERROR] API调用失败: 请求超时（{timeout}s）"
+        except Exception as e:
+            return f"[ERROR] API调用失败: {e}"
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if status >= 400:
+            # 与同步客户端的 HTTPError 文本保持一致
+            try:
+                detail = f" - {data.get('error', {}).get('message', str(data))}"
+            except Exception:
+                detail = f" - Status: {status}"
+            return f"[ERROR] API调用失败: {status} {reason} for url: {url}{detail}"
+        if data is None:
+            return f"[ERROR] API调用失败: 响应不是有效的 JSON: {body[:200]!r}"
+        try:
+            return self.api._parse_response(data, provider_config["payload_format"])
+        except Exception as e:
+            return f"[ERROR] API调用失败: {e}"
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak,
+            "connections_opened": self._connections,
+            "idle_connections": sum(len(v) for v in self._idle.values()),
+        }
+
+    async def aclose(self):
+        """关闭所有空闲连接。"""
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for _, writer in conns:
+                writer.close()
+
+    async def _send(self, url: str, payload: Dict[str, Any], headers: Dict[str, str], timeout: float,
+                    api_cfg: Dict[str, Any]) -> Tuple[int, str, Dict[str, str], bytes]:
+        """``ApiClient._send`` 的协程版本：同样的重试策略（429 / 5xx、连接错误、超时）与熔断器。
+
+        每次请求占用一个并发名额，退避等待期间释放。返回最后一次的响应（可能仍是错误
+        状态）；网络错误或超时重试用尽时抛出最后一次的异常，熔断打开时抛出 CircuitOpenError。
+        """
+        policy = RetryPolicy.from_config({**self.cfg, **api_cfg})
+        breaker = self.api.breakers.get(api_cfg.get("base_url") or url)
+        deadline = time.monotonic() + policy.deadline
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        retry = 0
+        while True:
+            error = None
+            resp = None
+            async with self._slots:
+                with breaker.attempt():
+                    self._in_flight += 1
+                    self._peak = max(self._peak, self._in_flight)
+                    try:
+                        resp = await asyncio.wait_for(self._post(url, payload, headers), min(timeout, max(deadline - time.monotonic(), 1.0)))
+                    except (OSError, asyncio.TimeoutError) as e:
+                        breaker.record_failure(str(e) or "请求超时")
+                        error = e
+                    except Exception as e:
+                        breaker.record_failure(str(e))
+                        raise
+                    else:
+                        if resp[0] >= 500:
+                            breaker.record_failure(f"HTTP {resp[0]}")
+                        else:
+                            breaker.record_success()
+                        if resp[0] not in policy.retry_statuses:
+                            return resp
+                    finally:
+                        self._in_flight -= 1
+
+            retry_after = parse_retry_after(resp[2].get("retry-after")) if resp is not None else None
+            wait = policy.backoff(retry, retry_after)
+            retry += 1
+            # 次数用尽，或剩余时间不够等到下一次（含服务器要求的 Retry-After）
+            if retry >= policy.max_attempts or time.monotonic() + wait >= deadline:
+                if error is not None:
+                    raise error
+                return resp
+            await asyncio.sleep(wait)
+
+    # ---------- HTTP/1.1 ----------
+    async def _post(self, url: str, payload: Dict[str, Any], headers: Dict[str, str]) -> Tuple[int, str, Dict[str, str], bytes]:
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        key = (parts.scheme, parts.hostname or "", parts.port or (443 if secure else 80))
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = {"Host": parts.netloc, "Accept": "application/json", "Accept-Encoding": "identity", "Connection": "keep-alive", **headers}
+        head["Content-Length"] = str(len(body))
+        request = (f"POST {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in head.items()) + "\r\n").encode("latin-1") + body
+
+        while True:
+            reused = bool(self._idle.get(key))
+            reader, writer = self._idle[key].pop() if reused else await self._connect(key, secure)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, reason, resp_headers, resp_body, keep = await self._read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                # 服务器已关闭的空闲长连接：换新连接重发一次（还没收到任何响应）
+                if reused:
+                    continue
+                raise ConnectionError(f"连接被关闭: {e}") from e
+            except BaseException:
+                # 取消或超时：连接状态未知，直接关闭
+                writer.close()
+                raise
+            if keep and len(self._idle.setdefault(key, [])) < self.max_idle_per_host:
+                self._idle[key].append((reader, writer))
+            else:
+                writer.close()
+            return status, reason, resp_headers, resp_body
+
+    async def _connect(self, key: Tuple[str, str, int], secure: bool):
+        context = None
+        if secure:
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            context = self._ssl
+        reader, writer = await asyncio.open_connection(key[1], key[2], ssl=context)
+        self._connections += 1
+        return reader, writer
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        version, _, rest = status_line.decode("latin-1").strip().partition(" ")
+        code, _, reason = rest.partition(" ")
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # 跳过 trailer 直到空行
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep = False
+        return int(code), reason, headers, body, keep
+
+
+__all__ = ["AsyncApiClient"]
@@ -0,0 +1,201 @@
+"""模型回复缓存：内存 LRU + 磁盘 SQLite 两级，按规范化后的请求 payload 命中。
+
+回归测试与重试经常重放完全相同的请求。键是端点加上 ``_build_payload`` 生成的
+payload（model、messages、temperature 等，去掉 ``stream``）按键排序后的 JSON 的
+SHA-256，因此上下文或参数有任何不同都不会命中。只缓存成功的回复（不含
+``[ERROR]``）。
+
+- 内存层：最近使用的 ``memory_entries`` 条（OrderedDict LRU），磁盘命中时提升到内存；
+- 磁盘层：``responses`` 表，超过 ``max_bytes`` 时按最近使用时间淘汰最旧的条目
+  （内存命中不回写使用时间，是近似 LRU）；
+- ``ttl``：条目的有效秒数，过期后视为未命中并删除，None 表示不过期。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from .resilience import endpoint_key
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PATH = os.path.join(_PROJECT_ROOT, "storage", "response_cache.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    expires REAL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used);
+"""
+
+
+def cache_key(url: str, payload: Dict[str, Any]) -> str:
+    """端点 + 规范化 payload 的 SHA-256；``stream`` 只影响传输方式，不参与计算。"""
+    canonical = {k: v for k, v in payload.items() if k != "stream"}
+    raw = json.dumps({"endpoint": endpoint_key(url), "payload": canonical}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str | None = None, memory_entries: int = 256, max_bytes: int = 64 * 1024 * 1024, ttl: float | None = 7 * 24 * 3600):
+        """``path`` 为 None 时只有内存层。"""
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[str, float | None]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+        self._conn = None
+        self._disk_bytes = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            try:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            except sqlite3.DatabaseError:
+                pass
+            self._conn.executescript(_SCHEMA)
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "ResponseCache":
+        ttl_hours = cfg.get("response_cache_ttl_hours", 168)
+        return cls(
+            path=cfg.get("response_cache_path", DEFAULT_PATH),
+            memory_entries=int(cfg.get("response_cache_memory_entries", 256)),
+            max_bytes=int(float(cfg.get("response_cache_max_mb", 64)) * 1024 * 1024),
+            ttl=float(ttl_hours) * 3600 if ttl_hours else None,
+        )
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                value, expires = hit
+                if expires is None or expires > now:
+                    self._memory.move_to_end(key)
+                    self._metrics["memory_hits"] += 1
+                    return value
+                self._drop(key)
+                self._metrics["expired"] += 1
+                self._metrics["misses"] += 1
+                return None
+            if self._conn is not None:
+                row = self._conn.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, expires = row
+                    if expires is None or expires > now:
+                        self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                        self._remember(key, value, expires)
+                        self._metrics["disk_hits"] += 1
+                        return value
+                    self._drop(key)
+                    self._metrics["expired"] += 1
+            self._metrics["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        expires = now + self.ttl if self.ttl else None
+        with self._lock:
+            self._remember(key, value, expires)
+            self._metrics["stores"] += 1
+            if self._conn is None:
+                return
+            size = len(value.encode("utf-8"))
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, expires, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, size, now, expires, now),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            if self._disk_bytes > self.max_bytes:
+                self._shrink(now)
+
+    def _remember(self, key: str, value: str, expires: float | None):
+        # 调用方持有 self._lock
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _drop(self, key: str):
+        # 调用方持有 self._lock
+        self._memory.pop(key, None)
+        if self._conn is not None:
+            row = self._conn.execute("DELETE FROM responses WHERE key = ? RETURNING size", (key,)).fetchone()
+            if row:
+                self._disk_bytes -= row[0]
+
+    def _shrink(self, now: float):
+        """先删过期条目，再按最近使用时间删最旧的，直到低于上限的 90%。"""
+        # 调用方持有 self._lock
+        expired = self._conn.execute("DELETE FROM responses WHERE expires IS NOT NULL AND expires <= ? RETURNING key, size", (now,)).fetchall()
+        for key, size in expired:
+            self._memory.pop(key, None)
+            self._disk_bytes -= size
+        self._metrics["expired"] += len(expired)
+        target = int(self.max_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            for key, size in rows:
+                if self._disk_bytes <= target:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                self._disk_bytes -= size
+                self._metrics["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+            self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中 / 未命中计数、命中率与两级的条目数和磁盘占用。"""
+        with self._lock:
+            stats = dict(self._metrics)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] if self._conn is not None else 0
+            stats["disk_bytes"] = self._disk_bytes
+            return stats
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_shared: ResponseCache | None = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache(cfg: Dict[str, Any]) -> ResponseCache:
+    """进程内共用的回复缓存，首次创建时按 cfg 中的 ``response_cache_*`` 配置。"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ResponseCache.from_config(cfg)
+        return _shared
+
+
+__all__ = ["ResponseCache", "cache_key", "shared_cache"]
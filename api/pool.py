@@ -0,0 +1,130 @@
+"""按 base_url 复用的 HTTP keep-alive 会话池。
+
+模块级的 ``requests.post`` 每次都新建 Session 与连接，每个请求都要重新做 DNS、
+TCP 与 TLS 握手。这里为每个 base_url 保留一个 ``requests.Session``（其 HTTPAdapter
+内部是线程安全的 urllib3 连接池），控制器的多个工作线程共用同一组长连接。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class _Entry:
+    __slots__ = ("session", "in_use", "last_used", "requests")
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.requests = 0
+
+
+class SessionPool:
+    """base_url -> keep-alive Session。
+
+    - ``pool_connections``：每个 Session 缓存的主机连接池数量；
+    - ``pool_maxsize``：每个主机最多保留的空闲长连接数，即可并发复用的连接数，
+      超出的并发请求临时建连接，用完即关；
+    - ``idle_timeout``：超过该秒数未使用的 Session 在下次取用时关闭并移除
+      （服务器通常也会在一段时间后断开空闲连接），None 表示不回收。
+    """
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 10, idle_timeout: float | None = 90.0):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._created = 0
+        self._evicted = 0
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @contextmanager
+    def session(self, base_url: str) -> Iterator[requests.Session]:
+        """借出 ``base_url`` 对应的 Session；借用期间不会被空闲回收关闭。"""
+        key = base_url.rstrip("/")
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(self._new_session())
+                self._created += 1
+            entry.in_use += 1
+            entry.requests += 1
+        try:
+            yield entry.session
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    def _evict_idle(self, now: float):
+        # 调用方持有 self._lock
+        if self.idle_timeout is None:
+            return
+        for key, entry in list(self._entries.items()):
+            if entry.in_use == 0 and now - entry.last_used > self.idle_timeout:
+                del self._entries[key]
+                self._evicted += 1
+                try:
+                    entry.session.close()
+                except Exception:
+                    pass
+
+    def evict_idle(self):
+        """立即关闭空闲超时的 Session（通常无需调用，取用时会顺带回收）。"""
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "in_use": sum(e.in_use for e in self._entries.values()),
+                "created": self._created,
+                "evicted": self._evicted,
+                "requests": {k: e.requests for k, e in self._entries.items()},
+            }
+
+    def close(self):
+        """关闭全部 Session 及其连接。"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            try:
+                entry.session.close()
+            except Exception:
+                pass
+
+
+_shared: SessionPool | None = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool(cfg: Dict[str, Any] | None = None) -> SessionPool:
+    """进程内共用的会话池；首次创建时按 cfg 中的 ``http_pool_*`` 配置大小。"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            cfg = cfg or {}
+            idle = cfg.get("http_pool_idle_seconds", 90)
+            _shared = SessionPool(
+                pool_connections=int(cfg.get("http_pool_connections", 4)),
+                pool_maxsize=int(cfg.get("http_pool_maxsize", 10)),
+                idle_timeout=float(idle) if idle else None,
+            )
+        return _shared
+
+
+__all__ = ["SessionPool", "shared_pool"]
@@ -0,0 +1,235 @@
+"""请求重试（指数退避 + 抖动，遵守 Retry-After，带总时限）与按 base_url 的熔断器。
+
+服务商偶发的 429 / 5xx 不再第一次失败就直接显示给用户；持续失败的端点在熔断
+打开期间直接快速失败，不再每次发送都去请求，冷却后放行一个探测请求（半开）。
+"""
+import contextlib
+import email.utils
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断打开（或半开且已有探测请求在途）时拒绝请求。"""
+
+    def __init__(self, base_url: str, retry_in: float):
+        super().__init__(f"{base_url} 连续失败，已暂停请求（{retry_in:.0f} 秒后重试）")
+        self.base_url = base_url
+        self.retry_in = retry_in
+
+
+class RetryPolicy:
+    """重试策略。
+
+    - ``max_attempts``：单次调用最多发出的请求数（含第一次），1 表示不重试；
+    - ``base_delay`` / ``max_delay``：第 n 次重试前等待 ``uniform(0, min(max_delay, base_delay * 2**n))``
+      秒（full jitter，避免多个客户端同时重试）；
+    - ``deadline``：整个调用（含所有重试与等待）的总时限，剩余时间不够等待时放弃重试；
+    - ``retry_statuses``：可重试的 HTTP 状态码，响应带 Retry-After 时按其等待。
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0, deadline: float = 60.0,
+                 retry_statuses: Iterable[int] = (408, 429, 500, 502, 503, 504)):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_statuses = frozenset(retry_statuses)
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "RetryPolicy":
+        return cls(
+            max_attempts=cfg.get("retry_max_attempts", 3),
+            base_delay=float(cfg.get("retry_base_delay", 0.5)),
+            max_delay=float(cfg.get("retry_max_delay", 8.0)),
+            deadline=float(cfg.get("retry_deadline", 60.0)),
+        )
+
+    def backoff(self, retry: int, retry_after: float | None = None, rng: random.Random | None = None) -> float:
+        """第 ``retry`` 次重试（从 0 开始）前的等待秒数；服务器给出 Retry-After 时以其为准。"""
+        if retry_after is not None:
+            return max(0.0, retry_after)
+        return (rng or random).uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """解析 Retry-After 头：秒数或 HTTP 日期，无法解析时返回 None。"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+class CircuitBreaker:
+    """单个端点的熔断器（线程安全）。
+
+    连续 ``failure_threshold`` 次失败后打开，``reset_timeout`` 秒内直接拒绝；之后进入
+    半开状态，只放行一个探测请求：成功则关闭，失败则重新打开并重新计时。
+    """
+
+    def __init__(self, base_url: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.base_url = base_url
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._last_error = ""
+
+    def _current(self, now: float) -> str:
+        # 调用方持有 self._lock
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current(time.monotonic())
+
+    def before_request(self) -> bool:
+        """请求前调用；熔断打开或半开探测已在途时抛出 CircuitOpenError。
+
+        返回本次请求是否为半开状态下的探测请求。
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current(now)
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            retry_in = max(0.0, self.reset_timeout - (now - self._opened_at)) if state == OPEN else 0.0
+        raise CircuitOpenError(self.base_url, retry_in)
+
+    @contextlib.contextmanager
+    def attempt(self):
+        """包住一次请求：``before_request`` 之后，探测请求无论怎样结束都会释放探测名额。
+
+        请求若以既不算成功也不算失败的异常结束（如 KeyboardInterrupt、任务被取消），
+        半开状态会放行下一个探测，而不是永远拒绝。
+        """
+        probe = self.before_request()
+        try:
+            yield
+        finally:
+            if probe:
+                with self._lock:
+                    if self._state == HALF_OPEN:
+                        self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, error: str = ""):
+        with self._lock:
+            self._failures += 1
+            self._last_error = error
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def reset(self):
+        """手动关闭熔断（例如用户修改了配置）。"""
+        self.record_success()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current(now)
+            return {
+                "state": state,
+                "failures": self._failures,
+                "retry_in": max(0.0, self.reset_timeout - (now - self._opened_at)) if state == OPEN else 0.0,
+                "last_error": self._last_error,
+            }
+
+
+def endpoint_key(base_url: str) -> str:
+    """熔断按配置的 base_url 区分（忽略末尾的 / 与 /chat/completions）。"""
+    key = (base_url or "").rstrip("/")
+    if key.endswith("/chat/completions"):
+        key = key[: -len("/chat/completions")]
+    return key.rstrip("/")
+
+
+class BreakerRegistry:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, base_url: str) -> CircuitBreaker:
+        key = endpoint_key(base_url)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(key, self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def snapshot(self, base_url: str) -> Dict[str, Any]:
+        """某个端点的熔断状态；从未请求过的端点视为关闭。"""
+        key = endpoint_key(base_url)
+        with self._lock:
+            breaker = self._breakers.get(key)
+        if breaker is None:
+            return {"state": CLOSED, "failures": 0, "retry_in": 0.0, "last_error": ""}
+        return breaker.snapshot()
+
+    def states(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {key: b.snapshot() for key, b in breakers.items()}
+
+
+_shared: BreakerRegistry | None = None
+_shared_lock = threading.Lock()
+
+
+def shared_breakers(cfg: Dict[str, Any] | None = None) -> BreakerRegistry:
+    """进程内共用的熔断器表；首次创建时按 cfg 中的 ``breaker_*`` 配置。"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            cfg = cfg or {}
+            _shared = BreakerRegistry(
+                failure_threshold=int(cfg.get("breaker_failure_threshold", 5)),
+                reset_timeout=float(cfg.get("breaker_reset_seconds", 30)),
+            )
+        return _shared
+
+
+__all__ = [
+    "BreakerRegistry",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "RetryPolicy",
+    "endpoint_key",
+    "parse_retry_after",
+    "shared_breakers",
+]
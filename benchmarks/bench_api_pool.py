@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""基准测试：每次 requests.post 新建连接 与 SessionPool 复用长连接的单请求延迟。
+
+用法：python -m benchmarks.bench_api_pool [--requests 300] [--handshake-ms 0] [--workers 1]
+
+在本机启动一个 HTTP/1.1 keep-alive 的替身服务器，返回 OpenAI 格式的固定回复；
+``--handshake-ms`` 让服务器每接受一个新连接先等待指定毫秒，模拟真实服务商的
+DNS + TCP + TLS 建连往返（本机回环上这部分几乎为零）。分别用：
+
+1. ``requests.post``：旧实现，每个请求新建 Session 与连接；
+2. ``ApiClient``（SessionPool）：按 base_url 复用 keep-alive 连接；
+
+发送相同数量的请求，报告 p50 / p95 延迟与服务器接受的连接数。
+"""
+import argparse
+import json
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from api import ApiClient, SessionPool
+
+REPLY = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}]}).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    handshake = 0.0
+    connections = 0
+
+    def setup(self):
+        type(self).connections += 1
+        # 响应头与正文分两次写出，不关 Nagle 会与客户端的延迟 ACK 叠加出 40ms 等待
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.handshake:
+            time.sleep(self.handshake)
+        super().setup()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(REPLY)))
+        self.end_headers()
+        self.wfile.write(REPLY)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(send, count: int, workers: int):
+    def one(i):
+        start = time.perf_counter()
+        send(i)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        samples = sorted(ex.map(one, range(count)))
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request latency with and without connection pooling")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--handshake-ms", type=float, default=0.0, help="simulated connection setup cost")
+    parser.add_argument("--workers", type=int, default=1, help="concurrent sender threads")
+    args = parser.parse_args()
+
+    StandInHandler.handshake = args.handshake_ms / 1000
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+    cfg = {"provider": "custom", "api_key": "bench", "base_url": base_url, "model": "m", "timeout": 10}
+    url = base_url + "/chat/completions"
+    client = ApiClient(cfg, pool=SessionPool(pool_maxsize=max(10, args.workers)))
+    payload = client._build_payload("ping", [], "openai", "custom", cfg)
+    headers = client.PROVIDERS["custom"]["headers"]("bench")
+
+    def per_request(i):
+        resp = requests.post(url, json=payload, headers=headers, timeout=10)
+        resp.raise_for_status()
+        resp.json()
+
+    def pooled(i):
+        assert client.call_model("ping") == "ok"
+
+    try:
+        print(f"{args.requests} requests, {args.workers} worker(s), simulated handshake {args.handshake_ms:g} ms")
+        print(f"{'client':>14} {'p50 ms':>8} {'p95 ms':>8} {'connections':>12}")
+        for name, send in (("requests.post", per_request), ("SessionPool", pooled)):
+            StandInHandler.connections = 0
+            p50, p95 = measure(send, args.requests, args.workers)
+            print(f"{name:>14} {p50 * 1000:>8.2f} {p95 * 1000:>8.2f} {StandInHandler.connections:>12}")
+    finally:
+        client.pool.close()
+        httpd.shutdown()
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""基准测试：大消息压缩前后的数据库大小、读取延迟与缓存内存占用。
+
+用法：python -m benchmarks.bench_storage_compression [--sessions 200] [--messages 100] [--threshold 4096]
+
+合成语料：短问答 + 一定比例的长代码回复（接近实际对话中粘贴 / 生成代码的情况）。
+同一语料分别以不压缩（threshold=None）和压缩写入两个数据库后对比。
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from storage import Storage, codec
+
+CODE_LINES = [
+    "def {name}(self, value):",
+    "    if value is None:",
+    "        raise ValueError('{name}: value is required')",
+    "    result = self._cache.get(value)",
+    "    for item in sorted(self.items, key=lambda x: x.{field}):",
+    "        logger.debug('processing %s', item.{field})",
+    "    return {{'status': 'ok', '{field}': result}}",
+    "",
+]
+WORDS = "the a to of and is in how do I can you please explain why this function returns error".split()
+
+
+def make_corpus(sessions: int, messages: int, code_ratio: float, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    corpus = []
+    for i in range(sessions):
+        msgs = []
+        for j in range(messages):
+            role = "user" if j % 2 == 0 else "assistant"
+            if role == "assistant" and rnd.random() < code_ratio:
+                lines = [
+                    rnd.choice(CODE_LINES).format(name=f"fn_{rnd.randint(0, 500)}", field=f"f{rnd.randint(0, 50)}")
+                    for _ in range(rnd.randint(80, 400))
+                ]
+                content = "```python\n" + "\n".join(lines) + "\n```"
+            else:
+                content = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 60)))
+            msgs.append({"role": role, "content": content, "timestamp": f"2024-01-01T00:{j // 60:02d}:{j % 60:02d}"})
+        corpus.append((f"Session {i}", msgs))
+    return corpus
+
+
+def db_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def cache_bytes(storage: Storage, sids: list) -> int:
+    total = 0
+    for sid in sids:
+        for m in storage.get_session(sid)["messages"]:
+            total += sys.getsizeof(codec.raw_content(m))
+            data = getattr(codec.raw_content(m), "data", None)
+            if data is not None:
+                total += sys.getsizeof(data)
+    return total
+
+
+def run(path: str, corpus: list, threshold, runs: int) -> dict:
+    s = Storage(path, compress_threshold=threshold)
+    start = time.perf_counter()
+    sids = []
+    for title, msgs in corpus:
+        sid = s.create_session(title)
+        s.sessions[sid]["messages"] = [dict(m) for m in msgs]
+        sids.append(sid)
+    s.save()
+    s.flush()
+    write_s = time.perf_counter() - start
+    s.close()
+    # 关闭最后一个连接时 WAL 已检查点回主库
+    size = db_size(path)
+
+    s = Storage(path, compress_threshold=threshold)
+    rnd = random.Random(1)
+    # 冷读取：未加载的会话按页读取（get_messages），并读取每条消息的正文（显示时解压）
+    page_ms = []
+    for _ in range(runs):
+        sid = rnd.choice(sids)
+        t = time.perf_counter()
+        for m in s.get_messages(sid, limit=50):
+            m["content"]
+        page_ms.append((time.perf_counter() - t) * 1000)
+    # 整个会话加载进缓存后的内存占用（仅消息正文）
+    mem = cache_bytes(s, sids[: min(len(sids), s.sessions.capacity)])
+    s.close()
+    page_ms.sort()
+    return {
+        "write_s": write_s,
+        "size_mb": size / 1e6,
+        "p50": statistics.median(page_ms),
+        "p95": page_ms[int(len(page_ms) * 0.95) - 1],
+        "cache_mb": mem / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message compression benchmark")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--code-ratio", type=float, default=0.3)
+    parser.add_argument("--threshold", type=int, default=4096)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.sessions, args.messages, args.code_ratio)
+    raw = sum(len(m["content"].encode("utf-8")) for _, msgs in corpus for m in msgs)
+    print(f"corpus: {args.sessions} sessions x {args.messages} messages, {raw / 1e6:.1f} MB of text")
+
+    tmp = tempfile.mkdtemp()
+    try:
+        results = {}
+        for label, threshold in (("plain", None), (f"zlib>={args.threshold}B", args.threshold)):
+            results[label] = run(os.path.join(tmp, f"{label}.db"), corpus, threshold, args.runs)
+        print(f"{'':>14} {'db MB':>8} {'write s':>8} {'page p50 ms':>12} {'page p95 ms':>12} {'cache MB':>9}")
+        for label, r in results.items():
+            print(f"{label:>14} {r['size_mb']:>8.1f} {r['write_s']:>8.2f} {r['p50']:>12.2f} {r['p95']:>12.2f} {r['cache_mb']:>9.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""基准测试：追加日志后端（LogStorage）与 SQLite Storage 的写入吞吐和打开会话延迟。
+
+用法：python -m benchmarks.bench_storage_log [--sessions 200] [--messages 100] [--opens 200]
+
+1. 追加吞吐：逐条 append_message 写入全部消息并 flush，按条 / 秒统计；
+2. 重新打开：关闭后重新构造后端的耗时（LogStorage 需要重放日志）；
+3. 打开会话：重新打开后随机打开未加载的会话并读取全部消息正文，统计 p50 / p95。
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from storage import LogStorage, Storage
+
+WORDS = "the a to of and is in how do I can you please explain why this function returns error".split()
+
+
+def append_all(store, sessions: int, messages: int, texts):
+    start = time.perf_counter()
+    sids = [store.create_session(f"Session {i}") for i in range(sessions)]
+    for j in range(messages):
+        for i, sid in enumerate(sids):
+            store.append_message(sid, "user" if j % 2 == 0 else "assistant", texts[(i + j) % len(texts)])
+    store.flush()
+    return sids, time.perf_counter() - start
+
+
+def open_sessions(store, sids, opens: int, seed: int = 0):
+    rnd = random.Random(seed)
+    samples = []
+    for sid in rnd.sample(sids, min(opens, len(sids))):
+        start = time.perf_counter()
+        chars = sum(len(m["content"]) for m in store.get_session(sid)["messages"])
+        samples.append(time.perf_counter() - start)
+        assert chars
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Log-structured vs SQLite storage backend")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=100, help="messages per session")
+    parser.add_argument("--opens", type=int, default=200, help="sessions opened after reopening")
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    texts = [" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 80))) for _ in range(500)]
+    total = args.sessions * args.messages
+    tmp = tempfile.mkdtemp()
+    backends = [
+        ("sqlite", lambda: Storage(os.path.join(tmp, "bench.db"), cache_size=16)),
+        ("log", lambda: LogStorage(os.path.join(tmp, "log"), cache_size=16)),
+    ]
+    try:
+        print(f"{args.sessions} sessions x {args.messages} messages")
+        print(f"{'backend':>8} {'append msg/s':>13} {'reopen ms':>10} {'open p50 ms':>12} {'open p95 ms':>12}")
+        for name, make in backends:
+            store = make()
+            sids, elapsed = append_all(store, args.sessions, args.messages, texts)
+            store.close()
+            start = time.perf_counter()
+            store = make()
+            reopen = time.perf_counter() - start
+            p50, p95 = open_sessions(store, sids, args.opens)
+            store.close()
+            print(f"{name:>8} {total / elapsed:>13.0f} {reopen * 1000:>10.1f} {p50 * 1000:>12.3f} {p95 * 1000:>12.3f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""基准测试：会话缓存中每条消息的内存开销（tracemalloc），dict 与 MessageRecord 对比。
+
+用法：python -m benchmarks.bench_storage_memory [--sessions 200] [--messages 500]
+
+同一批消息行分别构造为旧的四键 dict（role / timestamp 各自一份字符串）和
+``MessageRecord``（role 驻留、timestamp 为整数微秒），统计 tracemalloc 记录的
+分配量；消息体两边相同，单独列出后从“开销”中扣除。最后一行是通过
+``Storage.get_session`` 实际加载这些会话时的总分配量。
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import tracemalloc
+import uuid
+
+from storage import Storage, codec, records
+
+WORDS = "the a to of and is in how do I can you please explain why this function returns error".split()
+
+
+def build_db(path: str, sessions: int, messages: int, seed: int = 0) -> None:
+    """直接用 SQL 批量生成测试数据，时间戳与 Storage 写入的格式相同。"""
+    rnd = random.Random(seed)
+    Storage(path).close()
+    conn = sqlite3.connect(path)
+    codec.register(conn)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+    with conn:
+        sids = [str(uuid.uuid4()) for _ in range(sessions)]
+        conn.executemany(
+            "INSERT INTO sessions (session_id, title, draft) VALUES (?, ?, '')",
+            [(sid, f"Session {i}") for i, sid in enumerate(sids)],
+        )
+        rows = []
+        for i, sid in enumerate(sids):
+            for j in range(messages):
+                ts = start + datetime.timedelta(seconds=i * messages + j, microseconds=rnd.randint(0, 999999))
+                text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 40)))
+                rows.append((sid, "user" if j % 2 == 0 else "assistant", text, ts.isoformat()))
+        conn.executemany("INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)", rows)
+    conn.close()
+
+
+def traced(build):
+    """(结果, tracemalloc 记录的新增字节数)"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-message memory of the session cache")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=500, help="messages per session")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "bench.db")
+        build_db(path, args.sessions, args.messages)
+        conn = sqlite3.connect(path)
+        sql = "SELECT id, role, content, timestamp FROM messages ORDER BY id"
+        n = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+        def as_dicts():
+            return [{"id": r[0], "role": r[1], "content": r[2], "timestamp": r[3]} for r in conn.execute(sql)]
+
+        def as_records():
+            return [records.message(r[0], r[1], r[2], r[3]) for r in conn.execute(sql)]
+
+        dicts, dict_bytes = traced(as_dicts)
+        body_bytes = sum(sys.getsizeof(m["content"]) for m in dicts)
+        del dicts
+        recs, rec_bytes = traced(as_records)
+        del recs
+        conn.close()
+
+        dict_over = (dict_bytes - body_bytes) / n
+        rec_over = (rec_bytes - body_bytes) / n
+        print(f"{n} messages, bodies {body_bytes / n:.1f} B/msg")
+        print(f"{'representation':>16} {'B/msg':>8} {'overhead':>9}")
+        print(f"{'dict':>16} {dict_bytes / n:>8.1f} {dict_over:>9.1f}")
+        print(f"{'MessageRecord':>16} {rec_bytes / n:>8.1f} {rec_over:>9.1f}")
+        print(f"overhead reduction: {(1 - rec_over / dict_over) * 100:.0f}%")
+
+        # 通过 Storage 实际加载全部会话（含列表与缓存结构）
+        s = Storage(path, cache_size=args.sessions)
+        sids = list(s.sessions)
+        _, hydrate_bytes = traced(lambda: [len(s.get_session(sid)["messages"]) for sid in sids])
+        s.close()
+        print(f"Storage.get_session for all sessions: {hydrate_bytes / n:.1f} B/msg")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""基准测试：Storage.save() 的耗时应与改动量成正比，而与历史总量无关。
+
+用法：python -m benchmarks.bench_storage_save [--sessions 2000] [--messages 20]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from storage import Storage, codec
+
+
+def build_db(path: str, sessions: int, messages: int) -> None:
+    """直接用 SQL 批量生成测试数据（比逐条 append_message 快得多）。"""
+    Storage(path).close()
+    conn = sqlite3.connect(path)
+    codec.register(conn)
+    with conn:
+        conn.execute("DELETE FROM sessions")
+        sids = [str(uuid.uuid4()) for _ in range(sessions)]
+        conn.executemany(
+            "INSERT INTO sessions (session_id, title, draft) VALUES (?, ?, '')",
+            [(sid, f"Session {i}") for i, sid in enumerate(sids)],
+        )
+        conn.executemany(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, '')",
+            [
+                (sid, "user" if j % 2 == 0 else "assistant", f"message {j} of {sid}")
+                for sid in sids
+                for j in range(messages)
+            ],
+        )
+    conn.close()
+
+
+def time_save(path: str, changes: int) -> float:
+    """打开 DB，修改 ``changes`` 个会话（草稿 + 删除一条 + 追加一条），测量 save()。"""
+    storage = Storage(path, cache_size=max(64, changes))
+    for sid in list(storage.sessions)[:changes]:
+        sess = storage.get_session(sid)
+        sess["draft"] = "draft"
+        msgs = sess["messages"]
+        if msgs:
+            del msgs[0]
+        msgs.append({"role": "user", "content": "new", "timestamp": ""})
+    start = time.perf_counter()
+    storage.save().result()
+    elapsed = time.perf_counter() - start
+    storage.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Storage.save() delta persistence benchmark")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--messages", type=int, default=20, help="messages per session")
+    parser.add_argument("--changes", type=int, nargs="+", default=[0, 1, 10, 100])
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        print(f"{'sessions':>10} {'messages':>10} {'changes':>8} {'save() ms':>10}")
+        for n in args.sessions:
+            path = os.path.join(tmp, f"bench_{n}.db")
+            build_db(path, n, args.messages)
+            for k in args.changes:
+                # 每轮使用数据副本，避免上一轮的修改影响结果
+                run_path = os.path.join(tmp, "run.db")
+                shutil.copyfile(path, run_path)
+                ms = time_save(run_path, min(k, n)) * 1000
+                print(f"{n:>10} {n * args.messages:>10} {k:>8} {ms:>10.2f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
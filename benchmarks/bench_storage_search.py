@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""基准测试：Storage.search() 在大库上的查询延迟（目标：百万消息下 < 50ms）。
+
+用法：python -m benchmarks.bench_storage_search [--messages 1000000] [--sessions 5000]
+
+先用 SQL 批量生成不带索引的旧库，再打开 Storage 触发增量回填，
+最后对高频词、低频词、短词和组合词分别测量 p50 / p95。
+默认 20 万条以便快速运行，验收目标请使用 --messages 1000000。
+"""
+import argparse
+import itertools
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+import uuid
+
+from storage import Storage, codec
+
+VOCAB_SIZE = 20_000
+WORDS_PER_MESSAGE = 12
+
+
+def make_vocab(rnd: random.Random) -> list:
+    """随机词表，按 Zipf 分布取词：少数高频词 + 大量低频词，接近真实文本。"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rnd.choice(letters) for _ in range(rnd.randint(4, 9))) for _ in range(VOCAB_SIZE)]
+
+
+def build_legacy_db(path: str, sessions: int, messages: int, seed: int = 0) -> None:
+    """生成 FTS 迁移之前（user_version = 3）的数据库。"""
+    rnd = random.Random(seed)
+    vocab = make_vocab(rnd)
+    cum = list(itertools.accumulate(1 / (i + 1) for i in range(len(vocab))))
+    Storage(path).close()
+    conn = sqlite3.connect(path)
+    codec.register(conn)
+    with conn:
+        for name in ("messages_fts_ai", "messages_fts_ad", "messages_fts_au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute("DROP TABLE IF EXISTS messages_fts")
+        conn.execute("DROP TABLE IF EXISTS search_index_state")
+        conn.execute("DROP VIEW IF EXISTS message_text")
+        conn.execute("PRAGMA user_version = 3")
+        sids = [str(uuid.uuid4()) for _ in range(sessions)]
+        conn.executemany(
+            "INSERT INTO sessions (session_id, title, draft) VALUES (?, ?, '')",
+            [(sid, f"Session {i}") for i, sid in enumerate(sids)],
+        )
+        conn.executemany(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, '')",
+            (
+                (
+                    sids[i % sessions],
+                    "user" if i % 2 == 0 else "assistant",
+                    " ".join(rnd.choices(vocab, cum_weights=cum, k=WORDS_PER_MESSAGE)),
+                )
+                for i in range(messages)
+            ),
+        )
+    conn.close()
+
+
+def measure(storage: Storage, query: str, runs: int) -> tuple:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        storage.search(query, limit=20)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Storage.search() latency benchmark")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--sessions", type=int, default=2_000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "bench_search.db")
+        start = time.perf_counter()
+        build_legacy_db(path, args.sessions, args.messages)
+        print(f"build legacy db: {time.perf_counter() - start:.1f}s ({args.messages} messages)")
+
+        start = time.perf_counter()
+        storage = Storage(path)
+        print(f"open (index backfill runs in background): {(time.perf_counter() - start) * 1000:.1f}ms")
+        if storage._backfill_thread:
+            storage._backfill_thread.join()
+        print(f"backfill: {time.perf_counter() - start:.1f}s")
+
+        vocab = make_vocab(random.Random(0))
+        queries = {
+            "top-1 word": vocab[0],
+            "top-10 word": vocab[10],
+            "top-100 word": vocab[100],
+            "top-1000 word": vocab[1000],
+            "rare word": vocab[-1],
+            "two words": f"{vocab[50]} {vocab[200]}",
+            "3-char substring": vocab[3][:3],
+            "2-char (LIKE)": vocab[3][:2],
+        }
+        print(f"{'query':>18} {'p50 ms':>8} {'p95 ms':>8}")
+        for label, query in queries.items():
+            p50, p95 = measure(storage, query, args.runs)
+            print(f"{label:>18} {p50:>8.2f} {p95:>8.2f}")
+        storage.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
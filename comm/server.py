@@ -9,18 +9,28 @@ from typing import Dict, Optional, Set, Any
 import websockets
 
 import config
-from api import ApiClient
+from api import AsyncApiClient
 
 
 class RelayServer:
-    def __init__(self, host: str = "0.0.0.0", port: int = 8765, allowed_keys: Optional[Set[str]] = None):
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 8765,
+        allowed_keys: Optional[Set[str]] = None,
+        storage: Any = None,
+        max_inflight: Optional[int] = None,
+    ):
         self.host = host
         self.port = port
         self.allowed_keys = allowed_keys
         self.clients: Dict[str, Any] = {}
         self.cfg = config.load_config()
-        self.api_client = ApiClient(self.cfg)
+        # 上游模型调用在事件循环内异步进行，慢请求不会阻塞其它客户端
+        self.api_client = AsyncApiClient(self.cfg, max_concurrency=max_inflight)
         self._auth_keys: Dict[Any, str] = {}
+        # 可选：与桌面端共用同一个 data.db，带 "persist": true 的请求会写入会话
+        self.storage = storage
 
     def process_request(self, path, request_headers):
         """处理WebSocket握手请求，提取认证密钥。"""
@@ -32,13 +42,17 @@ class RelayServer:
         auth_key = "test_key"
         
         self.clients[auth_key] = websocket
+        # 本连接发起、尚未完成的模型请求；断开时取消，不再占用上游并发
+        pending: Set[asyncio.Task] = set()
         try:
             async for message in websocket:
-                await self._handle_message(auth_key, message)
+                await self._handle_message(auth_key, message, pending)
         finally:
+            for task in pending:
+                task.cancel()
             self.clients.pop(auth_key, None)
 
-    async def _handle_message(self, sender_key: str, raw: str):
+    async def _handle_message(self, sender_key: str, raw: str, pending: Optional[Set[asyncio.Task]] = None):
         try:
             payload = json.loads(raw)
         except Exception:
@@ -47,21 +61,30 @@ class RelayServer:
         target = payload.get("target")
 
         if msg_type == "model_request":
-            reply_text = self._call_model(payload)
-            await self._send_to(
-                sender_key,
-                {
-                    "type": "model_reply",
-                    "session_id": payload.get("session_id"),
-                    "reply": reply_text,
-                    "meta": {"from": "server"},
-                },
-            )
+            # 每个模型请求一个任务，同一连接上的后续消息无需等待上游回复
+            task = asyncio.create_task(self._answer_model_request(sender_key, payload))
+            if pending is not None:
+                pending.add(task)
+                task.add_done_callback(pending.discard)
             return
 
         await self._relay(sender_key, target, payload)
 
-    def _call_model(self, payload: dict) -> str:
+    async def _answer_model_request(self, sender_key: str, payload: dict):
+        reply_text = await self._call_model(payload)
+        # 存储调用会同步等待数据库（poll / 恢复归档），放到线程里执行，不阻塞事件循环
+        await asyncio.to_thread(self._persist, payload, reply_text)
+        await self._send_to(
+            sender_key,
+            {
+                "type": "model_reply",
+                "session_id": payload.get("session_id"),
+                "reply": reply_text,
+                "meta": {"from": "server"},
+            },
+        )
+
+    async def _call_model(self, payload: dict) -> str:
         prompt = payload.get("text", "")
         context = payload.get("context") or []
         api_cfg = payload.get("api_cfg") or None
@@ -86,10 +109,27 @@ class RelayServer:
                 return f"[ERROR] server missing model config: {model_name}"
 
         try:
-            return self.api_client.call_model(prompt, context=context, cfg=api_cfg)
+            return await self.api_client.call_model(prompt, context=context, cfg=api_cfg)
         except Exception as e:
             return f"[ERROR] remote model call failed: {e}"
 
+    def _persist(self, payload: dict, reply_text: str) -> None:
+        """把请求和回复追加到共享数据库中的会话（桌面端轮询后即可看到）"""
+        sid = payload.get("session_id")
+        if self.storage is None or not sid or not payload.get("persist"):
+            return
+        try:
+            self.storage.poll_changes()
+            if sid not in self.storage.sessions:
+                self.storage.restore_session(sid)
+            if sid not in self.storage.sessions:
+                self.storage.sessions[sid] = {"session_id": sid, "title": payload.get("title") or "Relay", "messages": []}
+                self.storage.save()
+            self.storage.append_message(sid, "user", payload.get("text", ""))
+            self.storage.append_message(sid, "assistant", reply_text)
+        except Exception as e:
+            print(f"[relay] 保存会话 {sid} 失败: {e}")
+
     async def _relay(self, sender_key: str, target_key: Optional[str], payload: dict):
         if not target_key:
             return
@@ -107,13 +147,16 @@ class RelayServer:
             pass
 
     async def run(self):
-        async with websockets.serve(
-            self.handler, 
-            self.host, 
-            self.port,
-            process_request=self.process_request
-        ):
-            await asyncio.Future()
+        try:
+            async with websockets.serve(
+                self.handler, 
+                self.host, 
+                self.port,
+                process_request=self.process_request
+            ):
+                await asyncio.Future()
+        finally:
+            await self.api_client.aclose()
 
 
 def main():
@@ -121,11 +164,29 @@ def main():
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=8765)
     parser.add_argument("--auth-key", action="append", help="Allowed auth key (can be set multiple times)")
+    parser.add_argument("--db", default=None, help="Share this session DB (e.g. storage/data.db) with the desktop app")
+    parser.add_argument("--memory", action="store_true", help="Keep persisted sessions in memory only (lost on exit)")
+    parser.add_argument("--log", default=None, help="Persist sessions to append-only log segments in this directory")
+    parser.add_argument("--max-inflight", type=int, default=None, help="Upstream model requests in flight at once (default: async_max_concurrency or 256)")
     args = parser.parse_args()
 
     allowed = set(args.auth_key) if args.auth_key else None
-    server = RelayServer(args.host, args.port, allowed)
-    asyncio.run(server.run())
+    storage = None
+    if args.db:
+        from storage import Storage
+        storage = Storage(args.db)
+    elif args.log:
+        from storage import LogStorage
+        storage = LogStorage(args.log)
+    elif args.memory:
+        from storage import MemoryStorage
+        storage = MemoryStorage()
+    server = RelayServer(args.host, args.port, allowed, storage, max_inflight=args.max_inflight)
+    try:
+        asyncio.run(server.run())
+    finally:
+        if storage is not None:
+            storage.close()
 
 
 if __name__ == "__main__":
@@ -15,6 +15,7 @@ DEFAULT_CFG: Dict[str, Any] = {
     "models": {},
     "max_history_messages": 10,
     "timeout": 60,
+    "stream_responses": True,
     "input_height": 4,
     "window_width": 1000,
     "window_height": 700,
@@ -16,6 +16,10 @@ class Controller:
         self.comm = comm
         self.current_session: str | None = None
         self.current_prompt: str = "default"  # 默认Prompt
+        # 分页加载：当前会话窗口内最早一条消息的 id（None 表示从会话开头起全部已显示）
+        self.page_size: int = int(cfg.get("message_page_size", 50) or 50)
+        self._oldest_id: int | None = None
+        self._has_older: bool = False
         # 线程安全的队列用于后台线程与UI线程通信
         self.result_queue = queue.Queue()
         if self.comm:
@@ -25,47 +29,105 @@ class Controller:
             except Exception:
                 pass
 
-    def on_delete_message(self, session_id: str, msg_index: int):
-        """删除指定会话中的单条消息（按索引）。"""
+    @property
+    def current_session(self) -> str | None:
+        return self._current_session
+
+    @current_session.setter
+    def current_session(self, session_id: str | None):
+        self._current_session = session_id
+        # 正在显示的会话不会被后台归档
         try:
-            sess = self.storage.get_session(session_id)
-            msgs = sess.get("messages", [])
-            if 0 <= msg_index < len(msgs):
-                del msgs[msg_index]
-                # 覆盖并保存
-                self.storage.sessions[session_id]["messages"] = msgs
-                self.storage.save()
-                # 如果当前会话，刷新UI显示
-                if self.ui and getattr(self, 'current_session', None) == session_id:
-                    self.ui.show_messages(msgs)
+            self.storage.active_session = session_id
         except Exception:
             pass
 
+    def on_delete_message(self, session_id: str, msg_index: int):
+        """删除指定会话中的单条消息（按索引）。"""
+        self.on_delete_messages(session_id, [msg_index])
+
     def on_delete_messages(self, session_id: str, indices: list):
-        """批量删除多条消息，indices 为索引列表。"""
+        """批量删除多条消息，indices 为索引列表（转换为消息 id 后删除）。"""
         try:
             if not indices:
                 return
-            sess = self.storage.get_session(session_id)
-            msgs = sess.get("messages", [])
-            # 删除时从高到低删除以避免索引偏移
-            for idx in sorted(indices, reverse=True):
-                if 0 <= idx < len(msgs):
-                    del msgs[idx]
-            self.storage.sessions[session_id]["messages"] = msgs
-            self.storage.save()
+            self.on_delete_message_ids(session_id, self._message_ids(session_id, indices))
+        except Exception:
+            pass
+
+    def on_delete_message_ids(self, session_id: str, ids: list):
+        """按消息 id 删除，一条 DELETE 语句完成，不再整库重写。"""
+        try:
+            if not ids:
+                return
+            self.storage.delete_messages(session_id, ids)
             if self.ui and getattr(self, 'current_session', None) == session_id:
-                self.ui.show_messages(msgs)
+                self._refresh_window()
         except Exception:
             pass
 
+    # ---------- 分页窗口 ----------
+    def _window_messages(self, session_id: str) -> list:
+        """当前显示窗口内的消息（UI 气泡索引与之一一对应）；非当前会话返回全部消息。"""
+        if session_id == self.current_session and self._oldest_id is not None:
+            return self.storage.get_messages(session_id, after_id=self._oldest_id - 1, limit=None)
+        return self.storage.get_messages(session_id, limit=None)
+
+    def _show_page(self, session_id: str):
+        """显示会话最新一页消息"""
+        # 多取一条判断是否还有更早的消息（恰好 page_size 条时不显示“加载更早”）
+        page = self.storage.get_messages(session_id, limit=self.page_size + 1)
+        self._has_older = len(page) > self.page_size
+        page = page[-self.page_size:]
+        self._oldest_id = page[0].get('id') if page else None
+        self.ui.show_messages(page)
+        self._update_has_older()
+
+    def _refresh_window(self):
+        """重新渲染当前窗口（保留已加载的更早页）"""
+        if not self.current_session:
+            return
+        self.ui.show_messages(self._window_messages(self.current_session))
+        self._update_has_older()
+
+    def _update_has_older(self):
+        if hasattr(self.ui, 'set_has_older'):
+            try:
+                self.ui.set_has_older(self._has_older)
+            except Exception:
+                pass
+
+    def on_load_older_messages(self) -> list:
+        """加载当前会话更早的一页消息并插入到顶部"""
+        if not self.current_session or self._oldest_id is None or not self._has_older:
+            return []
+        page = self.storage.get_messages(self.current_session, before_id=self._oldest_id, limit=self.page_size + 1)
+        self._has_older = len(page) > self.page_size
+        page = page[-self.page_size:]
+        if page:
+            self._oldest_id = page[0].get('id')
+            if hasattr(self.ui, 'prepend_messages'):
+                self.ui.prepend_messages(page)
+            else:
+                self.ui.show_messages(self._window_messages(self.current_session))
+        self._update_has_older()
+        return page
+
+    def _message_ids(self, session_id: str, indices: list) -> list:
+        """将窗口内消息索引转换为稳定的消息 id。"""
+        msgs = self._window_messages(session_id)
+        selected = [msgs[i] for i in sorted(set(indices)) if 0 <= i < len(msgs)]
+        if any(m.get('id') is None for m in selected):
+            # 尚未落盘的消息没有 id，先保存以分配 id
+            self.storage.save()
+        return [m.get('id') for m in selected if m.get('id') is not None]
+
     def on_export_messages(self, session_id: str, indices: list, filename: str, format_type: str = 'txt'):
         """导出选中的消息到文件，支持 txt/md/json（简单实现）。"""
         try:
             if not indices:
                 return
-            sess = self.storage.get_session(session_id)
-            msgs = sess.get("messages", [])
+            msgs = self._window_messages(session_id)
             selected = [msgs[i] for i in sorted(indices) if 0 <= i < len(msgs)]
             if not selected:
                 return
@@ -85,15 +147,14 @@ class Controller:
             elif format_type == 'json':
                 import json
                 with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump({'messages': selected}, f, ensure_ascii=False, indent=2)
+                    json.dump({'messages': [dict(m) for m in selected]}, f, ensure_ascii=False, indent=2)
         except Exception:
             pass
 
     def on_retry_message(self, session_id: str, msg_index: int):
         """重试某条用户消息（将其作为新请求发送）。只对 user 类型有效。"""
         try:
-            sess = self.storage.get_session(session_id)
-            msgs = sess.get("messages", [])
+            msgs = self._window_messages(session_id)
             if 0 <= msg_index < len(msgs):
                 msg = msgs[msg_index]
                 if msg.get('role') == 'user':
@@ -115,8 +176,11 @@ class Controller:
 
         sid = self.storage.create_session(title)
         self.current_session = sid
+        self._oldest_id = None
+        self._has_older = False
         self.ui.refresh_sessions(self.storage.list_sessions())
         self.ui.show_messages([])
+        self._update_has_older()
 
     def on_select_session(self, session_id: str):
         # 保存当前会话的草稿（如果存在）
@@ -130,11 +194,12 @@ class Controller:
             pass
 
         self.current_session = session_id
-        sess = self.storage.get_session(session_id)
-        self.ui.show_messages(sess.get("messages", []))
+        # 只加载最新一页，打开大会话与小会话开销相同（不加载全部消息）
+        self._show_page(session_id)
         # 加载草稿到输入区
         try:
-            draft_text = sess.get('draft', '')
+            sess = self.storage.sessions.get(session_id)
+            draft_text = sess.get('draft', '') if sess else ''
             if hasattr(self.ui, 'input_text'):
                 self.ui.input_text.delete('1.0', tk.END)
                 if draft_text:
@@ -145,14 +210,16 @@ class Controller:
     def on_send(self, prompt: str):
         if not self.current_session:
             self.current_session = self.storage.create_session("Auto")
-        self.storage.append_message(self.current_session, "user", prompt)
+            self._oldest_id = None
+            self._has_older = False
+        msg_id = self.storage.append_message(self.current_session, "user", prompt)
 
         # 立即显示用户消息（只追加气泡，避免整页重绘）
         try:
-            self.ui.add_message_bubble('user', prompt)
+            self.ui.add_message_bubble('user', prompt, msg_id=msg_id)
         except Exception:
-            # 回退到完整渲染
-            self.ui.show_messages(self.storage.get_session(self.current_session).get("messages", []))
+            # 回退到重绘当前窗口
+            self._refresh_window()
 
         use_remote = bool(self.comm and self.cfg.get("comm_enabled") and self.cfg.get("comm_use_remote_model"))
 
@@ -164,7 +231,7 @@ class Controller:
             return
 
         # 在后台线程中执行API调用
-        thread = threading.Thread(target=self._call_api_async, args=(prompt,))
+        thread = threading.Thread(target=self._call_api_async, args=(prompt, self.current_session))
         thread.daemon = True
         thread.start()
 
@@ -175,16 +242,17 @@ class Controller:
         # 在UI主线程添加临时气泡
         self.ui.root.after(0, lambda: self.ui.add_message_bubble('assistant', '正在思考...', temporary=True))
 
-    def _build_context_messages(self):
+    def _build_context_messages(self, session_id: str | None = None):
         """构建发送给AI的上下文消息，包括完整的对话历史"""
-        all_messages = self.storage.get_session(self.current_session).get("messages", []) if self.current_session else []
+        session_id = session_id or self.current_session
+        if not session_id:
+            return []
         # 包括完整的对话历史，这样AI才能理解上下文
         # 不排除最后一条消息，因为完整的对话历史对AI很重要
         max_history = self.cfg.get("max_history_messages", 10)
-        if max_history > 0:
-            # 如果设置了最大历史数量，则取最近的N条消息
-            return all_messages[-max_history:] if len(all_messages) > max_history else all_messages
-        return all_messages
+        # 设置了最大历史数量时只读取最近的N条消息；转换为 dict 以便 JSON 编码
+        msgs = self.storage.get_messages(session_id, limit=max_history if max_history > 0 else None)
+        return [dict(m) for m in msgs]
 
     def _send_remote_model_request(self, prompt: str):
         if not self.comm:
@@ -205,21 +273,22 @@ class Controller:
         except Exception:
             pass
 
-    def _call_api_async(self, prompt: str):
-        """在后台线程中异步调用API"""
+    def _call_api_async(self, prompt: str, session_id: str | None = None):
+        """在后台线程中异步调用API；session_id 为发送时的会话（等待回复期间用户可能切换会话）"""
+        session_id = session_id or self.current_session
         try:
             # 动态获取当前模型配置
             import config
             current_model = config.get_current_model()
             if not current_model:
                 reply = "[ERROR] 未选择模型，请先选择模型"
-                self.result_queue.put(reply)
+                self.result_queue.put(("reply", reply, session_id))
                 return
 
             model_config = config.get_model(current_model)
             if not model_config:
                 reply = f"[ERROR] 模型 '{current_model}' 配置不存在"
-                self.result_queue.put(reply)
+                self.result_queue.put(("reply", reply, session_id))
                 return
 
             # 创建API客户端配置
@@ -228,11 +297,13 @@ class Controller:
                 'base_url': model_config['base_url'],
                 'api_key': model_config['api_key'],
                 'model': model_config['model'],
-                'timeout': self.cfg.get('timeout', 30)
+                'timeout': self.cfg.get('timeout', 30),
+                # 模型配置中 "response_cache": false 时该模型绕过回复缓存
+                'response_cache': model_config.get('response_cache', True),
             }
 
             # 根据设置获取指定数量的历史消息作为context
-            context = self._build_context_messages()
+            context = self._build_context_messages(session_id)
 
             # 应用Prompt
             if self.prompt_manager:
@@ -241,24 +312,43 @@ class Controller:
                 context_messages = self.prompt_manager.apply_prompt(context_messages, self.current_prompt)
                 context = [{'role': m.role, 'content': m.content, 'timestamp': m.timestamp} for m in context_messages]
 
+            if self.cfg.get("stream_responses", True):
+                self._stream_reply(prompt, context, api_cfg, session_id)
+                return
             reply = self.api_client.call_model(prompt, context=context, cfg=api_cfg)
         except Exception as e:
             reply = f"[ERROR] 调用 API 失败: {e}"
 
-        # 将结果放入线程安全队列，由UI线程处理
-        self.result_queue.put(reply)
+        # 将结果放入线程安全队列，由UI线程保存到发起请求的会话
+        self.result_queue.put(("reply", reply, session_id))
 
-    def _update_ui_with_reply(self, reply: str):
-        """在主线程中更新UI显示回复"""
-        # 使用气泡渲染回复并保存
+    def _stream_reply(self, prompt: str, context: List[Dict[str, Any]], api_cfg: Dict[str, Any], session_id: str | None = None):
+        """流式调用：每个增量以 ("delta", 文本, 会话 id) 放入结果队列，UI 线程原地更新气泡；
+        结束时放入 ("done", 完整回复, 会话 id)，由 UI 线程只保存一次（保存到发起请求的会话）。"""
+        session_id = session_id or self.current_session
+        parts: List[str] = []
+        try:
+            for delta in self.api_client.stream_model(prompt, context=context, cfg=api_cfg):
+                if delta:
+                    parts.append(delta)
+                    self.result_queue.put(("delta", delta, session_id))
+        except Exception as e:
+            parts.append(("\n" if parts else "") + f"[ERROR] 调用 API 失败: {e}")
+        self.result_queue.put(("done", "".join(parts), session_id))
+
+    def _update_ui_with_reply(self, reply: str, session_id: str | None = None):
+        """在主线程中更新UI显示回复；session_id 为发起请求的会话"""
+        session_id = session_id or self.current_session
+        # 先保存回复以获得消息 id，再用气泡渲染
+        msg_id = self.storage.append_message(session_id, "assistant", reply)
+        if session_id != self.current_session:
+            # 等待回复期间切换了会话：只保存，不渲染到当前会话
+            return
         try:
-            self.ui.add_message_bubble('assistant', reply)
+            self.ui.add_message_bubble('assistant', reply, msg_id=msg_id)
         except Exception:
-            # 如果气泡渲染失败，回退到完整渲染
-            self.ui.show_messages(self.storage.get_session(self.current_session).get("messages", []) + [{'role':'assistant','content':reply}])
-
-        # 保存回复到存储
-        self.storage.append_message(self.current_session, "assistant", reply)
+            # 如果气泡渲染失败，回退到重绘当前窗口
+            self._refresh_window()
 
     def on_update_config(self, new_cfg: Dict[str, Any]):
         # 更新内存 cfg 并持久化
@@ -295,14 +385,10 @@ class Controller:
 
         # 如果有当前会话，计算并显示token统计
         if self.current_session:
-            session = self.storage.get_session(self.current_session)
-            all_messages = session.get("messages", [])
-            
+            session = self.storage.sessions.get(self.current_session) or {}
+
             # 根据新设置计算要发送的上下文消息（包括完整的对话历史）
-            if new_count > 0:
-                context_messages = all_messages[-new_count:] if len(all_messages) > new_count else all_messages
-            else:
-                context_messages = all_messages
+            context_messages = self.storage.get_messages(self.current_session, limit=new_count if new_count > 0 else None)
 
             # 计算上下文的token数（包括完整的对话历史）
             context_tokens = TokenCalculator.calculate_messages_tokens(context_messages)
@@ -372,6 +458,46 @@ class Controller:
         window = PromptManagementWindow(self.ui.root, self.ui._theme, self.storage, self.current_prompt)
         window.on_apply = lambda name: self.on_prompt_changed(name)
 
+    def on_search(self, query: str, limit: int = 50) -> list:
+        """全文搜索消息，结果附带会话标题"""
+        results = self.storage.search(query, limit=limit)
+        for r in results:
+            sess = self.storage.sessions.get(r.get("session_id"))
+            # 归档会话不在缓存中，结果自带标题
+            r["title"] = sess.get("title", "") if sess else r.get("title", "")
+        return results
+
+    def on_open_search_result(self, session_id: str, message_id: int):
+        """跳转到搜索命中的会话与消息"""
+        if session_id not in self.storage.sessions and not self.storage.restore_session(session_id):
+            return
+        if session_id != self.current_session:
+            self.on_select_session(session_id)
+            self.ui.refresh_sessions(self.storage.list_sessions())
+        if self._oldest_id is not None and message_id < self._oldest_id:
+            # 命中的消息比当前窗口更早：把窗口扩展到该消息
+            self._oldest_id = message_id
+            self._has_older = True
+            self._refresh_window()
+        if hasattr(self.ui, "scroll_to_message"):
+            self.ui.scroll_to_message(message_id)
+
+    def on_storage_changes(self):
+        """拉取其它进程（如中继服务器）写入的会话变化并刷新界面"""
+        try:
+            changed = self.storage.poll_changes()
+        except Exception:
+            return
+        if not changed:
+            return
+        self.ui.refresh_sessions(self.storage.list_sessions())
+        if self.current_session in changed:
+            if self.current_session in self.storage.sessions:
+                self._refresh_window()
+            else:
+                self.current_session = None
+                self.ui.show_messages([])
+
     def on_rename_session(self, session_id: str, new_name: str):
         """重命名会话"""
         self.storage.rename_session(session_id, new_name)
@@ -432,7 +558,8 @@ class Controller:
         """导出为JSON格式"""
         import json
         with open(filename, "w", encoding="utf-8") as f:
-            json.dump(session, f, ensure_ascii=False, indent=2)
+            # 缓存中的消息是 MessageRecord，转换为 dict 后写出
+            json.dump(session, f, ensure_ascii=False, indent=2, default=dict)
 
     def _on_comm_message(self, payload: Dict[str, Any]):
         """处理来自通信模块的消息"""
@@ -441,13 +568,14 @@ class Controller:
             session_id = payload.get("session_id") or self.current_session
             if not session_id:
                 session_id = self.storage.create_session("Remote")
-            if session_id not in self.storage.sessions:
+            # 已归档的会话先恢复，不在同一 id 下另建一条记录
+            if session_id not in self.storage.sessions and not self.storage.restore_session(session_id):
                 self.storage.sessions[session_id] = {"session_id": session_id, "title": "Remote", "draft": "", "messages": []}
 
             if msg_type == "model_reply":
                 reply = payload.get("reply", "")
                 if session_id == self.current_session:
-                    self.result_queue.put(reply)
+                    self.result_queue.put(("reply", reply, session_id))
                 else:
                     self.storage.append_message(session_id, "assistant", reply)
                 return
@@ -1,17 +1,35 @@
 """Storage port abstracts session and message persistence."""
 from __future__ import annotations
 
-from typing import Protocol, List
+from typing import Any, Dict, List, Optional, Protocol, Set
 
 from .types import Message, Session, SessionSummary
 
 
 class StoragePort(Protocol):
-    def list_sessions(self) -> List[SessionSummary]:
-        """Return summaries of all sessions."""
+    def list_sessions(
+        self,
+        sort: str = "recent",
+        title_filter: Optional[str] = None,
+        min_messages: Optional[int] = None,
+        limit: Optional[int] = None,
+        include_archived: bool = True,
+    ) -> List[SessionSummary]:
+        """Return session summaries (message count, token total, last activity and preview),
+        sorted and filtered without reading message rows."""
 
     def get_session(self, session_id: str) -> Session:
-        """Return a session with messages; create fallback if missing."""
+        """Return a session with messages (restoring it if archived); create fallback if missing."""
+
+    def get_messages(
+        self,
+        session_id: str,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = 50,
+        after_id: Optional[int] = None,
+    ) -> List[Message]:
+        """Return a page of messages (oldest first): the newest ``limit`` before ``before_id``,
+        or the oldest ``limit`` after ``after_id``."""
 
     def create_session(self, title: str = "New Session") -> str:
         """Create a session and return its id."""
@@ -19,12 +37,30 @@ class StoragePort(Protocol):
     def save_session(self, session: Session) -> None:
         """Persist an entire session (metadata and messages)."""
 
-    def append_message(self, session_id: str, role: str, content: str) -> None:
-        """Append a message to a session."""
+    def append_message(self, session_id: str, role: str, content: str) -> int:
+        """Append a message to a session and return its stable id."""
+
+    def delete_messages(self, session_id: str, ids: List[int]) -> int:
+        """Delete messages of a session by id and return the number removed."""
 
     def delete_session(self, session_id: str) -> bool:
         """Delete a session and return True if removed."""
 
+    def search(self, query: str, limit: int = 20, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Full-text search messages; return ranked hits with session/message ids and snippets."""
+
+    def archive_idle_sessions(self, days: float) -> int:
+        """Move sessions idle for more than ``days`` to cold storage and return the count."""
+
+    def restore_session(self, session_id: str) -> bool:
+        """Bring an archived session back into hot storage; return True if restored."""
+
+    def poll_changes(self) -> Set[str]:
+        """Reload sessions changed by other processes; return their ids."""
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until all pending writes are durable."""
+
     def clear_all_sessions(self) -> None:
         """Remove all sessions and messages."""
 
@@ -10,6 +10,7 @@ class Message:
     role: str
     content: str
     timestamp: str
+    id: Optional[int] = None
 
 
 @dataclass
@@ -24,6 +25,12 @@ class Session:
 class SessionSummary:
     session_id: str
     title: str
+    message_count: int = 0
+    token_total: int = 0
+    last_message_at: Optional[str] = None
+    last_preview: str = ""
+    updated_at: Optional[str] = None
+    archived: bool = False
 
 
 CommTarget = str
@@ -10,7 +10,17 @@ from comm import WebSocketComm
 
 def main():
     cfg = load_config()
-    storage = Storage()
+    # 不小于该字节数的消息压缩存储（0 表示不压缩）；超过该天数无活动的会话移入 archive.db（0 表示不归档）
+    storage = Storage(
+        compress_threshold=cfg.get("storage_compress_threshold", 4096) or None,
+        archive_after_days=cfg.get("storage_archive_after_days", 90) or None,
+    )
+    # 后台定时备份到 storage/backups/（0 表示关闭），保留最近 storage_backup_keep 份
+    if cfg.get("storage_backup_interval_hours", 24):
+        storage.start_backups(cfg.get("storage_backup_interval_hours", 24), keep=cfg.get("storage_backup_keep", 7))
+    # 空闲超过该秒数后回收空闲页并更新查询统计（0 表示关闭）
+    if cfg.get("storage_maintenance_idle_seconds", 30):
+        storage.start_maintenance(cfg.get("storage_maintenance_idle_seconds", 30))
     client = ApiClient(cfg)
     prompt_manager = DbPromptManager(storage)
     comm = None
@@ -0,0 +1,56 @@
+"""备份 / 恢复会话数据库（SQLite backup API，不阻塞正在运行的应用）。
+
+用法（在项目根目录）::
+
+    python -m scripts.backup_sessions backup [--keep 7]
+    python -m scripts.backup_sessions list
+    python -m scripts.backup_sessions restore latest|<快照目录名>
+
+恢复会覆盖 data.db / archive.db，需先关闭应用。``--db`` 指定数据库文件，
+默认 storage/data.db；快照默认保存在数据库同目录的 backups/ 下。
+"""
+import argparse
+import os
+import sys
+
+from storage import archive, backup
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Back up / restore the session database")
+    parser.add_argument("--db", default=os.path.join(_PROJECT_ROOT, "storage", "data.db"), help="SQLite DB path")
+    parser.add_argument("--dir", default=None, help="snapshot directory (default: backups/ next to the DB)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bk = sub.add_parser("backup", help="take a snapshot now")
+    bk.add_argument("--keep", type=int, default=backup.DEFAULT_KEEP, help="snapshots to keep (0 = all)")
+    sub.add_parser("list", help="list snapshots, oldest first")
+    rs = sub.add_parser("restore", help="overwrite the DB with a snapshot (app must be closed)")
+    rs.add_argument("snapshot", help="'latest' or a snapshot directory name")
+    args = parser.parse_args(argv)
+
+    directory = args.dir or os.path.join(os.path.dirname(args.db), backup.DIRNAME)
+    archive_path = archive.default_path(args.db)
+    if args.command == "backup":
+        path = backup.snapshot(args.db, directory, archive_path, keep=args.keep or None)
+        print("snapshot:", path)
+    elif args.command == "list":
+        for path in backup.list_snapshots(directory):
+            print(os.path.basename(path))
+    else:
+        snaps = backup.list_snapshots(directory)
+        if args.snapshot == "latest":
+            target = snaps[-1] if snaps else None
+        else:
+            target = os.path.join(directory, args.snapshot)
+        if not target or target not in snaps:
+            print("no such snapshot:", args.snapshot, file=sys.stderr)
+            return 1
+        backup.restore(target, args.db, archive_path)
+        print("restored:", target)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
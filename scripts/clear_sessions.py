@@ -2,5 +2,5 @@ from storage import Storage
 
 s = Storage()
 print('Before sessions:', len(s.sessions))
-s.clear_all_sessions()
+s.clear_all_sessions().result()
 print('Cleared sessions. After sessions:', len(s.sessions))
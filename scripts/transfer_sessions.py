@@ -0,0 +1,51 @@
+"""导出 / 导入会话（JSONL，流式、分批提交，可中断续传）。
+
+用法（在项目根目录）::
+
+    python -m scripts.transfer_sessions export sessions.jsonl [--session ID ...]
+    python -m scripts.transfer_sessions import sessions.jsonl
+    python -m scripts.transfer_sessions import-legacy storage/data.json
+
+``--db`` 指定数据库文件，默认 storage/data.db。
+"""
+import argparse
+import sys
+
+from storage import Storage
+
+
+def _report(p):
+    sys.stderr.write(f"\r{p.fraction * 100:5.1f}%  sessions={p.sessions}  messages={p.messages}")
+    sys.stderr.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export / import sessions as JSONL")
+    parser.add_argument("--db", default=None, help="SQLite DB path (default: storage/data.db)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="records per transaction (import)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="write sessions to a JSONL file")
+    exp.add_argument("path")
+    exp.add_argument("--session", action="append", dest="sessions", help="only export this session id (repeatable)")
+    imp = sub.add_parser("import", help="import a JSONL export")
+    imp.add_argument("path")
+    legacy = sub.add_parser("import-legacy", help="import a legacy data.json")
+    legacy.add_argument("path")
+    args = parser.parse_args(argv)
+
+    s = Storage(args.db)
+    try:
+        if args.command == "export":
+            counts = s.export_jsonl(args.path, args.sessions, progress=_report)
+        elif args.command == "import":
+            counts = s.import_jsonl(args.path, progress=_report, batch_size=args.batch_size)
+        else:
+            counts = s.import_legacy_json(args.path, progress=_report, batch_size=args.batch_size)
+    finally:
+        s.close()
+    sys.stderr.write("\n")
+    print(f"{args.command}: {counts['sessions']} sessions, {counts['messages']} messages")
+
+
+if __name__ == "__main__":
+    main()
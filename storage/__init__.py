@@ -1,39 +1,272 @@
 """SQLite-backed storage module with a drop-in compatible API."""
 from __future__ import annotations
 
-import json
+import datetime
+import functools
 import os
 import sqlite3
+import threading
 import uuid
-from typing import Any, Dict, List, Optional
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import archive, backup, changes, codec, contents, maintenance, records, search_index, session_stats, token_counts, transfer
+from .cache import SessionCache, slice_messages
+from .connections import ConnectionManager, enable_wal
+from .logstore import LogStorage
+from .memory import MemoryStorage
+
+
+def _utc_now() -> str:
+    return datetime.datetime.now(datetime.UTC).isoformat()
+
+
+# ---------- schema migrations ----------
+# 每个迁移对应 PRAGMA user_version 的一个版本号，按顺序在打开数据库时执行。
+# 已发布的迁移不要修改，只能在列表末尾追加新的迁移。
+
+def _migrate_message_session_index(conn: sqlite3.Connection) -> None:
+    # 覆盖按会话读取 / 删除 / 外键级联的查询
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id)")
+
+
+def _migrate_message_timestamp_index(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)")
+
+
+def _migrate_sessions_updated_at(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE sessions ADD COLUMN updated_at TEXT")
+    _backfill_updated_at(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at)")
+
+
+def _backfill_updated_at(conn: sqlite3.Connection) -> None:
+    """以最后一条消息时间（否则创建时间）填充缺失的 updated_at。"""
+    conn.execute(
+        """
+        UPDATE sessions SET updated_at = COALESCE(
+            (SELECT MAX(m.timestamp) FROM messages m WHERE m.session_id = sessions.session_id),
+            strftime('%Y-%m-%dT%H:%M:%S+00:00', created_at),
+            strftime('%Y-%m-%dT%H:%M:%S+00:00', 'now')
+        )
+        WHERE updated_at IS NULL
+        """
+    )
+
+
+def _migrate_message_codec(conn: sqlite3.Connection, compress_threshold: Optional[int] = codec.DEFAULT_THRESHOLD) -> None:
+    # 大消息压缩存储：索引 / 汇总触发器改为读取解码后的文本，再按配置的阈值压缩已有的大消息
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "codec" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN codec INTEGER NOT NULL DEFAULT 0")
+    search_index.use_decoded_text(conn)
+    session_stats.use_decoded_text(conn)
+    if compress_threshold is not None:
+        codec.compress_existing(conn, compress_threshold)
+
+
+def _migrate_content_dedup(conn: sqlite3.Connection, dedup_min: Optional[int] = contents.DEDUP_MIN) -> None:
+    # 相同的大消息体只存一份：触发器改为通过 contents 解析引用，再按配置的阈值迁移已有消息
+    contents.create_contents(conn)
+    search_index.use_decoded_text(conn, contents.text_sql)
+    session_stats.use_decoded_text(conn, contents.text_sql)
+    if dedup_min is not None:
+        contents.dedup_existing(conn, dedup_min)
+
+
+def _migrate_token_counts(conn: sqlite3.Connection) -> None:
+    # 每条消息的 token 估算写入时计算一次；已有的行由后台线程回填
+    token_counts.create_token_counts(conn)
+    # 重建 change_log 触发器：回填 token_count 不通知其它进程
+    changes.create_change_log(conn)
+
+
+def _migrate_plain_triggers(conn: sqlite3.Connection) -> None:
+    # 触发器只用内置 SQL，未注册 message_text() 的连接也能写消息；
+    # 压缩 / 引用的行由写任务在 Python 侧维护索引与预览
+    search_index.use_plain_triggers(conn)
+    session_stats.use_plain_triggers(conn)
+
+
+MIGRATIONS: List[Callable[..., None]] = [
+    _migrate_message_session_index,     # 1
+    _migrate_message_timestamp_index,   # 2
+    _migrate_sessions_updated_at,       # 3
+    search_index.create_search_index,   # 4
+    session_stats.create_session_stats, # 5
+    _migrate_message_codec,             # 6
+    _migrate_content_dedup,             # 7
+    transfer.create_import_progress,    # 8
+    changes.create_change_log,          # 9
+    _migrate_token_counts,              # 10
+    _migrate_plain_triggers,            # 11
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(
+    conn: sqlite3.Connection,
+    compress_threshold: Optional[int] = codec.DEFAULT_THRESHOLD,
+    dedup_min: Optional[int] = contents.DEDUP_MIN,
+) -> int:
+    """Apply pending migrations in order; return the resulting schema version.
+
+    Each migration runs in its own transaction together with the
+    ``user_version`` bump, so an interrupted upgrade resumes where it stopped.
+    ``compress_threshold`` and ``dedup_min`` are the store's settings, used
+    when existing messages are compressed / deduplicated (``None`` leaves
+    them as they are).
+    """
+    options = {
+        _migrate_message_codec: {"compress_threshold": compress_threshold},
+        _migrate_content_dedup: {"dedup_min": dedup_min},
+    }
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        step = MIGRATIONS[target - 1]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn, **options.get(step, {}))
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    return version
+
+
+def _insert_message(
+    conn: sqlite3.Connection, session_id: str, role: str, codec_id: int, content: Any, ts: str, tokens: int
+) -> int:
+    """Insert one message row and return the id SQLite assigned to it."""
+    cur = conn.execute(
+        "INSERT INTO messages (session_id, role, codec, content, timestamp, token_count) VALUES (?, ?, ?, ?, ?, ?)",
+        (session_id, role, codec_id, content, ts, tokens),
+    )
+    return cur.lastrowid
+
+
+def _locked(method: Callable) -> Callable:
+    """Run a Storage method while holding the cache lock."""
+
+    @functools.wraps(method)
+    def wrapper(self: "Storage", *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class Storage:
-    """Session/message storage using SQLite (compatible with previous JSON API)."""
+    """Session/message storage using SQLite (compatible with previous JSON API).
+
+    Session metadata is loaded eagerly at startup; messages are fetched per
+    session on first ``get_session`` and kept in a bounded LRU
+    (``cache_size`` hydrated sessions) as compact ``records.MessageRecord``
+    objects.  Sessions idle for longer than
+    ``archive_after_days`` are moved to ``archive.db`` (``storage.archive``)
+    and restored when they are opened again.
 
-    def __init__(self, path: str | None = None):
+    The DB runs in WAL mode and all writes go through a single background
+    writer thread (``storage.writer``) that group-commits them.  The cache is
+    updated immediately and most calls return without waiting for an fsync;
+    ``append_message`` waits because SQLite assigns the message id at insert
+    time.  Use ``durable()``/``flush()`` when a write must be on disk.  Reads use a
+    per-thread read-only connection (``storage.connections``) and the cache
+    is guarded by an RLock, so any thread may call into Storage.
+
+    Other processes (e.g. the relay server) may open the same DB; call
+    ``poll_changes()`` periodically to pick up their writes
+    (``storage.changes``).
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        cache_size: int = 64,
+        write_queue_size: int = 1024,
+        compress_threshold: Optional[int] = codec.DEFAULT_THRESHOLD,
+        dedup_min: Optional[int] = contents.DEDUP_MIN,
+        archive_path: Optional[str] = None,
+        archive_after_days: Optional[float] = None,
+    ):
         # 使用基于项目根目录的绝对路径，确保应用可移植
         _PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.path = path or os.path.join(_PROJECT_ROOT, "storage", "data.db")
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # 不小于该字节数的消息压缩存储；None 表示不压缩
+        self.compress_threshold = compress_threshold
+        # 不小于该字节数的消息按内容 hash 去重存储；None 表示不去重
+        self.dedup_min = dedup_min
+        # 缓存中相同的消息体共用一个对象
+        self._interner = contents.Interner()
 
-        self.conn = sqlite3.connect(self.path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self._enable_fk()
-        self._init_db()
+        # 建表与迁移使用一次性连接，之后所有写入都交给后台写线程
+        boot = sqlite3.connect(self.path, timeout=changes.BUSY_TIMEOUT_MS / 1000)
+        try:
+            # 新建的库在写入第一页之前选择增量 auto_vacuum
+            maintenance.prepare(boot)
+            enable_wal(boot)
+            boot.execute("PRAGMA foreign_keys = ON;")
+            codec.register(boot)
+            self._init_db(boot)
+            # 冷会话归档库：与热库同目录，所有连接以 ATTACH 方式打开
+            self.archive_path = archive_path or archive.default_path(self.path)
+            archive.attach(boot, self.archive_path)
+            maintenance.prepare(boot, archive.SCHEMA)
+            boot.execute(f"PRAGMA {archive.SCHEMA}.journal_mode = WAL;")
+            archive.create_archive(boot, search_index.uses_trigram(boot))
+            archive.reconcile(boot)
+            boot.commit()
+        finally:
+            boot.close()
 
+        self._changes = changes.ChangeTracker()
+        self._db = ConnectionManager(self.path, write_queue_size, self.archive_path, self._changes)
+        self._writer = self._db.writer
+
+        # 缓存会被 Tk 线程、WebSocket 回调线程和 API 工作线程同时访问
+        self._lock = threading.RLock()
+        self._failed_saves: List[Tuple[set, set, Dict[str, Dict[int, Any]]]] = []
+        # 其它进程改过、但本进程仍有未提交写入的会话：留到下次 poll_changes 刷新
+        self._deferred_changes: set = set()
+        # 界面当前显示的会话（由 Controller 设置），归档时跳过
+        self.active_session: Optional[str] = None
         # cache for compatibility with existing controller code
-        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.sessions: SessionCache = SessionCache(self._load_messages, cache_size)
+        # 先确定高水位再加载缓存：加载期间其它进程的写入会在第一次 poll 时补上
+        self._feed = changes.ChangeFeed(self.path, self._changes)
         self._load_sessions_into_cache()
 
-    def _enable_fk(self) -> None:
-        try:
-            self.conn.execute("PRAGMA foreign_keys = ON;")
-        except Exception:
-            pass
+        self._fts_trigram = search_index.uses_trigram(self.conn)
+        self._backfill_thread: Optional[threading.Thread] = None
+        if search_index.backfill_pending(self.conn):
+            self._backfill_thread = threading.Thread(target=self._backfill_search_index, name="storage-fts-backfill", daemon=True)
+            self._backfill_thread.start()
+        self._token_thread: Optional[threading.Thread] = None
+        if token_counts.backfill_pending(self.conn):
+            self._token_thread = threading.Thread(
+                target=self._backfill, args=(token_counts.backfill_step,), name="storage-token-backfill", daemon=True
+            )
+            self._token_thread.start()
+        self._backups: Optional[backup.BackupScheduler] = None
+        self._maintenance: Optional[maintenance.MaintenanceScheduler] = None
+        self._archive_thread: Optional[threading.Thread] = None
+        if archive_after_days:
+            self._archive_thread = threading.Thread(
+                target=self._archive_in_background, args=(archive_after_days,), name="storage-archive", daemon=True
+            )
+            self._archive_thread.start()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Read-only connection owned by the calling thread."""
+        return self._db.reader()
 
-    def _init_db(self) -> None:
-        self.conn.executescript(
+    def _init_db(self, conn: sqlite3.Connection) -> None:
+        conn.executescript(
             """
             CREATE TABLE IF NOT EXISTS sessions (
                 session_id TEXT PRIMARY KEY,
@@ -56,181 +289,719 @@ class Storage:
             );
             """
         )
-        self.conn.commit()
-        self._ensure_default_prompts()
+        conn.commit()
+        migrate(conn, self.compress_threshold, self.dedup_min)
+        self._ensure_default_prompts(conn)
         # 如果 sessions 为空，尝试从 legacy JSON（storage/data.json）导入示例会话
-        cur = self.conn.execute("SELECT COUNT(1) FROM sessions")
+        cur = conn.execute("SELECT COUNT(1) FROM sessions")
         try:
             count = cur.fetchone()[0]
         except Exception:
             count = 0
-        if count == 0:
-            self._seed_from_json()
+        self._seed_from_json(conn, resume_only=count > 0)
 
-    def _ensure_default_prompts(self) -> None:
-        cur = self.conn.execute("SELECT COUNT(1) FROM prompts")
+    def _ensure_default_prompts(self, conn: sqlite3.Connection) -> None:
+        cur = conn.execute("SELECT COUNT(1) FROM prompts")
         count = cur.fetchone()[0]
         if count == 0:
-            self.conn.execute(
+            conn.execute(
                 "INSERT INTO prompts (name, role, content) VALUES (?, ?, ?)",
                 ("default", "system", "You are a helpful assistant."),
             )
-            self.conn.commit()
+            conn.commit()
+
+    def _seed_from_json(self, conn: sqlite3.Connection, resume_only: bool = False) -> None:
+        """如果存在旧的 `storage/data.json`，将其中的会话导入到新建的 SQLite DB 中。
 
-    def _seed_from_json(self) -> None:
-        """如果存在旧的 `storage/data.json`，将其中的会话导入到新建的 SQLite DB 中。"""
+        流式解析、分批提交；中断后下次启动从上次提交的位置继续（resume_only）。
+        """
         json_path = os.path.join(os.path.dirname(self.path), "data.json")
         if not os.path.exists(json_path):
             return
         try:
-            with open(json_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
-            return
-
-        sessions = data.get("sessions", {}) if isinstance(data, dict) else {}
-        try:
-            for sid, sess in sessions.items():
-                title = sess.get("title", "")
-                draft = sess.get("draft", "")
-                # 插入会话（如果不存在）
-                self.conn.execute(
-                    "INSERT OR IGNORE INTO sessions (session_id, title, draft) VALUES (?, ?, ?)",
-                    (sid, title, draft),
-                )
-                # 插入消息
-                for m in sess.get("messages", []) or []:
-                    self.conn.execute(
-                        "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-                        (
-                            sid,
-                            m.get("role", "assistant"),
-                            m.get("content", ""),
-                            m.get("timestamp", ""),
-                        ),
-                    )
-            self.conn.commit()
+            position = transfer.resume_position(conn, transfer.source_key(json_path))
+            if resume_only and (position[0] == 0 or position[1]):
+                return
+            transfer.run_import(
+                json_path,
+                transfer.read_legacy_json,
+                transfer.in_transaction(conn),
+                position,
+                compress_threshold=self.compress_threshold,
+                dedup_min=self.dedup_min,
+            )
         except Exception:
-            # 容错：若导入过程中出错，回滚以保持 DB 一致性
-            try:
-                self.conn.rollback()
-            except Exception:
-                pass
+            # 容错：出错的批次已回滚，已提交的批次保留
+            pass
 
     def _load_sessions_into_cache(self) -> None:
-        self.sessions = {}
+        self.sessions.clear()
         cur = self.conn.execute("SELECT session_id, title, draft FROM sessions")
         for row in cur.fetchall():
-            self.sessions[row["session_id"]] = {
-                "session_id": row["session_id"],
-                "title": row["title"],
-                "draft": row["draft"] or "",
-                "messages": [],
-            }
-
-        # load messages grouped by session
+            self.sessions.add_meta(row["session_id"], row["title"], row["draft"] or "")
+
+    def _load_messages(self, session_id: str) -> List[Dict[str, Any]]:
+        # 读己之写：等待该会话排队中的写入提交后再读取
+        self._writer.wait_for_key(session_id)
         cur = self.conn.execute(
-            "SELECT session_id, role, content, timestamp FROM messages ORDER BY id ASC"
+            f"SELECT {contents.MESSAGE_COLUMNS} WHERE m.session_id = ? ORDER BY m.id ASC",
+            (session_id,),
         )
-        for row in cur.fetchall():
-            sess = self.sessions.get(row["session_id"])
-            if not sess:
-                continue
-            sess.setdefault("messages", []).append(
-                {
-                    "role": row["role"],
-                    "content": row["content"],
-                    "timestamp": row["timestamp"],
-                }
-            )
+        return [self._row_to_message(row) for row in cur.fetchall()]
 
-    def save(self) -> None:
-        """Persist session metadata (title/draft) from cache to DB."""
-        for sess in self.sessions.values():
-            sid = sess.get("session_id")
-            self.conn.execute(
-                """
-                INSERT INTO sessions (session_id, title, draft)
-                VALUES (?, ?, ?)
-                ON CONFLICT(session_id) DO UPDATE SET
-                    title=excluded.title,
-                    draft=excluded.draft
-                """,
-                (sid, sess.get("title", ""), sess.get("draft", "")),
-            )
-            # sync messages for this session to reflect any in-memory edits (e.g., deletions)
-            self.conn.execute("DELETE FROM messages WHERE session_id = ?", (sid,))
-            msgs = sess.get("messages", []) or []
-            for m in msgs:
-                self.conn.execute(
-                    "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-                    (sid, m.get("role", "assistant"), m.get("content", ""), m.get("timestamp", "")),
+    def _row_to_message(self, row: sqlite3.Row) -> Dict[str, Any]:
+        # 压缩的消息体保持压缩，读取 content 时才解压
+        body = self._interner.from_row(row["codec"], row["content"], row["body_codec"], row["body"])
+        return records.message(row["id"], row["role"], body, row["timestamp"], row["token_count"])
+
+    # ---------- write-behind helpers ----------
+    def _write(self, fn: Callable[[sqlite3.Connection], Any], key: Any = None, keys: Any = ()) -> Future:
+        return self._writer.submit(fn, key=key, keys=keys)
+
+    def durable(self) -> Future:
+        """Return a future that completes once all writes so far are committed."""
+        return self._writer.durable()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until all queued writes are committed to disk."""
+        return self._writer.flush(timeout)
+
+    def close(self) -> None:
+        """Flush pending writes, stop the writer thread and close all connections."""
+        if self._backups is not None:
+            self._backups.stop()
+        if self._maintenance is not None:
+            self._maintenance.stop()
+        self._db.close()
+        self._feed.close()
+
+    def _encode(self, content: Any) -> contents.Encoded:
+        """How a body is written: inline (plain / zlib) or as a ``contents`` reference."""
+        return contents.encode(content, self.compress_threshold, self.dedup_min)
+
+    @_locked
+    def save(self) -> Future:
+        """Persist cached changes to the DB.
+
+        Only sessions marked dirty since the last save are written: changed
+        metadata is upserted and messages are synced as a delta (deleted,
+        edited and new rows) with ``executemany`` in a single write job.
+        Returns the job's durability future.
+        """
+        # 之前失败的保存：恢复脏标记和落盘快照后一并重写
+        while self._failed_saves:
+            meta, msgs, prior = self._failed_saves.pop()
+            self.sessions.restore_dirty(meta, msgs)
+            for sid, snaps in prior.items():
+                if self.sessions.is_hydrated(sid):
+                    self.sessions[sid]._persisted.update(snaps)
+        meta_ids, msg_ids = self.sessions.take_dirty()
+        if not meta_ids and not msg_ids:
+            return self.durable()
+        now = _utc_now()
+        upserts = [
+            (sid, self.sessions[sid].get("title", ""), self.sessions[sid].get("draft", ""), now)
+            for sid in meta_ids
+        ]
+        touched = [(now, sid) for sid in msg_ids - meta_ids]
+        deletes: List[Tuple[int]] = []
+        updates: List[Tuple[str, int, Any, str, int]] = []
+        inserts: List[Tuple[str, str, int, Any, str, int]] = []
+        new_msgs: List[Tuple[str, Dict[str, Any]]] = []
+        blobs: List[Tuple[bytes, int, Any, int]] = []
+        # 改写/删除前的落盘快照：写入失败时恢复，下次 save() 才能重新得出这些差异
+        prior: Dict[str, Dict[int, Any]] = {}
+        for sid in msg_ids:
+            sess = self.sessions[sid]
+            deleted, changed, new = sess.message_delta()
+            if deleted or changed:
+                prior[sid] = {mid: sess._persisted[mid] for mid in deleted + [m["id"] for m in changed]}
+            deletes.extend((mid,) for mid in deleted)
+            for mid in deleted:
+                sess._persisted.pop(mid, None)
+            for m in changed:
+                enc = self._encode(codec.raw_content(m))
+                if enc.blob:
+                    blobs.append(enc.blob)
+                updates.append((
+                    m.get("role", "assistant"), enc.codec, enc.content, m.get("timestamp", ""),
+                    token_counts.of_message(m), m["id"],
+                ))
+                sess.mark_persisted(m)
+            for m in new:
+                enc = self._encode(codec.raw_content(m))
+                if enc.blob:
+                    blobs.append(enc.blob)
+                inserts.append((
+                    sid, m.get("role", "assistant"), enc.codec, enc.content, m.get("timestamp", ""),
+                    token_counts.of_message(m),
+                ))
+                new_msgs.append((sid, m))
+
+        def job(conn: sqlite3.Connection) -> List[int]:
+            if upserts:
+                conn.executemany(
+                    """
+                    INSERT INTO sessions (session_id, title, draft, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(session_id) DO UPDATE SET
+                        title=excluded.title,
+                        draft=excluded.draft,
+                        updated_at=excluded.updated_at
+                    """,
+                    upserts,
+                )
+            if touched:
+                conn.executemany("UPDATE sessions SET updated_at = ? WHERE session_id = ?", touched)
+            if blobs:
+                # 正文先于引用它的消息写入
+                contents.insert_blobs(conn, blobs)
+            # 触发器只维护 codec = 0 的行，其余行的索引在改写前后同步
+            rewritten = deletes + [(u[-1],) for u in updates]
+            if rewritten:
+                search_index.unindex_encoded(conn, "m.id = ?", rewritten)
+            if deletes:
+                conn.executemany("DELETE FROM messages WHERE id = ?", deletes)
+            if updates:
+                conn.executemany(
+                    "UPDATE messages SET role = ?, codec = ?, content = ?, timestamp = ?, token_count = ? WHERE id = ?",
+                    updates,
                 )
-        self.conn.commit()
+            # id 在插入时由 AUTOINCREMENT 分配，多个进程写同一个库时也按写入顺序递增
+            new_ids = [_insert_message(conn, *row) for row in inserts]
+            if updates or new_ids:
+                search_index.index_encoded(conn, "m.id = ?", [(u[-1],) for u in updates] + [(i,) for i in new_ids])
+            if msg_ids:
+                session_stats.fill_previews(conn, msg_ids)
+            if deletes or updates:
+                contents.collect(conn)
+            return new_ids
 
+        fut = self._write(job, keys=meta_ids | msg_ids)
+
+        def on_done(f: Future) -> None:
+            # 运行在写线程上，不能拿缓存锁；记录下来由下次 save() 恢复脏标记
+            if f.exception() is not None:
+                self._failed_saves.append((meta_ids, msg_ids, prior))
+
+        fut.add_done_callback(on_done)
+        if new_msgs:
+            # 新消息要等提交后才有 id（通常只有直接写入缓存的消息走这里，
+            # append_message 不经过 save）；on_done 之后再回填
+            settled = threading.Event()
+            fut.add_done_callback(lambda f: settled.set())
+            settled.wait()
+            if fut.exception() is None:
+                for (sid, m), msg_id in zip(new_msgs, fut.result()):
+                    m["id"] = msg_id
+                    if self.sessions.is_hydrated(sid):
+                        self.sessions[sid].mark_persisted(m)
+        return fut
+
+    @_locked
     def create_session(self, title: str = "New Session") -> str:
         sid = str(uuid.uuid4())
-        self.conn.execute(
-            "INSERT INTO sessions (session_id, title, draft) VALUES (?, ?, '')",
-            (sid, title),
+        now = _utc_now()
+        self._write(
+            lambda conn: conn.execute(
+                "INSERT INTO sessions (session_id, title, draft, updated_at) VALUES (?, ?, '', ?)",
+                (sid, title, now),
+            ),
+            key=sid,
         )
-        self.conn.commit()
-        self.sessions[sid] = {"session_id": sid, "title": title, "draft": "", "messages": []}
+        self.sessions.add_meta(sid, title, "", rows=[])
         return sid
 
-    def list_sessions(self) -> List[Dict[str, Any]]:
-        return [
-            {"session_id": s["session_id"], "title": s.get("title", "")}
-            for s in self.sessions.values()
-        ]
+    @_locked
+    def list_sessions(
+        self,
+        sort: str = "recent",
+        title_filter: Optional[str] = None,
+        min_messages: Optional[int] = None,
+        limit: Optional[int] = None,
+        include_archived: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Session summaries read from ``session_stats`` (no message scan).
+
+        Each dict has ``session_id``, ``title``, ``message_count``,
+        ``token_total``, ``last_message_at``, ``last_preview``,
+        ``updated_at`` and ``archived``.  ``sort`` is one of
+        ``session_stats.SORTS``; filtering, ordering and ``limit`` are
+        applied in SQL.
+        """
+        sql, params = session_stats.list_query(sort, title_filter, min_messages, limit, include_archived)
+        self._writer.wait_for_thread()
+        rows = [session_stats.row_to_summary(r) for r in self.conn.execute(sql, params)]
+        seen = set()
+        for row in rows:
+            seen.add(row["session_id"])
+            rec = self.sessions.get(row["session_id"])
+            if rec is not None:
+                # 未保存的重命名以缓存为准
+                row["title"] = rec.get("title", "")
+        # 只存在于缓存、尚未 save() 的会话
+        for rec in self.sessions.values():
+            sid = rec["session_id"]
+            # 被筛选或 limit 排除的已保存会话不算（未修改的会话一定已在库中）
+            if sid in seen or not self.sessions.is_dirty(sid):
+                continue
+            if self.conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (sid,)).fetchone():
+                continue
+            summary = session_stats.cached_summary(rec)
+            if title_filter and title_filter.lower() not in summary["title"].lower():
+                continue
+            if min_messages is not None and summary["message_count"] < min_messages:
+                continue
+            rows.insert(0, summary)
+        return rows if limit is None else rows[:limit]
 
     def get_session(self, session_id: str) -> Dict[str, Any]:
-        sess = self.sessions.get(session_id)
-        if sess:
-            return sess
+        # 归档会话在缓存锁外恢复
+        if session_id not in self.sessions:
+            self.restore_session(session_id)
+        with self._lock:
+            if session_id in self.sessions:
+                return self.sessions.hydrate(session_id)
         # fallback to empty session shape
         return {"session_id": session_id, "title": "", "messages": [], "draft": ""}
 
-    def append_message(self, session_id: str, role: str, content: str) -> None:
-        import datetime
+    def get_messages(
+        self,
+        session_id: str,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = 50,
+        after_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Keyset-paginated message read, oldest first within the page.
 
+        ``before_id`` returns the newest ``limit`` messages with a smaller id
+        (the newest page when omitted); ``after_id`` instead returns the
+        oldest ``limit`` messages with a larger id.  ``limit=None`` means no
+        limit.  Loaded sessions are sliced from the cache, others are read
+        with one indexed query and are not hydrated.  Archived sessions are
+        restored first.
+        """
         if session_id not in self.sessions:
-            session_id = self.create_session("Auto")
-        ts = datetime.datetime.now(datetime.UTC).isoformat()
-        self.conn.execute(
-            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-            (session_id, role, content, ts),
-        )
-        self.conn.commit()
-        self.sessions[session_id]["messages"].append({"role": role, "content": content, "timestamp": ts})
+            self.restore_session(session_id)
+        return self._page(session_id, before_id, limit, after_id)
+
+    @_locked
+    def _page(
+        self, session_id: str, before_id: Optional[int], limit: Optional[int], after_id: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        if session_id not in self.sessions:
+            return []
+        if self.sessions.is_hydrated(session_id):
+            return slice_messages(self.sessions[session_id]["messages"], before_id, limit, after_id)
+        self._writer.wait_for_key(session_id)
+        sql = f"SELECT {contents.MESSAGE_COLUMNS} WHERE m.session_id = ?"
+        params: List[Any] = [session_id]
+        if after_id is not None:
+            sql += " AND m.id > ?"
+            params.append(after_id)
+        if before_id is not None:
+            sql += " AND m.id < ?"
+            params.append(before_id)
+        # 向前翻页按 id 倒序取 limit 条再反转，走 idx_messages_session
+        newest_first = after_id is None
+        sql += " ORDER BY m.id DESC" if newest_first else " ORDER BY m.id ASC"
+        sql += " LIMIT ?"
+        params.append(-1 if limit is None else limit)
+        rows = [self._row_to_message(row) for row in self.conn.execute(sql, params).fetchall()]
+        if newest_first:
+            rows.reverse()
+        return rows
+
+    def append_message(self, session_id: str, role: str, content: str) -> int:
+        """Append a message and return its stable message id.
 
+        The id is assigned by SQLite when the writer thread inserts the row,
+        so this waits for the commit; the cache lock is not held meanwhile.
+        """
+        # 已归档的会话先移回热库（缓存锁外），否则新建会话
+        if session_id not in self.sessions:
+            self.restore_session(session_id)
+        with self._lock:
+            if session_id not in self.sessions:
+                session_id = self.create_session("Auto")
+            elif self.sessions.is_dirty(session_id):
+                # 会话可能只存在于缓存中（如 Controller 直接写入），先保存（同一写队列保证顺序）
+                self.save()
+        ts = _utc_now()
+        enc = self._encode(content)
+        tokens = token_counts.estimate(content)
+
+        def job(conn: sqlite3.Connection) -> int:
+            if enc.blob:
+                contents.insert_blobs(conn, [enc.blob])
+            msg_id = _insert_message(conn, session_id, role, enc.codec, enc.content, ts, tokens)
+            if enc.codec != codec.CODEC_PLAIN:
+                search_index.index_encoded(conn, "m.id = ?", [(msg_id,)])
+                session_stats.fill_previews(conn, [session_id])
+            conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (ts, session_id))
+            return msg_id
+
+        msg_id = self._write(job, key=session_id).result()
+        with self._lock:
+            # 未加载的会话下次 get_session 时会从 DB 读取到这条消息；
+            # 等待提交期间加载的会话已含这一行
+            if self.sessions.is_hydrated(session_id) and msg_id not in self.sessions[session_id]._persisted:
+                body = self._interner.intern(enc.body, enc.blob[0] if enc.blob else None)
+                self.sessions[session_id].append_persisted(records.message(msg_id, role, body, ts, tokens))
+        return msg_id
+
+    @_locked
+    def delete_messages(self, session_id: str, ids: List[int]) -> int:
+        """Delete messages by id with one indexed statement.
+
+        Returns the number of distinct ids scheduled for deletion.
+        """
+        ids = sorted({int(i) for i in ids if i is not None})
+        if not ids:
+            return 0
+        placeholders = ",".join("?" * len(ids))
+        now = _utc_now()
+
+        def job(conn: sqlite3.Connection) -> int:
+            search_index.unindex_encoded(conn, "m.session_id = ? AND m.id = ?", [(session_id, i) for i in ids])
+            cur = conn.execute(
+                f"DELETE FROM messages WHERE session_id = ? AND id IN ({placeholders})",
+                (session_id, *ids),
+            )
+            session_stats.fill_previews(conn, [session_id])
+            conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (now, session_id))
+            contents.collect(conn)
+            return cur.rowcount
+
+        self._write(job, key=session_id)
+        if self.sessions.is_hydrated(session_id):
+            self.sessions[session_id].remove_persisted(ids)
+        return len(ids)
+
+    @_locked
     def delete_session(self, session_id: str) -> bool:
-        cur = self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-        self.conn.commit()
-        removed = cur.rowcount > 0
-        if removed:
-            self.sessions.pop(session_id, None)
-        return removed
-
-    def clear_all_sessions(self) -> None:
-        self.conn.execute("DELETE FROM sessions")
-        self.conn.execute("DELETE FROM messages")
-        self.conn.commit()
-        self.sessions = {}
+        if session_id not in self.sessions:
+            if not archive.is_archived(self.conn, session_id):
+                return False
+            self._write(lambda conn: archive.drop_archived(conn, [session_id]), key=session_id)
+            return True
+        def job(conn: sqlite3.Connection) -> None:
+            search_index.unindex_encoded(conn, "m.session_id = ?", [(session_id,)])
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            contents.collect(conn)
+
+        self._write(job, key=session_id)
+        self.sessions.pop(session_id, None)
+        return True
+
+    @_locked
+    def clear_all_sessions(self) -> Future:
+        def job(conn: sqlite3.Connection) -> None:
+            conn.execute("DELETE FROM sessions")
+            conn.execute("DELETE FROM messages")
+            conn.execute("DELETE FROM contents")
+            # 触发器不会删除压缩 / 引用行的索引项
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('delete-all')")
+            archive.clear(conn)
+
+        fut = self._write(job)
+        self.sessions.clear()
+        return fut
 
     def rename_session(self, session_id: str, new_title: str) -> bool:
-        cur = self.conn.execute(
-            "UPDATE sessions SET title = ? WHERE session_id = ?", (new_title, session_id)
-        )
-        self.conn.commit()
-        if cur.rowcount > 0:
-            if session_id in self.sessions:
-                self.sessions[session_id]["title"] = new_title
+        if session_id not in self.sessions:
+            self.restore_session(session_id)
+        with self._lock:
+            if session_id not in self.sessions:
+                return False
+            now = _utc_now()
+            self._write(
+                lambda conn: conn.execute(
+                    "UPDATE sessions SET title = ?, updated_at = ? WHERE session_id = ?",
+                    (new_title, now, session_id),
+                ),
+                key=session_id,
+            )
+            self.sessions[session_id].set_persisted("title", new_title)
             return True
-        return False
+
+    # ---------- cross-process changes ----------
+    def poll_changes(self) -> set:
+        """Refresh sessions other processes changed since the last call; return their ids.
+
+        Cheap when nothing changed (one ``PRAGMA data_version``).  Changed
+        sessions get fresh metadata and their messages reload on next
+        access; deleted ones leave the cache.  Sessions with unsaved local
+        edits are left alone.  Never waits for the writer thread (it is
+        polled from the Tk thread): sessions with local writes still queued
+        are refreshed by a later poll.
+        """
+        changed = self._feed.poll()
+        with self._lock:
+            if changed is None:
+                # change_log 已被裁剪到高水位之后：整体重新加载元数据
+                changed = set(self.sessions.keys())
+                changed.update(r["session_id"] for r in self.conn.execute("SELECT session_id FROM sessions"))
+            changed |= self._deferred_changes
+            self._deferred_changes = set()
+            refreshed = set()
+            for sid in changed:
+                if self.sessions.is_dirty(sid):
+                    continue
+                if self._writer.is_pending(sid):
+                    # 读连接还看不到本进程排队中的写入，现在刷新会用旧数据覆盖缓存
+                    self._deferred_changes.add(sid)
+                    continue
+                row = self.conn.execute("SELECT title, draft FROM sessions WHERE session_id = ?", (sid,)).fetchone()
+                known = sid in self.sessions
+                self.sessions.pop(sid, None)
+                if row is not None:
+                    self.sessions.add_meta(sid, row["title"], row["draft"] or "")
+                if row is not None or known:
+                    refreshed.add(sid)
+            return refreshed
+
+    # ---------- background backfills ----------
+    def _backfill(self, step: Callable[[sqlite3.Connection], bool]) -> None:
+        """Run a migration's backfill one writer job per batch until ``step`` returns False."""
+        try:
+            while self._writer.call(step):
+                pass
+        except Exception:
+            # 写线程已关闭或出错：剩余部分在下次打开时继续回填
+            pass
+
+    # ---------- full-text search ----------
+    def _backfill_search_index(self) -> None:
+        """Index messages that predate the FTS table, one writer job per batch."""
+        self._backfill(search_index.backfill_step)
+
+    def search(self, query: str, limit: int = 20, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Full-text search over message content, best matches first.
+
+        Returns dicts with ``session_id``, ``message_id``, ``role``,
+        ``snippet`` (hits wrapped in ``[...]``) and ``rank``.
+        """
+        self._writer.wait_for_thread()
+        try:
+            hits = search_index.search(self.conn, query, limit, session_id, self._fts_trigram)
+        except sqlite3.OperationalError:
+            hits = []
+        if len(hits) < limit:
+            # 热库命中不足时补充归档会话中的结果（带 title / archived）
+            try:
+                hits += archive.search(self.conn, query, limit - len(hits), session_id, self._fts_trigram)
+            except sqlite3.OperationalError:
+                pass
+        return hits
+
+    # ---------- cold-session archive ----------
+    def _archive_in_background(self, days: float) -> None:
+        try:
+            self.archive_idle_sessions(days)
+        except Exception:
+            # 写线程已关闭或出错：下次启动再归档
+            pass
+
+    def archive_idle_sessions(self, days: float, batch: int = archive.BATCH_SIZE) -> int:
+        """Move sessions idle for more than ``days`` to the archive; return the count.
+
+        Sessions loaded in the cache, with unsaved changes or shown in the
+        UI (``active_session``) stay hot.  Each
+        batch is copied and then removed from the hot DB in two writer jobs,
+        awaited without holding the cache lock.
+        """
+        cutoff = (datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=days)).isoformat()
+        self._writer.wait_for_thread()
+        candidates = archive.idle_sessions(self.conn, cutoff)
+        moved = 0
+        for start in range(0, len(candidates), batch):
+            with self._lock:
+                ids = [
+                    sid for sid in candidates[start:start + batch]
+                    if sid in self.sessions and sid != self.active_session
+                    and not self.sessions.is_hydrated(sid) and not self.sessions.is_dirty(sid)
+                ]
+                if not ids:
+                    continue
+                # 先移出缓存并排队写入（按会话 id 排序）：此后打开这些会话的调用
+                # 在 restore_session 中等归档提交后再恢复
+                metas = {sid: self.sessions.pop(sid) for sid in ids}
+                now = _utc_now()
+                copied = self._write(lambda conn: archive.copy_to_archive(conn, ids, now), keys=ids)
+                dropped = self._write(lambda conn: archive.drop_hot(conn, ids), keys=ids)
+            try:
+                copied.result()
+                moved += dropped.result()
+            except Exception:
+                # 归档失败：会话仍在热库中，放回缓存
+                with self._lock:
+                    for sid, meta in metas.items():
+                        if sid not in self.sessions:
+                            self.sessions.add_meta(sid, meta.get("title", ""), meta.get("draft", ""))
+                raise
+        return moved
+
+    def restore_session(self, session_id: str) -> bool:
+        """Move an archived session back to the hot DB; return False if it is not archived.
+
+        The writer round-trip runs without holding the cache lock.
+        """
+        with self._lock:
+            if session_id in self.sessions:
+                return False
+        # 正在归档的会话：等归档提交后再判断
+        self._writer.wait_for_key(session_id)
+        if not archive.is_archived(self.conn, session_id):
+            return False
+
+        def job(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+            # 复制与删除在同一个任务中：并发恢复同一会话时后到的任务什么也不复制
+            rows = archive.copy_to_hot(conn, [session_id], self._encode)
+            archive.drop_archived(conn, [session_id])
+            return rows
+
+        restored = self._write(job, key=session_id).result()
+        with self._lock:
+            for row in restored:
+                if row["session_id"] not in self.sessions:
+                    self.sessions.add_meta(row["session_id"], row["title"], row["draft"])
+            return session_id in self.sessions
+
+    @_locked
+    def storage_stats(self) -> Dict[str, Any]:
+        """Deduplication report: DB-side ``contents`` figures plus cache sharing.
+
+        ``dedup_ratio`` is message references per distinct stored body;
+        ``bytes_saved`` compares the text size of all referencing messages
+        with what ``contents`` stores (deduplication and compression);
+        ``cache_bytes_saved`` is memory not duplicated thanks to interning.
+        """
+        self._writer.wait_for_thread()
+        report = contents.stats(self.conn)
+        report["messages"] = self.conn.execute("SELECT COALESCE(SUM(message_count), 0) FROM session_stats").fetchone()[0]
+        report["archived_sessions"] = archive.count(self.conn)
+        cached = (
+            m for sid in self.sessions.hydrated_ids()
+            for m in dict.get(dict.__getitem__(self.sessions, sid), "messages") or ()
+        )
+        report.update(contents.memory_stats(cached))
+        return report
+
+    # ---------- backups ----------
+    @property
+    def backup_dir(self) -> str:
+        return os.path.join(os.path.dirname(self.path), backup.DIRNAME)
+
+    def create_backup(
+        self,
+        directory: Optional[str] = None,
+        keep: Optional[int] = backup.DEFAULT_KEEP,
+        pages: int = backup.DEFAULT_PAGES,
+        sleep: float = backup.DEFAULT_SLEEP,
+        progress: backup.BackupProgress = None,
+    ) -> str:
+        """Snapshot the DB and archive into ``directory`` (default ``backups/``); return its path.
+
+        Runs on the calling thread without taking the cache lock or the
+        writer, so writes continue meanwhile; only committed data is copied.
+        """
+        return backup.snapshot(self.path, directory or self.backup_dir, self.archive_path, pages, sleep, progress, keep)
+
+    def start_backups(self, interval_hours: float, keep: Optional[int] = backup.DEFAULT_KEEP, directory: Optional[str] = None) -> backup.BackupScheduler:
+        """Take a snapshot every ``interval_hours`` on a background thread (stopped by ``close``)."""
+        target = directory or self.backup_dir
+        if self._backups is not None:
+            self._backups.stop()
+        self._backups = backup.BackupScheduler(
+            lambda: self.create_backup(target, keep), interval_hours * 3600, backup.last_snapshot_time(target)
+        ).start()
+        return self._backups
+
+    # ---------- maintenance ----------
+    def maintenance_stats(self) -> Dict[str, Dict[str, Any]]:
+        """File size, free pages and fragmentation of ``data.db`` and the archive."""
+        self._writer.wait_for_thread()
+        return {
+            "main": maintenance.stats(self.conn, "main", self.path),
+            "archive": maintenance.stats(self.conn, archive.SCHEMA, self.archive_path),
+        }
+
+    def run_maintenance(self, step_pages: int = maintenance.DEFAULT_STEP_PAGES) -> int:
+        """Reclaim all free pages and refresh planner statistics now; return pages freed.
+
+        Files created before incremental auto-vacuum are rewritten once by
+        ``VACUUM`` first.  Runs through the writer, so queued writes go first.
+        """
+        freed = maintenance.reclaim(self._writer.call, ("main", archive.SCHEMA), step_pages)
+        self._writer.call(maintenance.optimize)
+        return freed
+
+    def start_maintenance(
+        self,
+        idle_after: float = maintenance.DEFAULT_IDLE_AFTER,
+        interval: float = maintenance.DEFAULT_INTERVAL,
+        step_pages: int = maintenance.DEFAULT_STEP_PAGES,
+        optimize_hours: float = maintenance.DEFAULT_OPTIMIZE_EVERY / 3600,
+    ) -> maintenance.MaintenanceScheduler:
+        """Reclaim free pages and optimize while no writes arrive (stopped by ``close``)."""
+        if self._maintenance is not None:
+            self._maintenance.stop()
+        self._maintenance = maintenance.MaintenanceScheduler(
+            self._writer, ("main", archive.SCHEMA), interval, idle_after, step_pages, optimize_hours * 3600
+        ).start()
+        return self._maintenance
+
+    # ---------- bulk export / import ----------
+    def export_jsonl(
+        self,
+        path: str,
+        session_ids: Optional[List[str]] = None,
+        progress: transfer.ProgressFn = None,
+    ) -> Dict[str, int]:
+        """Write sessions (default: all, archived included) to ``path`` as JSONL; return counts.
+
+        Pending cache changes are saved first.  The file is written to a
+        temporary name and renamed, so a partial export never replaces an
+        existing one.
+        """
+        self.save()
+        self._writer.wait_for_thread()
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            counts = transfer.export_jsonl(self.conn, f, session_ids, progress, archived=True)
+        os.replace(tmp, path)
+        return counts
+
+    def import_jsonl(self, path: str, progress: transfer.ProgressFn = None, batch_size: int = transfer.BATCH_SIZE) -> Dict[str, int]:
+        """Import a JSONL export; return ``{"sessions", "messages"}`` imported.
+
+        Each batch is one writer job, so other writes are not blocked for
+        the whole import.  Sessions that already exist are skipped, and an
+        interrupted import of the same file resumes where it stopped.
+        """
+        return self._import(path, transfer.read_jsonl, progress, batch_size)
+
+    def import_legacy_json(self, path: str, progress: transfer.ProgressFn = None, batch_size: int = transfer.BATCH_SIZE) -> Dict[str, int]:
+        """Import a legacy ``data.json`` (``{"sessions": {...}}``) the same way."""
+        return self._import(path, transfer.read_legacy_json, progress, batch_size)
+
+    def _import(self, path: str, reader: Any, progress: transfer.ProgressFn, batch_size: int) -> Dict[str, int]:
+        def created(rows: List[Tuple[str, str, str]]) -> None:
+            with self._lock:
+                for sid, title, draft in rows:
+                    if sid not in self.sessions:
+                        self.sessions.add_meta(sid, title, draft)
+
+        position = self._writer.call(lambda conn: transfer.resume_position(conn, transfer.source_key(path)))
+        return transfer.run_import(
+            path, reader, self._writer.call, position, progress, batch_size, created,
+            compress_threshold=self.compress_threshold, dedup_min=self.dedup_min,
+        )
 
     # Prompt management (DB-backed, PromptPort-compatible helpers)
     def list_prompts(self) -> List[Dict[str, str]]:
+        self._writer.wait_for_thread()
         cur = self.conn.execute("SELECT name, role, content FROM prompts ORDER BY name ASC")
         return [
             {"name": row["name"], "role": row["role"], "content": row["content"]}
@@ -238,6 +1009,7 @@ class Storage:
         ]
 
     def get_prompt(self, name: str) -> Optional[Dict[str, str]]:
+        self._writer.wait_for_thread()
         cur = self.conn.execute(
             "SELECT name, role, content FROM prompts WHERE name = ?", (name,)
         )
@@ -246,23 +1018,25 @@ class Storage:
             return None
         return {"name": row["name"], "role": row["role"], "content": row["content"]}
 
-    def upsert_prompt(self, name: str, role: str, content: str) -> None:
-        self.conn.execute(
-            """
-            INSERT INTO prompts (name, role, content)
-            VALUES (?, ?, ?)
-            ON CONFLICT(name) DO UPDATE SET
-                role=excluded.role,
-                content=excluded.content
-            """,
-            (name, role, content),
+    def upsert_prompt(self, name: str, role: str, content: str) -> Future:
+        return self._write(
+            lambda conn: conn.execute(
+                """
+                INSERT INTO prompts (name, role, content)
+                VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    role=excluded.role,
+                    content=excluded.content
+                """,
+                (name, role, content),
+            )
         )
-        self.conn.commit()
 
     def delete_prompt(self, name: str) -> bool:
-        cur = self.conn.execute("DELETE FROM prompts WHERE name = ?", (name,))
-        self.conn.commit()
-        return cur.rowcount > 0
+        # 需要返回是否删除成功，等待该写入提交
+        return self._writer.call(
+            lambda conn: conn.execute("DELETE FROM prompts WHERE name = ?", (name,)).rowcount > 0
+        )
 
 
-__all__ = ["Storage"]
+__all__ = ["LogStorage", "MemoryStorage", "Storage"]
@@ -0,0 +1,288 @@
+"""Cold-session archive in a separate SQLite file, attached as ``archive``.
+
+Sessions idle for longer than the archiving policy are moved in bulk from
+the hot DB to ``archive.db``: their messages leave ``messages`` (and with
+them the FTS index, ``session_stats`` and ``contents`` references), so
+startup, cache loading and the hot indexes only see the working set.
+
+``archive.sessions`` keeps the summary columns of ``session_stats`` so the
+session list still shows archived sessions without opening their messages;
+``archive_fts`` is a contentless FTS5 index, so archived messages stay
+searchable without storing their text twice.  Archived bodies are stored
+inline (plain or zlib) and are re-encoded, with deduplication, on restore.
+
+Moves in either direction are two writer jobs — copy, then delete from the
+source — because a transaction spanning attached WAL databases is not
+atomic across files.  A crash in between leaves a session in both files;
+``reconcile`` drops the archived copy on the next start.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from . import codec, contents, search_index, session_stats, token_counts
+
+SCHEMA = "archive"
+FILENAME = "archive.db"
+# 每个写任务搬移的会话数
+BATCH_SIZE = 200
+
+
+def default_path(db_path: str) -> str:
+    return os.path.join(os.path.dirname(db_path), FILENAME)
+
+
+def attach(conn: sqlite3.Connection, path: str, readonly: bool = False) -> None:
+    """Attach ``path`` as ``archive``; read-only connections attach by URI."""
+    target = f"file:{path}?mode=ro" if readonly else path
+    conn.execute(f"ATTACH DATABASE ? AS {SCHEMA}", (target,))
+
+
+def create_archive(conn: sqlite3.Connection, trigram: bool = True) -> None:
+    """Create the archive tables (idempotent)."""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.sessions (
+            session_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            draft TEXT DEFAULT '',
+            created_at TEXT,
+            updated_at TEXT,
+            archived_at TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            token_total INTEGER NOT NULL DEFAULT 0,
+            last_message_at TEXT,
+            last_preview TEXT NOT NULL DEFAULT ''
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.messages (
+            id INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            codec INTEGER NOT NULL DEFAULT 0,
+            content NOT NULL,
+            timestamp TEXT NOT NULL,
+            token_count INTEGER
+        )
+        """
+    )
+    # 早于 token_count 列创建的归档库
+    columns = {row[1] for row in conn.execute(f"PRAGMA {SCHEMA}.table_info(messages)")}
+    if "token_count" not in columns:
+        conn.execute(f"ALTER TABLE {SCHEMA}.messages ADD COLUMN token_count INTEGER")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {SCHEMA}.idx_archive_messages_session ON messages(session_id, id)")
+    exists = conn.execute(f"SELECT 1 FROM {SCHEMA}.sqlite_master WHERE name = 'archive_fts'").fetchone()
+    if exists:
+        return
+    # 与热库使用同一分词器，查询语义一致
+    tokenizer = "trigram" if trigram else "unicode61 remove_diacritics 2"
+    conn.execute(f"CREATE VIRTUAL TABLE {SCHEMA}.archive_fts USING fts5(content, content='', tokenize='{tokenizer}')")
+
+
+def _stage(conn: sqlite3.Connection, session_ids: Iterable[str]) -> None:
+    """Put the ids of one batch in ``temp.archive_batch``."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (session_id TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.archive_batch")
+    conn.executemany("INSERT OR IGNORE INTO temp.archive_batch (session_id) VALUES (?)", ((sid,) for sid in session_ids))
+
+
+_BATCH = "(SELECT session_id FROM temp.archive_batch)"
+
+
+def _drop_archived(conn: sqlite3.Connection) -> None:
+    # contentless FTS5 删除时需要提供原文
+    conn.execute(
+        f"INSERT INTO {SCHEMA}.archive_fts (archive_fts, rowid, content) "
+        f"SELECT 'delete', id, message_text(codec, content) FROM {SCHEMA}.messages WHERE session_id IN {_BATCH}"
+    )
+    conn.execute(f"DELETE FROM {SCHEMA}.messages WHERE session_id IN {_BATCH}")
+    conn.execute(f"DELETE FROM {SCHEMA}.sessions WHERE session_id IN {_BATCH}")
+
+
+def idle_sessions(conn: sqlite3.Connection, cutoff: str, limit: Optional[int] = None) -> List[str]:
+    """Hot sessions whose last activity is older than ``cutoff`` (ISO time)."""
+    rows = conn.execute(
+        "SELECT s.session_id FROM main.sessions s LEFT JOIN main.session_stats st ON st.session_id = s.session_id "
+        "WHERE COALESCE(st.last_message_at, s.updated_at, s.created_at) < ? LIMIT ?",
+        (cutoff, -1 if limit is None else limit),
+    )
+    return [r[0] for r in rows]
+
+
+def copy_to_archive(conn: sqlite3.Connection, session_ids: Sequence[str], now: str) -> None:
+    """Job 1 of archiving: copy sessions, messages and index entries."""
+    _stage(conn, session_ids)
+    # 重跑（上次只完成了第一步）时先清掉旧副本
+    _drop_archived(conn)
+    conn.execute(
+        f"""
+        INSERT INTO {SCHEMA}.sessions (session_id, title, draft, created_at, updated_at, archived_at,
+                                       message_count, token_total, last_message_at, last_preview)
+        SELECT s.session_id, s.title, s.draft, s.created_at, s.updated_at, ?,
+               COALESCE(st.message_count, 0), COALESCE(st.token_total, 0), st.last_message_at,
+               COALESCE(st.last_preview, '')
+        FROM main.sessions s LEFT JOIN main.session_stats st ON st.session_id = s.session_id
+        WHERE s.session_id IN {_BATCH}
+        """,
+        (now,),
+    )
+    # 引用 contents 的消息体就地展开，归档库不依赖热库
+    conn.execute(
+        f"""
+        INSERT INTO {SCHEMA}.messages (id, session_id, role, codec, content, timestamp, token_count)
+        SELECT m.id, m.session_id, m.role,
+               CASE WHEN m.codec = {codec.CODEC_REF} THEN c.codec ELSE m.codec END,
+               CASE WHEN m.codec = {codec.CODEC_REF} THEN c.body ELSE m.content END,
+               m.timestamp, m.token_count
+        FROM main.messages m LEFT JOIN main.contents c ON m.codec = {codec.CODEC_REF} AND c.hash = m.content
+        WHERE m.session_id IN {_BATCH}
+        """
+    )
+    conn.execute(
+        f"INSERT INTO {SCHEMA}.archive_fts (rowid, content) "
+        f"SELECT id, message_text(codec, content) FROM {SCHEMA}.messages WHERE session_id IN {_BATCH}"
+    )
+
+
+def drop_hot(conn: sqlite3.Connection, session_ids: Sequence[str]) -> int:
+    """Job 2 of archiving: delete the copied sessions from the hot DB."""
+    _stage(conn, session_ids)
+    copied = f"(SELECT session_id FROM {SCHEMA}.sessions WHERE session_id IN {_BATCH})"
+    search_index.unindex_encoded(conn, f"m.session_id IN {copied}", [()])
+    conn.execute(f"DELETE FROM main.messages WHERE session_id IN {copied}")
+    n = conn.execute(f"DELETE FROM main.sessions WHERE session_id IN {copied}").rowcount
+    contents.collect(conn)
+    return n
+
+
+def copy_to_hot(
+    conn: sqlite3.Connection,
+    session_ids: Sequence[str],
+    encode: Callable[[codec.Body], contents.Encoded],
+) -> List[Dict[str, Any]]:
+    """Job 1 of restoring: re-insert sessions and messages (keeping ids); return session metadata."""
+    _stage(conn, session_ids)
+    restored = [
+        {"session_id": r[0], "title": r[1], "draft": r[2] or ""}
+        for r in conn.execute(
+            f"SELECT session_id, title, draft FROM {SCHEMA}.sessions s "
+            f"WHERE session_id IN {_BATCH} AND NOT EXISTS (SELECT 1 FROM main.sessions h WHERE h.session_id = s.session_id)"
+        )
+    ]
+    if not restored:
+        return []
+    _stage(conn, [r["session_id"] for r in restored])
+    conn.execute(
+        f"INSERT INTO main.sessions (session_id, title, draft, created_at, updated_at) "
+        f"SELECT session_id, title, draft, created_at, updated_at FROM {SCHEMA}.sessions WHERE session_id IN {_BATCH}"
+    )
+    last = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT id, session_id, role, codec, content, timestamp, token_count FROM {SCHEMA}.messages "
+            f"WHERE session_id IN {_BATCH} AND id > ? ORDER BY id LIMIT 500",
+            (last,),
+        ).fetchall()
+        if not rows:
+            session_stats.fill_previews(conn, [r["session_id"] for r in restored])
+            return restored
+        blobs = []
+        inserts = []
+        for mid, sid, role, enc, content, ts, tokens in rows:
+            body = codec.from_row(enc, content)
+            e = encode(body)
+            if e.blob:
+                blobs.append(e.blob)
+            if tokens is None:
+                tokens = token_counts.estimate(body)
+            inserts.append((mid, sid, role, e.codec, e.content, ts, tokens))
+        contents.insert_blobs(conn, blobs)
+        conn.executemany(
+            "INSERT INTO main.messages (id, session_id, role, codec, content, timestamp, token_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            inserts,
+        )
+        search_index.index_encoded(conn, "m.id = ?", [(i[0],) for i in inserts if i[3] != codec.CODEC_PLAIN])
+        last = rows[-1][0]
+
+
+def drop_archived(conn: sqlite3.Connection, session_ids: Sequence[str]) -> None:
+    """Job 2 of restoring (or deleting an archived session)."""
+    _stage(conn, session_ids)
+    _drop_archived(conn)
+
+
+def reconcile(conn: sqlite3.Connection) -> int:
+    """Drop archived copies of sessions that are also in the hot DB (interrupted move)."""
+    ids = [r[0] for r in conn.execute(f"SELECT a.session_id FROM {SCHEMA}.sessions a JOIN main.sessions s USING (session_id)")]
+    if ids:
+        drop_archived(conn, ids)
+    return len(ids)
+
+
+def clear(conn: sqlite3.Connection) -> None:
+    conn.execute(f"DELETE FROM {SCHEMA}.messages")
+    conn.execute(f"DELETE FROM {SCHEMA}.sessions")
+    conn.execute(f"INSERT INTO {SCHEMA}.archive_fts (archive_fts) VALUES ('delete-all')")
+
+
+def is_archived(conn: sqlite3.Connection, session_id: str) -> bool:
+    return conn.execute(f"SELECT 1 FROM {SCHEMA}.sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+
+def count(conn: sqlite3.Connection) -> int:
+    return conn.execute(f"SELECT COUNT(*) FROM {SCHEMA}.sessions").fetchone()[0]
+
+
+def search(
+    conn: sqlite3.Connection,
+    query: str,
+    limit: int = 20,
+    session_id: Optional[str] = None,
+    trigram: bool = True,
+) -> List[Dict[str, Any]]:
+    """Search archived messages; same result shape as ``search_index.search`` plus ``title``."""
+    match, like_terms = search_index.build_query(query, trigram)
+    if not match and not like_terms:
+        return []
+    text = "message_text(m.codec, m.content)"
+    where: List[str] = []
+    params: List[Any] = []
+    if session_id is not None:
+        where.append("m.session_id = ?")
+        params.append(session_id)
+    for term in like_terms:
+        where.append(f"{text} LIKE ? ESCAPE '\\'")
+        params.append(search_index._like_pattern(term))
+    cols = f"m.id, m.session_id, m.role, {text}, s.title"
+    joins = f"JOIN {SCHEMA}.sessions s ON s.session_id = m.session_id"
+    if match:
+        sql = (
+            f"SELECT {cols}, bm25(archive_fts) FROM {SCHEMA}.archive_fts "
+            f"JOIN {SCHEMA}.messages m ON m.id = archive_fts.rowid {joins} "
+            "WHERE archive_fts MATCH ?" + "".join(f" AND {w}" for w in where) + " ORDER BY 6 LIMIT ?"
+        )
+        rows = conn.execute(sql, (match, *params, limit)).fetchall()
+    else:
+        sql = f"SELECT {cols}, 0.0 FROM {SCHEMA}.messages m {joins} WHERE " + " AND ".join(where) + " ORDER BY m.id DESC LIMIT ?"
+        rows = conn.execute(sql, (*params, limit)).fetchall()
+    # contentless 索引没有 snippet()，在 Python 中截取
+    term = query.split()[0]
+    return [
+        {
+            "session_id": r[1], "message_id": r[0], "role": r[2], "snippet": search_index._snippet(r[3], term),
+            "rank": r[5], "title": r[4], "archived": True,
+        }
+        for r in rows
+    ]
+
+
+__all__ = [
+    "BATCH_SIZE", "FILENAME", "attach", "clear", "copy_to_archive", "copy_to_hot", "count", "create_archive",
+    "default_path", "drop_archived", "drop_hot", "idle_sessions", "is_archived", "reconcile", "search",
+]
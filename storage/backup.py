@@ -0,0 +1,180 @@
+"""Online backups of the SQLite files with the backup API.
+
+A snapshot is a directory ``<backups>/<YYYYmmdd-HHMMSS>/`` holding a copy of
+``data.db`` and, if present, ``archive.db``.  Each file is copied with
+``Connection.backup`` from a dedicated read-only connection, ``pages`` pages
+per step with a ``sleep`` between steps, so the writer thread and the Tk
+thread never wait on it.  The source connection keeps one read transaction
+open for the whole copy: in WAL mode that pins a consistent snapshot, and
+commits made by the writer meanwhile neither block the backup nor restart
+it.
+
+Snapshots are written under a temporary name and renamed when complete;
+``prune`` keeps the newest ``keep``.  ``restore`` copies a snapshot back
+with the same API and must run while no Storage has the files open.
+"""
+from __future__ import annotations
+
+import datetime
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+
+DEFAULT_PAGES = 256
+DEFAULT_SLEEP = 0.005
+DEFAULT_KEEP = 7
+DIRNAME = "backups"
+_STAMP = "%Y%m%d-%H%M%S"
+_PARTIAL = ".partial"
+
+# progress(status, remaining, total)，与 sqlite3.Connection.backup 相同
+BackupProgress = Optional[Callable[[int, int, int], None]]
+
+
+def copy_db(
+    src_path: str,
+    dest_path: str,
+    pages: int = DEFAULT_PAGES,
+    sleep: float = DEFAULT_SLEEP,
+    progress: BackupProgress = None,
+) -> None:
+    """Copy one live database file to ``dest_path`` in paced steps."""
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True, isolation_level=None, check_same_thread=False)
+    try:
+        dst = sqlite3.connect(dest_path)
+        try:
+            # 固定读快照：备份期间写线程的提交不会让备份重新开始
+            src.execute("BEGIN")
+            src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+            src.backup(dst, pages=pages, sleep=sleep, progress=progress)
+            src.execute("COMMIT")
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+
+def snapshot(
+    db_path: str,
+    directory: str,
+    archive_path: Optional[str] = None,
+    pages: int = DEFAULT_PAGES,
+    sleep: float = DEFAULT_SLEEP,
+    progress: BackupProgress = None,
+    keep: Optional[int] = DEFAULT_KEEP,
+) -> str:
+    """Write a new snapshot directory and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    name = datetime.datetime.now().strftime(_STAMP)
+    final = os.path.join(directory, name)
+    n = 1
+    while os.path.exists(final):
+        n += 1
+        final = os.path.join(directory, f"{name}-{n}")
+    tmp = final + _PARTIAL
+    os.makedirs(tmp)
+    try:
+        copy_db(db_path, os.path.join(tmp, os.path.basename(db_path)), pages, sleep, progress)
+        if archive_path and os.path.exists(archive_path):
+            copy_db(archive_path, os.path.join(tmp, os.path.basename(archive_path)), pages, sleep, progress)
+        os.replace(tmp, final)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if keep:
+        prune(directory, keep)
+    return final
+
+
+def list_snapshots(directory: str) -> List[str]:
+    """Complete snapshots, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = [n for n in os.listdir(directory) if not n.endswith(_PARTIAL) and os.path.isdir(os.path.join(directory, n))]
+    return [os.path.join(directory, n) for n in sorted(names)]
+
+
+def prune(directory: str, keep: int) -> List[str]:
+    """Delete all but the newest ``keep`` snapshots (and leftover partial ones); return removed paths."""
+    removed = []
+    snaps = list_snapshots(directory)
+    stale = snaps[:-keep] if keep > 0 else snaps
+    for name in os.listdir(directory):
+        if name.endswith(_PARTIAL):
+            stale.append(os.path.join(directory, name))
+    for path in stale:
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+    return removed
+
+
+def last_snapshot_time(directory: str) -> Optional[float]:
+    snaps = list_snapshots(directory)
+    return os.path.getmtime(snaps[-1]) if snaps else None
+
+
+def restore(snapshot_dir: str, db_path: str, archive_path: Optional[str] = None) -> None:
+    """Overwrite ``db_path`` (and ``archive_path``) with a snapshot.
+
+    Uses the backup API into the target, so a leftover ``-wal`` file is
+    handled by SQLite instead of being mixed with the copied pages.
+    """
+    targets = [db_path] + ([archive_path] if archive_path else [])
+    for target in targets:
+        src_path = os.path.join(snapshot_dir, os.path.basename(target))
+        if not os.path.exists(src_path):
+            continue
+        src = sqlite3.connect(src_path)
+        try:
+            dst = sqlite3.connect(target)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+        finally:
+            src.close()
+
+
+class BackupScheduler:
+    """Background thread calling ``run()`` every ``interval`` seconds.
+
+    The first run is due ``interval`` after ``last`` (the newest snapshot's
+    time), so restarting the app does not take a snapshot each time.
+    """
+
+    def __init__(self, run: Callable[[], object], interval: float, last: Optional[float] = None):
+        self._run = run
+        self.interval = max(1.0, float(interval))
+        self._last = last
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="storage-backup", daemon=True)
+        self.last_error: Optional[BaseException] = None
+
+    def start(self) -> "BackupScheduler":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _loop(self) -> None:
+        delay = 0.0 if self._last is None else max(0.0, self._last + self.interval - time.time())
+        while not self._stop.wait(delay):
+            try:
+                self._run()
+                self.last_error = None
+            except Exception as e:
+                # 备份失败不影响应用，下个周期重试
+                self.last_error = e
+            delay = self.interval
+
+
+__all__ = [
+    "BackupScheduler", "DEFAULT_KEEP", "DEFAULT_PAGES", "DEFAULT_SLEEP", "copy_db", "last_snapshot_time",
+    "list_snapshots", "prune", "restore", "snapshot",
+]
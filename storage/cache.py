@@ -0,0 +1,270 @@
+"""Session cache: eager session metadata, lazily hydrated messages behind an LRU."""
+from __future__ import annotations
+
+import bisect
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .records import MessageRecord
+
+# messages (``MessageRecord``, including their ``id``) as loaded from the messages table
+MessageRows = List[Dict[str, Any]]
+
+_META_KEYS = ("title", "draft")
+
+
+class TrackedList(list):
+    """List that reports in-place mutations to its owning session."""
+
+    def __init__(self, items: Iterable[Any] = (), on_change: Callable[[], None] | None = None):
+        super().__init__(items)
+        self._on_change = on_change
+
+    def _changed(self) -> None:
+        if self._on_change:
+            self._on_change()
+
+
+def _mutator(name: str):
+    base = getattr(list, name)
+
+    def method(self, *args, **kwargs):
+        result = base(self, *args, **kwargs)
+        self._changed()
+        return result
+
+    method.__name__ = name
+    return method
+
+
+for _name in ("append", "extend", "insert", "pop", "remove", "clear", "sort", "reverse",
+              "__setitem__", "__delitem__", "__iadd__", "__imul__"):
+    setattr(TrackedList, _name, _mutator(_name))
+
+
+class SessionRecord(dict):
+    """A cached session dict whose ``messages`` key is loaded on first access.
+
+    Writes to ``title``/``draft``/``messages`` (and in-place edits of the
+    messages list) mark the session dirty so ``Storage.save`` only touches
+    what changed.
+    """
+
+    def __init__(self, cache: "SessionCache", *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._cache = cache
+        # message id -> values last written to the DB
+        self._persisted: Dict[int, Tuple[str, Any, str]] = {}
+
+    def __missing__(self, key: str) -> Any:
+        if key == "messages":
+            return self._cache.hydrate(self["session_id"])["messages"]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        sid = self.get("session_id")
+        if key == "messages":
+            if not (isinstance(value, TrackedList) and value._on_change == self._messages_changed):
+                value = TrackedList(value or [], self._messages_changed)
+            super().__setitem__(key, value)
+            self._messages_changed()
+            if sid in self._cache:
+                self._cache._touch(sid)
+            return
+        super().__setitem__(key, value)
+        if key in _META_KEYS:
+            self._cache._dirty_meta.add(sid)
+
+    def set_persisted(self, key: str, value: Any) -> None:
+        """Update a field that has already been written to the DB."""
+        dict.__setitem__(self, key, value)
+
+    def _messages_changed(self) -> None:
+        self._cache._dirty_messages.add(self.get("session_id"))
+
+    def attach_rows(self, rows: MessageRows) -> None:
+        """Attach messages loaded from the DB without marking them dirty."""
+        self._persisted = {}
+        for msg in rows:
+            self.mark_persisted(msg)
+        dict.__setitem__(self, "messages", TrackedList(rows, self._messages_changed))
+
+    def append_persisted(self, msg: Dict[str, Any]) -> None:
+        """Append a message that has already been written to the DB."""
+        msgs = dict.__getitem__(self, "messages")
+        last = msgs[-1].get("id") if msgs else None
+        if last is not None and last > msg["id"]:
+            # 并发追加时提交顺序可能与调用顺序不同，按 id 插入保持有序
+            list.insert(msgs, bisect.bisect_left(msgs, msg["id"], key=_id_key), msg)
+        else:
+            list.append(msgs, msg)
+        self.mark_persisted(msg)
+
+    def mark_persisted(self, msg: Dict[str, Any]) -> None:
+        self._persisted[msg["id"]] = _snapshot(msg)
+        if type(msg) is MessageRecord:
+            # 之后对消息的原地修改（m["content"] = ...）同样标记会话待保存
+            msg.owner = self._messages_changed
+
+    def message_delta(self) -> Tuple[List[int], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Diff the cached messages against what was last persisted.
+
+        Returns ``(deleted ids, changed msgs, new msgs)``; messages without a
+        known ``id`` are new.
+        """
+        msgs = dict.get(self, "messages") or []
+        current = set()
+        changed = []
+        new = []
+        for m in msgs:
+            snap = self._persisted.get(m.get("id"))
+            if snap is None:
+                new.append(m)
+                continue
+            current.add(m["id"])
+            if snap != _snapshot(m):
+                changed.append(m)
+        deleted = [mid for mid in self._persisted if mid not in current]
+        return deleted, changed, new
+
+    def remove_persisted(self, ids: Iterable[int]) -> None:
+        """Drop messages already deleted from the DB, without marking dirty."""
+        gone = set(ids)
+        for mid in gone:
+            self._persisted.pop(mid, None)
+        msgs = dict.get(self, "messages")
+        if msgs is not None:
+            list.__setitem__(msgs, slice(None), [m for m in msgs if m.get("id") not in gone])
+
+
+def _snapshot(msg: Dict[str, Any]) -> Tuple[str, Any, Any]:
+    # 取原始值：压缩的消息体比较 Packed 对象本身，不触发解压；时间戳不重新格式化
+    if type(msg) is MessageRecord:
+        return (msg.role, msg.body, msg.ts)
+    return (msg.get("role", "assistant"), msg.get("content", ""), msg.get("timestamp", ""))
+
+
+def _id_key(m: Dict[str, Any]) -> float:
+    # 未保存的新消息还没有 id，视为最新
+    mid = m.get("id")
+    return float("inf") if mid is None else mid
+
+
+def slice_messages(
+    msgs: List[Dict[str, Any]],
+    before_id: Optional[int],
+    limit: Optional[int],
+    after_id: Optional[int],
+) -> List[Dict[str, Any]]:
+    """A keyset page (as ``Storage.get_messages``) of a list ordered by message id."""
+    start = 0 if after_id is None else bisect.bisect_right(msgs, after_id, key=_id_key)
+    end = len(msgs) if before_id is None else bisect.bisect_left(msgs, before_id, key=_id_key)
+    if limit is None or end - start <= limit:
+        return list(msgs[start:end])
+    return list(msgs[start:start + limit]) if after_id is not None else list(msgs[end - limit:end])
+
+
+class SessionCache(dict):
+    """``session_id -> session dict`` mapping used as ``Storage.sessions``.
+
+    Every session's metadata (id/title/draft) is kept in memory, but the
+    ``messages`` list is only attached when a session is hydrated.  At most
+    ``capacity`` sessions stay hydrated; the least recently used clean one
+    drops its messages when the limit is exceeded and is reloaded on next
+    access.  Sessions with unsaved changes are never evicted.
+    """
+
+    def __init__(self, loader: Callable[[str], MessageRows], capacity: int = 64):
+        super().__init__()
+        self._loader = loader
+        self.capacity = max(1, int(capacity))
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._dirty_meta: Set[str] = set()
+        self._dirty_messages: Set[str] = set()
+
+    def __setitem__(self, session_id: str, sess: Dict[str, Any]) -> None:
+        # 兼容 Controller 直接写入普通 dict 的用法：整条会话视为待保存
+        record = SessionRecord(self, {k: v for k, v in sess.items() if k != "messages"})
+        record.setdefault("session_id", session_id)
+        super().__setitem__(session_id, record)
+        self._dirty_meta.add(session_id)
+        if "messages" in sess:
+            record["messages"] = sess["messages"]
+        else:
+            self._lru.pop(session_id, None)
+
+    def __delitem__(self, session_id: str) -> None:
+        super().__delitem__(session_id)
+        self._forget(session_id)
+
+    def pop(self, session_id: str, *default: Any) -> Any:
+        self._forget(session_id)
+        return super().pop(session_id, *default)
+
+    def clear(self) -> None:
+        super().clear()
+        self._lru.clear()
+        self._dirty_meta.clear()
+        self._dirty_messages.clear()
+
+    def _forget(self, session_id: str) -> None:
+        self._lru.pop(session_id, None)
+        self._dirty_meta.discard(session_id)
+        self._dirty_messages.discard(session_id)
+
+    def add_meta(self, session_id: str, title: str, draft: str = "", rows: MessageRows | None = None) -> SessionRecord:
+        """Register a persisted session; ``rows`` (if given) hydrates it clean."""
+        sess = SessionRecord(self, session_id=session_id, title=title, draft=draft or "")
+        super().__setitem__(session_id, sess)
+        if rows is not None:
+            sess.attach_rows(rows)
+            self._touch(session_id)
+        return sess
+
+    def is_hydrated(self, session_id: str) -> bool:
+        return session_id in self._lru
+
+    def hydrated_ids(self) -> List[str]:
+        return list(self._lru)
+
+    def is_dirty(self, session_id: str) -> bool:
+        return session_id in self._dirty_meta or session_id in self._dirty_messages
+
+    def take_dirty(self) -> Tuple[Set[str], Set[str]]:
+        """Return and reset the ``(metadata, messages)`` dirty session ids."""
+        meta = {sid for sid in self._dirty_meta if dict.__contains__(self, sid)}
+        msgs = {sid for sid in self._dirty_messages if dict.__contains__(self, sid)}
+        self._dirty_meta = set()
+        self._dirty_messages = set()
+        return meta, msgs
+
+    def restore_dirty(self, meta: Set[str], msgs: Set[str]) -> None:
+        self._dirty_meta |= meta
+        self._dirty_messages |= msgs
+
+    def hydrate(self, session_id: str) -> SessionRecord:
+        """Return the session with its messages loaded, updating LRU order."""
+        sess = dict.__getitem__(self, session_id)
+        if "messages" not in sess:
+            sess.attach_rows(self._loader(session_id))
+        self._touch(session_id)
+        return sess
+
+    def _touch(self, session_id: str) -> None:
+        self._lru[session_id] = None
+        self._lru.move_to_end(session_id)
+        if len(self._lru) <= self.capacity:
+            return
+        for old_id in list(self._lru):
+            if len(self._lru) <= self.capacity:
+                break
+            if old_id == session_id or old_id in self._dirty_messages:
+                continue
+            del self._lru[old_id]
+            old = dict.get(self, old_id)
+            if old is not None:
+                dict.pop(old, "messages", None)
+                old._persisted = {}
+
+
+__all__ = ["SessionCache", "SessionRecord", "TrackedList", "slice_messages"]
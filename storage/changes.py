@@ -0,0 +1,162 @@
+"""Cross-process change detection for the session cache.
+
+Several processes (the desktop app, the relay server, scripts) may open the
+same ``data.db``; each keeps its own ``Storage.sessions`` cache.  Triggers
+append the id of every changed session to ``change_log`` (one row per
+session per transaction), and each process remembers the highest ``seq``
+it has seen.  Polling is cheap: ``PRAGMA data_version`` on a dedicated
+connection only changes when another connection committed, so an idle DB
+costs one pragma per poll and no query.
+
+``ChangeTracker`` runs on the writer thread and records the ``seq`` range
+each of this process's transactions produced, so ``ChangeFeed.poll`` only
+reports changes made elsewhere.  Only the newest ``KEEP`` rows are kept;
+a process that fell further behind reloads all session metadata.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+from typing import List, Optional, Set, Tuple
+
+# 其它进程持有写锁时最多等待的毫秒数
+BUSY_TIMEOUT_MS = 5000
+KEEP = 10000
+_PRUNE_EVERY = 256
+
+_TXN_START = "(SELECT start FROM change_state WHERE id = 0)"
+
+
+def _log(sid: str) -> str:
+    # 同一事务内同一会话只记一行；start 为 NULL（非 Storage 写入）时每行都记录
+    return (
+        f"INSERT INTO change_log (session_id) SELECT {sid} WHERE NOT EXISTS ("
+        f"SELECT 1 FROM change_log WHERE seq > {_TXN_START} AND session_id = {sid})"
+    )
+
+
+_TRIGGERS = (
+    ("change_log_sessions_ai", "AFTER INSERT ON sessions", "new.session_id"),
+    ("change_log_sessions_au", "AFTER UPDATE ON sessions", "new.session_id"),
+    ("change_log_sessions_ad", "AFTER DELETE ON sessions", "old.session_id"),
+    ("change_log_messages_ai", "AFTER INSERT ON messages", "new.session_id"),
+    # 只有可见字段变化才通知（token_count 回填不算）
+    ("change_log_messages_au", "AFTER UPDATE OF session_id, role, codec, content, timestamp ON messages", "new.session_id"),
+    ("change_log_messages_ad", "AFTER DELETE ON messages", "old.session_id"),
+)
+
+
+def create_change_log(conn: sqlite3.Connection) -> None:
+    """Migration: ``change_log``, the per-transaction marker and the logging triggers."""
+    conn.execute("CREATE TABLE IF NOT EXISTS change_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS change_state (id INTEGER PRIMARY KEY CHECK (id = 0), start INTEGER)")
+    conn.execute("INSERT OR IGNORE INTO change_state (id, start) VALUES (0, NULL)")
+    for name, event, sid in _TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER {name} {event} BEGIN {_log(sid)}; END")
+
+
+def high_water(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+
+def mark_start(conn: sqlite3.Connection) -> int:
+    """Start logging each session once for the open transaction; return the current high-water mark."""
+    start = high_water(conn)
+    conn.execute("UPDATE change_state SET start = ? WHERE id = 0", (start,))
+    return start
+
+
+def clear_start(conn: sqlite3.Connection) -> int:
+    """Undo ``mark_start`` before COMMIT; return the transaction's last ``seq``."""
+    conn.execute("UPDATE change_state SET start = NULL WHERE id = 0")
+    return high_water(conn)
+
+
+class ChangeTracker:
+    """Writer-side hooks: remember which ``seq`` values this process wrote."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._own: List[Tuple[int, int]] = []
+        self._start = 0
+        self._pending: Optional[Tuple[int, int]] = None
+        self._commits = 0
+
+    def begin(self, conn: sqlite3.Connection) -> None:
+        """Called right after ``BEGIN IMMEDIATE``."""
+        self._start = mark_start(conn)
+
+    def end(self, conn: sqlite3.Connection) -> None:
+        """Called right before ``COMMIT``."""
+        end = clear_start(conn)
+        self._commits += 1
+        if self._commits % _PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM change_log WHERE seq <= ?", (end - KEEP,))
+        if end > self._start:
+            # 提交前登记：其它线程一旦看到这次提交，范围已经可查
+            self._pending = (self._start + 1, end)
+            with self._lock:
+                self._own.append(self._pending)
+
+    def committed(self, ok: bool) -> None:
+        pending, self._pending = self._pending, None
+        if pending and not ok:
+            with self._lock:
+                self._own.remove(pending)
+
+    def is_own(self, seq: int) -> bool:
+        with self._lock:
+            return any(lo <= seq <= hi for lo, hi in self._own)
+
+    def forget_below(self, seq: int) -> None:
+        with self._lock:
+            self._own = [(lo, hi) for lo, hi in self._own if hi > seq]
+
+
+class ChangeFeed:
+    """Reader side: report sessions changed by other connections since the last poll."""
+
+    def __init__(self, path: str, tracker: ChangeTracker):
+        self._conn = sqlite3.connect(
+            f"file:{path}?mode=ro", uri=True, isolation_level=None, check_same_thread=False,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+        )
+        self._tracker = tracker
+        self._lock = threading.Lock()
+        self._version = self._data_version()
+        self.high_water = high_water(self._conn)
+
+    def _data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def poll(self) -> Optional[Set[str]]:
+        """Ids of sessions changed elsewhere; ``None`` if the log no longer reaches back far enough."""
+        with self._lock:
+            version = self._data_version()
+            if version == self._version:
+                return set()
+            self._version = version
+            oldest = self._conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT seq, session_id FROM change_log WHERE seq > ? ORDER BY seq", (self.high_water,)
+            ).fetchall()
+            missed = oldest is not None and oldest > self.high_water + 1
+            changed = {sid for seq, sid in rows if not self._tracker.is_own(seq)}
+            if rows:
+                self.high_water = rows[-1][0]
+                self._tracker.forget_below(self.high_water)
+            return None if missed else changed
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+
+
+__all__ = [
+    "BUSY_TIMEOUT_MS", "ChangeFeed", "ChangeTracker", "KEEP", "clear_start", "create_change_log", "high_water",
+    "mark_start",
+]
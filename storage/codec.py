@@ -0,0 +1,128 @@
+"""Transparent compression of large message bodies.
+
+Bodies of at least ``threshold`` UTF-8 bytes are stored as zlib BLOBs with
+``messages.codec = 1``; smaller ones stay plain TEXT (``codec = 0``).  The
+SQL function ``message_text(codec, content)`` decodes either form; it is
+used by the ``message_text`` view and by the statements the write jobs run
+to index encoded rows, so connections that read or index decoded text must
+call ``register`` first.  The triggers themselves only use built-in SQL.
+
+In memory a compressed body stays compressed (``Packed``) inside a cached
+message (``storage.records``) and is only decoded when ``content`` is read,
+e.g. when the message is displayed or sent as context.
+"""
+from __future__ import annotations
+
+import sqlite3
+import zlib
+from typing import Any, Dict, Optional, Tuple, Union
+
+CODEC_PLAIN = 0
+CODEC_ZLIB = 1
+# content 列存放 contents 表的 hash（见 storage.contents）
+CODEC_REF = 2
+# 小于该字节数的消息不压缩（压缩收益小，且解压有固定开销）
+DEFAULT_THRESHOLD = 4096
+ZLIB_LEVEL = 6
+
+
+class Packed:
+    """A compressed message body; ``str(packed)`` decodes it."""
+
+    __slots__ = ("codec", "data", "__weakref__")
+
+    def __init__(self, codec: int, data: bytes):
+        self.codec = codec
+        self.data = data
+
+    def __str__(self) -> str:
+        return decode(self.codec, self.data)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Packed) and other.codec == self.codec and other.data == self.data
+
+    def __hash__(self) -> int:
+        return hash((self.codec, self.data))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __repr__(self) -> str:
+        return f"Packed(codec={self.codec}, {len(self.data)} bytes)"
+
+
+Body = Union[str, Packed]
+
+
+def decode(codec: int, content: Any) -> str:
+    if content is None:
+        return ""
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(content).decode("utf-8")
+    return content if isinstance(content, str) else bytes(content).decode("utf-8")
+
+
+def pack(text: Body, threshold: Optional[int] = DEFAULT_THRESHOLD) -> Body:
+    """Return ``text`` as stored in memory: ``Packed`` if above the threshold."""
+    if isinstance(text, Packed) or threshold is None or not text:
+        return text
+    raw = text.encode("utf-8")
+    if len(raw) < threshold:
+        return text
+    data = zlib.compress(raw, ZLIB_LEVEL)
+    # 压缩后没有变小（如已压缩过的随机内容）就按原样存储
+    if len(data) >= len(raw):
+        return text
+    return Packed(CODEC_ZLIB, data)
+
+
+def to_row(body: Body) -> Tuple[int, Any]:
+    """``(codec, content)`` column values for a body."""
+    if isinstance(body, Packed):
+        return body.codec, body.data
+    return CODEC_PLAIN, body
+
+
+def from_row(codec: Optional[int], content: Any) -> Body:
+    if codec and codec != CODEC_PLAIN:
+        return Packed(codec, bytes(content))
+    return content
+
+
+def raw_content(msg: Dict[str, Any]) -> Body:
+    """``content`` as held in memory (``Packed`` stays packed)."""
+    raw = getattr(msg, "raw", None)
+    return raw("content", "") if raw is not None else msg.get("content", "")
+
+
+def register(conn: sqlite3.Connection) -> None:
+    """Define ``message_text(codec, content)`` on a connection."""
+    conn.create_function("message_text", 2, decode, deterministic=True)
+
+
+def compress_existing(conn: sqlite3.Connection, threshold: int, batch: int = 500) -> int:
+    """Compress plain bodies of at least ``threshold`` bytes; return the count."""
+    done = 0
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, content FROM messages WHERE id > ? AND codec = 0 "
+            "AND length(CAST(content AS BLOB)) >= ? ORDER BY id LIMIT ?",
+            (last, threshold, batch),
+        ).fetchall()
+        if not rows:
+            return done
+        updates = []
+        for mid, content in rows:
+            body = pack(content, threshold)
+            if isinstance(body, Packed):
+                updates.append((body.codec, body.data, mid))
+        conn.executemany("UPDATE messages SET codec = ?, content = ? WHERE id = ?", updates)
+        done += len(updates)
+        last = rows[-1][0]
+
+
+__all__ = [
+    "CODEC_PLAIN", "CODEC_REF", "CODEC_ZLIB", "DEFAULT_THRESHOLD", "Packed",
+    "compress_existing", "decode", "from_row", "pack", "raw_content", "register", "to_row",
+]
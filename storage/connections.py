@@ -0,0 +1,115 @@
+"""Connection management for Storage.
+
+One serialized writer (``WriteBehindWriter``) owns the only read-write
+connection.  Every other thread gets its own read-only connection in WAL
+mode, opened on first use, so reads run against the last committed snapshot
+and never wait behind the writer's transaction.  A thread's connection is
+closed when the thread object is garbage collected, so short-lived worker
+threads (one per sent message) do not accumulate open connections.
+
+When an archive file is configured every connection attaches it as
+``archive`` (see ``storage.archive``).
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import weakref
+from typing import List, Optional
+
+from . import archive, changes, codec
+from .writer import WriteBehindWriter
+
+
+def enable_wal(conn: sqlite3.Connection) -> None:
+    try:
+        conn.execute("PRAGMA journal_mode = WAL;")
+    except Exception:
+        pass
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        path: str,
+        write_queue_size: int = 1024,
+        archive_path: Optional[str] = None,
+        tracker: Optional[changes.ChangeTracker] = None,
+    ):
+        self.path = path
+        self.archive_path = archive_path
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.writer = WriteBehindWriter(self._connect_writer, max_queue=write_queue_size, tracker=tracker)
+
+    def _connect_writer(self) -> sqlite3.Connection:
+        # 同一 data.db 可能被多个进程打开（应用 / 中继服务器 / 脚本）
+        conn = sqlite3.connect(self.path, isolation_level=None, timeout=changes.BUSY_TIMEOUT_MS / 1000)
+        enable_wal(conn)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        codec.register(conn)
+        if self.archive_path:
+            archive.attach(conn, self.archive_path)
+        return conn
+
+    def _connect_reader(self) -> sqlite3.Connection:
+        # 只读 + 自动提交：每条 SELECT 都读取最新已提交的快照，不持有长事务
+        conn = sqlite3.connect(
+            f"file:{self.path}?mode=ro",
+            uri=True,
+            isolation_level=None,
+            check_same_thread=False,
+            timeout=changes.BUSY_TIMEOUT_MS / 1000,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON;")
+        codec.register(conn)
+        if self.archive_path:
+            archive.attach(conn, self.archive_path, readonly=True)
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        """Return the calling thread's read-only connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._lock:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("storage is closed")
+                conn = self._connect_reader()
+                self._readers.append(conn)
+            self._local.conn = conn
+            # 线程结束、线程对象被回收时关闭它的只读连接
+            weakref.finalize(threading.current_thread(), self._release, conn)
+        return conn
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            try:
+                self._readers.remove(conn)
+            except ValueError:
+                # 已在 close() 中关闭
+                return
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def open_readers(self) -> int:
+        with self._lock:
+            return len(self._readers)
+
+    def close(self) -> None:
+        self.writer.close()
+        with self._lock:
+            self._closed = True
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+__all__ = ["ConnectionManager", "enable_wal"]
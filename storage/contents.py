@@ -0,0 +1,245 @@
+"""Content-addressed storage of message bodies.
+
+Bodies of at least ``DEDUP_MIN`` UTF-8 bytes are stored once in
+``contents`` (keyed by a 16-byte BLAKE2b hash of the text, optionally
+zlib-compressed) and messages reference them with ``codec = CODEC_REF`` and
+the hash in ``content``.  Triggers keep ``contents.refs`` in step with the
+messages pointing at each row; unreferenced rows are removed by
+``collect``, which write jobs call after deleting or rewriting messages.
+
+``Interner`` makes the session cache share one Python object per distinct
+body: ``Packed`` bodies through a weak-value dict keyed by hash, strings
+through ``sys.intern``.
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import sys
+import threading
+import weakref
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from . import codec
+from .codec import CODEC_PLAIN, CODEC_REF, Body, Packed
+
+# 小于该字节数的消息直接存储在 messages 中：引用本身（hash + 索引）并不更省空间
+DEDUP_MIN = 256
+HASH_BYTES = 16
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=HASH_BYTES).digest()
+
+
+def text_sql(row: str) -> str:
+    """SQL expression for the text of a ``messages`` row (any codec)."""
+    p = f"{row}." if row else ""
+    return (
+        f"(CASE WHEN {p}codec = {CODEC_REF} "
+        f"THEN (SELECT message_text(c.codec, c.body) FROM contents c WHERE c.hash = {p}content) "
+        f"ELSE message_text({p}codec, {p}content) END)"
+    )
+
+
+_REF_TRIGGERS = (
+    f"""
+    CREATE TRIGGER contents_ref_ai AFTER INSERT ON messages
+    WHEN new.codec = {CODEC_REF}
+    BEGIN
+        UPDATE contents SET refs = refs + 1 WHERE hash = new.content;
+    END
+    """,
+    f"""
+    CREATE TRIGGER contents_ref_ad AFTER DELETE ON messages
+    WHEN old.codec = {CODEC_REF}
+    BEGIN
+        UPDATE contents SET refs = refs - 1 WHERE hash = old.content;
+    END
+    """,
+    f"""
+    CREATE TRIGGER contents_ref_au AFTER UPDATE OF codec, content ON messages
+    WHEN old.codec = {CODEC_REF} OR new.codec = {CODEC_REF}
+    BEGIN
+        UPDATE contents SET refs = refs - 1 WHERE old.codec = {CODEC_REF} AND hash = old.content;
+        UPDATE contents SET refs = refs + 1 WHERE new.codec = {CODEC_REF} AND hash = new.content;
+    END
+    """,
+)
+
+
+def create_contents(conn: sqlite3.Connection) -> None:
+    """Migration: ``contents`` table and reference-count triggers."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS contents (
+            hash BLOB PRIMARY KEY,
+            codec INTEGER NOT NULL DEFAULT 0,
+            body NOT NULL,
+            size INTEGER NOT NULL,
+            refs INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """
+    )
+    # 只索引引用数为 0 的行，collect() 无需扫描整张表
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_contents_unreferenced ON contents(hash) WHERE refs <= 0")
+    for name in ("contents_ref_ai", "contents_ref_ad", "contents_ref_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for sql in _REF_TRIGGERS:
+        conn.execute(sql)
+
+
+class Encoded:
+    """Column values for one message body plus its in-memory form."""
+
+    __slots__ = ("codec", "content", "blob", "body")
+
+    def __init__(self, codec_: int, content: Any, blob: Optional[Tuple[bytes, int, Any, int]], body: Body):
+        self.codec = codec_
+        self.content = content
+        # (hash, codec, body, size) for contents，内联存储时为 None
+        self.blob = blob
+        self.body = body
+
+
+def encode(text: Body, compress_threshold: Optional[int], dedup_min: Optional[int] = DEDUP_MIN) -> Encoded:
+    """Decide how a body is stored: inline (plain / zlib) or by reference."""
+    if isinstance(text, Packed):
+        # 缓存中已压缩的消息：复用压缩数据，不再重新压缩
+        if dedup_min is None:
+            return Encoded(text.codec, text.data, None, text)
+        plain = str(text)
+        key = content_hash(plain)
+        return Encoded(CODEC_REF, key, (key, text.codec, text.data, len(plain.encode("utf-8"))), text)
+    raw_len = len(text.encode("utf-8")) if text else 0
+    body = codec.pack(text, compress_threshold)
+    enc, stored = codec.to_row(body)
+    if dedup_min is None or raw_len < dedup_min:
+        return Encoded(enc, stored, None, body)
+    key = content_hash(text)
+    return Encoded(CODEC_REF, key, (key, enc, stored, raw_len), body)
+
+
+def insert_blobs(conn: sqlite3.Connection, blobs: Iterable[Tuple[bytes, int, Any, int]]) -> None:
+    """Store bodies that are not in ``contents`` yet (refs start at 0)."""
+    conn.executemany(
+        "INSERT INTO contents (hash, codec, body, size) VALUES (?, ?, ?, ?) ON CONFLICT(hash) DO NOTHING",
+        blobs,
+    )
+
+
+def collect(conn: sqlite3.Connection) -> int:
+    """Delete bodies no message references any more; return the count."""
+    return conn.execute("DELETE FROM contents WHERE refs <= 0").rowcount
+
+
+def dedup_existing(conn: sqlite3.Connection, dedup_min: int = DEDUP_MIN, batch: int = 500) -> int:
+    """Move inline bodies of at least ``dedup_min`` bytes into ``contents``."""
+    done = 0
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, codec, content FROM messages WHERE id > ? "
+            f"AND (codec = {codec.CODEC_ZLIB} OR (codec = {CODEC_PLAIN} AND length(CAST(content AS BLOB)) >= ?)) "
+            "ORDER BY id LIMIT ?",
+            (last, dedup_min, batch),
+        ).fetchall()
+        if not rows:
+            return done
+        blobs = []
+        updates = []
+        for mid, enc, content in rows:
+            text = codec.decode(enc, content)
+            size = len(text.encode("utf-8"))
+            if size < dedup_min:
+                continue
+            key = content_hash(text)
+            blobs.append((key, enc, content, size))
+            updates.append((CODEC_REF, key, mid))
+        insert_blobs(conn, blobs)
+        conn.executemany("UPDATE messages SET codec = ?, content = ? WHERE id = ?", updates)
+        done += len(updates)
+        last = rows[-1][0]
+
+
+class Interner:
+    """Share one Python object per distinct message body."""
+
+    def __init__(self) -> None:
+        self._packed: "weakref.WeakValueDictionary[bytes, Packed]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def intern(self, body: Body, key: Optional[bytes] = None) -> Body:
+        if isinstance(body, Packed):
+            if key is None:
+                key = body.data
+            with self._lock:
+                existing = self._packed.get(key)
+                if existing is not None:
+                    return existing
+                self._packed[key] = body
+            return body
+        if type(body) is str:
+            return sys.intern(body)
+        return body
+
+    def from_row(self, enc: int, content: Any, body_codec: Optional[int], body: Any) -> Body:
+        """In-memory body for a row read with ``MESSAGE_COLUMNS`` (references resolved by the join)."""
+        if enc == CODEC_REF:
+            if body is None:
+                return ""
+            return self.intern(codec.from_row(body_codec, body), bytes(content))
+        return self.intern(codec.from_row(enc, content))
+
+
+# 读取消息时一并取出被引用的正文
+MESSAGE_COLUMNS = (
+    "m.id, m.role, m.codec, m.content, m.timestamp, m.token_count, c.codec AS body_codec, c.body AS body "
+    f"FROM messages m LEFT JOIN contents c ON m.codec = {CODEC_REF} AND c.hash = m.content"
+)
+
+
+def stats(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """Database-side dedup figures from ``contents``."""
+    distinct, refs, logical, unique, stored = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(refs), 0), COALESCE(SUM(size * refs), 0), "
+        "COALESCE(SUM(size), 0), COALESCE(SUM(length(body)), 0) FROM contents WHERE refs > 0"
+    ).fetchone()
+    return {
+        "distinct_bodies": distinct,
+        "body_refs": refs,
+        "dedup_ratio": (refs / distinct) if distinct else 1.0,
+        "logical_bytes": logical,
+        "unique_bytes": unique,
+        "stored_bytes": stored,
+        "bytes_saved": logical - stored,
+    }
+
+
+def memory_stats(messages: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Bytes held by cached message bodies, counting shared objects once."""
+    total = 0
+    shared = 0
+    seen: Dict[int, None] = {}
+    count = 0
+    for m in messages:
+        count += 1
+        body = codec.raw_content(m)
+        size = sys.getsizeof(body) + (sys.getsizeof(body.data) if isinstance(body, Packed) else 0)
+        total += size
+        if id(body) in seen:
+            continue
+        seen[id(body)] = None
+        shared += size
+    return {
+        "cached_messages": count,
+        "cached_bodies": len(seen),
+        "cache_bytes": shared,
+        "cache_bytes_saved": total - shared,
+    }
+
+
+__all__ = [
+    "DEDUP_MIN", "Encoded", "Interner", "MESSAGE_COLUMNS", "collect", "content_hash", "create_contents",
+    "dedup_existing", "encode", "insert_blobs", "memory_stats", "stats", "text_sql",
+]
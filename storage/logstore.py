@@ -0,0 +1,475 @@
+"""Append-only, log-structured ``StoragePort`` backend.
+
+An alternative to the SQLite ``Storage`` for write-heavy deployments such as
+the relay server: every change is one record appended to the active segment
+file (``00000001.log``, ``00000002.log``, … in ``directory``), with no
+transaction, index update or trigger per message.
+
+Record layout: a header ``(meta_len, body_len, crc32)``, a JSON object
+describing the change (``op`` = ``session``/``msg``/``del``/``drop``/
+``clear``/``prompt``/``prompt_del``/``checkpoint``) and, for messages, the
+raw UTF-8 body.  The CRC covers meta and body.
+
+On open the segments are replayed into the state of ``MemoryStorage`` (this
+class reuses its sessions cache, paging, summaries, search, archive flag and
+prompts).  Message bodies are not kept in memory: each session's index holds
+slotted records whose body is a ``LogBody`` (segment, offset, length),
+read through ``mmap`` when ``content`` is accessed.  A record that fails
+its length or CRC check ends replay of its segment; in the last segment
+(a write torn by a crash) the file is truncated there so appends continue
+from a clean tail.
+
+Updated and deleted messages leave dead bytes behind.  When a segment fills
+up and more than ``compact_ratio`` of the log is dead, a background thread
+rewrites the live state into one new segment that starts with a
+``checkpoint`` record (written to a temporary file, fsynced, then renamed),
+points all bodies at it and removes the old segments.
+
+Appends are written straight to the OS (no user-space buffer), so they
+survive a process crash; ``flush()``/``durable()`` (and ``sync=True`` per
+record) fsync for power loss.  Bodies are readable until ``close()``.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+import weakref
+import zlib
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import codec, records
+from .memory import MemoryStorage, _Row
+from .records import MessageRecord
+
+SUFFIX = ".log"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+# 死数据超过该比例时压缩
+DEFAULT_COMPACT_RATIO = 0.5
+# 后台压缩线程的检查间隔（秒）；段写满时会立即唤醒
+DEFAULT_COMPACT_INTERVAL = 600.0
+_HEADER = struct.Struct("<III")
+
+
+def default_dir() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "log")
+
+
+def _segment_path(directory: str, number: int) -> str:
+    return os.path.join(directory, f"{number:08d}{SUFFIX}")
+
+
+def _fsync_dir(directory: str) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        # Windows 不能打开目录，重命名本身已足够
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def encode_record(meta: Dict[str, Any], body: bytes = b"") -> Tuple[bytes, int]:
+    """``(record bytes, offset of the body within the record)``."""
+    data = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    crc = zlib.crc32(body, zlib.crc32(data))
+    return _HEADER.pack(len(data), len(body), crc) + data + body, _HEADER.size + len(data)
+
+
+class _Segment:
+    """One log file: appended through an unbuffered handle, read through ``mmap``."""
+
+    def __init__(self, directory: str, number: int):
+        self.number = number
+        self.path = _segment_path(directory, number)
+        self.file = open(self.path, "ab", buffering=0)
+        self.size = self.file.seek(0, os.SEEK_END)
+        # mmap 需要可读的句柄
+        self.reader = open(self.path, "rb")
+        self.mm: Optional[mmap.mmap] = None
+
+    def append(self, data: bytes) -> int:
+        """Write ``data`` at the end; return its offset."""
+        offset = self.size
+        view = memoryview(data)
+        while view:
+            view = view[self.file.write(view):]
+        self.size += len(data)
+        return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        if not length:
+            return b""
+        end = offset + length
+        if self.mm is None or end > len(self.mm):
+            # 活动段增长后重新映射
+            if self.mm is not None:
+                self.mm.close()
+            self.mm = mmap.mmap(self.reader.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mm[offset:end]
+
+    def sync(self) -> None:
+        os.fsync(self.file.fileno())
+
+    def truncate(self, size: int) -> None:
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.file.truncate(size)
+        self.size = size
+
+    def close(self) -> None:
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.reader.close()
+        self.file.close()
+
+
+class LogBody(codec.Packed):
+    """A message body stored in a log segment; ``str(body)`` reads it through ``mmap``.
+
+    ``relocate`` repoints it after compaction; ``detach`` copies the text
+    into memory before its segment is removed.
+    """
+
+    __slots__ = ("log", "segment", "offset", "length", "size", "text")
+
+    def __init__(self, log: "LogStorage", segment: _Segment, offset: int, length: int, size: int):
+        super().__init__(codec.CODEC_PLAIN, b"")
+        self.log = log
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        # 整条记录的字节数，用于统计死数据
+        self.size = size
+        self.text: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self.text is not None:
+            return self.text
+        with self.log._lock:
+            return self.segment.read(self.offset, self.length).decode("utf-8")
+
+    def __eq__(self, other: object) -> bool:
+        return self is other
+
+    def __hash__(self) -> int:
+        return id(self)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __repr__(self) -> str:
+        return f"LogBody(segment={self.segment.number}, offset={self.offset}, {self.length} bytes)"
+
+    def relocate(self, segment: _Segment, offset: int, size: int) -> None:
+        self.segment, self.offset, self.size = segment, offset, size
+
+    def detach(self) -> None:
+        if self.text is None:
+            self.text = str(self)
+
+
+def _session_meta(session_id: str, row: _Row) -> Dict[str, Any]:
+    return {
+        "op": "session", "sid": session_id, "title": row.title, "draft": row.draft,
+        "created": row.created_at, "updated": row.updated_at, "archived": row.archived,
+    }
+
+
+class LogStorage(MemoryStorage):
+    """Session/message storage in append-only log segments (same API as ``Storage``)."""
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        cache_size: int = 64,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        compact_ratio: float = DEFAULT_COMPACT_RATIO,
+        compact_interval: Optional[float] = DEFAULT_COMPACT_INTERVAL,
+        sync: bool = False,
+    ):
+        super().__init__(cache_size)
+        self.directory = directory or default_dir()
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_bytes = max(4096, int(segment_bytes))
+        self.compact_ratio = compact_ratio
+        self.sync = sync
+        self._segments: List[_Segment] = []
+        # 仍在使用中的已失效正文：压缩删除旧段前先读入内存
+        self._dead: "weakref.WeakSet[LogBody]" = weakref.WeakSet()
+        self._live_bytes = 0
+        self.recovery: Dict[str, Any] = {"records": 0, "truncated_bytes": 0, "damaged_segments": []}
+        with self._lock:
+            self._replay()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        if compact_interval:
+            self._compactor = threading.Thread(
+                target=self._compact_loop, args=(compact_interval,), name="storage-log-compact", daemon=True
+            )
+            self._compactor.start()
+
+    # ---------- replay / recovery ----------
+    def _segment_numbers(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX + ".tmp"):
+                # 未完成的压缩输出
+                os.remove(os.path.join(self.directory, name))
+            elif name.endswith(SUFFIX) and name[: -len(SUFFIX)].isdigit():
+                numbers.append(int(name[: -len(SUFFIX)]))
+        return sorted(numbers)
+
+    def _replay(self) -> None:
+        messages: Dict[str, Dict[int, MessageRecord]] = {}
+        numbers = self._segment_numbers()
+        for i, number in enumerate(numbers):
+            seg = _Segment(self.directory, number)
+            self._segments.append(seg)
+            good = self._replay_segment(seg, messages)
+            if good < seg.size:
+                if i == len(numbers) - 1:
+                    # 崩溃时写了一半的尾部记录：截断后继续追加
+                    self.recovery["truncated_bytes"] += seg.size - good
+                    seg.truncate(good)
+                else:
+                    self.recovery["damaged_segments"].append(seg.path)
+        for sid, row in self._rows.items():
+            row.messages = sorted(messages.get(sid, {}).values(), key=lambda m: m.id)
+            self._live_bytes += sum(m.body.size for m in row.messages)
+            if not row.archived:
+                self.sessions.add_meta(sid, row.title, row.draft)
+        if not self._segments:
+            self._segments.append(_Segment(self.directory, 1))
+
+    def _replay_segment(self, seg: _Segment, messages: Dict[str, Dict[int, MessageRecord]]) -> int:
+        """Apply the valid records of ``seg``; return the offset where they end."""
+        pos = 0
+        while pos + _HEADER.size <= seg.size:
+            meta_len, body_len, crc = _HEADER.unpack(seg.read(pos, _HEADER.size))
+            end = pos + _HEADER.size + meta_len + body_len
+            if not meta_len or end > seg.size:
+                break
+            data = seg.read(pos + _HEADER.size, meta_len)
+            body_offset = pos + _HEADER.size + meta_len
+            if zlib.crc32(seg.read(body_offset, body_len), zlib.crc32(data)) != crc:
+                break
+            try:
+                meta = json.loads(data)
+            except ValueError:
+                break
+            self._apply(meta, messages, LogBody(self, seg, body_offset, body_len, end - pos))
+            self.recovery["records"] += 1
+            pos = end
+        return pos
+
+    def _apply(self, meta: Dict[str, Any], messages: Dict[str, Dict[int, MessageRecord]], body: LogBody) -> None:
+        op = meta.get("op")
+        sid = meta.get("sid")
+        if op == "msg":
+            row = self._rows.get(sid)
+            if row is None:
+                return
+            msg = records.message(meta["id"], meta["role"], body, meta["ts"], meta.get("tok"))
+            messages.setdefault(sid, {})[msg.id] = msg
+            row.updated_at = meta.get("at", row.updated_at)
+            self._next_id = max(self._next_id, msg.id + 1)
+        elif op == "session":
+            row = self._rows.get(sid) or self._add_row(sid, "", "", meta["created"])
+            row.title, row.draft = meta["title"], meta["draft"]
+            row.created_at, row.updated_at, row.archived = meta["created"], meta["updated"], meta["archived"]
+        elif op == "del":
+            for mid in meta["ids"]:
+                messages.get(sid, {}).pop(mid, None)
+            if sid in self._rows:
+                self._rows[sid].updated_at = meta.get("at", self._rows[sid].updated_at)
+        elif op == "drop":
+            self._rows.pop(sid, None)
+            messages.pop(sid, None)
+        elif op in ("clear", "checkpoint"):
+            self._rows.clear()
+            messages.clear()
+            if op == "checkpoint":
+                self._prompts.clear()
+                self._next_id = max(self._next_id, meta.get("next_id", 1))
+        elif op == "prompt":
+            self._prompts[meta["name"]] = (meta["role"], meta["content"])
+        elif op == "prompt_del":
+            self._prompts.pop(meta["name"], None)
+
+    # ---------- appending ----------
+    def _append(self, meta: Dict[str, Any], body: bytes = b"") -> Tuple[_Segment, int, int]:
+        """Append one record; return ``(segment, body offset, record size)``."""
+        data, body_at = encode_record(meta, body)
+        seg = self._segments[-1]
+        if seg.size and seg.size + len(data) > self.segment_bytes:
+            seg = self._rotate()
+        offset = seg.append(data)
+        if self.sync:
+            seg.sync()
+        return seg, offset + body_at, len(data)
+
+    def _rotate(self) -> _Segment:
+        self._segments[-1].sync()
+        seg = _Segment(self.directory, self._segments[-1].number + 1)
+        self._segments.append(seg)
+        if self.compaction_due():
+            self._wake.set()
+        return seg
+
+    def _kill(self, msgs: List[MessageRecord]) -> None:
+        for m in msgs:
+            if isinstance(m.body, LogBody):
+                self._live_bytes -= m.body.size
+                self._dead.add(m.body)
+
+    # ---------- MemoryStorage persistence hooks ----------
+    def _put_session(self, session_id: str, row: _Row) -> None:
+        self._append(_session_meta(session_id, row))
+
+    def _put_message(
+        self, session_id: str, row: _Row, msg: MessageRecord, old: Optional[MessageRecord] = None
+    ) -> MessageRecord:
+        if old is not None:
+            self._kill([old])
+        raw = str(msg.body).encode("utf-8")
+        meta = {
+            "op": "msg", "sid": session_id, "id": msg.id, "role": msg.role, "ts": msg["timestamp"],
+            "tok": msg.tokens, "at": row.updated_at,
+        }
+        seg, offset, size = self._append(meta, raw)
+        self._live_bytes += size
+        return records.message(msg.id, msg.role, LogBody(self, seg, offset, len(raw), size), msg.ts, msg.tokens)
+
+    def _drop_messages(self, session_id: str, row: _Row, msgs: List[MessageRecord]) -> None:
+        self._append({"op": "del", "sid": session_id, "ids": [m.id for m in msgs], "at": row.updated_at})
+        self._kill(msgs)
+
+    def _drop_session(self, session_id: str, row: _Row) -> None:
+        self._append({"op": "drop", "sid": session_id})
+        self._kill(row.messages)
+
+    def _clear(self, rows: Dict[str, _Row]) -> None:
+        self._append({"op": "clear"})
+        for row in rows.values():
+            self._kill(row.messages)
+
+    def _put_prompt(self, name: str) -> None:
+        role, content = self._prompts[name]
+        self._append({"op": "prompt", "name": name, "role": role, "content": content})
+
+    def _drop_prompt(self, name: str) -> None:
+        self._append({"op": "prompt_del", "name": name})
+
+    # ---------- durability ----------
+    def durable(self) -> Future:
+        self.flush()
+        return super().durable()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            self._segments[-1].sync()
+        return True
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._compactor is not None and self._compactor.is_alive():
+            self._compactor.join()
+        with self._lock:
+            if not self._segments:
+                return
+            self._segments[-1].sync()
+            # 关闭后消息正文不能再读取
+            for seg in self._segments:
+                seg.close()
+            self._segments = []
+
+    # ---------- compaction ----------
+    def log_stats(self) -> Dict[str, Any]:
+        """Segment count, total and live bytes of the log."""
+        with self._lock:
+            total = sum(seg.size for seg in self._segments)
+            return {
+                "segments": len(self._segments),
+                "total_bytes": total,
+                "live_bytes": self._live_bytes,
+                "dead_ratio": 1 - self._live_bytes / total if total else 0.0,
+            }
+
+    def compaction_due(self) -> bool:
+        stats = self.log_stats()
+        return stats["total_bytes"] > self.segment_bytes and stats["dead_ratio"] > self.compact_ratio
+
+    def _compact_loop(self, interval: float) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                if self.compaction_due():
+                    self.compact()
+            except Exception:
+                # 压缩失败不影响写入，旧段保持不变，下次再试
+                pass
+
+    def compact(self) -> int:
+        """Rewrite the live state into one new segment and drop the old ones; return bytes freed."""
+        with self._lock:
+            before = sum(seg.size for seg in self._segments)
+            number = self._segments[-1].number + 1
+            final = _segment_path(self.directory, number)
+            tmp = final + ".tmp"
+            moves: List[Tuple[LogBody, int, int]] = []
+            with open(tmp, "wb") as f:
+                pos = 0
+
+                def write(meta: Dict[str, Any], body: bytes = b"") -> Tuple[int, int]:
+                    nonlocal pos
+                    data, body_at = encode_record(meta, body)
+                    f.write(data)
+                    start, pos = pos, pos + len(data)
+                    return start + body_at, len(data)
+
+                write({"op": "checkpoint", "next_id": self._next_id})
+                for name, (role, content) in self._prompts.items():
+                    write({"op": "prompt", "name": name, "role": role, "content": content})
+                for sid, row in sorted(self._rows.items(), key=lambda item: item[1].seq):
+                    write(_session_meta(sid, row))
+                    for m in row.messages:
+                        meta = {"op": "msg", "sid": sid, "id": m.id, "role": m.role, "ts": m["timestamp"], "tok": m.tokens}
+                        raw = str(m.body).encode("utf-8")
+                        offset, size = write(meta, raw)
+                        if isinstance(m.body, LogBody):
+                            moves.append((m.body, offset, size))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, final)
+            _fsync_dir(self.directory)
+
+            old, self._segments = self._segments, [_Segment(self.directory, number)]
+            new = self._segments[0]
+            for body, offset, size in moves:
+                body.relocate(new, offset, size)
+            self._live_bytes = sum(size for _, _, size in moves)
+            for body in list(self._dead):
+                body.detach()
+            self._dead = weakref.WeakSet()
+            for seg in old:
+                seg.close()
+                os.remove(seg.path)
+            return before - new.size
+
+
+__all__ = ["DEFAULT_COMPACT_RATIO", "DEFAULT_SEGMENT_BYTES", "LogBody", "LogStorage", "default_dir", "encode_record"]
@@ -0,0 +1,243 @@
+"""Free-page reclamation and planner statistics for the SQLite files.
+
+Deleting sessions and messages leaves free pages inside ``data.db``; with
+SQLite's default ``auto_vacuum = NONE`` the file never shrinks.  Both files
+use ``auto_vacuum = INCREMENTAL`` instead: a new file gets it before its
+first page is written (``prepare``), an existing one is rewritten once by
+``VACUUM`` (``convert``) when the app is idle.  After that ``vacuum_step``
+returns free pages to the OS a bounded number at a time.
+
+``MaintenanceScheduler`` wakes every ``interval`` seconds.  Once no write
+has been submitted for ``idle_after`` seconds it reclaims free pages in
+writer jobs of ``step_pages`` pages, stopping as soon as writes resume, and
+every ``optimize_every`` seconds refreshes planner statistics
+(``ANALYZE`` the first time, ``PRAGMA optimize`` afterwards).  ``stats``
+reports file size, free pages and b-tree fragmentation.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Sequence
+
+INCREMENTAL = 2
+_MODES = {0: "none", 1: "full", 2: "incremental"}
+DEFAULT_INTERVAL = 60.0
+DEFAULT_IDLE_AFTER = 30.0
+DEFAULT_STEP_PAGES = 256
+DEFAULT_OPTIMIZE_EVERY = 6 * 3600.0
+# ANALYZE 每个索引最多采样的行数，大库上也能很快完成
+ANALYSIS_LIMIT = 1000
+# 两个回收步骤之间让出写线程的时间
+_STEP_PAUSE = 0.05
+
+Call = Callable[..., Any]
+
+
+def auto_vacuum(conn: sqlite3.Connection, schema: str = "main") -> int:
+    return conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0]
+
+
+def prepare(conn: sqlite3.Connection, schema: str = "main") -> bool:
+    """Select incremental auto-vacuum for a file with no pages yet; return True if set.
+
+    Must run before anything writes the file, including ``journal_mode = WAL``.
+    """
+    if conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]:
+        return False
+    conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+    return True
+
+
+def needs_conversion(conn: sqlite3.Connection, schema: str = "main") -> bool:
+    return auto_vacuum(conn, schema) != INCREMENTAL
+
+
+def convert(conn: sqlite3.Connection, schema: str = "main") -> None:
+    """Rewrite an existing file with incremental auto-vacuum (outside any transaction)."""
+    conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+    conn.execute(f"VACUUM {schema}")
+
+
+def free_pages(conn: sqlite3.Connection, schema: str = "main") -> int:
+    return conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+
+
+def vacuum_step(conn: sqlite3.Connection, schema: str = "main", pages: int = DEFAULT_STEP_PAGES) -> int:
+    """Release up to ``pages`` free pages; return how many were released."""
+    before = free_pages(conn, schema)
+    if auto_vacuum(conn, schema) != INCREMENTAL:
+        return 0
+    # sqlite3 模块只执行语句的第一步，每次 incremental_vacuum 只释放一页
+    for _ in range(min(pages, before)):
+        conn.execute(f"PRAGMA {schema}.incremental_vacuum(1)")
+    return before - free_pages(conn, schema)
+
+
+def optimize(conn: sqlite3.Connection) -> None:
+    """Refresh planner statistics for all attached files."""
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is None:
+        conn.execute("ANALYZE")
+    else:
+        conn.execute("PRAGMA optimize")
+
+
+def reclaim(
+    call: Call,
+    schemas: Sequence[str],
+    step_pages: int = DEFAULT_STEP_PAGES,
+    keep_going: Callable[[], bool] = lambda: True,
+    pause: float = 0.0,
+) -> int:
+    """Convert and shrink ``schemas`` through ``call`` (``WriteBehindWriter.call``); return pages freed.
+
+    ``keep_going`` is checked before every step, so a caller can stop as
+    soon as the app becomes busy.
+    """
+    freed = 0
+    for schema in schemas:
+        if not keep_going():
+            break
+        if call(lambda conn: needs_conversion(conn, schema)):
+            before = call(lambda conn: free_pages(conn, schema))
+            # VACUUM 同时清空了空闲页
+            call(lambda conn: convert(conn, schema), transaction=False)
+            freed += before
+            continue
+        while keep_going():
+            n = call(lambda conn: vacuum_step(conn, schema, step_pages))
+            freed += n
+            if n < step_pages:
+                break
+            if pause:
+                time.sleep(pause)
+    return freed
+
+
+def fragmentation(conn: sqlite3.Connection, schema: str = "main") -> Optional[float]:
+    """Share of b-tree pages not stored right after the previous page of the same b-tree.
+
+    ``None`` when SQLite was built without the ``dbstat`` table.
+    """
+    try:
+        rows = conn.execute("SELECT name, pageno FROM dbstat WHERE schema = ?", (schema,)).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    jumps = 0
+    total = 0
+    prev_name = None
+    prev_page = 0
+    for name, page in rows:
+        if name == prev_name:
+            total += 1
+            if page != prev_page + 1:
+                jumps += 1
+        prev_name, prev_page = name, page
+    return jumps / total if total else 0.0
+
+
+def stats(conn: sqlite3.Connection, schema: str = "main", path: Optional[str] = None) -> Dict[str, Any]:
+    """Size and free-space figures for one attached file."""
+    page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+    page_count = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+    free = free_pages(conn, schema)
+    if path:
+        file_bytes = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    else:
+        file_bytes = page_size * page_count
+    return {
+        "file_bytes": file_bytes,
+        "page_size": page_size,
+        "page_count": page_count,
+        "free_pages": free,
+        "free_bytes": free * page_size,
+        "free_ratio": free / page_count if page_count else 0.0,
+        "auto_vacuum": _MODES.get(auto_vacuum(conn, schema), "unknown"),
+        "fragmentation": fragmentation(conn, schema),
+    }
+
+
+class MaintenanceScheduler:
+    """Background thread running ``reclaim`` and ``optimize`` while the writer is idle.
+
+    Idle means nothing is queued and no job other than the scheduler's own
+    was submitted for ``idle_after`` seconds.
+    """
+
+    def __init__(
+        self,
+        writer: Any,
+        schemas: Sequence[str] = ("main",),
+        interval: float = DEFAULT_INTERVAL,
+        idle_after: float = DEFAULT_IDLE_AFTER,
+        step_pages: int = DEFAULT_STEP_PAGES,
+        optimize_every: float = DEFAULT_OPTIMIZE_EVERY,
+    ):
+        self._writer = writer
+        self.schemas = tuple(schemas)
+        self.interval = max(0.01, float(interval))
+        self.idle_after = max(0.0, float(idle_after))
+        self.step_pages = max(1, int(step_pages))
+        self.optimize_every = float(optimize_every)
+        self._seen_seq = writer.submitted
+        self._seen_at = time.monotonic()
+        self._last_optimize: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="storage-maintenance", daemon=True)
+        self.freed = 0
+        self.last_error: Optional[BaseException] = None
+
+    def start(self) -> "MaintenanceScheduler":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def idle(self) -> bool:
+        if self._stop.is_set():
+            return False
+        seq = self._writer.submitted
+        now = time.monotonic()
+        if seq != self._seen_seq:
+            self._seen_seq, self._seen_at = seq, now
+        return self._writer.pending() == 0 and now - self._seen_at >= self.idle_after
+
+    def _call(self, fn: Callable[[sqlite3.Connection], Any], transaction: bool = True) -> Any:
+        result = self._writer.call(fn, transaction=transaction)
+        # 自己提交的任务不算作应用的写入活动
+        self._seen_seq = self._writer.submitted
+        return result
+
+    def run_once(self) -> int:
+        """One pass while idle: reclaim free pages, then optimize if due; return pages freed."""
+        if not self.idle():
+            return 0
+        freed = reclaim(self._call, self.schemas, self.step_pages, self.idle, _STEP_PAUSE)
+        now = time.monotonic()
+        due = self._last_optimize is None or now - self._last_optimize >= self.optimize_every
+        if due and self.idle():
+            self._call(optimize)
+            self._last_optimize = now
+        return freed
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.freed += self.run_once()
+                self.last_error = None
+            except Exception as e:
+                # 维护失败不影响应用，下个周期重试
+                self.last_error = e
+
+
+__all__ = [
+    "DEFAULT_IDLE_AFTER", "DEFAULT_INTERVAL", "DEFAULT_OPTIMIZE_EVERY", "DEFAULT_STEP_PAGES", "MaintenanceScheduler",
+    "auto_vacuum", "convert", "fragmentation", "free_pages", "needs_conversion", "optimize", "prepare", "reclaim",
+    "stats", "vacuum_step",
+]
@@ -0,0 +1,429 @@
+"""In-memory ``StoragePort`` backend: the ``Storage`` API with nothing on disk.
+
+Sessions, messages and prompts live in dicts guarded by one lock.  Writes
+apply immediately, so ``save()``/``durable()`` return completed futures and
+``flush()`` has nothing to wait for.  The ``sessions`` cache, message ids,
+keyset paging, session summaries, search, archiving and prompts behave like
+the SQLite backend (``tests/test_storage_conformance.py`` runs the same
+checks against both).  Search matches every term as a case-insensitive
+substring, like the trigram index.
+
+Used by tests that do not need a file, by benchmarks to separate engine
+cost from disk cost, and by ``python -m comm.server --memory``.  Every
+change to the stored state goes through a ``_put_*``/``_drop_*`` hook, which
+``storage.logstore`` overrides to persist it.
+"""
+from __future__ import annotations
+
+import datetime
+import threading
+import uuid
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from . import codec, records, search_index, session_stats, token_counts
+from .cache import SessionCache, slice_messages
+from .records import MessageRecord
+
+DEFAULT_PROMPTS = {"default": ("system", "You are a helpful assistant.")}
+
+# list_sessions 的排序键与方向，与 session_stats.SORTS 一致（空值排在最后）
+_SORT_KEYS = {
+    "recent": (lambda s, row: s["last_message_at"] or s["updated_at"] or "", True),
+    "updated": (lambda s, row: s["updated_at"] or "", True),
+    "created": (lambda s, row: row.created_at, True),
+    "title": (lambda s, row: s["title"].lower(), False),
+    "messages": (lambda s, row: s["message_count"], True),
+    "tokens": (lambda s, row: s["token_total"], True),
+}
+
+
+def _utc_now() -> str:
+    return datetime.datetime.now(datetime.UTC).isoformat()
+
+
+def _done(value: Any = None) -> Future:
+    fut: Future = Future()
+    fut.set_result(value)
+    return fut
+
+
+def _copy(msg: MessageRecord) -> MessageRecord:
+    # 缓存中的修改不能影响已“持久化”的消息
+    return MessageRecord(msg.id, msg.role, msg.body, msg.ts, msg.tokens)
+
+
+class _Row:
+    """One stored session (the equivalent of its rows in the SQLite tables)."""
+
+    __slots__ = ("title", "draft", "created_at", "updated_at", "seq", "archived", "messages")
+
+    def __init__(self, title: str, draft: str, now: str, seq: int):
+        self.title = title
+        self.draft = draft
+        self.created_at = now
+        self.updated_at = now
+        self.seq = seq
+        self.archived = False
+        self.messages: List[MessageRecord] = []
+
+
+class MemoryStorage:
+    """Session/message storage held in process memory (same API as ``Storage``)."""
+
+    def __init__(self, cache_size: int = 64):
+        self._lock = threading.RLock()
+        self._rows: Dict[str, _Row] = {}
+        self._prompts: Dict[str, tuple] = dict(DEFAULT_PROMPTS)
+        self._next_id = 1
+        self._seq = 0
+        self.sessions: SessionCache = SessionCache(self._load_messages, cache_size)
+        # 界面当前显示的会话（由 Controller 设置），归档时跳过
+        self.active_session: Optional[str] = None
+
+    # ---------- internals ----------
+    def _load_messages(self, session_id: str) -> List[MessageRecord]:
+        row = self._rows.get(session_id)
+        return [_copy(m) for m in row.messages] if row else []
+
+    def _add_row(self, session_id: str, title: str, draft: str, now: str) -> _Row:
+        self._seq += 1
+        row = self._rows[session_id] = _Row(title, draft, now, self._seq)
+        return row
+
+    def _new_id(self) -> int:
+        msg_id = self._next_id
+        self._next_id += 1
+        return msg_id
+
+    # ---------- persistence hooks (no-ops here, see storage.logstore) ----------
+    def _put_session(self, session_id: str, row: _Row) -> None:
+        """Session metadata (title, draft, times, archived flag) changed."""
+
+    def _put_message(
+        self, session_id: str, row: _Row, msg: MessageRecord, old: Optional[MessageRecord] = None
+    ) -> MessageRecord:
+        """Store ``msg`` (replacing ``old``); return the record to keep in ``row.messages``."""
+        return msg
+
+    def _drop_messages(self, session_id: str, row: _Row, msgs: List[MessageRecord]) -> None:
+        """``msgs`` were deleted from the session."""
+
+    def _drop_session(self, session_id: str, row: _Row) -> None:
+        """The session and its messages were deleted."""
+
+    def _clear(self, rows: Dict[str, _Row]) -> None:
+        """All sessions (``rows``) were deleted."""
+
+    def _put_prompt(self, name: str) -> None:
+        """A prompt was added or changed."""
+
+    def _drop_prompt(self, name: str) -> None:
+        """A prompt was deleted."""
+
+    def _summary(self, session_id: str, row: _Row) -> Dict[str, Any]:
+        last = row.messages[-1] if row.messages else None
+        return {
+            "session_id": session_id,
+            "title": row.title,
+            "message_count": len(row.messages),
+            "token_total": sum(m.tokens or 0 for m in row.messages),
+            "last_message_at": last["timestamp"] if last else None,
+            "last_preview": last["content"][:session_stats.PREVIEW_CHARS] if last else "",
+            "updated_at": row.updated_at,
+            "archived": row.archived,
+        }
+
+    # ---------- durability (nothing to wait for) ----------
+    def durable(self) -> Future:
+        return _done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+    def poll_changes(self) -> set:
+        # 只在本进程内共享，没有其它写入者
+        return set()
+
+    # ---------- sessions ----------
+    def save(self) -> Future:
+        """Apply cached changes to the store (same delta rules as ``Storage.save``)."""
+        with self._lock:
+            meta_ids, msg_ids = self.sessions.take_dirty()
+            now = _utc_now()
+            for sid in meta_ids:
+                sess = self.sessions[sid]
+                row = self._rows.get(sid) or self._add_row(sid, "", "", now)
+                row.title = sess.get("title", "")
+                row.draft = sess.get("draft", "")
+                row.updated_at = now
+                self._put_session(sid, row)
+            for sid in msg_ids:
+                sess = self.sessions[sid]
+                row = self._rows.get(sid)
+                if row is None:
+                    row = self._add_row(sid, sess.get("title", ""), sess.get("draft", ""), now)
+                    self._put_session(sid, row)
+                row.updated_at = now
+                deleted, changed, new = sess.message_delta()
+                stored = {m.id: m for m in row.messages}
+                for mid in deleted:
+                    sess._persisted.pop(mid, None)
+                removed = [stored.pop(mid) for mid in deleted if mid in stored]
+                if removed:
+                    self._drop_messages(sid, row, removed)
+                for m in new:
+                    m["id"] = self._new_id()
+                for m in changed + new:
+                    msg = records.message(
+                        m["id"], m.get("role", "assistant"), codec.raw_content(m), m.get("timestamp", ""),
+                        token_counts.of_message(m),
+                    )
+                    stored[msg.id] = self._put_message(sid, row, msg, stored.get(msg.id))
+                    sess.mark_persisted(m)
+                row.messages = sorted(stored.values(), key=lambda m: m.id)
+            return self.durable()
+
+    def create_session(self, title: str = "New Session") -> str:
+        with self._lock:
+            sid = str(uuid.uuid4())
+            self._put_session(sid, self._add_row(sid, title, "", _utc_now()))
+            self.sessions.add_meta(sid, title, "", rows=[])
+            return sid
+
+    def list_sessions(
+        self,
+        sort: str = "recent",
+        title_filter: Optional[str] = None,
+        min_messages: Optional[int] = None,
+        limit: Optional[int] = None,
+        include_archived: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Session summaries with the same fields, filters and orderings as ``Storage.list_sessions``."""
+        if sort not in _SORT_KEYS:
+            raise ValueError(f"unknown sort: {sort}")
+        key, descending = _SORT_KEYS[sort]
+        with self._lock:
+            items = []
+            for sid, row in self._rows.items():
+                if row.archived and not include_archived:
+                    continue
+                if title_filter and title_filter.lower() not in row.title.lower():
+                    continue
+                summary = self._summary(sid, row)
+                if min_messages is not None and summary["message_count"] < min_messages:
+                    continue
+                items.append((summary, row))
+            # 稳定排序：先按次要键，再按主键
+            items.sort(key=lambda item: item[1].seq, reverse=True)
+            items.sort(key=lambda item: item[1].archived)
+            items.sort(key=lambda item: key(*item), reverse=descending)
+            rows = [summary for summary, _row in items[:limit]]
+            seen = set()
+            for summary in rows:
+                seen.add(summary["session_id"])
+                sess = self.sessions.get(summary["session_id"])
+                if sess is not None:
+                    summary["title"] = sess.get("title", "")
+            for sess in self.sessions.values():
+                if sess["session_id"] in seen or sess["session_id"] in self._rows:
+                    continue
+                summary = session_stats.cached_summary(sess)
+                if title_filter and title_filter.lower() not in summary["title"].lower():
+                    continue
+                if min_messages is not None and summary["message_count"] < min_messages:
+                    continue
+                rows.insert(0, summary)
+            return rows if limit is None else rows[:limit]
+
+    def get_session(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            if session_id in self.sessions or self.restore_session(session_id):
+                return self.sessions.hydrate(session_id)
+            return {"session_id": session_id, "title": "", "messages": [], "draft": ""}
+
+    def get_messages(
+        self,
+        session_id: str,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = 50,
+        after_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            if session_id not in self.sessions and not self.restore_session(session_id):
+                return []
+            if self.sessions.is_hydrated(session_id):
+                return slice_messages(self.sessions[session_id]["messages"], before_id, limit, after_id)
+            row = self._rows.get(session_id)
+            if row is None:
+                return []
+            return [_copy(m) for m in slice_messages(row.messages, before_id, limit, after_id)]
+
+    def append_message(self, session_id: str, role: str, content: str) -> int:
+        with self._lock:
+            if session_id not in self.sessions:
+                if not self.restore_session(session_id):
+                    session_id = self.create_session("Auto")
+            elif self.sessions.is_dirty(session_id):
+                self.save()
+            ts = _utc_now()
+            msg = records.message(self._new_id(), role, content, ts, token_counts.estimate(content))
+            row = self._rows[session_id]
+            row.updated_at = ts
+            row.messages.append(self._put_message(session_id, row, msg))
+            if self.sessions.is_hydrated(session_id):
+                self.sessions[session_id].append_persisted(_copy(msg))
+            return msg.id
+
+    def delete_messages(self, session_id: str, ids: List[int]) -> int:
+        ids = sorted({int(i) for i in ids if i is not None})
+        if not ids:
+            return 0
+        with self._lock:
+            row = self._rows.get(session_id)
+            if row is not None:
+                gone = set(ids)
+                removed = [m for m in row.messages if m.id in gone]
+                row.messages = [m for m in row.messages if m.id not in gone]
+                row.updated_at = _utc_now()
+                self._drop_messages(session_id, row, removed)
+            if self.sessions.is_hydrated(session_id):
+                self.sessions[session_id].remove_persisted(ids)
+            return len(ids)
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self.sessions:
+                row = self._rows.get(session_id)
+                if row is None or not row.archived:
+                    return False
+            row = self._rows.pop(session_id, None)
+            if row is not None:
+                self._drop_session(session_id, row)
+            self.sessions.pop(session_id, None)
+            return True
+
+    def clear_all_sessions(self) -> Future:
+        with self._lock:
+            rows, self._rows = self._rows, {}
+            self._clear(rows)
+            self.sessions.clear()
+            return self.durable()
+
+    def rename_session(self, session_id: str, new_title: str) -> bool:
+        with self._lock:
+            if session_id not in self.sessions and not self.restore_session(session_id):
+                return False
+            row = self._rows.get(session_id)
+            if row is not None:
+                row.title = new_title
+                row.updated_at = _utc_now()
+                self._put_session(session_id, row)
+            self.sessions[session_id].set_persisted("title", new_title)
+            return True
+
+    # ---------- search ----------
+    def search(self, query: str, limit: int = 20, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Messages containing every term (case-insensitive); hot sessions first, then archived.
+
+        Same result shape as ``Storage.search``; ``rank`` is the negated
+        number of term occurrences, so lower is better as with bm25.
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        lowered = [t.lower() for t in terms]
+        hot: List[Dict[str, Any]] = []
+        cold: List[Dict[str, Any]] = []
+        with self._lock:
+            for sid, row in self._rows.items():
+                if session_id is not None and sid != session_id:
+                    continue
+                for m in row.messages:
+                    text = m["content"]
+                    low = text.lower()
+                    if not all(t in low for t in lowered):
+                        continue
+                    hit = {
+                        "session_id": sid, "message_id": m.id, "role": m.role,
+                        "snippet": search_index._snippet(text, terms[0]),
+                        "rank": -float(sum(low.count(t) for t in lowered)),
+                    }
+                    if row.archived:
+                        hit.update(title=row.title, archived=True)
+                        cold.append(hit)
+                    else:
+                        hot.append(hit)
+        for hits in (hot, cold):
+            hits.sort(key=lambda h: (h["rank"], -h["message_id"]))
+        return (hot + cold)[:limit]
+
+    # ---------- archive ----------
+    def archive_idle_sessions(self, days: float, batch: Optional[int] = None) -> int:
+        """Flag sessions idle for more than ``days`` as archived; return the count.
+
+        Same eligibility as ``Storage.archive_idle_sessions``: loaded,
+        unsaved or active sessions stay hot.
+        """
+        cutoff = (datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=days)).isoformat()
+        moved = 0
+        with self._lock:
+            for sid, row in self._rows.items():
+                if row.archived:
+                    continue
+                last = row.messages[-1]["timestamp"] if row.messages else None
+                if (last or row.updated_at or row.created_at) >= cutoff:
+                    continue
+                if sid not in self.sessions or sid == self.active_session:
+                    continue
+                if self.sessions.is_hydrated(sid) or self.sessions.is_dirty(sid):
+                    continue
+                row.archived = True
+                self._put_session(sid, row)
+                self.sessions.pop(sid, None)
+                moved += 1
+        return moved
+
+    def restore_session(self, session_id: str) -> bool:
+        with self._lock:
+            row = self._rows.get(session_id)
+            if session_id in self.sessions or row is None or not row.archived:
+                return False
+            row.archived = False
+            self._put_session(session_id, row)
+            self.sessions.add_meta(session_id, row.title, row.draft)
+            return True
+
+    # ---------- prompts ----------
+    def list_prompts(self) -> List[Dict[str, str]]:
+        with self._lock:
+            return [
+                {"name": name, "role": role, "content": content}
+                for name, (role, content) in sorted(self._prompts.items())
+            ]
+
+    def get_prompt(self, name: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            if name not in self._prompts:
+                return None
+            role, content = self._prompts[name]
+            return {"name": name, "role": role, "content": content}
+
+    def upsert_prompt(self, name: str, role: str, content: str) -> Future:
+        with self._lock:
+            self._prompts[name] = (role, content)
+            self._put_prompt(name)
+            return self.durable()
+
+    def delete_prompt(self, name: str) -> bool:
+        with self._lock:
+            if self._prompts.pop(name, None) is None:
+                return False
+            self._drop_prompt(name)
+            return True
+
+
+__all__ = ["MemoryStorage"]
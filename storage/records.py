@@ -0,0 +1,147 @@
+"""Compact message records held by the session cache.
+
+A cached message used to be a four-entry dict with its own copies of the
+role and ISO timestamp strings.  ``MessageRecord`` keeps the same fields in
+``__slots__``: the role is interned, the body is held as stored (``str`` or
+``codec.Packed``) and a UTC timestamp in the format ``Storage`` writes is
+kept as integer microseconds since the epoch, formatted again on read.
+``tokens`` carries the stored token estimate (``storage.token_counts``); it
+is not one of the mapping keys and is reset when ``content`` changes.
+``owner`` is a callback set by the session cache once the record is
+persisted; assignments call it so in-place edits mark the session dirty.
+Timestamps in any other format (e.g. imported data) stay strings, so every
+value reads back exactly as it was written.
+
+Records support the dict operations the app uses on messages
+(``m['content']``, ``m.get('id')``, assignment, ``dict(m)``, comparison with
+a dict) but are not ``dict`` instances: pass ``dict(m)`` to ``json``.
+"""
+from __future__ import annotations
+
+import datetime
+import sys
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .codec import Body, Packed
+
+_KEYS = ("id", "role", "content", "timestamp")
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def pack_timestamp(value: Any) -> Any:
+    """Integer microseconds for a canonical UTC ISO string, otherwise ``value`` unchanged."""
+    # datetime.now(UTC).isoformat()：25 位（无微秒）或 32 位
+    if type(value) is not str or len(value) not in (25, 32) or not value.endswith("+00:00"):
+        return value
+    try:
+        delta = datetime.datetime.fromisoformat(value) - _EPOCH
+    except ValueError:
+        return value
+    us = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    # 只有能原样还原的字符串才转换（如 "T" 换成空格的写法保持字符串）
+    return us if unpack_timestamp(us) == value else value
+
+
+def unpack_timestamp(value: Any) -> Any:
+    if type(value) is int:
+        return (_EPOCH + datetime.timedelta(microseconds=value)).isoformat()
+    return value
+
+
+class MessageRecord(MutableMapping):
+    """One cached message: ``id``, ``role``, ``content`` and ``timestamp`` in slots.
+
+    ``content`` is decoded on every read when the body is packed; use
+    ``raw('content')`` (or ``codec.raw_content``) for the stored form.  Keys
+    other than the four fields go to a small dict created on first use.
+    """
+
+    __slots__ = ("id", "role", "body", "ts", "tokens", "extra", "owner")
+
+    def __init__(self, msg_id: Optional[int], role: str, body: Body, timestamp: Any, tokens: Optional[int] = None):
+        self.id = msg_id
+        self.role = sys.intern(role) if type(role) is str else role
+        self.body = body
+        self.ts = pack_timestamp(timestamp)
+        self.tokens = tokens
+        self.extra: Optional[Dict[str, Any]] = None
+        self.owner: Optional[Callable[[], None]] = None
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "content":
+            body = self.body
+            return str(body) if isinstance(body, Packed) else body
+        if key == "id":
+            return self.id
+        if key == "role":
+            return self.role
+        if key == "timestamp":
+            return unpack_timestamp(self.ts)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == "content":
+            self.body = value
+            self.tokens = None
+        elif key == "id":
+            self.id = value
+        elif key == "role":
+            self.role = sys.intern(value) if type(value) is str else value
+        elif key == "timestamp":
+            self.ts = pack_timestamp(value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        if self.owner is not None:
+            self.owner()
+
+    def __delitem__(self, key: str) -> None:
+        # 四个基本字段始终存在
+        if self.extra is None or key not in self.extra:
+            raise KeyError(key)
+        del self.extra[key]
+        if self.owner is not None:
+            self.owner()
+
+    def __contains__(self, key: object) -> bool:
+        return key in _KEYS or (self.extra is not None and key in self.extra)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from _KEYS
+        if self.extra:
+            yield from list(self.extra)
+
+    def __len__(self) -> int:
+        return len(_KEYS) + (len(self.extra) if self.extra else 0)
+
+    def __repr__(self) -> str:
+        return f"MessageRecord({dict(self)!r})"
+
+    def copy(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def raw(self, key: str, default: Any = None) -> Any:
+        """The stored value, without decoding (``Packed`` bodies, integer timestamps)."""
+        if key == "content":
+            return self.body
+        if key == "timestamp":
+            return self.ts
+        return self.get(key, default)
+
+
+def message(msg_id: Optional[int], role: str, body: Body, timestamp: Any, tokens: Optional[int] = None) -> MessageRecord:
+    """Build a cached message record."""
+    return MessageRecord(msg_id, role, body, timestamp, tokens)
+
+
+__all__ = ["MessageRecord", "message", "pack_timestamp", "unpack_timestamp"]
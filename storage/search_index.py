@@ -0,0 +1,285 @@
+"""Full-text search over message content (SQLite FTS5).
+
+``messages_fts`` is an external-content FTS5 table over the ``message_text``
+view, so the text is stored once (in ``messages``) and only the inverted
+index is extra.  Triggers keep plain rows (``codec = 0``) in sync with
+``messages``; they use built-in SQL only, so any connection can write
+messages.  Compressed and deduplicated rows need ``message_text()`` to be
+decoded and are (un)indexed by the write jobs with ``index_encoded`` /
+``unindex_encoded``.
+
+Databases created before the index existed are indexed incrementally: rows
+with ``id >= indexed_below`` (in ``search_index_state``) are in the index,
+older rows are added in batches by ``backfill_step`` from newest to oldest.
+The triggers use the same boundary, so a row is never indexed twice or
+removed from the index before it was added.
+"""
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import contents
+from .codec import CODEC_PLAIN
+
+# trigram 分词支持子串匹配，中文无需额外分词；旧版 SQLite 不支持时退回 unicode61
+_TOKENIZERS = ("trigram", "unicode61 remove_diacritics 2")
+TRIGRAM_MIN = 3
+SNIPPET_CHARS = 40
+# 命中数不超过该值时按相关度（bm25）排序，否则按时间倒序
+RANK_WINDOW = 5000
+
+_INDEXED_BELOW = "(SELECT value FROM search_index_state WHERE key = 'indexed_below')"
+
+_TRIGGER_NAMES = ("messages_fts_ai", "messages_fts_ad", "messages_fts_au")
+
+
+def plain_text(row: str) -> str:
+    return f"{row}.content"
+
+
+def decoded_text(row: str) -> str:
+    """Message text for rows that may be compressed (see ``storage.codec``)."""
+    return f"message_text({row}.codec, {row}.content)"
+
+
+def _triggers(text: Callable[[str], str] = plain_text) -> Tuple[str, ...]:
+    return (
+        f"""
+        CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages
+        WHEN new.id >= {_INDEXED_BELOW}
+        BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, {text('new')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages
+        WHEN old.id >= {_INDEXED_BELOW}
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, {text('old')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER messages_fts_au AFTER UPDATE OF content ON messages
+        WHEN old.id >= {_INDEXED_BELOW}
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, {text('old')});
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, {text('new')});
+        END
+        """,
+    )
+
+
+def _plain_triggers() -> Tuple[str, ...]:
+    return (
+        f"""
+        CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages
+        WHEN new.id >= {_INDEXED_BELOW} AND new.codec = {CODEC_PLAIN}
+        BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        f"""
+        CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages
+        WHEN old.id >= {_INDEXED_BELOW} AND old.codec = {CODEC_PLAIN}
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        """,
+        f"""
+        CREATE TRIGGER messages_fts_au AFTER UPDATE OF codec, content ON messages
+        WHEN old.id >= {_INDEXED_BELOW}
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+                SELECT 'delete', old.id, old.content WHERE old.codec = {CODEC_PLAIN};
+            INSERT INTO messages_fts (rowid, content) SELECT new.id, new.content WHERE new.codec = {CODEC_PLAIN};
+        END
+        """,
+    )
+
+
+def use_plain_triggers(conn: sqlite3.Connection) -> None:
+    """Migration: sync triggers without app-defined functions (plain rows only)."""
+    for name in _TRIGGER_NAMES:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for sql in _plain_triggers():
+        conn.execute(sql)
+
+
+def _encoded_rows(where: str) -> str:
+    # 触发器跳过的行（压缩 / 引用），在写线程的连接上解码
+    return (
+        f"SELECT m.id, {contents.text_sql('m')} FROM messages m "
+        f"WHERE {where} AND m.codec != {CODEC_PLAIN} AND m.id >= {_INDEXED_BELOW}"
+    )
+
+
+def index_encoded(conn: sqlite3.Connection, where: str, params: List[Tuple[Any, ...]]) -> None:
+    """Index encoded rows matching ``where`` (alias ``m``), once per parameter tuple; call after writing them."""
+    conn.executemany(f"INSERT INTO messages_fts (rowid, content) {_encoded_rows(where)}", params)
+
+
+def unindex_encoded(conn: sqlite3.Connection, where: str, params: List[Tuple[Any, ...]]) -> None:
+    """Remove encoded rows matching ``where`` from the index; call before deleting or rewriting them."""
+    conn.executemany(
+        f"INSERT INTO messages_fts (messages_fts, rowid, content) SELECT 'delete', * FROM ({_encoded_rows(where)})",
+        params,
+    )
+
+
+def use_decoded_text(conn: sqlite3.Connection, text: Callable[[str], str] = decoded_text) -> None:
+    """Point the content view and sync triggers at the decoded message text."""
+    conn.execute("DROP VIEW IF EXISTS message_text")
+    conn.execute(f"CREATE VIEW message_text (id, content) AS SELECT id, {text('messages')} FROM messages")
+    for name in _TRIGGER_NAMES:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for sql in _triggers(text):
+        conn.execute(sql)
+
+
+def create_search_index(conn: sqlite3.Connection) -> None:
+    """Migration: FTS5 table, sync triggers and backfill bookkeeping."""
+    conn.execute("CREATE VIEW IF NOT EXISTS message_text (id, content) AS SELECT id, content FROM messages")
+    error: Optional[Exception] = None
+    for tokenizer in _TOKENIZERS:
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE messages_fts USING fts5("
+                f"content, content='message_text', content_rowid='id', tokenize='{tokenizer}')"
+            )
+            error = None
+            break
+        except sqlite3.OperationalError as e:
+            error = e
+    if error is not None:
+        raise error
+
+    conn.execute("CREATE TABLE IF NOT EXISTS search_index_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    # 迁移前已有的消息留给后台回填，之后写入的消息由触发器直接索引
+    conn.execute(
+        "INSERT OR REPLACE INTO search_index_state (key, value) "
+        "SELECT 'indexed_below', COALESCE(MAX(id), 0) + 1 FROM messages"
+    )
+    # 迁移运行在事务内，不能用 executescript（它会先提交）
+    for sql in _triggers():
+        conn.execute(sql)
+
+
+def backfill_pending(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT value FROM search_index_state WHERE key = 'indexed_below'").fetchone()
+    return bool(row) and row[0] > 1
+
+
+def backfill_step(conn: sqlite3.Connection, batch: int = 5000) -> bool:
+    """Index the next ``batch`` ids below the boundary; return True if more remain."""
+    row = conn.execute("SELECT value FROM search_index_state WHERE key = 'indexed_below'").fetchone()
+    below = row[0] if row else 1
+    if below <= 1:
+        return False
+    low = max(1, below - batch)
+    conn.execute(
+        "INSERT INTO messages_fts (rowid, content) SELECT id, content FROM message_text WHERE id >= ? AND id < ?",
+        (low, below),
+    )
+    conn.execute("UPDATE search_index_state SET value = ? WHERE key = 'indexed_below'", (low,))
+    return low > 1
+
+
+def uses_trigram(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+    return bool(row) and "trigram" in (row[0] or "")
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _snippet(content: str, term: str) -> str:
+    """Python-side snippet for rows matched by LIKE only."""
+    pos = content.lower().find(term.lower())
+    if pos < 0:
+        return content[:SNIPPET_CHARS]
+    start = max(0, pos - SNIPPET_CHARS // 2)
+    end = min(len(content), pos + len(term) + SNIPPET_CHARS // 2)
+    text = content[start:pos] + "[" + content[pos:pos + len(term)] + "]" + content[pos + len(term):end]
+    return ("…" if start > 0 else "") + text + ("…" if end < len(content) else "")
+
+
+def build_query(query: str, trigram: bool) -> Tuple[str, List[str]]:
+    """Split user input into an FTS5 MATCH expression and LIKE-only terms.
+
+    Every term is quoted, so FTS5 operators typed by the user are treated
+    as text.  With the trigram tokenizer terms shorter than three characters
+    cannot be matched by the index and are filtered with LIKE instead.
+    """
+    match_terms: List[str] = []
+    like_terms: List[str] = []
+    for term in query.split():
+        if trigram and len(term) < TRIGRAM_MIN:
+            like_terms.append(term)
+        else:
+            match_terms.append('"' + term.replace('"', '""') + '"')
+    return " ".join(match_terms), like_terms
+
+
+def search(
+    conn: sqlite3.Connection,
+    query: str,
+    limit: int = 20,
+    session_id: Optional[str] = None,
+    trigram: bool = True,
+) -> List[Dict[str, Any]]:
+    match, like_terms = build_query(query, trigram)
+    if not match and not like_terms:
+        return []
+    params: List[Any] = []
+    where: List[str] = []
+    if session_id is not None:
+        where.append("m.session_id = ?")
+        params.append(session_id)
+    for term in like_terms:
+        where.append(f"{contents.text_sql('m')} LIKE ? ESCAPE '\\'")
+        params.append(_like_pattern(term))
+
+    if match:
+        # bm25 需要遍历全部命中行；命中过多时（高频词）改为按最新消息返回，
+        # 按 rowid 倒序时 FTS5 可以边读边停，不受命中数影响
+        probe = conn.execute(
+            "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rowid DESC LIMIT ?",
+            (match, RANK_WINDOW + 1),
+        ).fetchall()
+        ranked = len(probe) <= RANK_WINDOW
+        order = "messages_fts.rank" if ranked else "messages_fts.rowid DESC"
+        sql = (
+            "SELECT m.id, m.session_id, m.role, "
+            "snippet(messages_fts, 0, '[', ']', '…', 32) AS snippet, "
+            + ("messages_fts.rank" if ranked else "0.0")
+            + " FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ?"
+            + "".join(f" AND {w}" for w in where)
+            + f" ORDER BY {order} LIMIT ?"
+        )
+        rows = conn.execute(sql, (match, *params, limit)).fetchall()
+        return [
+            {"session_id": r[1], "message_id": r[0], "role": r[2], "snippet": r[3], "rank": r[4]}
+            for r in rows
+        ]
+
+    # 只有短词：无法走索引，按最新消息倒序扫描，命中 limit 条即停止
+    sql = (
+        f"SELECT m.id, m.session_id, m.role, {contents.text_sql('m')} FROM messages m WHERE "
+        + " AND ".join(where)
+        + " ORDER BY m.id DESC LIMIT ?"
+    )
+    rows = conn.execute(sql, (*params, limit)).fetchall()
+    return [
+        {"session_id": r[1], "message_id": r[0], "role": r[2], "snippet": _snippet(r[3], like_terms[0]), "rank": 0.0}
+        for r in rows
+    ]
+
+
+__all__ = [
+    "create_search_index", "backfill_pending", "backfill_step", "build_query", "index_encoded", "search",
+    "unindex_encoded", "use_decoded_text", "use_plain_triggers", "uses_trigram",
+]
@@ -0,0 +1,282 @@
+"""Per-session aggregates kept in ``session_stats`` by triggers.
+
+Message count, estimated token total, last activity and a preview of the
+last message are updated incrementally on every insert/update/delete of
+``messages``, so listing and sorting sessions never scans message rows.
+The triggers only read plain bodies (``codec = 0``); for sessions whose
+last message is encoded the write jobs fill in ``last_preview`` with
+``fill_previews``.
+"""
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import contents
+from .codec import CODEC_PLAIN
+
+PREVIEW_CHARS = 80
+
+
+def token_estimate_sql(col: str) -> str:
+    """SQL expression approximating ``TokenCalculator.estimate_tokens``.
+
+    Pure SQL so the triggers work on any connection (no app-defined
+    function needed): characters taking 3 UTF-8 bytes are counted as CJK
+    (2.5 tokens each), everything else as 1/4 token.
+    """
+    chars = f"length({col})"
+    wide = f"((length(CAST({col} AS BLOB)) - length({col})) / 2)"
+    return (
+        f"(CASE WHEN {col} IS NULL OR {col} = '' THEN 0 "
+        f"ELSE MAX(1, CAST({wide} * 2.5 + ({chars} - {wide}) / 4.0 + 0.5 AS INTEGER)) END)"
+    )
+
+
+_LAST_MESSAGE = (
+    "(SELECT {col} FROM messages WHERE session_id = {sid} ORDER BY id DESC LIMIT 1)"
+)
+
+
+def _last(col: str, sid: str) -> str:
+    return _LAST_MESSAGE.format(col=col, sid=sid)
+
+
+def plain_text(row: str) -> str:
+    return f"{row}.content" if row else "content"
+
+
+def decoded_text(row: str) -> str:
+    """Message text for rows that may be compressed (see ``storage.codec``)."""
+    prefix = f"{row}." if row else ""
+    return f"message_text({prefix}codec, {prefix}content)"
+
+
+def plain_only(row: str) -> str:
+    """Text of plain rows, ``''`` for encoded ones (no app-defined function needed)."""
+    prefix = f"{row}." if row else ""
+    return f"(CASE WHEN {prefix}codec = {CODEC_PLAIN} THEN {prefix}content ELSE '' END)"
+
+
+def _tokens(text: Callable[[str], str], row: str, counted: bool) -> str:
+    estimate = token_estimate_sql(text(row))
+    # 有 token_count 列时优先使用写入时计算好的值（见 storage.token_counts）
+    return f"COALESCE({row}.token_count, {estimate})" if counted else estimate
+
+
+def _triggers(text: Callable[[str], str] = plain_text, counted: bool = False, builtin: bool = False) -> Tuple[str, ...]:
+    preview = f"substr({text('')}, 1, {PREVIEW_CHARS})"
+    updated_columns = "content, timestamp, token_count" if counted else "content, timestamp"
+    refresh_preview = "last_message_id = new.id"
+    if builtin:
+        updated_columns = "codec, " + updated_columns
+        # 只回填 token_count 时保留 fill_previews 写入的预览
+        refresh_preview += " AND (new.codec IS NOT old.codec OR new.content IS NOT old.content)"
+    return (
+        """
+        CREATE TRIGGER session_stats_session_ai AFTER INSERT ON sessions
+        BEGIN
+            INSERT OR IGNORE INTO session_stats (session_id) VALUES (new.session_id);
+        END
+        """,
+        f"""
+        CREATE TRIGGER session_stats_ai AFTER INSERT ON messages
+        BEGIN
+            INSERT OR IGNORE INTO session_stats (session_id) VALUES (new.session_id);
+            UPDATE session_stats SET
+                message_count = message_count + 1,
+                token_total = token_total + {_tokens(text, 'new', counted)},
+                last_message_id = CASE WHEN new.id >= COALESCE(last_message_id, 0) THEN new.id ELSE last_message_id END,
+                last_message_at = CASE WHEN new.id >= COALESCE(last_message_id, 0) THEN new.timestamp ELSE last_message_at END,
+                last_preview = CASE WHEN new.id >= COALESCE(last_message_id, 0)
+                    THEN substr({text('new')}, 1, {PREVIEW_CHARS}) ELSE last_preview END
+            WHERE session_id = new.session_id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER session_stats_ad AFTER DELETE ON messages
+        BEGIN
+            UPDATE session_stats SET
+                message_count = message_count - 1,
+                token_total = token_total - {_tokens(text, 'old', counted)}
+            WHERE session_id = old.session_id;
+            -- 删除的是最后一条消息时，沿 idx_messages_session 取新的最后一条
+            UPDATE session_stats SET
+                last_message_id = {_last('id', 'old.session_id')},
+                last_message_at = {_last('timestamp', 'old.session_id')},
+                last_preview = COALESCE({_last(preview, 'old.session_id')}, '')
+            WHERE session_id = old.session_id AND last_message_id = old.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER session_stats_au AFTER UPDATE OF {updated_columns} ON messages
+        BEGIN
+            UPDATE session_stats SET
+                token_total = token_total - {_tokens(text, 'old', counted)} + {_tokens(text, 'new', counted)},
+                last_message_at = CASE WHEN last_message_id = new.id THEN new.timestamp ELSE last_message_at END,
+                last_preview = CASE WHEN {refresh_preview}
+                    THEN substr({text('new')}, 1, {PREVIEW_CHARS}) ELSE last_preview END
+            WHERE session_id = new.session_id;
+        END
+        """,
+    )
+
+
+_TRIGGER_NAMES = ("session_stats_session_ai", "session_stats_ai", "session_stats_ad", "session_stats_au")
+
+
+def _create_triggers(conn: sqlite3.Connection, text: Callable[[str], str], counted: bool = False, builtin: bool = False) -> None:
+    for name in _TRIGGER_NAMES:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for sql in _triggers(text, counted, builtin):
+        conn.execute(sql)
+
+
+def use_decoded_text(conn: sqlite3.Connection, text: Callable[[str], str] = decoded_text, counted: bool = False) -> None:
+    """Recreate the triggers to read the decoded message text (and ``token_count`` if ``counted``)."""
+    _create_triggers(conn, text, counted)
+
+
+def use_plain_triggers(conn: sqlite3.Connection) -> None:
+    """Migration: triggers without app-defined functions (encoded bodies count via ``token_count``)."""
+    _create_triggers(conn, plain_only, counted=True, builtin=True)
+
+
+def fill_previews(conn: sqlite3.Connection, session_ids: Iterable[str]) -> None:
+    """Set ``last_preview`` of sessions whose last message is encoded (the triggers leave it empty)."""
+    conn.executemany(
+        f"""
+        UPDATE session_stats SET last_preview = COALESCE(
+            (SELECT substr({contents.text_sql('m')}, 1, {PREVIEW_CHARS}) FROM messages m
+             WHERE m.id = session_stats.last_message_id AND m.codec != {CODEC_PLAIN}), '')
+        WHERE session_id = ? AND last_preview = ''
+        """,
+        [(sid,) for sid in set(session_ids)],
+    )
+
+
+def create_session_stats(conn: sqlite3.Connection) -> None:
+    """Migration: ``session_stats`` table, triggers and a one-off backfill.
+
+    Rebuilds from scratch if the objects already exist, so rerunning it
+    (e.g. after ``user_version`` was lowered) recomputes the aggregates.
+    """
+    for name in _TRIGGER_NAMES:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS session_stats")
+    conn.execute(
+        """
+        CREATE TABLE session_stats (
+            session_id TEXT PRIMARY KEY REFERENCES sessions(session_id) ON DELETE CASCADE,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            token_total INTEGER NOT NULL DEFAULT 0,
+            last_message_id INTEGER,
+            last_message_at TEXT,
+            last_preview TEXT NOT NULL DEFAULT ''
+        )
+        """
+    )
+    conn.execute("CREATE INDEX idx_session_stats_last_message_at ON session_stats(last_message_at)")
+    # 已有数据：一次 GROUP BY 扫描计算聚合值
+    conn.execute(
+        f"""
+        INSERT INTO session_stats (session_id, message_count, token_total)
+        SELECT s.session_id, COUNT(m.id), COALESCE(SUM({token_estimate_sql('m.content')}), 0)
+        FROM sessions s LEFT JOIN messages m ON m.session_id = s.session_id
+        GROUP BY s.session_id
+        """
+    )
+    conn.execute(
+        f"""
+        UPDATE session_stats SET
+            last_message_id = {_last('id', 'session_stats.session_id')},
+            last_message_at = {_last('timestamp', 'session_stats.session_id')},
+            last_preview = COALESCE({_last(f'substr(content, 1, {PREVIEW_CHARS})', 'session_stats.session_id')}, '')
+        WHERE message_count > 0
+        """
+    )
+    _create_triggers(conn, plain_text)
+
+
+# list_sessions 支持的排序方式
+SORTS = {
+    "recent": "COALESCE(last_message_at, updated_at) DESC",
+    "updated": "updated_at DESC",
+    "created": "created_at DESC",
+    "title": "title COLLATE NOCASE ASC",
+    "messages": "message_count DESC",
+    "tokens": "token_total DESC",
+}
+
+_HOT = (
+    "SELECT s.session_id, s.title, s.created_at, s.updated_at, "
+    "COALESCE(st.message_count, 0) AS message_count, COALESCE(st.token_total, 0) AS token_total, "
+    "st.last_message_at, COALESCE(st.last_preview, '') AS last_preview, 0 AS archived, s.rowid AS seq "
+    "FROM sessions s LEFT JOIN session_stats st ON st.session_id = s.session_id"
+)
+# 归档会话的汇总列在归档时从 session_stats 复制（见 storage.archive）
+_ARCHIVED = (
+    "SELECT session_id, title, created_at, updated_at, message_count, token_total, "
+    "last_message_at, last_preview, 1, 0 FROM archive.sessions"
+)
+
+
+def list_query(
+    sort: str = "recent",
+    title_filter: Optional[str] = None,
+    min_messages: Optional[int] = None,
+    limit: Optional[int] = None,
+    include_archived: bool = False,
+) -> Tuple[str, List[Any]]:
+    if sort not in SORTS:
+        raise ValueError(f"unknown sort: {sort}")
+    source = _HOT + (" UNION ALL " + _ARCHIVED if include_archived else "")
+    sql = f"SELECT * FROM ({source})"
+    where: List[str] = []
+    params: List[Any] = []
+    if title_filter:
+        escaped = title_filter.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where.append("title LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    if min_messages is not None:
+        where.append("message_count >= ?")
+        params.append(min_messages)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {SORTS[sort]}, archived, seq DESC LIMIT ?"
+    params.append(-1 if limit is None else limit)
+    return sql, params
+
+
+def cached_summary(sess: Dict[str, Any]) -> Dict[str, Any]:
+    """Summary of a session that so far exists only in the cache (not saved yet)."""
+    msgs = dict.get(sess, "messages") or []
+    return {
+        "session_id": sess["session_id"],
+        "title": sess.get("title", ""),
+        "message_count": len(msgs),
+        "token_total": 0,
+        "last_message_at": msgs[-1].get("timestamp") if msgs else None,
+        "last_preview": msgs[-1].get("content", "")[:PREVIEW_CHARS] if msgs else "",
+        "updated_at": None,
+        "archived": False,
+    }
+
+
+def row_to_summary(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "session_id": row["session_id"],
+        "title": row["title"],
+        "message_count": row["message_count"],
+        "token_total": row["token_total"],
+        "last_message_at": row["last_message_at"],
+        "last_preview": row["last_preview"],
+        "updated_at": row["updated_at"],
+        "archived": bool(row["archived"]),
+    }
+
+
+__all__ = [
+    "cached_summary", "create_session_stats", "fill_previews", "list_query", "row_to_summary", "token_estimate_sql",
+    "use_decoded_text", "use_plain_triggers", "SORTS",
+]
@@ -0,0 +1,74 @@
+"""Per-message token estimates stored in ``messages.token_count``.
+
+``TokenCalculator.estimate_tokens`` makes three regex passes over a
+message.  Storage runs it once when a message is written (append, save,
+import, restore from the archive), stores the result in the column and
+keeps it on the cached ``MessageRecord``, so context budgeting only sums
+integers.  ``session_stats.token_total`` adds up the same values.
+
+Rows written before the column existed hold ``NULL`` until
+``backfill_step`` reaches them on a background thread; until then they are
+estimated when read (``of_message``) and by the SQL approximation in
+``session_stats``.
+"""
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Dict
+
+from token_calculator import TokenCalculator
+
+from . import codec, contents, session_stats
+from .codec import Body
+from .records import MessageRecord
+
+BATCH_SIZE = 2000
+
+
+def estimate(body: Body) -> int:
+    """Token estimate of a message body (``Packed`` bodies are decoded once)."""
+    return TokenCalculator.estimate_tokens(str(body)) if body else 0
+
+
+def of_message(msg: Dict[str, Any]) -> int:
+    """Stored estimate of a cached message; computed (and kept) if missing."""
+    n = getattr(msg, "tokens", None)
+    if n is None:
+        n = estimate(codec.raw_content(msg))
+        if type(msg) is MessageRecord:
+            msg.tokens = n
+    return n
+
+
+def create_token_counts(conn: sqlite3.Connection) -> None:
+    """Migration: the ``token_count`` column and stats triggers that use it.
+
+    Existing rows keep ``NULL``; ``backfill_step`` fills them later so the
+    upgrade itself stays fast.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "token_count" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN token_count INTEGER")
+    # 只索引待回填的行，回填完成后索引为空
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_token_pending ON messages(id) WHERE token_count IS NULL")
+    session_stats.use_decoded_text(conn, contents.text_sql, counted=True)
+
+
+def backfill_pending(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM messages WHERE token_count IS NULL LIMIT 1").fetchone() is not None
+
+
+def backfill_step(conn: sqlite3.Connection, batch: int = BATCH_SIZE) -> bool:
+    """Fill ``token_count`` for the next ``batch`` rows; return True if more remain."""
+    rows = conn.execute(
+        f"SELECT {contents.MESSAGE_COLUMNS} WHERE m.token_count IS NULL ORDER BY m.id LIMIT ?", (batch,)
+    ).fetchall()
+    updates = []
+    for mid, _role, enc, content, _ts, _tokens, body_codec, body in rows:
+        text = codec.decode(body_codec, body) if enc == codec.CODEC_REF else codec.decode(enc, content)
+        updates.append((estimate(text), mid))
+    conn.executemany("UPDATE messages SET token_count = ? WHERE id = ?", updates)
+    return len(rows) == batch
+
+
+__all__ = ["BATCH_SIZE", "backfill_pending", "backfill_step", "create_token_counts", "estimate", "of_message"]
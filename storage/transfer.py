@@ -0,0 +1,456 @@
+"""Streaming JSONL export / import and legacy ``data.json`` import.
+
+Export writes one JSON record per line: a ``session`` header followed by
+its ``message`` records, so neither side ever holds more than one record
+(or, for legacy ``data.json``, one session) in memory::
+
+    {"type": "session", "session_id": "...", "title": "...", "draft": "", "created_at": "...", "updated_at": "..."}
+    {"type": "message", "session_id": "...", "role": "user", "content": "...", "timestamp": "..."}
+
+Import also accepts session lines carrying an inline ``messages`` list.
+Records are applied in batches with ``executemany``; each batch commits
+together with its position in ``import_progress``, so an interrupted import
+resumes after the last committed batch.  Sessions that already exist in
+the DB are skipped (with their messages), which makes re-importing the same
+file harmless.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import uuid
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Sequence, Tuple
+
+from . import changes, codec, contents, search_index, session_stats, token_counts
+
+BATCH_SIZE = 1000
+_CHUNK = 1 << 16
+
+
+def create_import_progress(conn: sqlite3.Connection) -> None:
+    """Migration: bookkeeping for resumable imports."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT PRIMARY KEY,
+            position INTEGER NOT NULL DEFAULT 0,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            messages INTEGER NOT NULL DEFAULT 0,
+            current_session TEXT,
+            current_accepted INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+
+
+class Progress:
+    """Snapshot passed to progress callbacks (``done``/``total`` in bytes)."""
+
+    __slots__ = ("done", "total", "sessions", "messages")
+
+    def __init__(self, done: int, total: int, sessions: int, messages: int):
+        self.done = done
+        self.total = total
+        self.sessions = sessions
+        self.messages = messages
+
+    @property
+    def fraction(self) -> float:
+        return min(1.0, self.done / self.total) if self.total else 1.0
+
+
+ProgressFn = Optional[Callable[[Progress], None]]
+
+
+class Batch:
+    """Parsed records ready to be written by ``apply_batch``."""
+
+    __slots__ = ("sessions", "messages", "blobs", "position", "bytes_read", "done")
+
+    def __init__(self) -> None:
+        # (session_id, title, draft, created_at, updated_at)
+        self.sessions: List[Tuple[str, str, str, Optional[str], Optional[str]]] = []
+        # (session_id, role, codec, content, timestamp, token_count)
+        self.messages: List[Tuple[str, str, int, Any, str, int]] = []
+        self.blobs: Dict[str, List[Tuple[bytes, int, Any, int]]] = {}
+        self.position = 0
+        self.bytes_read = 0
+        self.done = False
+
+    def __len__(self) -> int:
+        return len(self.sessions) + len(self.messages)
+
+    def add_session(self, rec: Dict[str, Any]) -> str:
+        sid = str(rec.get("session_id") or rec.get("id") or uuid.uuid4())
+        self.sessions.append((
+            sid,
+            rec.get("title") or "",
+            rec.get("draft") or "",
+            rec.get("created_at"),
+            rec.get("updated_at"),
+        ))
+        return sid
+
+    def add_message(self, sid: str, rec: Dict[str, Any], compress_threshold: Optional[int], dedup_min: Optional[int]) -> None:
+        text = str(rec.get("content") or "")
+        enc = contents.encode(text, compress_threshold, dedup_min)
+        if enc.blob:
+            self.blobs.setdefault(sid, []).append(enc.blob)
+        self.messages.append((
+            sid, rec.get("role") or "assistant", enc.codec, enc.content, rec.get("timestamp") or "",
+            token_counts.estimate(text),
+        ))
+
+
+def source_key(path: str) -> str:
+    """Identify an import file; a modified file starts a fresh import."""
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def resume_position(conn: sqlite3.Connection, source: str) -> Tuple[int, bool]:
+    row = conn.execute("SELECT position, done FROM import_progress WHERE source = ?", (source,)).fetchone()
+    return (row[0], bool(row[1])) if row else (0, False)
+
+
+def apply_batch(conn: sqlite3.Connection, source: str, batch: Batch) -> List[Tuple[str, str, str]]:
+    """Write one batch and its progress row; return ``(id, title, draft)`` of created sessions.
+
+    Runs inside the caller's transaction (writer job or ``run_import``).
+    """
+    row = conn.execute(
+        "SELECT sessions, messages, current_session, current_accepted FROM import_progress WHERE source = ?",
+        (source,),
+    ).fetchone()
+    n_sessions, n_messages, current, current_ok = row if row else (0, 0, None, 0)
+    accepted = {current} if current and current_ok else set()
+    created: List[Tuple[str, str, str]] = []
+    # 已归档的会话同样视为已存在
+    archived = any(r[1] == "archive" for r in conn.execute("PRAGMA database_list"))
+    for sid, title, draft, created_at, updated_at in batch.sessions:
+        # 续传时上一批的最后一个会话可能再次出现（隐式会话头），沿用之前的判断
+        if sid == current:
+            continue
+        current = sid
+        if archived and conn.execute("SELECT 1 FROM archive.sessions WHERE session_id = ?", (sid,)).fetchone():
+            continue
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO sessions (session_id, title, draft, created_at, updated_at) "
+            "VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)",
+            (sid, title, draft, created_at, updated_at),
+        )
+        if cur.rowcount:
+            accepted.add(sid)
+            created.append((sid, title, draft))
+    blobs = [b for sid, items in batch.blobs.items() if sid in accepted for b in items]
+    if blobs:
+        contents.insert_blobs(conn, blobs)
+    rows = [m for m in batch.messages if m[0] in accepted]
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO messages (session_id, role, codec, content, timestamp, token_count) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    if any(m[2] != codec.CODEC_PLAIN for m in rows):
+        # 压缩 / 引用的行不经触发器索引
+        search_index.index_encoded(conn, "m.id > ?", [(last_id,)])
+        session_stats.fill_previews(conn, {m[0] for m in rows})
+    if blobs:
+        # 同一正文在已存在的会话中被跳过时，引用数仍为 0
+        contents.collect(conn)
+    if batch.done:
+        from . import _backfill_updated_at
+
+        _backfill_updated_at(conn)
+    conn.execute(
+        "INSERT OR REPLACE INTO import_progress "
+        "(source, position, sessions, messages, current_session, current_accepted, done) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (source, batch.position, n_sessions + len(created), n_messages + len(rows), current,
+         int(current in accepted), int(batch.done)),
+    )
+    return created
+
+
+def read_jsonl(
+    path: str,
+    start: int = 0,
+    batch_size: int = BATCH_SIZE,
+    compress_threshold: Optional[int] = codec.DEFAULT_THRESHOLD,
+    dedup_min: Optional[int] = contents.DEDUP_MIN,
+) -> Iterator[Batch]:
+    """Yield batches of records from a JSONL file, starting at byte ``start``."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        batch = Batch()
+        current: Optional[str] = None
+        for line in iter(f.readline, b""):
+            line = line.strip()
+            if line:
+                rec = json.loads(line)
+                kind = rec.get("type") or ("message" if "role" in rec else "session")
+                if kind == "session":
+                    current = batch.add_session(rec)
+                    for m in rec.get("messages") or ():
+                        batch.add_message(current, m, compress_threshold, dedup_min)
+                elif kind == "message":
+                    sid = str(rec.get("session_id") or "")
+                    if sid != current:
+                        # 没有会话头的消息：补一个空标题的会话
+                        current = batch.add_session({"session_id": sid})
+                    batch.add_message(current, rec, compress_threshold, dedup_min)
+            if len(batch) >= batch_size:
+                batch.position = batch.bytes_read = f.tell()
+                yield batch
+                batch = Batch()
+        batch.position = batch.bytes_read = f.tell()
+        batch.done = True
+        yield batch
+
+
+class _JsonStream:
+    """Minimal incremental reader for one large JSON object.
+
+    Values are decoded one at a time with ``raw_decode``; consumed text is
+    dropped, so memory is bounded by the largest single value.
+    """
+
+    def __init__(self, f: IO[str]):
+        self._f = f
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _more(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._f.read(max(_CHUNK, len(self._buf) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"expected {ch!r} in legacy JSON")
+        self._pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise
+                continue
+            # 数字可能在缓冲区末尾被截断
+            if end == len(self._buf) and self._more():
+                continue
+            self._pos = end
+            return obj
+
+    def members(self) -> Iterator[str]:
+        """Iterate the keys of the object at the cursor; call ``value()`` for each."""
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            ch = self.peek()
+            self._pos += 1
+            if ch == "}":
+                return
+            if ch != ",":
+                raise ValueError("malformed legacy JSON object")
+
+
+def read_legacy_json(
+    path: str,
+    start: int = 0,
+    batch_size: int = BATCH_SIZE,
+    compress_threshold: Optional[int] = codec.DEFAULT_THRESHOLD,
+    dedup_min: Optional[int] = contents.DEDUP_MIN,
+) -> Iterator[Batch]:
+    """Yield batches from ``{"sessions": {id: {title, draft, messages}}}``.
+
+    ``position`` counts sessions; on resume the first ``start`` sessions
+    are parsed but not written.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        batch = Batch()
+        seen = 0
+        if stream.peek() == "{":
+            for key in stream.members():
+                if key != "sessions" or stream.peek() != "{":
+                    stream.value()
+                    continue
+                for sid in stream.members():
+                    sess = stream.value()
+                    seen += 1
+                    if seen <= start or not isinstance(sess, dict):
+                        continue
+                    batch.add_session({**sess, "session_id": sid})
+                    for m in sess.get("messages") or ():
+                        batch.add_message(sid, m, compress_threshold, dedup_min)
+                    if len(batch) >= batch_size:
+                        batch.position = seen
+                        batch.bytes_read = f.buffer.tell()
+                        yield batch
+                        batch = Batch()
+        batch.position = seen
+        batch.bytes_read = os.path.getsize(path)
+        batch.done = True
+        yield batch
+
+
+Reader = Callable[..., Iterator[Batch]]
+
+
+def run_import(
+    path: str,
+    reader: Reader,
+    apply: Callable[[Callable[[sqlite3.Connection], Any]], Any],
+    position: Tuple[int, bool],
+    progress: ProgressFn = None,
+    batch_size: int = BATCH_SIZE,
+    on_created: Optional[Callable[[List[Tuple[str, str, str]]], None]] = None,
+    **encode: Any,
+) -> Dict[str, int]:
+    """Drive ``reader`` batches through ``apply(job)``; return the totals for ``path``.
+
+    ``apply`` runs ``job(conn)`` in one transaction (a writer job, or
+    ``in_transaction`` for a plain connection).  ``on_created`` receives
+    the sessions each committed batch created.
+    """
+    source = source_key(path)
+    start, done = position
+    totals = {"sessions": 0, "messages": 0}
+    if done:
+        return totals
+    total = os.path.getsize(path)
+    for batch in reader(path, start, batch_size, **encode):
+        created, totals = apply(lambda conn, b=batch: (apply_batch(conn, source, b), _counts(conn, source)))
+        if on_created and created:
+            on_created(created)
+        if progress:
+            progress(Progress(batch.bytes_read, total, totals["sessions"], totals["messages"]))
+    return totals
+
+
+def _counts(conn: sqlite3.Connection, source: str) -> Dict[str, int]:
+    row = conn.execute("SELECT sessions, messages FROM import_progress WHERE source = ?", (source,)).fetchone()
+    return {"sessions": row[0], "messages": row[1]} if row else {"sessions": 0, "messages": 0}
+
+
+def in_transaction(conn: sqlite3.Connection) -> Callable[[Callable[[sqlite3.Connection], Any]], Any]:
+    """``apply`` for ``run_import`` on a connection owned by the caller."""
+
+    def apply(job: Callable[[sqlite3.Connection], Any]) -> Any:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 每批每个会话只写一行 change_log
+            changes.mark_start(conn)
+            result = job(conn)
+            changes.clear_start(conn)
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    return apply
+
+
+def message_text(row: sqlite3.Row) -> str:
+    """Decoded body of a row read with ``contents.MESSAGE_COLUMNS``."""
+    if row["codec"] == codec.CODEC_REF:
+        return codec.decode(row["body_codec"], row["body"])
+    return codec.decode(row["codec"], row["content"])
+
+
+def export_jsonl(
+    conn: sqlite3.Connection,
+    out: IO[str],
+    session_ids: Optional[Sequence[str]] = None,
+    progress: ProgressFn = None,
+    archived: bool = False,
+) -> Dict[str, int]:
+    """Stream sessions and their messages to ``out`` as JSONL.
+
+    With ``archived`` the sessions in the attached archive follow the hot ones.
+    """
+    where = ""
+    params: List[Any] = []
+    if session_ids is not None:
+        where = f" WHERE s.session_id IN ({','.join('?' * len(session_ids))})"
+        params = list(session_ids)
+    sources = [(
+        "SELECT s.session_id, s.title, s.draft, s.created_at, s.updated_at FROM sessions s",
+        f"SELECT {contents.MESSAGE_COLUMNS} WHERE m.session_id = ? ORDER BY m.id",
+        message_text,
+    )]
+    total = conn.execute(
+        "SELECT COALESCE(SUM(st.message_count), 0) FROM sessions s "
+        "LEFT JOIN session_stats st ON st.session_id = s.session_id" + where,
+        params,
+    ).fetchone()[0]
+    if archived:
+        # 归档库中的消息体都是内联存储（见 storage.archive）
+        sources.append((
+            "SELECT s.session_id, s.title, s.draft, s.created_at, s.updated_at FROM archive.sessions s",
+            "SELECT m.id, m.role, m.codec, m.content, m.timestamp FROM archive.messages m WHERE m.session_id = ? ORDER BY m.id",
+            lambda row: codec.decode(row["codec"], row["content"]),
+        ))
+        total += conn.execute("SELECT COALESCE(SUM(s.message_count), 0) FROM archive.sessions s" + where, params).fetchone()[0]
+    n_sessions = n_messages = 0
+    for session_sql, message_sql, text in sources:
+        for sess in conn.execute(session_sql + where + " ORDER BY s.rowid", params):
+            header = {
+                "type": "session",
+                "session_id": sess[0],
+                "title": sess[1],
+                "draft": sess[2] or "",
+                "created_at": sess[3],
+                "updated_at": sess[4],
+            }
+            out.write(json.dumps(header, ensure_ascii=False) + "\n")
+            n_sessions += 1
+            for row in conn.execute(message_sql, (sess[0],)):
+                rec = {
+                    "type": "message",
+                    "session_id": sess[0],
+                    "role": row["role"],
+                    "content": text(row),
+                    "timestamp": row["timestamp"],
+                }
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                n_messages += 1
+                if progress and n_messages % BATCH_SIZE == 0:
+                    progress(Progress(n_messages, total, n_sessions, n_messages))
+    if progress:
+        progress(Progress(n_messages, total, n_sessions, n_messages))
+    return {"sessions": n_sessions, "messages": n_messages}
+
+
+__all__ = [
+    "BATCH_SIZE", "Batch", "Progress", "ProgressFn", "apply_batch", "create_import_progress", "export_jsonl", "in_transaction",
+    "read_jsonl", "read_legacy_json", "resume_position", "run_import", "source_key",
+]
@@ -0,0 +1,280 @@
+"""Write-behind writer: one background thread owns the write connection.
+
+Jobs are callables ``fn(conn)`` submitted through a bounded queue.  The
+writer drains whatever is queued (up to ``max_batch`` jobs) into a single
+transaction — a group commit — so N quick writes cost one fsync instead of
+N.  Each job runs inside its own SAVEPOINT, so one failing job does not
+discard the rest of its batch.
+
+Another process holding the write lock makes ``BEGIN IMMEDIATE`` wait up to
+the connection's busy timeout; the writer then retries a few times before
+failing the batch.  An optional ``tracker`` (``storage.changes``) is called
+around every transaction.
+
+Jobs submitted with ``transaction=False`` (e.g. ``VACUUM``) run on their
+own in autocommit mode, between two batches.
+"""
+from __future__ import annotations
+
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Optional
+
+_STOP = object()
+# BEGIN IMMEDIATE 在 busy timeout 之后仍然拿不到写锁时的重试次数
+BUSY_RETRIES = 3
+
+_live_writers: "weakref.WeakSet[WriteBehindWriter]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all_writers() -> None:
+    # 进程退出前把排队中的写入落盘，避免守护线程被直接终止导致丢数据
+    for writer in list(_live_writers):
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+class _Job:
+    __slots__ = ("fn", "future", "seq", "transaction")
+
+    def __init__(self, fn: Optional[Callable[[sqlite3.Connection], Any]], seq: int, transaction: bool = True):
+        self.fn = fn
+        self.future: Future = Future()
+        self.seq = seq
+        self.transaction = transaction
+
+
+class WriteBehindWriter:
+    def __init__(
+        self,
+        connect: Callable[[], sqlite3.Connection],
+        max_queue: int = 1024,
+        max_batch: int = 256,
+        tracker: Any = None,
+    ):
+        self._connect = connect
+        self.tracker = tracker
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, max_queue))
+        self.max_batch = max(1, max_batch)
+        self.last_error: Optional[BaseException] = None
+
+        self._cond = threading.Condition()
+        self._submit_lock = threading.Lock()
+        self._seq = 0
+        self._done_seq = 0
+        # 读己之写：记录每个线程 / 每个 key 最后提交的写入序号
+        self._last_by_thread: Dict[int, int] = {}
+        self._last_by_key: Dict[Any, int] = {}
+        self._closed = False
+
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        _live_writers.add(self)
+
+    # ---------- producer side ----------
+    def submit(
+        self,
+        fn: Callable[[sqlite3.Connection], Any],
+        key: Any = None,
+        keys: Iterable[Any] = (),
+        transaction: bool = True,
+    ) -> Future:
+        """Queue a write job; blocks only while the queue is full.
+
+        The returned future resolves to ``fn``'s return value once the
+        transaction containing it has committed.  ``key``/``keys`` tag the
+        job for ``wait_for_key``.  ``transaction=False`` runs ``fn`` alone,
+        outside any transaction.
+        """
+        # 序号分配与入队在同一把锁内完成，保证队列顺序与序号一致
+        with self._submit_lock:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("storage writer is closed")
+                self._seq += 1
+                job = _Job(fn, self._seq, transaction)
+                self._last_by_thread[threading.get_ident()] = job.seq
+                if key is not None:
+                    self._last_by_key[key] = job.seq
+                for k in keys:
+                    self._last_by_key[k] = job.seq
+            self._queue.put(job)
+        return job.future
+
+    def call(self, fn: Callable[[sqlite3.Connection], Any], timeout: Optional[float] = None, transaction: bool = True) -> Any:
+        """Run a write job and wait for its committed result."""
+        return self.submit(fn, transaction=transaction).result(timeout)
+
+    def durable(self) -> Future:
+        """Future that completes once every write submitted so far is committed."""
+        with self._cond:
+            if self._done_seq >= self._seq or self._closed:
+                fut: Future = Future()
+                fut.set_result(None)
+                return fut
+        return self.submit(lambda conn: None)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until all writes submitted so far are committed."""
+        with self._cond:
+            target = self._seq
+        return self._wait_for(target, timeout)
+
+    def wait_for_thread(self, timeout: Optional[float] = None) -> bool:
+        """Block until the calling thread's own writes are committed."""
+        with self._cond:
+            target = self._last_by_thread.get(threading.get_ident(), 0)
+        return self._wait_for(target, timeout)
+
+    def wait_for_key(self, key: Any, timeout: Optional[float] = None) -> bool:
+        """Block until writes submitted with ``key`` are committed."""
+        with self._cond:
+            target = self._last_by_key.get(key, 0)
+        return self._wait_for(target, timeout)
+
+    def is_pending(self, key: Any) -> bool:
+        """Whether writes submitted with ``key`` are still uncommitted (never blocks)."""
+        with self._cond:
+            return self._last_by_key.get(key, 0) > self._done_seq
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._seq - self._done_seq
+
+    @property
+    def submitted(self) -> int:
+        """Sequence number of the last submitted job (grows with every write)."""
+        with self._cond:
+            return self._seq
+
+    def _wait_for(self, target: int, timeout: Optional[float]) -> bool:
+        if threading.current_thread() is self._thread:
+            return True
+        with self._cond:
+            return self._cond.wait_for(lambda: self._done_seq >= target or not self._thread.is_alive(), timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        with self._submit_lock:
+            with self._cond:
+                if self._closed:
+                    return
+                self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+        _live_writers.discard(self)
+
+    # ---------- writer thread ----------
+    def _run(self) -> None:
+        conn = self._connect()
+        self._ready.set()
+        held = None
+        try:
+            while True:
+                item = self._queue.get() if held is None else held
+                held = None
+                if item is not _STOP and not item.transaction:
+                    self._run_alone(conn, item)
+                    continue
+                stop = item is _STOP
+                batch = [] if stop else [item]
+                while not stop and len(batch) < self.max_batch:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                    elif not item.transaction:
+                        # 事务外的任务留到本批提交之后单独执行
+                        held = item
+                        break
+                    else:
+                        batch.append(item)
+                if batch:
+                    self._commit_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._cond:
+                self._cond.notify_all()
+
+    @staticmethod
+    def _begin(conn: sqlite3.Connection) -> None:
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                msg = str(e)
+                if attempt == BUSY_RETRIES or ("locked" not in msg and "busy" not in msg):
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+
+    def _run_alone(self, conn: sqlite3.Connection, job: _Job) -> None:
+        try:
+            result = [(job, job.fn(conn), None)]
+        except Exception as e:
+            result = [(job, None, e)]
+        self._finish(result, job.seq)
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list) -> None:
+        results = []
+        committed = False
+        try:
+            self._begin(conn)
+            if self.tracker is not None:
+                self.tracker.begin(conn)
+            for job in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    results.append((job, job.fn(conn), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((job, None, e))
+            if self.tracker is not None:
+                self.tracker.end(conn)
+            conn.execute("COMMIT")
+            committed = True
+        except Exception as e:
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            results = [(job, None, e) for job in batch]
+        if self.tracker is not None:
+            self.tracker.committed(committed)
+        self._finish(results, batch[-1].seq)
+
+    def _finish(self, results: list, seq: int) -> None:
+        for job, value, error in results:
+            if error is not None:
+                self.last_error = error
+                print(f"[storage] 后台写入失败: {error}")
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(value)
+        with self._cond:
+            self._done_seq = max(self._done_seq, seq)
+            # 已提交的 key 无需再等待，清理掉避免字典无限增长
+            if len(self._last_by_key) > 1024:
+                self._last_by_key = {k: v for k, v in self._last_by_key.items() if v > self._done_seq}
+            self._cond.notify_all()
+
+
+__all__ = ["WriteBehindWriter"]
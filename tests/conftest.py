@@ -33,5 +33,6 @@ def temp_storage():
     
     yield storage
     
+    storage.close()
     # 清理临时目录
     shutil.rmtree(temp_dir, ignore_errors=True)
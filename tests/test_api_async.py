@@ -0,0 +1,241 @@
+import asyncio
+import json
+import time
+
+from api import ApiClient, AsyncApiClient
+from api.resilience import OPEN, BreakerRegistry
+from comm.server import RelayServer
+from core.ports import Message
+
+
+class _Upstream:
+    """asyncio 替身服务器：延迟 ``delay`` 秒后回显最后一条消息，记录并发与连接数。
+
+    前 ``unavailable`` 个请求返回 503（Retry-After: 0）。
+    """
+
+    def __init__(self, delay=0.0, chunked=False, close_after=False, unavailable=0):
+        self.delay = delay
+        self.chunked = chunked
+        self.close_after = close_after
+        self.unavailable = unavailable
+        self.active = self.peak = self.connections = 0
+        self.bodies = []
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                headers = {}
+                while (h := await reader.readline()) not in (b"\r\n", b""):
+                    k, _, v = h.decode().partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                payload = json.loads(await reader.readexactly(int(headers["content-length"])))
+                self.bodies.append(payload)
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                try:
+                    await asyncio.sleep(self.delay)
+                finally:
+                    self.active -= 1
+                text = payload["messages"][-1]["content"]
+                extra = ""
+                if self.unavailable:
+                    self.unavailable -= 1
+                    status, body, extra = "503 Service Unavailable", {"error": {"message": "busy"}}, "Retry-After: 0\r\n"
+                elif text == "fail":
+                    status, body = "429 Too Many Requests", {"error": {"message": "slow down"}}
+                else:
+                    status, body = "200 OK", {"choices": [{"message": {"content": "echo " + text}}]}
+                data = json.dumps(body).encode()
+                if self.chunked:
+                    head = f"HTTP/1.1 {status}\r\n{extra}Transfer-Encoding: chunked\r\n\r\n".encode()
+                    data = b"".join(b"%x\r\n%s\r\n" % (len(p), p) for p in (data[:7], data[7:])) + b"0\r\n\r\n"
+                else:
+                    head = f"HTTP/1.1 {status}\r\n{extra}Content-Length: {len(data)}\r\n\r\n".encode()
+                writer.write(head + data)
+                await writer.drain()
+                if self.close_after:
+                    # 不声明 Connection: close 就断开，模拟服务器回收空闲长连接
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0, backlog=1024)
+        port = self.server.sockets[0].getsockname()[1]
+        self.cfg = {"provider": "custom", "api_key": "k", "base_url": f"http://127.0.0.1:{port}/v1", "model": "m", "timeout": 10}
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+
+
+def test_hundreds_of_requests_in_flight():
+    async def main():
+        async with _Upstream(delay=0.2) as up:
+            client = AsyncApiClient(up.cfg)
+            start = time.perf_counter()
+            replies = await asyncio.gather(*(client.call_model(f"q{i}") for i in range(300)))
+            elapsed = time.perf_counter() - start
+            await client.aclose()
+            return up, client, replies, elapsed
+
+    up, client, replies, elapsed = asyncio.run(main())
+    assert replies == [f"echo q{i}" for i in range(300)]
+    assert up.peak == 256 and client.stats()["peak_in_flight"] == 256
+    # 串行需要 60 秒；两轮（256 + 44）各约 0.2 秒
+    assert elapsed < 5
+    assert up.bodies[0]["model"] == "m" and up.bodies[0]["temperature"] == 0.7
+
+
+def test_concurrency_limit_keep_alive_and_send_chat():
+    async def main():
+        async with _Upstream(delay=0.01, chunked=True) as up:
+            client = AsyncApiClient(up.cfg, max_concurrency=4)
+            replies = await asyncio.gather(*(client.call_model(f"q{i}") for i in range(40)))
+            reply = await client.send_chat([Message("user", "hi", ""), Message("assistant", "hello", ""), Message("user", "again", "")])
+            error = await client.call_model("fail")
+            await client.aclose()
+            return up, replies, reply, error
+
+    up, replies, reply, error = asyncio.run(main())
+    assert replies == [f"echo q{i}" for i in range(40)]
+    assert up.peak <= 4 and up.connections == 4
+    assert reply == "echo again"
+    assert [m["role"] for m in up.bodies[40]["messages"]] == ["user", "assistant", "user"]
+    assert error.startswith("[ERROR]") and "429" in error and "slow down" in error
+
+
+def test_stale_keep_alive_connection_is_replaced():
+    async def main():
+        async with _Upstream(close_after=True) as up:
+            client = AsyncApiClient(up.cfg)
+            first = await client.call_model("a")
+            await asyncio.sleep(0.05)
+            second = await client.call_model("b")
+            return up, first, second
+
+    up, first, second = asyncio.run(main())
+    assert (first, second) == ("echo a", "echo b")
+    assert up.connections == 2
+
+
+def test_cancellation_and_timeout_release_slots():
+    async def main():
+        async with _Upstream(delay=1.0) as up:
+            client = AsyncApiClient(up.cfg, max_concurrency=2)
+            task = asyncio.create_task(client.call_model("slow"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            timed_out = await client.call_model("slow", cfg={**up.cfg, "timeout": 0.1})
+            stats = client.stats()
+            return timed_out, stats
+
+    timed_out, stats = asyncio.run(main())
+    assert timed_out.startswith("[ERROR]") and "超时" in timed_out
+    # 被取消 / 超时的连接不放回池中
+    assert stats["in_flight"] == 0 and stats["idle_connections"] == 0
+
+
+def test_retries_and_breaker_match_the_sync_client():
+    async def main():
+        async with _Upstream(unavailable=2) as up:
+            breakers = BreakerRegistry(failure_threshold=3, reset_timeout=30)
+            client = AsyncApiClient(up.cfg, api=ApiClient(up.cfg, breakers=breakers))
+            # 503 + Retry-After 重试后成功
+            retried = await client.call_model("q")
+            sent = len(up.bodies)
+            up.unavailable = 3
+            failed = await client.call_model("q")
+            # 连续失败后熔断打开：不再请求上游
+            blocked = await client.call_model("q")
+            await client.aclose()
+            return up, breakers.get(up.cfg["base_url"]), sent, retried, failed, blocked
+
+    up, breaker, sent, retried, failed, blocked = asyncio.run(main())
+    assert retried == "echo q" and sent == 3
+    assert failed.startswith("[ERROR]") and "503" in failed
+    assert breaker.state == OPEN and len(up.bodies) == 6
+    assert blocked.startswith("[ERROR]") and "暂停请求" in blocked
+
+
+def test_relay_keeps_serving_while_upstream_is_slow():
+    class _Socket:
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, raw):
+            self.sent.append((time.perf_counter(), json.loads(raw)))
+
+    async def main():
+        async with _Upstream(delay=0.5) as up:
+            server = RelayServer()
+            server.api_client = AsyncApiClient(up.cfg)
+            me, other = _Socket(), _Socket()
+            server.clients = {"me": me, "other": other}
+            pending = set()
+            start = time.perf_counter()
+            for i in range(50):
+                await server._handle_message("me", json.dumps({"type": "model_request", "text": f"q{i}", "api_cfg": up.cfg}), pending)
+            await server._handle_message("me", json.dumps({"type": "chat", "target": "other", "text": "hi"}), pending)
+            relayed = other.sent[0][0] - start
+            await asyncio.gather(*pending)
+            return me, relayed, time.perf_counter() - start
+
+    me, relayed, total = asyncio.run(main())
+    assert relayed < 0.2
+    assert sorted(p["reply"] for _, p in me.sent) == sorted(f"echo q{i}" for i in range(50))
+    assert total < 2
+
+
+def test_slow_persist_does_not_block_the_relay():
+    class _Socket:
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, raw):
+            self.sent.append((time.perf_counter(), json.loads(raw)))
+
+    class _SlowStorage:
+        sessions = {"s1": {}}
+
+        def __init__(self):
+            self.appended = []
+
+        def poll_changes(self):
+            time.sleep(0.5)
+
+        def append_message(self, sid, role, text):
+            self.appended.append((sid, role, text))
+
+    async def main():
+        async with _Upstream() as up:
+            server = RelayServer()
+            server.api_client = AsyncApiClient(up.cfg)
+            server.storage = _SlowStorage()
+            me, other = _Socket(), _Socket()
+            server.clients = {"me": me, "other": other}
+            pending = set()
+            request = {"type": "model_request", "text": "q", "api_cfg": up.cfg, "session_id": "s1", "persist": True}
+            start = time.perf_counter()
+            await server._handle_message("me", json.dumps(request), pending)
+            await asyncio.sleep(0.1)
+            await server._handle_message("me", json.dumps({"type": "chat", "target": "other", "text": "hi"}), pending)
+            relayed = other.sent[0][0] - start
+            await asyncio.gather(*pending)
+            return server.storage, me, relayed
+
+    storage, me, relayed = asyncio.run(main())
+    assert relayed < 0.3
+    assert storage.appended == [("s1", "user", "q"), ("s1", "assistant", "echo q")]
+    assert me.sent[0][1]["reply"] == "echo q"
@@ -0,0 +1,117 @@
+import json
+import time
+
+import requests
+
+from api import ApiClient
+from api.cache import ResponseCache, cache_key
+
+CFG = {"provider": "custom", "api_key": "k", "base_url": "https://cache.test/v1", "model": "m"}
+
+
+class _Resp:
+    status_code = 200
+
+    def __init__(self, content, stream=False):
+        self.content = content
+        self.headers = {"Content-Type": "text/event-stream" if stream else "application/json"}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"choices": [{"message": {"content": self.content}}]}
+
+    def iter_lines(self, decode_unicode=False):
+        for word in self.content.split(" "):
+            yield "data: " + json.dumps({"choices": [{"delta": {"content": word + " "}}]})
+            yield ""
+        yield "data: [DONE]"
+
+
+def _upstream(monkeypatch):
+    calls = []
+
+    def fake_post(self, url, json=None, stream=False, **kwargs):
+        calls.append(json)
+        return _Resp(f"reply {len(calls)}", stream=stream)
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    return calls
+
+
+def test_key_is_canonical():
+    a = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 0.7}
+    b = {"temperature": 0.7, "stream": True, "messages": [{"content": "hi", "role": "user"}], "model": "m"}
+    assert cache_key("https://x.test/v1/", a) == cache_key("https://x.test/v1/chat/completions", b)
+    assert cache_key("https://x.test/v1", a) != cache_key("https://x.test/v1", {**a, "temperature": 0.2})
+    assert cache_key("https://x.test/v1", a) != cache_key("https://y.test/v1", a)
+
+
+def test_calls_hit_cache_and_can_bypass(monkeypatch, tmp_path):
+    calls = _upstream(monkeypatch)
+    client = ApiClient({}, cache=ResponseCache(str(tmp_path / "cache.db")))
+    context = [{"role": "user", "content": "earlier", "timestamp": "t1"}]
+    assert client.call_model("q", context, CFG) == "reply 1"
+    # 时间戳不进入 payload，不影响命中
+    assert client.call_model("q", [{**context[0], "timestamp": "t2"}], CFG) == "reply 1"
+    assert client.call_model("other", context, CFG) == "reply 2"
+    # 单次调用绕过、模型配置关闭
+    assert client.call_model("q", context, CFG, use_cache=False) == "reply 3"
+    assert client.call_model("q", context, {**CFG, "response_cache": False}) == "reply 4"
+    assert len(calls) == 4
+    stats = client.cache.stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 2 and stats["stores"] == 2
+    # 未启用缓存的客户端（默认）不读写缓存
+    assert ApiClient({}).cache is None
+
+
+def test_stream_replies_are_cached(monkeypatch):
+    calls = _upstream(monkeypatch)
+    client = ApiClient({}, cache=ResponseCache(None))
+    first = list(client.stream_model("q", cfg=CFG))
+    assert len(first) == 2 and "".join(first) == "reply 1 "
+    assert list(client.stream_model("q", cfg=CFG)) == ["reply 1 "]
+    # 流式与非流式的 payload 相同（stream 不参与计算键）
+    assert client.call_model("q", cfg=CFG) == "reply 1 "
+    assert len(calls) == 1 and calls[0]["stream"] is True
+
+
+def test_disk_tier_survives_restart_and_expires(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path, ttl=60)
+    cache.put("k", "value")
+    cache.close()
+
+    cache = ResponseCache(path, ttl=60)
+    assert cache.get("k") == "value" and cache.stats()["disk_hits"] == 1
+    assert cache.get("k") == "value" and cache.stats()["memory_hits"] == 1
+
+    now = time.time()
+    monkeypatch.setattr("api.cache.time.time", lambda: now + 61)
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert stats["expired"] == 1 and stats["disk_entries"] == 0 and stats["disk_bytes"] == 0
+    cache.close()
+
+
+def test_size_based_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), memory_entries=2, max_bytes=1000)
+    for i in range(4):
+        cache.put(f"k{i}", f"{i}" * 200)
+    # 磁盘命中刷新使用时间，淘汰时排在后面
+    assert cache.get("k0") == "0" * 200
+    cache.put("k4", "4" * 200)
+    assert cache.stats()["evictions"] == 0
+    cache.put("k5", "5" * 200)
+    stats = cache.stats()
+    assert stats["evictions"] == 2 and stats["disk_bytes"] == 800 and stats["memory_entries"] == 2
+    assert cache.get("k1") is None and cache.get("k2") is None
+    assert [cache.get(k) is not None for k in ("k0", "k3", "k4", "k5")] == [True] * 4
+    cache.close()
@@ -0,0 +1,85 @@
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from api import ApiClient, SessionPool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        type(self).connections += 1
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().setup()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body = json.dumps({"choices": [{"message": {"content": "echo " + payload["messages"][-1]["content"]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.connections = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _cfg(base_url):
+    return {"provider": "custom", "api_key": "k", "base_url": base_url, "model": "m"}
+
+
+def test_requests_reuse_one_connection(server):
+    pool = SessionPool()
+    # 每次新建客户端（如测试连接按钮）也共用同一个池
+    replies = [ApiClient({}, pool=pool).call_model(f"q{i}", cfg=_cfg(server)) for i in range(5)]
+    assert replies == [f"echo q{i}" for i in range(5)]
+    assert _Handler.connections == 1
+    stats = pool.stats()
+    assert stats["sessions"] == 1 and stats["in_use"] == 0
+    assert stats["requests"] == {server + "/chat/completions": 5}
+    pool.close()
+
+
+def test_concurrent_workers_bounded_by_pool_size(server):
+    pool = SessionPool(pool_maxsize=4)
+    client = ApiClient({}, pool=pool)
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        replies = list(ex.map(lambda i: client.call_model(f"q{i}", cfg=_cfg(server)), range(40)))
+    assert replies == [f"echo q{i}" for i in range(40)]
+    assert _Handler.connections <= 4
+    assert pool.stats()["in_use"] == 0
+    pool.close()
+
+
+def test_idle_sessions_are_evicted(server):
+    pool = SessionPool(idle_timeout=0.05)
+    client = ApiClient({}, pool=pool)
+    client.call_model("a", cfg=_cfg(server))
+    with pool.session("http://other.invalid"):
+        time.sleep(0.1)
+        pool.evict_idle()
+        # 借出中的 Session 不会被回收
+        assert pool.stats()["sessions"] == 1 and pool.stats()["evicted"] == 1
+    client.call_model("b", cfg=_cfg(server))
+    assert _Handler.connections == 2
+    pool.close()
+    assert pool.stats()["sessions"] == 0
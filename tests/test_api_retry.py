@@ -0,0 +1,143 @@
+import pytest
+import requests
+
+from api import ApiClient
+from api.resilience import CLOSED, HALF_OPEN, OPEN, BreakerRegistry, CircuitBreaker, CircuitOpenError, RetryPolicy, parse_retry_after
+
+BASE = "https://flaky.test/v1"
+
+
+class _Resp:
+    def __init__(self, status, body=None, retry_after=None):
+        self.status_code = status
+        self.headers = {"Content-Type": "application/json"}
+        if retry_after is not None:
+            self.headers["Retry-After"] = retry_after
+        self.body = body if body is not None else {"choices": [{"message": {"content": "ok"}}]}
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+    def json(self):
+        return self.body
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """按顺序返回预设结果的 Session.post；异常实例会被抛出。记录每次等待的秒数。"""
+    state = {"script": [], "calls": 0, "sleeps": []}
+
+    def fake_post(self, url, **kwargs):
+        state["calls"] += 1
+        item = state["script"].pop(0)
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    monkeypatch.setattr("api.api_client.time.sleep", lambda s: state["sleeps"].append(s))
+    return state
+
+
+def _client(**cfg):
+    return ApiClient({"retry_base_delay": 0.01, **cfg}, breakers=BreakerRegistry(failure_threshold=3, reset_timeout=30))
+
+
+def _cfg():
+    return {"provider": "custom", "api_key": "k", "base_url": BASE, "model": "m"}
+
+
+def test_transient_errors_are_retried(upstream):
+    upstream["script"] = [_Resp(503), requests.exceptions.ConnectionError("reset"), _Resp(200)]
+    assert _client().call_model("q", cfg=_cfg()) == "ok"
+    assert upstream["calls"] == 3 and len(upstream["sleeps"]) == 2
+    # full jitter：第 n 次重试等待不超过 base * 2**n
+    assert 0 <= upstream["sleeps"][0] <= 0.01 and 0 <= upstream["sleeps"][1] <= 0.02
+
+    # 非重试状态码立即返回错误
+    upstream["script"] = [_Resp(400, {"error": {"message": "bad request"}})]
+    reply = _client().call_model("q", cfg=_cfg())
+    assert reply.startswith("[ERROR]") and "bad request" in reply and upstream["calls"] == 4
+
+
+def test_retry_after_and_deadline(upstream):
+    upstream["script"] = [_Resp(429, retry_after="2"), _Resp(200)]
+    assert _client().call_model("q", cfg=_cfg()) == "ok"
+    assert upstream["sleeps"] == [2.0]
+
+    # 服务器要求的等待超过总时限：不再重试，直接返回错误
+    upstream["script"] = [_Resp(429, {"error": {"message": "rate limited"}}, retry_after="120")]
+    reply = _client(retry_deadline=10).call_model("q", cfg=_cfg())
+    assert "rate limited" in reply and upstream["sleeps"] == [2.0]
+
+    # 次数用尽后返回最后一次的错误
+    upstream["script"] = [_Resp(502)] * 2
+    reply = _client(retry_max_attempts=2).call_model("q", cfg=_cfg())
+    assert reply.startswith("[ERROR]") and "502" in reply and upstream["calls"] == 5
+
+
+def test_breaker_opens_fails_fast_and_probes(upstream, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("api.resilience.time.monotonic", lambda: clock[0])
+    client = _client(retry_max_attempts=1)
+    upstream["script"] = [_Resp(500)] * 3
+    for _ in range(3):
+        client.call_model("q", cfg=_cfg())
+    breaker = client.breakers.get(BASE + "/chat/completions/")
+    assert breaker.state == OPEN and client.breakers.snapshot(BASE)["retry_in"] == 30
+
+    # 打开期间不发请求
+    reply = client.call_model("q", cfg=_cfg())
+    assert reply.startswith("[ERROR]") and "30 秒后重试" in reply and upstream["calls"] == 3
+
+    # 冷却后半开：探测失败重新打开，探测成功关闭
+    clock[0] += 31
+    assert breaker.state == HALF_OPEN
+    upstream["script"] = [_Resp(503)]
+    client.call_model("q", cfg=_cfg())
+    assert breaker.state == OPEN
+    clock[0] += 31
+    upstream["script"] = [_Resp(200)]
+    assert client.call_model("q", cfg=_cfg()) == "ok"
+    assert breaker.state == CLOSED and breaker.snapshot()["failures"] == 0
+
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker("https://x.test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure("boom")
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    # 4xx 等非失败响应也结束探测
+    breaker.record_success()
+    breaker.before_request()
+    breaker.before_request()
+
+
+def test_probe_ending_in_an_unrecorded_exception_frees_the_slot(upstream):
+    client = _client(retry_max_attempts=1)
+    breaker = client.breakers.get(BASE)
+    breaker.failure_threshold, breaker.reset_timeout = 1, 0
+    breaker.record_failure("boom")
+    # 探测请求被中断：既不算成功也不算失败
+    upstream["script"] = [KeyboardInterrupt()]
+    with pytest.raises(KeyboardInterrupt):
+        client.call_model("q", cfg=_cfg())
+    assert breaker.state == HALF_OPEN
+    upstream["script"] = [_Resp(200)]
+    assert client.call_model("q", cfg=_cfg()) == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_policy_and_retry_after_parsing():
+    policy = RetryPolicy(base_delay=1, max_delay=4)
+    assert all(0 <= policy.backoff(10) <= 4 for _ in range(50))
+    assert policy.backoff(0, retry_after=7) == 7
+    assert RetryPolicy.from_config({"retry_max_attempts": 0}).max_attempts == 1
+    assert parse_retry_after("3") == 3.0 and parse_retry_after("soon") is None and parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
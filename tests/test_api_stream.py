@@ -0,0 +1,174 @@
+import json
+
+import requests
+
+from api.api_client import ApiClient
+from controller.controller import Controller
+
+CFG = {"provider": "custom", "api_key": "k", "base_url": "https://example.test/v1", "model": "m"}
+
+
+def _event(content=None, **delta):
+    if content is not None:
+        delta["content"] = content
+    return "data: " + json.dumps({"choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+
+
+class _FakeResponse:
+    def __init__(self, lines, content_type="text/event-stream", status=200, body=None):
+        self.lines = lines
+        self.headers = {"Content-Type": content_type}
+        self.status_code = status
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+    def json(self):
+        return self.body
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self.lines:
+            if isinstance(line, Exception):
+                raise line
+            yield line
+
+
+def test_sse_lines_parse_into_deltas():
+    lines = [
+        ": keep-alive",
+        _event(role="assistant"), "",
+        _event("Hel"), "",
+        "event: message", _event("lo 中文"), "",
+        _event(None), "",
+        "data: [DONE]", "",
+        _event("after done"), "",
+    ]
+    assert list(ApiClient._iter_sse_deltas(lines)) == ["Hel", "lo 中文"]
+    # bytes 行、多行 data、没有结尾空行的最后一个事件
+    raw = [b'data: {"choices": [{"delta":', b'data: {"content": "a"}}]}', b"", _event("b").encode()]
+    assert list(ApiClient._iter_sse_deltas(raw)) == ["a", "b"]
+    assert list(ApiClient._iter_sse_deltas(['data: {"error": {"message": "quota"}}', ""])) == ["[ERROR] API调用失败: quota"]
+
+
+def test_stream_model_posts_stream_request(monkeypatch):
+    calls = []
+
+    def fake_post(self, url, json=None, headers=None, timeout=None, stream=False):
+        calls.append((url, json, stream))
+        return _FakeResponse([_event("Hi"), "", _event(" there"), "", "data: [DONE]", ""])
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    assert list(ApiClient({}).stream_model("q", [{"role": "user", "content": "c"}], CFG)) == ["Hi", " there"]
+    url, payload, stream = calls[0]
+    assert url == "https://example.test/v1/chat/completions" and stream and payload["stream"] is True
+
+    # 服务器忽略 stream 参数返回完整 JSON
+    body = {"choices": [{"message": {"content": "whole"}}]}
+    monkeypatch.setattr(requests.Session, "post", lambda *a, **k: _FakeResponse([], "application/json", body=body))
+    assert list(ApiClient({}).stream_model("q", cfg=CFG)) == ["whole"]
+
+    # 中途断开：保留已收到的部分，另起一行追加错误
+    cut = [_event("part"), "", requests.exceptions.ChunkedEncodingError("reset")]
+    monkeypatch.setattr(requests.Session, "post", lambda *a, **k: _FakeResponse(cut))
+    out = list(ApiClient({}).stream_model("q", cfg=CFG))
+    assert out[0] == "part" and out[1].startswith("\n[ERROR]")
+
+    monkeypatch.setattr(requests.Session, "post", lambda *a, **k: _FakeResponse([], status=401, body={"error": {"message": "bad key"}}))
+    out = list(ApiClient({}).stream_model("q", cfg=CFG))
+    assert len(out) == 1 and out[0].startswith("[ERROR]") and "bad key" in out[0]
+
+
+def test_mock_stream_matches_blocking_reply(monkeypatch):
+    monkeypatch.setattr("api.api_client.time.sleep", lambda s: None)
+    client = ApiClient({})
+    pieces = list(client.stream_model("hello streaming world"))
+    assert len(pieces) > 1
+    assert "".join(pieces) == client.call_model("hello streaming world")
+
+
+def test_controller_queues_deltas_then_full_text():
+    class Client:
+        def stream_model(self, prompt, context=None, cfg=None):
+            yield "a"
+            yield ""
+            yield "b"
+            raise RuntimeError("boom")
+
+    c = Controller(None, None, Client(), {})
+    c._stream_reply("q", [], CFG)
+    items = []
+    while not c.result_queue.empty():
+        items.append(c.result_queue.get_nowait())
+    assert items[:2] == [("delta", "a", None), ("delta", "b", None)]
+    kind, full, session_id = items[2]
+    assert kind == "done" and session_id is None and full.startswith("ab\n[ERROR]") and "boom" in full
+
+
+def test_stream_reply_is_saved_to_the_session_it_started_in():
+    from types import SimpleNamespace
+
+    from ui.app_ui import AppUI
+
+    class Storage:
+        def __init__(self):
+            self.appended = []
+
+        def append_message(self, sid, role, text):
+            self.appended.append((sid, role, text))
+            return len(self.appended)
+
+    class Bubble:
+        content = "partial"
+
+        def set_content(self, text):
+            self.content = text
+
+        def set_message_id(self, msg_id):
+            self.msg_id = msg_id
+
+    bubble = Bubble()
+    ui = SimpleNamespace(_stream_bubble=bubble, _stream_parts=["partial"],
+                         c=SimpleNamespace(current_session="b", storage=Storage()))
+    # 流式回复期间切换到了会话 b：回复仍保存到发起请求的会话 a，且不渲染
+    AppUI._finish_stream_reply(ui, "full reply", "a")
+    assert ui.c.storage.appended == [("a", "assistant", "full reply")]
+    assert bubble.content == "partial" and ui._stream_bubble is None
+
+    ui._stream_bubble = bubble
+    AppUI._finish_stream_reply(ui, "second", "b")
+    assert ui.c.storage.appended[-1] == ("b", "assistant", "second")
+    assert bubble.content == "second" and bubble.msg_id == 2
+
+
+def test_blocking_reply_is_saved_to_the_session_it_started_in():
+    from types import SimpleNamespace
+
+    from ui.app_ui import AppUI
+
+    class Storage:
+        def __init__(self):
+            self.appended = []
+
+        def append_message(self, sid, role, text):
+            self.appended.append((sid, role, text))
+            return len(self.appended)
+
+    c = Controller(None, None, object(), {"stream_responses": False})
+    c._call_api_async("q", "a")
+    kind, _, session_id = c.result_queue.get_nowait()
+    assert (kind, session_id) == ("reply", "a")
+
+    # 等待回复期间切换到了会话 b：只保存到会话 a，不渲染
+    rendered = []
+    ui = SimpleNamespace(c=SimpleNamespace(current_session="b", storage=Storage()),
+                         add_message_bubble=lambda *a, **k: rendered.append(a))
+    AppUI._update_ui_with_reply(ui, "reply", "a")
+    assert ui.c.storage.appended == [("a", "assistant", "reply")] and rendered == []
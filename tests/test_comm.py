@@ -5,7 +5,7 @@ import os
 import sys
 import threading
 import time
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
@@ -77,12 +77,12 @@ class TestComm:
         assert server.allowed_keys == {"key1", "key2"}
 
     @patch('comm.server.config.load_config')
-    @patch('comm.server.ApiClient')
+    @patch('comm.server.AsyncApiClient')
     def test_relay_server_call_model(self, mock_api_client, mock_load_config):
         """测试服务器端模型调用。"""
         mock_load_config.return_value = {"provider": "test", "api_key": "test_key"}
         mock_client = MagicMock()
-        mock_client.call_model.return_value = "Mock reply"
+        mock_client.call_model = AsyncMock(return_value="Mock reply")
         mock_api_client.return_value = mock_client
 
         server = RelayServer()
@@ -91,7 +91,7 @@ class TestComm:
             "context": [{"role": "user", "content": "Hi"}],
             "api_cfg": {"model": "gpt-3.5"}
         }
-        reply = server._call_model(payload)
+        reply = asyncio.run(server._call_model(payload))
         assert reply == "Mock reply"
         mock_client.call_model.assert_called_once_with("Hello", context=[{"role": "user", "content": "Hi"}], cfg={"model": "gpt-3.5"})
 
@@ -169,7 +169,7 @@ class TestIntegration:
     def test_client_server_model_request(self, server_thread):
         """测试客户端请求远程模型调用。"""
         server, port = server_thread
-        with patch('comm.server.ApiClient.call_model', return_value="Server model reply"):
+        with patch('comm.server.AsyncApiClient.call_model', return_value="Server model reply"):
             comm = WebSocketComm(f"ws://127.0.0.1:{port}", "test_key")
             received = []
 
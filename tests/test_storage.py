@@ -0,0 +1,299 @@
+import sqlite3
+
+from storage import Storage
+
+
+def test_messages_loaded_on_demand(temp_storage):
+    s = temp_storage
+    sid = s.create_session('Lazy')
+    for i in range(3):
+        s.append_message(sid, 'user', f'msg {i}')
+
+    s.flush()
+    reopened = Storage(s.path)
+    assert sid in reopened.sessions
+    assert reopened.sessions[sid]['title'] == 'Lazy'
+    assert not reopened.sessions.is_hydrated(sid)
+
+    msgs = reopened.get_session(sid)['messages']
+    assert [m['content'] for m in msgs] == ['msg 0', 'msg 1', 'msg 2']
+    assert reopened.sessions.is_hydrated(sid)
+
+
+def test_hydrated_sessions_are_bounded(temp_storage):
+    s = temp_storage
+    sids = [s.create_session(f'S{i}') for i in range(5)]
+    for sid in sids:
+        s.append_message(sid, 'user', sid)
+
+    s.flush()
+    reopened = Storage(s.path, cache_size=2)
+    for sid in sids:
+        assert reopened.get_session(sid)['messages'][0]['content'] == sid
+    assert reopened.sessions.hydrated_ids() == sids[-2:]
+    # evicted sessions keep their metadata and reload messages transparently
+    assert reopened.sessions[sids[0]]['title'] == 'S0'
+    assert reopened.sessions[sids[0]]['messages'][0]['content'] == sids[0]
+
+
+def test_save_keeps_messages_of_unloaded_sessions(temp_storage):
+    s = temp_storage
+    a = s.create_session('A')
+    b = s.create_session('B')
+    s.append_message(a, 'user', 'keep me')
+    s.append_message(b, 'user', 'delete me')
+
+    s.flush()
+    reopened = Storage(s.path)
+    msgs = reopened.get_session(b)['messages']
+    del msgs[0]
+    reopened.sessions[b]['messages'] = msgs
+    reopened.sessions[a]['draft'] = 'draft text'
+    reopened.save().result()
+
+    check = Storage(s.path)
+    assert [m['content'] for m in check.get_session(a)['messages']] == ['keep me']
+    assert check.get_session(a)['draft'] == 'draft text'
+    assert check.get_session(b)['messages'] == []
+
+
+def _trace_statements(storage):
+    """Trace SQL executed by the background writer connection."""
+    statements = []
+    storage._writer.call(lambda conn: conn.set_trace_callback(statements.append))
+    statements.clear()
+    return statements
+
+
+def _stop_trace(storage):
+    storage._writer.call(lambda conn: conn.set_trace_callback(None))
+
+
+def test_save_writes_only_dirty_rows(temp_storage):
+    s = temp_storage
+    a = s.create_session('A')
+    b = s.create_session('B')
+    for i in range(5):
+        s.append_message(a, 'user', f'a{i}')
+        s.append_message(b, 'user', f'b{i}')
+
+    s.flush()
+    statements = _trace_statements(s)
+    s.save().result()
+    assert statements == []
+
+    msgs = s.get_session(a)['messages']
+    del msgs[1]
+    msgs[0]['content'] = 'a0 edited'
+    msgs.append({'role': 'assistant', 'content': 'a5', 'timestamp': ''})
+    s.save().result()
+    _stop_trace(s)
+    assert not any(sql.startswith('DELETE FROM messages WHERE session_id') for sql in statements)
+    assert not any(b in sql for sql in statements)
+    assert not any(f"'b{i}'" in sql for i in range(5) for sql in statements)
+
+    check = Storage(s.path)
+    assert [m['content'] for m in check.get_session(a)['messages']] == ['a0 edited', 'a2', 'a3', 'a4', 'a5']
+    assert [m['content'] for m in check.get_session(b)['messages']] == [f'b{i}' for i in range(5)]
+
+
+def test_in_place_edit_of_a_message_is_saved(temp_storage):
+    s = temp_storage
+    sid = s.create_session('Edit')
+    s.append_message(sid, 'user', 'before')
+    s.sessions[sid]['messages'].append({'role': 'assistant', 'content': 'reply', 'timestamp': ''})
+    s.save().result()
+    s.sessions.pop(sid)
+    s.sessions.add_meta(sid, 'Edit')
+
+    # 只改消息本身（不改列表）也会标记会话待保存
+    s.sessions[sid]['messages'][0]['content'] = 'after'
+    assert s.sessions.is_dirty(sid)
+    s.save().result()
+    assert not s.sessions.is_dirty(sid)
+    s.sessions[sid]['messages'][1]['role'] = 'user'
+    s.save()
+    s.flush()
+
+    check = Storage(s.path)
+    assert [(m['role'], m['content']) for m in check.get_session(sid)['messages']] == [('user', 'after'), ('user', 'reply')]
+
+
+def test_session_added_directly_to_cache_is_persisted(temp_storage):
+    s = temp_storage
+    s.sessions['remote-1'] = {'session_id': 'remote-1', 'title': 'Remote', 'draft': '', 'messages': []}
+    s.append_message('remote-1', 'assistant', 'hi')
+
+    s.flush()
+    check = Storage(s.path)
+    assert check.sessions['remote-1']['title'] == 'Remote'
+    assert [m['content'] for m in check.get_session('remote-1')['messages']] == ['hi']
+
+
+def test_message_ids_are_stable(temp_storage):
+    s = temp_storage
+    sid = s.create_session('Ids')
+    ids = [s.append_message(sid, 'user', f'm{i}') for i in range(3)]
+    assert [m['id'] for m in s.get_session(sid)['messages']] == ids
+
+    s.flush()
+    reopened = Storage(s.path)
+    assert [m['id'] for m in reopened.get_session(sid)['messages']] == ids
+
+
+def test_failed_save_is_written_by_the_next_save(temp_storage, monkeypatch):
+    from storage import session_stats
+
+    s = temp_storage
+    sid = s.create_session('Retry')
+    s.append_message(sid, 'user', 'keep')
+    s.append_message(sid, 'user', 'drop')
+    msgs = s.get_session(sid)['messages']
+    msgs[0]['content'] = 'edited'
+    del msgs[1]
+    msgs.append({'role': 'assistant', 'content': 'new', 'timestamp': ''})
+
+    # 模拟磁盘已满：这次写入整体回滚
+    def disk_full(conn, session_ids):
+        raise sqlite3.OperationalError('database or disk is full')
+
+    with monkeypatch.context() as m:
+        m.setattr(session_stats, 'fill_previews', disk_full)
+        assert s.save().exception() is not None
+    assert msgs[-1].get('id') is None
+
+    s.save().result()
+    s.flush()
+    check = Storage(s.path)
+    assert [m['content'] for m in check.get_session(sid)['messages']] == ['edited', 'new']
+
+
+def test_delete_messages_by_id(temp_storage):
+    s = temp_storage
+    sid = s.create_session('Delete')
+    ids = [s.append_message(sid, 'user', f'm{i}') for i in range(300)]
+
+    statements = _trace_statements(s)
+    removed = s.delete_messages(sid, ids[::2])
+    s.flush()
+    _stop_trace(s)
+    assert removed == 150
+    # 触发器内的语句会以外层 SQL 重复上报，按去重后计数
+    assert len({sql for sql in statements if sql.startswith('DELETE FROM messages')}) == 1
+    assert [m['id'] for m in s.get_session(sid)['messages']] == ids[1::2]
+    # cache stays clean: nothing left for save() to rewrite
+    assert not s.sessions.is_dirty(sid)
+
+    reopened = Storage(s.path)
+    assert [m['id'] for m in reopened.get_session(sid)['messages']] == ids[1::2]
+
+
+def test_controller_deletes_by_index_through_ids(temp_storage):
+    from controller.controller import Controller
+
+    s = temp_storage
+    sid = s.create_session('Ctrl')
+    for i in range(4):
+        s.append_message(sid, 'user', f'm{i}')
+    ctrl = Controller(None, s, None, {})
+    ctrl.on_delete_messages(sid, [0, 2])
+    assert [m['content'] for m in s.get_session(sid)['messages']] == ['m1', 'm3']
+
+
+def _bulk_session(s, n):
+    """直接用 SQL 写入 n 条消息（比逐条 append 快），返回会话 id。"""
+    sid = s.create_session('Big')
+    s._writer.call(lambda conn: conn.executemany(
+        "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, 'user', ?, '')",
+        [(sid, f'm{i}') for i in range(n)],
+    ))
+    # 绕过了缓存写入，按重新打开后的状态只保留元数据
+    s.sessions.pop(sid)
+    s.sessions.add_meta(sid, 'Big')
+    return sid
+
+
+def test_get_messages_pages_backwards_by_id(temp_storage):
+    s = temp_storage
+    sid = _bulk_session(s, 120)
+
+    newest = s.get_messages(sid, limit=50)
+    assert [m['content'] for m in newest] == [f'm{i}' for i in range(70, 120)]
+    older = s.get_messages(sid, before_id=newest[0]['id'], limit=50)
+    assert [m['content'] for m in older] == [f'm{i}' for i in range(20, 70)]
+    oldest = s.get_messages(sid, before_id=older[0]['id'], limit=50)
+    assert [m['content'] for m in oldest] == [f'm{i}' for i in range(20)]
+    assert s.get_messages(sid, before_id=oldest[0]['id']) == []
+    after = s.get_messages(sid, after_id=newest[-3]['id'], limit=None)
+    assert [m['content'] for m in after] == ['m118', 'm119']
+    # 分页读取不会把整个会话加载进缓存
+    assert not s.sessions.is_hydrated(sid)
+
+    # 已加载的会话从缓存切片，包含尚未保存的新消息
+    msgs = s.get_session(sid)['messages']
+    msgs.append({'role': 'user', 'content': 'unsaved', 'timestamp': ''})
+    page = s.get_messages(sid, limit=3)
+    assert [m['content'] for m in page] == ['m118', 'm119', 'unsaved']
+    assert [m['content'] for m in s.get_messages(sid, before_id=page[0]['id'], limit=2)] == ['m116', 'm117']
+
+
+class _PagedUI:
+    def __init__(self):
+        self.shown = []
+        self.prepended = []
+        self.has_older = None
+
+    def show_messages(self, messages):
+        self.shown = list(messages)
+
+    def prepend_messages(self, messages):
+        self.prepended.append(list(messages))
+        self.shown = list(messages) + self.shown
+
+    def set_has_older(self, value):
+        self.has_older = value
+
+
+def test_controller_opens_large_session_one_page_at_a_time(temp_storage):
+    from controller.controller import Controller
+
+    s = temp_storage
+    sid = _bulk_session(s, 20000)
+    ui = _PagedUI()
+    ctrl = Controller(ui, s, None, {'message_page_size': 50})
+
+    ctrl.on_select_session(sid)
+    assert [m['content'] for m in ui.shown] == [f'm{i}' for i in range(19950, 20000)]
+    assert ui.has_older is True
+    assert not s.sessions.is_hydrated(sid)
+
+    ctrl.on_load_older_messages()
+    assert [m['content'] for m in ui.prepended[-1]] == [f'm{i}' for i in range(19900, 19950)]
+    assert len(ui.shown) == 100
+
+    # 索引基于已加载窗口：0 号是窗口中最早的消息
+    ctrl.on_delete_messages(sid, [0, 99])
+    assert ui.shown[0]['content'] == 'm19901'
+    assert ui.shown[-1]['content'] == 'm19998'
+    assert len(ui.shown) == 98
+    assert not s.sessions.is_hydrated(sid)
+
+
+def test_has_older_is_exact_at_page_boundaries(temp_storage):
+    from controller.controller import Controller
+
+    s = temp_storage
+    sid = _bulk_session(s, 10)
+    ui = _PagedUI()
+    ctrl = Controller(ui, s, None, {'message_page_size': 5})
+
+    ctrl.on_select_session(sid)
+    assert [m['content'] for m in ui.shown] == [f'm{i}' for i in range(5, 10)]
+    assert ui.has_older is True
+    # 恰好剩下一页：加载后不再提示还有更早的消息
+    assert [m['content'] for m in ctrl.on_load_older_messages()] == [f'm{i}' for i in range(5)]
+    assert ui.has_older is False
+
+    exact = _bulk_session(s, 5)
+    ctrl.on_select_session(exact)
+    assert len(ui.shown) == 5 and ui.has_older is False
@@ -0,0 +1,152 @@
+import sqlite3
+
+from storage import Storage, archive, codec
+
+
+BIG = "def handler(event):\n    return process(event)\n" * 200
+OLD = "2020-01-01T00:00:00+00:00"
+
+
+def _setup(tmp_path):
+    """Two old sessions and one recent, reopened so nothing is hydrated."""
+    path = str(tmp_path / "data.db")
+    s = Storage(path)
+    old_a = s.create_session("Old A")
+    s.append_message(old_a, "user", "archived needle question")
+    s.append_message(old_a, "assistant", BIG)
+    old_b = s.create_session("Old B")
+    s.append_message(old_b, "user", BIG)
+    new = s.create_session("New")
+    s.append_message(new, "user", "recent")
+    s.flush()
+    s._writer.call(lambda conn: conn.execute(
+        "UPDATE messages SET timestamp = ? WHERE session_id IN (?, ?)", (OLD, old_a, old_b)))
+    s._writer.call(lambda conn: conn.execute(
+        "UPDATE sessions SET updated_at = ? WHERE session_id IN (?, ?)", (OLD, old_a, old_b)))
+    s.close()
+    return path, old_a, old_b, new
+
+
+def test_idle_sessions_move_to_archive(tmp_path):
+    path, old_a, old_b, new = _setup(tmp_path)
+    s = Storage(path)
+    expected = [m["content"] for m in s.get_messages(old_a)]
+    s.sessions.pop(old_a)
+    s.sessions.add_meta(old_a, "Old A")
+
+    assert s.archive_idle_sessions(30) == 2
+    assert sorted(s.sessions.keys()) == [new]
+    assert s.conn.execute("SELECT COUNT(*) FROM main.messages").fetchone()[0] == 1
+    # 共享的大消息体已不被热库引用
+    assert s.conn.execute("SELECT COUNT(*) FROM main.contents").fetchone()[0] == 0
+    assert s.storage_stats()["archived_sessions"] == 2
+
+    rows = {r["session_id"]: r for r in s.list_sessions()}
+    assert (rows[old_a]["archived"], rows[old_a]["message_count"], rows[old_a]["title"]) == (True, 2, "Old A")
+    assert rows[new]["archived"] is False
+    assert [r["session_id"] for r in s.list_sessions(include_archived=False)] == [new]
+
+    hits = s.search("needle")
+    assert [(h["session_id"], h["title"], h.get("archived")) for h in hits] == [(old_a, "Old A", True)]
+    assert "[needle]" in hits[0]["snippet"]
+    assert len(s.search("handler")) == 2
+    s.close()
+
+    # 重启后归档会话不进入缓存
+    s = Storage(path)
+    assert sorted(s.sessions.keys()) == [new]
+    s.close()
+    conn = sqlite3.connect(str(tmp_path / "archive.db"))
+    assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 3
+    conn.close()
+
+    # 重新打开时恢复：内容、id 不变，重新进入热库索引
+    s = Storage(path)
+    msgs = s.get_messages(old_a)
+    assert [m["content"] for m in msgs] == expected
+    assert old_a in s.sessions and s.sessions[old_a]["title"] == "Old A"
+    assert s.search("needle")[0].get("archived") is None
+    assert s.conn.execute(f"SELECT COUNT(*) FROM main.messages WHERE codec = {codec.CODEC_REF}").fetchone()[0] == 1
+    assert s.storage_stats()["archived_sessions"] == 1
+    assert s.get_session(old_b)["messages"][0]["content"] == BIG
+    assert s.storage_stats()["archived_sessions"] == 0
+    assert s.conn.execute("SELECT SUM(refs) FROM main.contents").fetchone()[0] == 2
+    s._writer.call(lambda conn: conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('integrity-check', 1)"))
+    s.close()
+
+
+def test_loaded_and_dirty_sessions_stay_hot(tmp_path):
+    path, old_a, old_b, new = _setup(tmp_path)
+    s = Storage(path)
+    s.get_session(old_a)
+    s.sessions[old_b]["title"] = "renamed"
+    assert s.archive_idle_sessions(30) == 0
+    s.close()
+
+
+def test_restore_does_not_hold_the_cache_lock_while_writing(tmp_path):
+    import threading
+    import time
+
+    path, old_a, old_b, new = _setup(tmp_path)
+    s = Storage(path)
+    assert s.archive_idle_sessions(30) == 2
+
+    # 写线程被占住：恢复在等待写入，其它线程仍能使用缓存
+    gate = threading.Event()
+    s._writer.submit(lambda conn: gate.wait(5))
+    restoring = threading.Thread(target=s.get_session, args=(old_a,))
+    restoring.start()
+    time.sleep(0.1)
+    start = time.perf_counter()
+    s.rename_session(new, "Still responsive")
+    assert time.perf_counter() - start < 1
+    gate.set()
+    restoring.join(5)
+    assert old_a in s.sessions and s.sessions[old_a]["title"] == "Old A"
+    assert s.get_session(old_a)["messages"][0]["content"] == "archived needle question"
+    s.close()
+
+
+def test_interrupted_move_is_reconciled(tmp_path):
+    path, old_a, old_b, new = _setup(tmp_path)
+    s = Storage(path)
+    # 只完成了复制一步：会话同时存在于两个库中
+    s._writer.call(lambda conn: archive.copy_to_archive(conn, [old_a], OLD))
+    s.close()
+
+    s = Storage(path)
+    assert s.storage_stats()["archived_sessions"] == 0
+    assert [r["archived"] for r in s.list_sessions() if r["session_id"] == old_a] == [False]
+    assert s.search("needle")[0].get("archived") is None
+    s.close()
+
+
+def test_delete_and_clear_archived_sessions(tmp_path):
+    path, old_a, old_b, new = _setup(tmp_path)
+    s = Storage(path)
+    s.archive_idle_sessions(30)
+    assert s.delete_session(old_a) is True
+    s.flush()
+    assert s.search("needle") == []
+    assert s.get_messages(old_a) == []
+    s.clear_all_sessions().result()
+    assert s.list_sessions() == []
+    assert s.search("handler") == []
+    s.close()
+
+
+def test_export_includes_archived_sessions(tmp_path):
+    path, old_a, old_b, new = _setup(tmp_path)
+    s = Storage(path)
+    s.archive_idle_sessions(30)
+    out = str(tmp_path / "all.jsonl")
+    assert s.export_jsonl(out) == {"sessions": 3, "messages": 4}
+    # 归档会话视为已存在，不会被重复导入
+    assert s.import_jsonl(out) == {"sessions": 0, "messages": 0}
+    s.close()
+
+    other = Storage(str(tmp_path / "other" / "data.db"))
+    assert other.import_jsonl(out) == {"sessions": 3, "messages": 4}
+    assert other.get_messages(old_b)[0]["content"] == BIG
+    other.close()
@@ -0,0 +1,131 @@
+import sqlite3
+
+from storage import Storage, changes
+
+
+def _pair(tmp_path):
+    path = str(tmp_path / "data.db")
+    return Storage(path), Storage(path)
+
+
+def test_other_process_changes_are_picked_up(tmp_path):
+    app, relay = _pair(tmp_path)
+    assert app.poll_changes() == set()
+
+    sid = relay.create_session("From relay")
+    relay.append_message(sid, "user", "hello")
+    relay.flush()
+    assert app.poll_changes() == {sid}
+    assert app.sessions[sid]["title"] == "From relay"
+    assert [m["content"] for m in app.get_messages(sid)] == ["hello"]
+
+    # 已加载的消息在下一次访问时重新读取
+    relay.append_message(sid, "assistant", "hi")
+    relay.rename_session(sid, "Renamed")
+    relay.flush()
+    assert app.poll_changes() == {sid}
+    assert app.sessions[sid]["title"] == "Renamed"
+    assert [m["content"] for m in app.get_messages(sid)] == ["hello", "hi"]
+
+    relay.delete_session(sid)
+    relay.flush()
+    assert app.poll_changes() == {sid}
+    assert sid not in app.sessions
+    app.close()
+    relay.close()
+
+
+def test_own_writes_and_idle_polls_report_nothing(tmp_path):
+    app, relay = _pair(tmp_path)
+    sid = app.create_session("Mine")
+    app.append_message(sid, "user", "local")
+    app.flush()
+    assert app.poll_changes() == set()
+    assert relay.poll_changes() == {sid}
+    assert relay.poll_changes() == set()
+    # 一个事务内的多条消息只记一行
+    log = app.conn.execute("SELECT session_id FROM change_log").fetchall()
+    assert len(log) <= 2
+    app.close()
+    relay.close()
+
+
+def test_unsaved_local_edits_are_not_overwritten(tmp_path):
+    app, relay = _pair(tmp_path)
+    sid = app.create_session("Shared")
+    app.flush()
+    relay.poll_changes()
+    app.poll_changes()
+    app.sessions[sid]["draft"] = "typing..."
+    relay.rename_session(sid, "Remote title")
+    relay.flush()
+    assert app.poll_changes() == set()
+    assert app.sessions[sid]["draft"] == "typing..."
+    app.close()
+    relay.close()
+
+
+def test_pruned_log_reloads_all_metadata(tmp_path):
+    app, relay = _pair(tmp_path)
+    sid = relay.create_session("Before")
+    relay.flush()
+    conn = sqlite3.connect(relay.path)
+    conn.execute("UPDATE sessions SET title = 'Outside Storage' WHERE session_id = ?", (sid,))
+    # 模拟落后太多：日志已裁剪到 app 的高水位之后
+    conn.execute("DELETE FROM change_log")
+    conn.execute("INSERT INTO change_log (seq, session_id) VALUES (?, 'other')", (changes.high_water(conn) + 100,))
+    conn.commit()
+    conn.close()
+    assert sid in app.poll_changes()
+    assert app.sessions[sid]["title"] == "Outside Storage"
+    app.close()
+    relay.close()
+
+
+def test_ids_follow_write_order_across_processes(tmp_path):
+    a, b = _pair(tmp_path)
+    sid = a.create_session("Shared")
+    a.flush()
+    b.poll_changes()
+    a.append_message(sid, "user", "a1")
+    b.append_message(sid, "user", "b1")
+    b.append_message(sid, "user", "b2")
+    a.append_message(sid, "user", "a2")
+    a.flush()
+    b.flush()
+    reader = Storage(str(tmp_path / "data.db"))
+    assert [m["content"] for m in reader.get_messages(sid, limit=2)] == ["b2", "a2"]
+    a.poll_changes()
+    assert [m["content"] for m in a.get_messages(sid)] == ["a1", "b1", "b2", "a2"]
+    reader.close()
+    a.close()
+    b.close()
+
+
+def test_poll_does_not_wait_for_the_writer(tmp_path):
+    import threading
+    import time
+
+    app, relay = _pair(tmp_path)
+    sid = relay.create_session("Remote")
+    relay.flush()
+    app.poll_changes()
+    app.append_message(sid, "user", "first")
+
+    relay.rename_session(sid, "Renamed")
+    relay.flush()
+
+    # 写线程被占住（事务中持有写锁），且该会话有本地写入未提交：poll_changes 仍立即返回
+    gate = threading.Event()
+    app._writer.submit(lambda conn: gate.wait(5), key=sid)
+    start = time.perf_counter()
+    assert app.poll_changes() == set()
+    assert time.perf_counter() - start < 1
+    # 本地写入提交后，下一次轮询补上推迟的刷新
+    gate.set()
+    app.flush()
+    assert app.poll_changes() == {sid}
+    assert app.sessions[sid]["title"] == "Renamed"
+    assert [m["content"] for m in app.get_messages(sid)] == ["first"]
+    app.close()
+    relay.close()
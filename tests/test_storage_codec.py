@@ -0,0 +1,124 @@
+import json
+import sqlite3
+
+import storage
+from storage import Storage, codec
+
+
+def _big(text="def handler(event):\n    return process(event)\n", n=200):
+    return text * n
+
+
+def test_large_bodies_are_stored_compressed(tmp_path):
+    s = Storage(str(tmp_path / "c.db"), compress_threshold=1024, dedup_min=None)
+    sid = s.create_session("Code")
+    small = s.append_message(sid, "user", "short question")
+    big = s.append_message(sid, "assistant", _big())
+    s.flush()
+
+    rows = dict(s.conn.execute("SELECT id, codec FROM messages").fetchall())
+    assert rows == {small: codec.CODEC_PLAIN, big: codec.CODEC_ZLIB}
+    stored = s.conn.execute("SELECT length(content) FROM messages WHERE id = ?", (big,)).fetchone()[0]
+    assert stored < len(_big()) // 10
+
+    # the cache keeps the packed bytes and decodes on read
+    msg = s.get_session(sid)["messages"][1]
+    assert isinstance(codec.raw_content(msg), codec.Packed)
+    assert msg["content"] == _big()
+    assert msg.get("content") == _big()
+    assert json.loads(json.dumps(dict(msg)))["content"] == _big()
+
+    # a reload from the DB gives the same result
+    s.sessions.pop(sid)
+    s.sessions.add_meta(sid, "Code")
+    assert [m["content"] for m in s.get_messages(sid)] == ["short question", _big()]
+    assert s.get_session(sid)["messages"][1]["content"] == _big()
+    s.close()
+
+
+def test_search_and_stats_see_decoded_text(tmp_path):
+    s = Storage(str(tmp_path / "c.db"), compress_threshold=1024)
+    sid = s.create_session("Code")
+    mid = s.append_message(sid, "assistant", "needle in a haystack " + _big())
+    assert [r["message_id"] for r in s.search("haystack")] == [mid]
+    assert [r["message_id"] for r in s.search("ne")] == [mid]
+    row = s.list_sessions()[0]
+    assert row["last_preview"].startswith("needle in a haystack")
+    assert row["token_total"] > 1000
+
+    s.delete_messages(sid, [mid])
+    assert s.search("haystack") == []
+    assert s.list_sessions()[0]["token_total"] == 0
+    s._writer.call(lambda conn: conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('integrity-check', 1)"))
+    s.close()
+
+
+def test_edits_of_compressed_messages_are_saved(tmp_path):
+    s = Storage(str(tmp_path / "c.db"), compress_threshold=1024, dedup_min=None)
+    sid = s.create_session("Edit")
+    s.append_message(sid, "assistant", _big())
+    s.save().result()
+    assert s.sessions.take_dirty() == (set(), set())
+
+    msgs = s.get_session(sid)["messages"]
+    msgs[0]["content"] = "replaced"
+    s.sessions[sid]["messages"] = msgs
+    s.save()
+    s.flush()
+    assert s.conn.execute("SELECT codec, content FROM messages").fetchone()[:] == (0, "replaced")
+    s.close()
+
+
+def test_migration_compresses_existing_rows(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    s = Storage(path)
+    sid = s.create_session("Old")
+    s.append_message(sid, "user", "hi")
+    s.close()
+    conn = sqlite3.connect(path)
+    codec.register(conn)
+    with conn:
+        conn.execute("UPDATE messages SET content = ?", (_big(n=500),))
+        conn.execute("PRAGMA user_version = 5")
+    conn.close()
+
+    s = Storage(path)
+    assert s.conn.execute("PRAGMA user_version").fetchone()[0] == storage.SCHEMA_VERSION
+    # large bodies end up compressed in the contents table
+    assert s.conn.execute("SELECT codec FROM contents").fetchone()[0] == codec.CODEC_ZLIB
+    assert s.get_session(sid)["messages"][0]["content"] == _big(n=500)
+    assert len(s.search("handler")) == 1
+    s.close()
+
+
+def test_other_connections_can_write_messages(tmp_path):
+    path = str(tmp_path / "c.db")
+    s = Storage(path, compress_threshold=1024)
+    sid = s.create_session("Mixed")
+    first = s.append_message(sid, "user", "plain question")
+    second = s.append_message(sid, "assistant", "needle " + _big())
+    s.flush()
+    assert s.list_sessions()[0]["last_preview"].startswith("needle")
+
+    # 触发器只用内置 SQL：未注册 message_text() 的连接也能写入
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, 'user', 'external note', 'z')", (sid,)
+        )
+        conn.execute("UPDATE messages SET content = 'edited question' WHERE id = ?", (first,))
+        conn.execute("DELETE FROM messages WHERE role = 'user' AND content = 'external note'")
+    conn.close()
+
+    assert [r["message_id"] for r in s.search("edited")] == [first]
+    # 删除最后一条后，压缩的上一条消息的预览在写任务中补上
+    third = s.append_message(sid, "user", "tail")
+    s.delete_messages(sid, [third])
+    s.flush()
+    assert s.list_sessions()[0]["last_preview"].startswith("needle")
+    s.delete_messages(sid, [second])
+    s.flush()
+    assert s.search("needle") == []
+    assert s.list_sessions()[0]["last_preview"] == "edited question"
+    s._writer.call(lambda conn: conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('integrity-check', 1)"))
+    s.close()
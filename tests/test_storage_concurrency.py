@@ -0,0 +1,120 @@
+import gc
+import sqlite3
+import threading
+import time
+
+from storage import Storage
+
+
+def test_read_connections_are_per_thread_and_read_only(temp_storage):
+    s = temp_storage
+    conns = {}
+
+    def grab(name):
+        conns[name] = s.conn
+
+    t = threading.Thread(target=grab, args=("worker",))
+    t.start()
+    t.join()
+    assert s.conn is s.conn
+    assert conns["worker"] is not s.conn
+
+    try:
+        s.conn.execute("DELETE FROM prompts")
+        assert False, "reader connection must be read-only"
+    except sqlite3.OperationalError:
+        pass
+
+
+def test_reader_of_finished_thread_is_closed(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Short")
+    s.append_message(sid, "user", "hi")
+    s.flush()
+
+    def read():
+        s.get_messages(sid)
+
+    for _ in range(50):
+        t = threading.Thread(target=read)
+        t.start()
+        t.join()
+    del t
+    gc.collect()
+    # 只剩调用线程自己的连接（以及可能尚未回收的最后一个）
+    assert s._db.open_readers() <= 2
+
+
+def test_reads_do_not_block_behind_a_write(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Busy")
+    s.append_message(sid, "user", "committed")
+    s.flush()
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def long_write(conn):
+        conn.execute("UPDATE sessions SET title = 'writing' WHERE session_id = ?", (sid,))
+        started.set()
+        release.wait(5)
+
+    fut = s._writer.submit(long_write)
+    assert started.wait(5)
+    t0 = time.perf_counter()
+    count = s.conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (sid,)).fetchone()[0]
+    title = s.conn.execute("SELECT title FROM sessions WHERE session_id = ?", (sid,)).fetchone()[0]
+    elapsed = time.perf_counter() - t0
+    release.set()
+    fut.result(5)
+
+    assert count == 1
+    assert title == "Busy"  # 读到的是写事务开始前的快照
+    assert elapsed < 1.0
+
+
+def test_concurrent_append_read_delete(temp_storage):
+    s = temp_storage
+    threads_n, per_thread = 8, 60
+    sids = [s.create_session(f"T{i}") for i in range(threads_n)]
+    shared = s.create_session("Shared")
+    errors = []
+    kept = {}
+
+    def worker(n):
+        try:
+            sid = sids[n]
+            ids = []
+            for i in range(per_thread):
+                ids.append(s.append_message(sid, "user", f"{n}-{i}"))
+                s.append_message(shared, "assistant", f"{n}-{i}")
+                if i % 10 == 9:
+                    # 删除最近写入的一半，并穿插读取
+                    s.delete_messages(sid, ids[-10::2])
+                    msgs = s.get_session(sid)["messages"]
+                    assert [m["id"] for m in msgs] == sorted(m["id"] for m in msgs)
+                    s.conn.execute("SELECT COUNT(*) FROM messages").fetchone()
+                s.list_sessions()
+            kept[sid] = [m for j, m in enumerate(ids) if (j % 10) % 2 == 1]
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(threads_n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(60)
+    assert not errors
+    assert s.flush(10)
+    assert s._writer.last_error is None
+
+    for sid in sids:
+        assert [m["id"] for m in s.get_session(sid)["messages"]] == kept[sid]
+    assert len(s.get_session(shared)["messages"]) == threads_n * per_thread
+
+    reopened = Storage(s.path)
+    for sid in sids:
+        assert [m["id"] for m in reopened.get_session(sid)["messages"]] == kept[sid]
+    shared_ids = [m["id"] for m in reopened.get_session(shared)["messages"]]
+    assert len(set(shared_ids)) == threads_n * per_thread
+    reopened.close()
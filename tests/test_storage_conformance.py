@@ -0,0 +1,185 @@
+"""StoragePort conformance: the same checks against every storage backend."""
+import pytest
+
+from storage import LogStorage, MemoryStorage, Storage
+from token_calculator import TokenCalculator
+
+BACKENDS = {
+    "sqlite": lambda tmp_path: Storage(str(tmp_path / "data.db")),
+    "memory": lambda tmp_path: MemoryStorage(),
+    "log": lambda tmp_path: LogStorage(str(tmp_path / "log")),
+}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def store(request, tmp_path):
+    s = BACKENDS[request.param](tmp_path)
+    yield s
+    s.close()
+
+
+def _unload(s, sid):
+    # 丢弃缓存中的消息，下次读取走后端
+    title = s.sessions[sid]["title"]
+    s.sessions.pop(sid)
+    s.sessions.add_meta(sid, title)
+
+
+def test_append_and_keyset_pages(store):
+    sid = store.create_session("Paged")
+    ids = [store.append_message(sid, "user" if i % 2 == 0 else "assistant", f"m{i}") for i in range(7)]
+    assert ids == sorted(ids) and len(set(ids)) == 7
+    for hydrated in (True, False):
+        if not hydrated:
+            _unload(store, sid)
+        assert [m["content"] for m in store.get_messages(sid, limit=3)] == ["m4", "m5", "m6"]
+        assert [m["content"] for m in store.get_messages(sid, before_id=ids[4], limit=3)] == ["m1", "m2", "m3"]
+        assert [m["content"] for m in store.get_messages(sid, after_id=ids[1], limit=2)] == ["m2", "m3"]
+        assert [m["id"] for m in store.get_messages(sid, limit=None)] == ids
+    assert store.get_messages("missing") == []
+    assert [m["role"] for m in store.get_session(sid)["messages"]][:2] == ["user", "assistant"]
+
+
+def test_cache_edits_are_saved_as_deltas(store):
+    sid = "legacy-id"
+    store.sessions[sid] = {"session_id": sid, "title": "Direct", "messages": [
+        {"role": "user", "content": "one", "timestamp": "2024-01-01T00:00:00+00:00"},
+        {"role": "assistant", "content": "two", "timestamp": "2024-01-01T00:00:01+00:00"},
+    ]}
+    assert store.list_sessions()[0]["session_id"] == sid
+    store.save().result()
+    msgs = store.get_session(sid)["messages"]
+    assert all(m["id"] is not None for m in msgs)
+
+    msgs[0]["content"] = "one (edited)"
+    del msgs[1]
+    msgs.append({"role": "user", "content": "three", "timestamp": "2024-01-01T00:00:02+00:00"})
+    store.sessions[sid]["messages"] = msgs
+    store.sessions[sid]["draft"] = "unsent"
+    store.save()
+    store.flush()
+    assert not store.sessions.is_dirty(sid)
+    _unload(store, sid)
+    assert [m["content"] for m in store.get_messages(sid, limit=None)] == ["one (edited)", "three"]
+    # append_message 先保存未保存的缓存修改
+    store.sessions[sid]["title"] = "Renamed in cache"
+    store.append_message(sid, "assistant", "four")
+    _unload(store, sid)
+    assert store.sessions[sid]["title"] == "Renamed in cache"
+    assert store.get_messages(sid)[-1]["content"] == "four"
+
+
+def test_session_summaries(store):
+    a = store.create_session("Alpha")
+    b = store.create_session("beta")
+    empty = store.create_session("Gamma")
+    store.append_message(a, "user", "short")
+    for text in ("x", "y", "the last message of beta " * 10):
+        store.append_message(b, "user", text)
+    store.flush()
+
+    rows = {r["session_id"]: r for r in store.list_sessions()}
+    assert rows[b]["message_count"] == 3 and rows[empty]["message_count"] == 0
+    assert rows[b]["token_total"] == sum(
+        TokenCalculator.estimate_tokens(t) for t in ("x", "y", "the last message of beta " * 10)
+    )
+    assert rows[b]["last_preview"] == ("the last message of beta " * 10)[:80]
+    assert rows[a]["last_message_at"] and rows[empty]["last_message_at"] is None
+    assert not any(r["archived"] for r in rows.values())
+
+    assert [r["session_id"] for r in store.list_sessions(sort="messages")] == [b, a, empty]
+    assert [r["title"] for r in store.list_sessions(sort="title")] == ["Alpha", "beta", "Gamma"]
+    assert [r["session_id"] for r in store.list_sessions(sort="recent", limit=2)] == [b, a]
+    assert [r["session_id"] for r in store.list_sessions(title_filter="ETA")] == [b]
+    assert {r["session_id"] for r in store.list_sessions(min_messages=1)} == {a, b}
+    with pytest.raises(ValueError):
+        store.list_sessions(sort="nope")
+
+
+def test_delete_rename_clear(store):
+    sid = store.create_session("Old title")
+    ids = [store.append_message(sid, "user", f"m{i}") for i in range(3)]
+    assert store.delete_messages(sid, [ids[0], ids[2], None]) == 2
+    assert store.delete_messages(sid, []) == 0
+    _unload(store, sid)
+    assert [m["content"] for m in store.get_messages(sid)] == ["m1"]
+
+    assert store.rename_session(sid, "New title") and not store.rename_session("missing", "x")
+    assert store.list_sessions()[0]["title"] == "New title"
+    other = store.create_session("Other")
+    assert store.delete_session(other) and not store.delete_session(other)
+    assert [r["session_id"] for r in store.list_sessions()] == [sid]
+    store.clear_all_sessions()
+    assert store.list_sessions() == [] and len(store.sessions) == 0
+
+
+def test_search(store):
+    a = store.create_session("A")
+    b = store.create_session("B")
+    store.append_message(a, "user", "How do I parse JSON in Python?")
+    hit_id = store.append_message(b, "assistant", "Use json.loads to parse a JSON string")
+    store.append_message(b, "user", "thanks")
+    store.flush()
+
+    hits = store.search("json parse")
+    assert {h["session_id"] for h in hits} == {a, b}
+    assert all("[" in h["snippet"] and set(h) >= {"message_id", "role", "rank"} for h in hits)
+    assert [h["message_id"] for h in store.search("JSON", session_id=b)] == [hit_id]
+    assert len(store.search("json", limit=1)) == 1
+    assert store.search("xyzzy") == [] and store.search("   ") == []
+    # 短于三个字符的词同样按子串匹配
+    assert {h["session_id"] for h in store.search("in")} == {a, b}
+
+
+def test_archive_and_restore(store):
+    sid = store.create_session("Cold")
+    store.append_message(sid, "user", "archived needle")
+    hot = store.create_session("Hot")
+    store.get_session(hot)
+    store.flush()
+    _unload(store, sid)
+    # 截止时间在未来：所有未加载、无未保存修改的会话都视为空闲
+    assert store.archive_idle_sessions(-1) == 1
+    assert sid not in store.sessions
+    rows = {r["session_id"]: r for r in store.list_sessions()}
+    assert rows[sid]["archived"] and rows[sid]["message_count"] == 1
+    assert sid not in {r["session_id"] for r in store.list_sessions(include_archived=False)}
+    hit = store.search("needle")[0]
+    assert hit["archived"] and hit["title"] == "Cold" and "[needle]" in hit["snippet"]
+
+    assert [m["content"] for m in store.get_messages(sid)] == ["archived needle"]
+    assert sid in store.sessions and not store.restore_session(sid)
+    assert not store.list_sessions()[0]["archived"]
+
+
+def test_archived_ids_are_restored_not_replaced(store):
+    sid = store.create_session("Cold")
+    store.append_message(sid, "user", "first")
+    shown = store.create_session("Shown")
+    store.flush()
+    _unload(store, sid)
+    _unload(store, shown)
+    # 界面正在显示的会话不归档
+    store.active_session = shown
+    assert store.archive_idle_sessions(-1) == 1 and shown in store.sessions
+
+    assert store.append_message(sid, "assistant", "second") > 0
+    assert [m["content"] for m in store.get_messages(sid)] == ["first", "second"]
+    assert [r["title"] for r in store.list_sessions() if r["session_id"] == sid] == ["Cold"]
+
+    _unload(store, sid)
+    store.active_session = None
+    assert store.archive_idle_sessions(-1) == 2
+    assert store.rename_session(sid, "Warm") and sid in store.sessions
+    assert [r["title"] for r in store.list_sessions() if r["session_id"] == sid] == ["Warm"]
+
+
+def test_prompts(store):
+    assert store.get_prompt("default")["role"] == "system"
+    store.upsert_prompt("coder", "system", "You write code.")
+    store.upsert_prompt("coder", "system", "You write tests.")
+    store.flush()
+    assert store.get_prompt("coder") == {"name": "coder", "role": "system", "content": "You write tests."}
+    assert [p["name"] for p in store.list_prompts()] == ["coder", "default"]
+    assert store.delete_prompt("coder") and not store.delete_prompt("coder")
+    assert store.get_prompt("coder") is None
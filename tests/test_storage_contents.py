@@ -0,0 +1,98 @@
+import sqlite3
+
+import storage
+from storage import Storage, codec, search_index, session_stats
+
+
+BODY = "Traceback (most recent call last):\n  File \"app.py\", line 10, in <module>\n" * 20
+
+
+def _reload(s, sid):
+    s.sessions.pop(sid)
+    s.sessions.add_meta(sid, "")
+    return s.get_session(sid)["messages"]
+
+
+def test_identical_bodies_are_stored_once(temp_storage):
+    s = temp_storage
+    a = s.create_session("A")
+    b = s.create_session("B")
+    ids = [s.append_message(a, "user", BODY), s.append_message(a, "user", BODY), s.append_message(b, "user", BODY)]
+    s.flush()
+
+    assert s.conn.execute("SELECT COUNT(*), SUM(refs) FROM contents").fetchone()[:] == (1, 3)
+    assert {r[0] for r in s.conn.execute("SELECT codec FROM messages")} == {codec.CODEC_REF}
+    report = s.storage_stats()
+    assert report["distinct_bodies"] == 1
+    assert report["dedup_ratio"] == 3
+    assert report["bytes_saved"] >= 2 * len(BODY)
+
+    # one shared object in memory, also after reloading from the DB
+    msgs = _reload(s, a) + _reload(s, b)
+    assert [m["content"] for m in msgs] == [BODY] * 3
+    assert len({id(codec.raw_content(m)) for m in msgs}) == 1
+    assert s.storage_stats()["cache_bytes_saved"] > 0
+
+    assert len(s.search("Traceback", limit=10)) == 3
+    s.delete_messages(a, ids[:2])
+    s.flush()
+    assert s.conn.execute("SELECT refs FROM contents").fetchone()[0] == 1
+    s.delete_session(b)
+    s.flush()
+    assert s.conn.execute("SELECT COUNT(*) FROM contents").fetchone()[0] == 0
+
+
+def test_editing_a_shared_body_leaves_the_others(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Edit")
+    s.append_message(sid, "user", BODY)
+    s.append_message(sid, "user", BODY)
+    msgs = s.get_session(sid)["messages"]
+    msgs[0]["content"] = BODY + "edited"
+    s.sessions[sid]["messages"] = msgs
+    s.save()
+    s.flush()
+
+    assert sorted(r[0] for r in s.conn.execute("SELECT refs FROM contents")) == [1, 1]
+    assert [m["content"] for m in _reload(s, sid)] == [BODY + "edited", BODY]
+    s._writer.call(lambda conn: conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('integrity-check', 1)"))
+
+
+def test_short_retries_stay_inline_but_share_memory(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Retry")
+    s.append_message(sid, "user", "please retry this")
+    s.append_message(sid, "user", "please retry this")
+    s.flush()
+    assert s.conn.execute("SELECT COUNT(*) FROM contents").fetchone()[0] == 0
+    first, second = _reload(s, sid)
+    assert codec.raw_content(first) is codec.raw_content(second)
+
+
+def test_migration_deduplicates_existing_rows(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    s = Storage(path)
+    sid = s.create_session("Old")
+    s.close()
+    conn = sqlite3.connect(path)
+    codec.register(conn)
+    with conn:
+        for name in ("contents_ref_ai", "contents_ref_ad", "contents_ref_au"):
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.execute("DROP TABLE contents")
+        conn.execute("PRAGMA user_version = 6")
+        search_index.use_decoded_text(conn)
+        session_stats.use_decoded_text(conn)
+        conn.executemany(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, 'user', ?, '')",
+            [(sid, BODY), (sid, BODY), (sid, "small")],
+        )
+    conn.close()
+
+    s = Storage(path)
+    assert s.conn.execute("PRAGMA user_version").fetchone()[0] == storage.SCHEMA_VERSION
+    assert s.conn.execute("SELECT COUNT(*), SUM(refs) FROM contents").fetchone()[:] == (1, 2)
+    assert [m["content"] for m in s.get_session(sid)["messages"]] == [BODY, BODY, "small"]
+    assert len(s.search("Traceback")) == 2
+    assert s.list_sessions()[0]["message_count"] == 3
+    s.close()
@@ -0,0 +1,115 @@
+import os
+import time
+
+from storage import LogStorage
+from storage.logstore import LogBody
+
+
+def _segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".log"))
+
+
+def test_state_survives_reopen(tmp_path):
+    d = str(tmp_path / "log")
+    s = LogStorage(d)
+    sid = s.create_session("Kept")
+    ids = [s.append_message(sid, "user", f"message {i} 中文") for i in range(5)]
+    s.delete_messages(sid, [ids[1]])
+    msgs = s.get_session(sid)["messages"]
+    msgs[0]["content"] = "edited"
+    s.sessions[sid]["messages"] = msgs
+    s.sessions[sid]["draft"] = "unsent"
+    s.save()
+    cold = s.create_session("Cold")
+    s.append_message(cold, "assistant", "old reply")
+    s.sessions.pop(cold)
+    s.sessions.add_meta(cold, "Cold")
+    s.archive_idle_sessions(-1)
+    gone = s.create_session("Gone")
+    s.delete_session(gone)
+    s.upsert_prompt("coder", "system", "You write code.")
+    assert isinstance(s._rows[sid].messages[0].body, LogBody)
+    s.close()
+
+    s = LogStorage(d)
+    assert s.recovery["truncated_bytes"] == 0 and not s.recovery["damaged_segments"]
+    assert [m["content"] for m in s.get_messages(sid)] == ["edited", "message 2 中文", "message 3 中文", "message 4 中文"]
+    assert s.get_session(sid)["draft"] == "unsent"
+    rows = {r["session_id"]: r for r in s.list_sessions()}
+    assert set(rows) == {sid, cold} and rows[cold]["archived"]
+    assert s.get_prompt("coder")["content"] == "You write code."
+    # 已用过的 id 不会重复分配
+    assert s.append_message(sid, "user", "next") > ids[-1]
+    s.close()
+
+
+def test_torn_and_corrupt_tail_is_truncated(tmp_path):
+    d = str(tmp_path / "log")
+    s = LogStorage(d)
+    sid = s.create_session("T")
+    s.append_message(sid, "user", "first")
+    s.append_message(sid, "user", "second")
+    s.close()
+    path = os.path.join(d, _segments(d)[-1])
+    size = os.path.getsize(path)
+
+    # 崩溃时写了一半的记录
+    with open(path, "ab") as f:
+        f.write(b"\x40\x00\x00\x00\x10\x00\x00\x00partial")
+    s = LogStorage(d)
+    assert s.recovery["truncated_bytes"] == 15
+    assert os.path.getsize(path) == size
+    assert [m["content"] for m in s.get_messages(sid)] == ["first", "second"]
+    s.append_message(sid, "user", "third")
+    s.close()
+
+    # 最后一条记录的正文损坏：校验失败，只丢弃这一条
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"X")
+    s = LogStorage(d)
+    assert s.recovery["truncated_bytes"] > 0
+    assert [m["content"] for m in s.get_messages(sid)] == ["first", "second"]
+    s.close()
+
+
+def test_compaction_drops_dead_records(tmp_path):
+    d = str(tmp_path / "log")
+    s = LogStorage(d, segment_bytes=4096, compact_interval=None)
+    sid = s.create_session("Busy")
+    ids = [s.append_message(sid, "user", f"{i} " + "x" * 200) for i in range(60)]
+    held = s.get_messages(sid, limit=None)
+    s.delete_messages(sid, ids[:50])
+    assert len(_segments(d)) > 1 and s.compaction_due()
+
+    freed = s.compact()
+    assert freed > 0 and len(_segments(d)) == 1
+    assert s.log_stats()["dead_ratio"] < 0.1
+    # 仍被引用的已删除消息在旧段删除前读入内存，存活的消息指向新段
+    assert held[0]["content"].startswith("0 ") and held[-1]["content"].startswith("59 ")
+    assert [m["id"] for m in s.get_messages(sid, limit=None)] == ids[50:]
+    s.append_message(sid, "assistant", "after compaction")
+    s.close()
+
+    s = LogStorage(d)
+    assert [m["content"] for m in s.get_messages(sid, limit=3)][-1] == "after compaction"
+    assert s.get_messages(sid, limit=None)[0]["id"] == ids[50]
+    s.close()
+
+
+def test_background_compaction_and_leftover_temp_file(tmp_path):
+    d = str(tmp_path / "log")
+    os.makedirs(d)
+    with open(os.path.join(d, "00000009.log.tmp"), "wb") as f:
+        f.write(b"unfinished compaction")
+    s = LogStorage(d, segment_bytes=4096, compact_interval=60)
+    assert not os.path.exists(os.path.join(d, "00000009.log.tmp"))
+    sid = s.create_session("Churn")
+    for i in range(100):
+        s.delete_messages(sid, [s.append_message(sid, "user", "y" * 300)])
+    # 段写满时唤醒压缩线程
+    deadline = time.time() + 5
+    while len(_segments(d)) > 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert len(_segments(d)) <= 2
+    s.close()
@@ -0,0 +1,73 @@
+import sqlite3
+import time
+
+from storage import Storage, maintenance
+
+
+def _fill(s, sessions=20, size=4000):
+    sids = [s.create_session(f"S{i}") for i in range(sessions)]
+    for sid in sids:
+        for j in range(10):
+            s.append_message(sid, "user", f"{j} " + "x" * size)
+    s.flush()
+    return sids
+
+
+def test_new_files_use_incremental_auto_vacuum_and_shrink(tmp_path):
+    s = Storage(str(tmp_path / "data.db"), compress_threshold=None)
+    stats = s.maintenance_stats()
+    assert stats["main"]["auto_vacuum"] == stats["archive"]["auto_vacuum"] == "incremental"
+    for sid in _fill(s):
+        s.delete_session(sid)
+    s.flush()
+    before = s.maintenance_stats()["main"]
+    assert before["free_pages"] > 50 and 0 < before["free_ratio"] < 1
+
+    # 每步最多释放 step_pages 页
+    assert s._writer.call(lambda conn: maintenance.vacuum_step(conn, "main", 10)) == 10
+    assert s.run_maintenance(step_pages=16) == before["free_pages"] - 10
+    after = s.maintenance_stats()["main"]
+    assert after["free_pages"] == 0 and after["page_count"] <= before["page_count"] - before["free_pages"] + 5
+    assert after["fragmentation"] is not None
+    # ANALYZE 已生成统计表
+    assert s.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+    s.close()
+
+
+def test_existing_file_is_converted_once(tmp_path):
+    path = str(tmp_path / "data.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    s = Storage(path, compress_threshold=None)
+    assert s.maintenance_stats()["main"]["auto_vacuum"] == "none"
+    sid = _fill(s, sessions=2)[0]
+    s.delete_session(sid)
+    s.flush()
+    free = s.maintenance_stats()["main"]["free_pages"]
+    assert free and s.run_maintenance() == free
+    stats = s.maintenance_stats()["main"]
+    assert stats["auto_vacuum"] == "incremental" and stats["free_pages"] == 0
+    assert len(s.list_sessions()) == 1
+    s.close()
+
+
+def test_scheduler_waits_for_idle_writer(tmp_path):
+    s = Storage(str(tmp_path / "data.db"), compress_threshold=None)
+    for sid in _fill(s, sessions=5):
+        s.delete_session(sid)
+    s.flush()
+    sched = maintenance.MaintenanceScheduler(s._writer, ("main",), interval=60, idle_after=0.3, step_pages=8)
+    s.create_session("busy")
+    assert sched.run_once() == 0
+    assert s.maintenance_stats()["main"]["free_pages"] > 0
+    time.sleep(0.35)
+    assert sched.idle()
+    assert sched.run_once() > 0
+    assert s.maintenance_stats()["main"]["free_pages"] == 0
+    # 维护自身提交的任务不会打断空闲状态
+    assert sched.idle()
+
+    s._maintenance = sched
+    s.close()
+    assert not sched._thread.is_alive()
@@ -0,0 +1,106 @@
+import sqlite3
+
+import storage
+from storage import Storage
+
+
+LEGACY_SCHEMA = """
+CREATE TABLE sessions (
+    session_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    draft TEXT DEFAULT '',
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    FOREIGN KEY(session_id) REFERENCES sessions(session_id) ON DELETE CASCADE
+);
+CREATE TABLE prompts (
+    name TEXT PRIMARY KEY,
+    role TEXT NOT NULL DEFAULT 'system',
+    content TEXT NOT NULL
+);
+"""
+
+
+def _legacy_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO sessions (session_id, title) VALUES ('s1', 'Old'), ('s2', 'Empty')")
+    conn.execute(
+        "INSERT INTO messages (session_id, role, content, timestamp) "
+        "VALUES ('s1', 'user', 'hi', '2026-01-12T00:00:00Z'), ('s1', 'assistant', 'yo', '2026-01-12T00:00:10Z')"
+    )
+    conn.commit()
+    conn.close()
+
+
+def _plan(conn, sql, params=()):
+    return " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def test_legacy_db_is_migrated_on_open(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    _legacy_db(path)
+
+    s = Storage(path)
+    assert s.conn.execute("PRAGMA user_version").fetchone()[0] == storage.SCHEMA_VERSION
+    indexes = {row[0] for row in s.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_messages_session", "idx_messages_timestamp", "idx_sessions_updated_at"} <= indexes
+    updated = dict(s.conn.execute("SELECT session_id, updated_at FROM sessions"))
+    assert updated["s1"] == "2026-01-12T00:00:10Z"
+    assert updated["s2"]
+    assert [m["content"] for m in s.get_session("s1")["messages"]] == ["hi", "yo"]
+
+    # reopening is a no-op
+    assert storage.migrate(Storage(path).conn) == storage.SCHEMA_VERSION
+
+
+def test_existing_messages_follow_the_configured_codec_settings(tmp_path):
+    big = "long reply " * 500
+    for threshold, expected in ((None, 0), (1024, 1)):
+        path = str(tmp_path / f"legacy-{threshold}.db")
+        _legacy_db(path)
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO messages (session_id, role, content, timestamp) VALUES ('s2', 'assistant', ?, '')", (big,))
+        conn.commit()
+        conn.close()
+        s = Storage(path, compress_threshold=threshold, dedup_min=None)
+        assert s.conn.execute("SELECT codec FROM messages WHERE session_id = 's2'").fetchone()[0] == expected
+        assert [m["content"] for m in s.get_session("s2")["messages"]] == [big]
+        s.close()
+
+
+def test_writes_touch_updated_at(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Touch")
+    s._writer.call(
+        lambda conn: conn.execute("UPDATE sessions SET updated_at = '2000-01-01' WHERE session_id = ?", (sid,))
+    )
+    s.append_message(sid, "user", "hello")
+    s.flush()
+    row = s.conn.execute("SELECT updated_at FROM sessions WHERE session_id = ?", (sid,)).fetchone()
+    assert row[0] > "2000-01-01"
+
+
+def test_hot_queries_use_indexes(temp_storage):
+    conn = temp_storage.conn
+    load = _plan(conn, "SELECT id, role, content, timestamp FROM messages WHERE session_id = ? ORDER BY id ASC", ("s",))
+    assert "idx_messages_session" in load
+    assert "TEMP B-TREE" not in load
+
+    count = _plan(conn, "SELECT COUNT(1) FROM messages WHERE session_id = ?", ("s",))
+    assert "COVERING INDEX idx_messages_session" in count
+
+    delete = _plan(conn, "DELETE FROM messages WHERE session_id = ?", ("s",))
+    assert "idx_messages_session" in delete
+
+    by_id = _plan(conn, "DELETE FROM messages WHERE session_id = ? AND id IN (?, ?)", ("s", 1, 2))
+    assert "SCAN" not in by_id
+
+    recent = _plan(conn, "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT 20")
+    assert "idx_sessions_updated_at" in recent
@@ -0,0 +1,48 @@
+import datetime
+
+from storage import Storage, records
+
+
+def test_record_reads_like_the_old_message_dict():
+    ts = datetime.datetime(2024, 5, 1, 12, 30, 0, 123456, tzinfo=datetime.UTC).isoformat()
+    m = records.message(7, "assistant", "hello", ts)
+    assert type(m.raw("timestamp")) is int
+    assert m["timestamp"] == ts and m.get("content") == "hello" and m.get("missing", 1) == 1
+    assert m == {"id": 7, "role": "assistant", "content": "hello", "timestamp": ts}
+    assert dict(m) == {**m} == m.copy()
+    m["meta"] = {"pinned": True}
+    assert "meta" in m and len(m) == 5
+    del m["meta"]
+    assert list(m) == ["id", "role", "content", "timestamp"]
+
+    # 无微秒与非标准格式都原样还原
+    whole = datetime.datetime(2024, 5, 1, tzinfo=datetime.UTC).isoformat()
+    assert records.message(1, "user", "", whole)["timestamp"] == whole
+    for odd in ("", "2024-01-01T00:00:00", "2024-05-01 12:30:00+00:00", None):
+        assert records.message(1, "user", "", odd).raw("timestamp") == odd
+
+
+def test_cached_messages_are_records(tmp_path):
+    path = str(tmp_path / "data.db")
+    s = Storage(path)
+    sid = s.create_session("R")
+    s.append_message(sid, "user", "first")
+    s.append_message(sid, "assistant", "second")
+    s.flush()
+    s.sessions.pop(sid)
+    s.sessions.add_meta(sid, "R")
+
+    msgs = s.get_session(sid)["messages"]
+    assert all(isinstance(m, records.MessageRecord) for m in msgs)
+    assert msgs[0].role is s.get_messages(sid)[0].role is records.message(None, "u" + "ser", "", "").role
+    # 与 dict 相同：修改后重新赋值列表标记为待保存，只写入改动的那一行
+    msgs[1]["content"] = "edited"
+    s.sessions[sid]["messages"] = msgs
+    assert s.sessions[sid].message_delta() == ([], [msgs[1]], [])
+    s.save().result()
+    s.close()
+
+    s = Storage(path)
+    assert [(m["role"], m["content"]) for m in s.get_messages(sid)] == [("user", "first"), ("assistant", "edited")]
+    assert s.get_messages(sid)[0]["timestamp"] == s.conn.execute("SELECT MIN(timestamp) FROM messages").fetchone()[0]
+    s.close()
@@ -0,0 +1,96 @@
+import sqlite3
+
+import storage
+from storage import Storage, codec
+
+
+def test_search_returns_ranked_snippets(temp_storage):
+    s = temp_storage
+    a = s.create_session("A")
+    b = s.create_session("B")
+    s.append_message(a, "user", "How do I create an index in sqlite?")
+    hit = s.append_message(b, "assistant", "Use CREATE INDEX; sqlite index lookups avoid a full scan of the sqlite table.")
+    s.append_message(b, "user", "thanks")
+
+    results = s.search("sqlite index")
+    assert [r["message_id"] for r in results][0] == hit
+    assert {r["session_id"] for r in results} == {a, b}
+    assert "[" in results[0]["snippet"]
+
+    only_a = s.search("sqlite", session_id=a)
+    assert [r["session_id"] for r in only_a] == [a]
+
+
+def test_search_index_follows_edits_and_deletes(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Sync")
+    keep = s.append_message(sid, "user", "今天天气很好，去公园散步")
+    gone = s.append_message(sid, "user", "公园里人很多")
+    assert {r["message_id"] for r in s.search("公园")} == {keep, gone}
+
+    s.delete_messages(sid, [gone])
+    assert [r["message_id"] for r in s.search("公园")] == [keep]
+
+    msgs = s.get_session(sid)["messages"]
+    msgs[0]["content"] = "下雨了，待在家里"
+    s.sessions[sid]["messages"] = msgs
+    s.save()
+    assert s.search("公园") == []
+    assert [r["message_id"] for r in s.search("待在家里")] == [keep]
+
+    s.delete_session(sid)
+    assert s.search("待在家里") == []
+
+
+def test_search_treats_operators_as_text(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Ops")
+    s.append_message(sid, "user", 'say "hello" OR NOT goodbye')
+    assert s.search('"hello" OR') != []
+    assert s.search("NEAR(") == []
+    assert s.search("   ") == []
+
+
+def test_existing_database_is_indexed_incrementally(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    s = Storage(path)
+    sid = s.create_session("Old")
+    s.close()
+    conn = sqlite3.connect(path)
+    codec.register(conn)
+    with conn:
+        for name in ("messages_fts_ai", "messages_fts_ad", "messages_fts_au"):
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.execute("DROP TABLE messages_fts")
+        conn.execute("DROP TABLE search_index_state")
+        conn.execute("DROP VIEW message_text")
+        conn.execute("PRAGMA user_version = 3")
+        conn.executemany(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, 'user', ?, '')",
+            [(sid, f"legacy message number {i}") for i in range(12000)],
+        )
+    conn.close()
+
+    s = Storage(path)
+    assert s._backfill_thread is not None
+    new_id = s.append_message(sid, "user", "fresh legacy message")
+    s._backfill_thread.join(30)
+    assert s.conn.execute("PRAGMA user_version").fetchone()[0] == storage.SCHEMA_VERSION
+    assert s.conn.execute("SELECT value FROM search_index_state").fetchone()[0] == 1
+    assert len(s.search("number 11999")) == 1
+    assert len(s.search("legacy message", limit=20000)) == 12001
+    assert s.search("fresh legacy")[0]["message_id"] == new_id
+    # the index is consistent with its content table
+    s._writer.call(lambda conn: conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('integrity-check', 1)"))
+    s.close()
+
+
+def test_very_common_terms_fall_back_to_recency(temp_storage, monkeypatch):
+    from storage import search_index
+
+    monkeypatch.setattr(search_index, "RANK_WINDOW", 5)
+    s = temp_storage
+    sid = s.create_session("Common")
+    ids = [s.append_message(sid, "user", f"common word {i}") for i in range(10)]
+    results = s.search("common", limit=3)
+    assert [r["message_id"] for r in results] == ids[::-1][:3]
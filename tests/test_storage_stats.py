@@ -0,0 +1,106 @@
+import sqlite3
+
+import storage
+from storage import Storage, codec
+
+
+def _stats(s, sid):
+    return {r["session_id"]: r for r in s.list_sessions()}[sid]
+
+
+def test_stats_follow_appends_edits_and_deletes(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Stats")
+    assert _stats(s, sid)["message_count"] == 0
+    assert _stats(s, sid)["last_preview"] == ""
+
+    a = s.append_message(sid, "user", "hello world")
+    b = s.append_message(sid, "assistant", "你好世界")
+    row = _stats(s, sid)
+    assert row["message_count"] == 2
+    assert row["token_total"] == 3 + 10
+    assert row["last_preview"] == "你好世界"
+    assert row["last_message_at"]
+
+    s.delete_messages(sid, [b])
+    row = _stats(s, sid)
+    assert (row["message_count"], row["token_total"], row["last_preview"]) == (1, 3, "hello world")
+
+    msgs = s.get_session(sid)["messages"]
+    msgs[0]["content"] = "edited"
+    s.sessions[sid]["messages"] = msgs
+    s.save()
+    row = _stats(s, sid)
+    assert (row["token_total"], row["last_preview"]) == (2, "edited")
+
+    s.delete_messages(sid, [a])
+    row = _stats(s, sid)
+    assert (row["message_count"], row["token_total"], row["last_preview"]) == (0, 0, "")
+    assert row["last_message_at"] is None
+
+    s.delete_session(sid)
+    s.flush()
+    assert s.conn.execute("SELECT COUNT(*) FROM session_stats").fetchone()[0] == 0
+
+
+def test_list_sessions_sorts_and_filters_in_sql(temp_storage):
+    s = temp_storage
+    busy = s.create_session("Busy chat")
+    quiet = s.create_session("Quiet chat")
+    other = s.create_session("Other")
+    for i in range(3):
+        s.append_message(busy, "user", f"message {i}")
+    s.append_message(quiet, "user", "latest")
+
+    assert [r["session_id"] for r in s.list_sessions(sort="recent")][:2] == [quiet, busy]
+    assert [r["session_id"] for r in s.list_sessions(sort="messages")][0] == busy
+    assert [r["title"] for r in s.list_sessions(sort="title")] == ["Busy chat", "Other", "Quiet chat"]
+    assert {r["session_id"] for r in s.list_sessions(title_filter="chat")} == {busy, quiet}
+    assert [r["session_id"] for r in s.list_sessions(min_messages=2)] == [busy]
+    assert len(s.list_sessions(limit=1)) == 1
+    assert other in {r["session_id"] for r in s.list_sessions(min_messages=0)}
+
+
+def test_list_sessions_does_not_read_messages(temp_storage):
+    s = temp_storage
+    sid = s.create_session("No scan")
+    s.append_message(sid, "user", "x")
+    s.flush()
+    statements = []
+    s.conn.set_trace_callback(statements.append)
+    try:
+        s.list_sessions()
+    finally:
+        s.conn.set_trace_callback(None)
+    assert statements and not any("messages" in sql for sql in statements)
+
+
+def test_migration_backfills_existing_sessions(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    s = Storage(path)
+    sid = s.create_session("Old")
+    empty = s.create_session("Empty")
+    s.close()
+    conn = sqlite3.connect(path)
+    codec.register(conn)
+    with conn:
+        for name in ("session_stats_session_ai", "session_stats_ai", "session_stats_ad", "session_stats_au"):
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.execute("DROP TABLE session_stats")
+        conn.execute("PRAGMA user_version = 4")
+        conn.executemany(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, 'user', ?, ?)",
+            [(sid, f"legacy {i}", f"2024-01-0{i + 1}T00:00:00+00:00") for i in range(3)],
+        )
+    conn.close()
+
+    s = Storage(path)
+    assert s.conn.execute("PRAGMA user_version").fetchone()[0] == storage.SCHEMA_VERSION
+    row = _stats(s, sid)
+    assert row["message_count"] == 3
+    assert row["last_preview"] == "legacy 2"
+    assert row["last_message_at"] == "2024-01-03T00:00:00+00:00"
+    assert _stats(s, empty)["message_count"] == 0
+    s.append_message(sid, "user", "new")
+    assert _stats(s, sid)["message_count"] == 4
+    s.close()
@@ -0,0 +1,88 @@
+import sqlite3
+
+import storage
+from storage import Storage, codec
+from token_calculator import TokenCalculator
+
+TEXTS = ["hello world", "你好，世界！这是一个测试。", "def f(x):\n    return x * 2\n" * 300]
+
+
+def _column(s):
+    return [r[0] for r in s.conn.execute("SELECT token_count FROM messages ORDER BY id")]
+
+
+def test_counts_are_computed_once_at_write(tmp_path, monkeypatch):
+    s = Storage(str(tmp_path / "data.db"), compress_threshold=1024)
+    sid = s.create_session("T")
+    for text in TEXTS:
+        s.append_message(sid, "user", text)
+    s.sessions[sid]["messages"].append({"role": "assistant", "content": "saved via save()", "timestamp": ""})
+    s.save().result()
+    expected = [TokenCalculator.estimate_tokens(t) for t in TEXTS + ["saved via save()"]]
+    assert _column(s) == expected
+    assert s.list_sessions()[0]["token_total"] == sum(expected)
+
+    # 缓存与重新加载的消息都带有 token 数，统计只做求和
+    s.sessions.pop(sid)
+    s.sessions.add_meta(sid, "T")
+    msgs = s.get_messages(sid, limit=None)
+    monkeypatch.setattr(TokenCalculator, "estimate_tokens", staticmethod(lambda text: 1 / 0))
+    assert TokenCalculator.calculate_messages_tokens(msgs) == sum(expected)
+    monkeypatch.undo()
+
+    # 编辑内容后重新计算
+    msgs = s.get_session(sid)["messages"]
+    msgs[0]["content"] = "edited " * 40
+    s.sessions[sid]["messages"] = msgs
+    s.save().result()
+    assert _column(s)[0] == TokenCalculator.estimate_tokens("edited " * 40)
+    assert s.list_sessions()[0]["token_total"] == sum(_column(s))
+    s.close()
+
+
+def test_existing_rows_are_backfilled_in_background(tmp_path):
+    path = str(tmp_path / "data.db")
+    s = Storage(path)
+    sid = s.create_session("Legacy")
+    s.close()
+    # 模拟升级前的数据：没有 token_count 的行
+    conn = sqlite3.connect(path)
+    codec.register(conn)
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, 'user', ?, '')",
+            [(sid, f"legacy message {i} 中文") for i in range(2500)],
+        )
+    log_rows = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+    conn.close()
+
+    s = Storage(path)
+    assert s._token_thread is not None
+    s._token_thread.join(30)
+    counts = _column(s)
+    assert None not in counts
+    assert counts[-1] == TokenCalculator.estimate_tokens("legacy message 2499 中文")
+    assert s.list_sessions()[0]["token_total"] == sum(counts)
+    assert s.conn.execute("PRAGMA user_version").fetchone()[0] == storage.SCHEMA_VERSION
+    # 回填不会被当作其它进程的修改
+    assert s.conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0] == log_rows
+    s.close()
+
+    s = Storage(path)
+    assert s._token_thread is None
+    s.close()
+
+
+def test_archive_round_trip_keeps_counts(tmp_path):
+    s = Storage(str(tmp_path / "data.db"))
+    sid = s.create_session("Old")
+    s.append_message(sid, "user", TEXTS[1])
+    s.flush()
+    s._writer.call(lambda conn: conn.execute("UPDATE sessions SET updated_at = '2020-01-01T00:00:00+00:00'"))
+    s._writer.call(lambda conn: conn.execute("UPDATE messages SET timestamp = '2020-01-01T00:00:00+00:00'"))
+    s.sessions.pop(sid)
+    s.sessions.add_meta(sid, "Old")
+    assert s.archive_idle_sessions(30) == 1
+    assert s.get_messages(sid)[0].tokens == TokenCalculator.estimate_tokens(TEXTS[1])
+    assert _column(s) == [TokenCalculator.estimate_tokens(TEXTS[1])]
+    s.close()
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+from storage import Storage, transfer
+
+
+BIG = "def handler(event):\n    return process(event)\n" * 200
+
+
+def _fill(s):
+    a = s.create_session("Alpha")
+    s.append_message(a, "user", "你好")
+    s.append_message(a, "assistant", BIG)
+    b = s.create_session("Beta")
+    s.append_message(b, "user", BIG)
+    s.append_message(b, "assistant", "line\nwith \"quotes\"")
+    return a, b
+
+
+def _contents(s, sid):
+    return [(m["role"], m["content"]) for m in s.get_messages(sid)]
+
+
+def test_export_import_round_trip(tmp_path):
+    src = Storage(str(tmp_path / "src.db"), compress_threshold=1024)
+    a, b = _fill(src)
+    out = str(tmp_path / "sessions.jsonl")
+    seen = []
+    assert src.export_jsonl(out, progress=seen.append) == {"sessions": 2, "messages": 4}
+    assert seen[-1].fraction == 1.0
+    expected = {sid: _contents(src, sid) for sid in (a, b)}
+    src.close()
+
+    records = [json.loads(line) for line in open(out, encoding="utf-8")]
+    assert [r["type"] for r in records] == ["session", "message", "message", "session", "message", "message"]
+
+    dst = Storage(str(tmp_path / "dst.db"), compress_threshold=1024)
+    assert dst.import_jsonl(out, batch_size=2) == {"sessions": 2, "messages": 4}
+    assert {sid: _contents(dst, sid) for sid in (a, b)} == expected
+    assert dst.sessions[a]["title"] == "Alpha"
+    # 大消息体按引用存储且只存一份
+    assert dst.conn.execute("SELECT COUNT(*), SUM(refs) FROM contents").fetchone()[:] == (1, 2)
+    assert len(dst.search("handler")) == 2
+    assert {r["session_id"]: r["message_count"] for r in dst.list_sessions()} == {a: 2, b: 2}
+
+    # 再次导入同一文件不会产生重复
+    assert dst.import_jsonl(out) == {"sessions": 0, "messages": 0}
+    assert dst.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 4
+    dst.close()
+
+
+def test_existing_sessions_are_skipped(tmp_path):
+    path = str(tmp_path / "in.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "session", "session_id": "s1", "title": "Mine"}) + "\n")
+        f.write(json.dumps({"type": "message", "session_id": "s1", "role": "user", "content": "x"}) + "\n")
+        # 内联消息的会话行 + 没有会话头的消息
+        f.write(json.dumps({"session_id": "s2", "title": "Inline", "messages": [{"role": "user", "content": "y"}]}) + "\n")
+        f.write(json.dumps({"type": "message", "session_id": "s3", "role": "user", "content": "z"}) + "\n")
+    s = Storage(str(tmp_path / "db.db"))
+    s.sessions.add_meta("s1", "Mine", "", rows=[])
+    s._writer.call(lambda conn: conn.execute("INSERT INTO sessions (session_id, title) VALUES ('s1', 'Mine')"))
+
+    assert s.import_jsonl(path) == {"sessions": 2, "messages": 2}
+    assert s.get_messages("s1") == []
+    assert [m["content"] for m in s.get_messages("s2")] == ["y"]
+    assert [m["content"] for m in s.get_messages("s3")] == ["z"]
+    s.close()
+
+
+def test_interrupted_import_resumes(tmp_path):
+    src = Storage(str(tmp_path / "src.db"))
+    sids = []
+    for i in range(5):
+        sid = src.create_session(f"S{i}")
+        for j in range(3):
+            src.append_message(sid, "user", f"m{i}-{j}")
+        sids.append(sid)
+    out = str(tmp_path / "all.jsonl")
+    src.export_jsonl(out)
+    src.close()
+
+    dst = Storage(str(tmp_path / "dst.db"))
+
+    def stop(p):
+        if p.messages >= 6:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        dst.import_jsonl(out, progress=stop, batch_size=3)
+    partial = dst.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    assert 0 < partial < 15
+
+    # 续传：从上次提交的批次继续，跨批次的会话不丢消息
+    assert dst.import_jsonl(out, batch_size=3) == {"sessions": 5, "messages": 15}
+    for i, sid in enumerate(sids):
+        assert [m["content"] for m in dst.get_messages(sid)] == [f"m{i}-{j}" for j in range(3)]
+    dst.close()
+
+
+def test_legacy_json_is_streamed(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "_CHUNK", 7)
+    data = {
+        "version": 1,
+        "sessions": {
+            f"legacy-{i}": {
+                "title": f"旧会话 {i}",
+                "draft": "",
+                "messages": [
+                    {"role": "user", "content": "问题 {}".format(i), "timestamp": f"2024-01-0{i + 1}T00:00:00"},
+                    {"role": "assistant", "content": BIG, "timestamp": f"2024-01-0{i + 1}T00:01:00"},
+                ],
+            }
+            for i in range(3)
+        },
+        "settings": {"x": [1, 2, 3]},
+    }
+    (tmp_path / "data.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    # 新建的数据库在启动时导入同目录的 data.json
+    s = Storage(str(tmp_path / "data.db"), compress_threshold=1024)
+    assert sorted(s.sessions.keys()) == ["legacy-0", "legacy-1", "legacy-2"]
+    msgs = s.get_messages("legacy-1")
+    assert [m["content"] for m in msgs] == ["问题 1", BIG]
+    assert s.conn.execute("SELECT COUNT(*) FROM contents").fetchone()[0] == 1
+    assert s.conn.execute("SELECT updated_at FROM sessions WHERE session_id = 'legacy-2'").fetchone()[0] == "2024-01-03T00:01:00"
+    s.close()
+
+    # 重启后不会再次导入
+    s = Storage(str(tmp_path / "data.db"))
+    assert s.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 6
+    s.close()
@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+
+from storage import Storage
+from storage.writer import WriteBehindWriter
+
+
+def _writer(path):
+    def connect():
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        return conn
+
+    w = WriteBehindWriter(connect)
+    w.call(lambda conn: conn.execute("CREATE TABLE IF NOT EXISTS t (v INTEGER)"))
+    return w
+
+
+def test_queued_writes_are_group_committed(tmp_path):
+    w = _writer(str(tmp_path / "w.db"))
+    commits = []
+    w.call(lambda conn: conn.set_trace_callback(lambda sql: sql == "COMMIT" and commits.append(sql)))
+    commits.clear()
+
+    gate = threading.Event()
+    w.submit(lambda conn: gate.wait())
+    futures = [w.submit(lambda conn, i=i: conn.execute("INSERT INTO t VALUES (?)", (i,)).lastrowid) for i in range(50)]
+    gate.set()
+    assert [f.result(5) for f in futures] == list(range(1, 51))
+    # 51 个任务最多分两批提交（闸门任务可能单独成批）
+    assert 1 <= len(commits) <= 2
+    w.close()
+
+
+def test_failing_job_does_not_drop_its_batch(tmp_path):
+    w = _writer(str(tmp_path / "w.db"))
+    gate = threading.Event()
+    w.submit(lambda conn: gate.wait())
+    ok = w.submit(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+    bad = w.submit(lambda conn: conn.execute("INSERT INTO missing VALUES (1)"))
+    gate.set()
+    ok.result(5)
+    assert isinstance(bad.exception(5), sqlite3.OperationalError)
+    assert w.call(lambda conn: conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]) == 1
+    w.close()
+
+
+def test_storage_reads_its_own_writes(temp_storage):
+    s = temp_storage
+    sid = s.create_session("RYW")
+    ids = [s.append_message(sid, "user", f"m{i}") for i in range(20)]
+    # 缓存淘汰后从 DB 重新加载，也必须看到尚在队列中的写入
+    s.sessions.pop(sid)
+    s.sessions.add_meta(sid, "RYW")
+    assert [m["id"] for m in s.get_session(sid)["messages"]] == ids
+
+    s.upsert_prompt("p", "system", "text")
+    assert s.get_prompt("p")["content"] == "text"
+
+
+def test_durable_future_and_close(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Durable")
+    s.append_message(sid, "user", "hello")
+    s.durable().result(5)
+
+    check = sqlite3.connect(s.path)
+    assert check.execute("SELECT content FROM messages WHERE session_id = ?", (sid,)).fetchone()[0] == "hello"
+    assert check.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    check.close()
+
+
+def test_message_ids_survive_concurrent_instances(temp_storage):
+    s = temp_storage
+    sid = s.create_session("Ids")
+    first = s.append_message(sid, "user", "a")
+    s.flush()
+    other = Storage(s.path)
+    second = other.append_message(sid, "user", "b")
+    third = s.append_message(sid, "user", "c")
+    other.close()
+    s.flush()
+    assert len({first, second, third}) == 3
+    reopened = Storage(s.path)
+    assert sorted(m["content"] for m in reopened.get_session(sid)["messages"]) == ["a", "b", "c"]
+    reopened.close()
@@ -55,8 +55,11 @@ class TokenCalculator:
         """计算消息列表的总token数"""
         total_tokens = 0
         for msg in messages:
-            content = msg.get('content', '')
-            total_tokens += cls.estimate_tokens(content)
+            # storage 缓存中的消息（MessageRecord）带有写入时算好的 token 数，直接累加
+            tokens = getattr(msg, 'tokens', None)
+            if tokens is None:
+                tokens = cls.estimate_tokens(msg.get('content', ''))
+            total_tokens += tokens
         return total_tokens
 
     @classmethod
@@ -106,9 +106,19 @@ class AppUI:
         self.msg_inner.bind("<Configure>", lambda e: self.msg_canvas.configure(scrollregion=self.msg_canvas.bbox("all")))
         self.msg_canvas.bind("<Configure>", self._on_msg_canvas_configure)
         self.msg_canvas.bind_all("<MouseWheel>", self._on_mousewheel)
+        # Ctrl+F 打开全文搜索
+        self._search_window = None
+        for seq in ("<Control-f>", "<Command-f>"):
+            try:
+                self.root.bind_all(seq, lambda e: self.open_search())
+            except Exception:
+                pass
 
         # 临时气泡引用（用于"正在思考..."）
         self._temp_bubble = None
+        # 正在流式接收的回复气泡及已收到的文本
+        self._stream_bubble = None
+        self._stream_parts = []
         # 输入区已拆分到 InputArea 模块
         # 相关控件与回调由 InputArea 管理，保留兼容属性以供旧代码使用
         self._input_min_lines = 2
@@ -236,7 +246,9 @@ class AppUI:
         for m in msgs:
             role = m.get('role', 'assistant')
             content = m.get('content', '')
-            self.add_message_bubble(role, content)
+            self.add_message_bubble(role, content, msg_id=m.get('id'))
+        if self.c:
+            self.set_has_older(getattr(self.c, '_has_older', False))
         # 重新应用主题背景
         try:
             self.msg_canvas.config(bg=self._theme.get('bg'))
@@ -291,11 +303,11 @@ class AppUI:
         except Exception:
             pass
 
-    def add_message_bubble(self, role: str, content: str, temporary: bool = False):
+    def add_message_bubble(self, role: str, content: str, temporary: bool = False, msg_id: int | None = None):
         """兼容层：使用 MessageList 添加消息气泡（优先使用新模块）。"""
         if self._message_list:
             try:
-                b = self._message_list.append_message(role, content)
+                b = self._message_list.append_message(role, content, msg_id=msg_id)
                 if temporary:
                     try:
                         if self._temp_bubble:
@@ -376,6 +388,48 @@ class AppUI:
         # 这些操作应在 refresh_sessions 中完成以保持会话映射一致。
         # 保持 show_messages 只负责渲染消息内容。
 
+    def prepend_messages(self, messages: List[Dict[str, str]]):
+        """在顶部插入更早的消息，并保持当前可见内容不跳动"""
+        if not messages or not self._message_list:
+            return
+        try:
+            self.msg_canvas.update_idletasks()
+            old_height = max(1, self.msg_inner.winfo_height())
+            top = self.msg_canvas.yview()[0] * old_height
+            self._message_list.prepend_messages(messages)
+            self._last_messages = list(messages) + list(getattr(self, '_last_messages', None) or [])
+            # 选中索引整体后移
+            self._selected_msg_indices = {i + len(messages) for i in self._selected_msg_indices}
+            self.msg_canvas.update_idletasks()
+            new_height = max(1, self.msg_inner.winfo_height())
+            self.msg_canvas.configure(scrollregion=self.msg_canvas.bbox("all"))
+            self.msg_canvas.yview_moveto((top + new_height - old_height) / new_height)
+        except Exception:
+            pass
+
+    def set_has_older(self, has_older: bool):
+        """显示/隐藏顶部的"加载更早消息"按钮"""
+        btn = getattr(self, '_load_older_btn', None)
+        if btn is None or not btn.winfo_exists():
+            btn = tk.Button(self.msg_inner, text="加载更早的消息", relief='flat', cursor='hand2',
+                            command=lambda: self.c.on_load_older_messages() if self.c else None)
+            try:
+                btn.config(bg=self._theme.get('bg'), fg=self._theme.get('muted') or self._theme.get('text'))
+            except Exception:
+                pass
+            self._load_older_btn = btn
+        try:
+            if has_older:
+                bubbles = self._message_list.get_bubbles() if self._message_list else []
+                opts = {'pady': 4}
+                if bubbles:
+                    opts['before'] = bubbles[0].widget()
+                btn.pack(**opts)
+            else:
+                btn.pack_forget()
+        except Exception:
+            pass
+
     def refresh_sessions(self, sessions: List[Dict[str, str]]):
         # refresh sessions called
         # use the new SessionList implementation
@@ -395,6 +449,46 @@ class AppUI:
                     pass
 
 
+    def open_search(self):
+        """打开（或聚焦）全文搜索窗口"""
+        if self._search_window:
+            try:
+                self._search_window.window.deiconify()
+                self._search_window.window.lift()
+                self._search_window.entry.focus_set()
+                return
+            except Exception:
+                self._search_window = None
+        from .search_box import SearchWindow
+        win = SearchWindow(self.root, self._theme)
+        win.on_search = lambda q: self.c.on_search(q) if self.c else []
+        win.on_open = lambda sid, mid: self.c.on_open_search_result(sid, mid) if self.c else None
+        win.window.protocol("WM_DELETE_WINDOW", self._close_search)
+        self._search_window = win
+
+    def _close_search(self):
+        if self._search_window:
+            self._search_window.close()
+        self._search_window = None
+
+    def scroll_to_message(self, msg_id: int):
+        """滚动到指定 id 的消息气泡并短暂高亮"""
+        if not getattr(self, '_message_list', None):
+            return
+        bubble = self._message_list.find_bubble(msg_id)
+        if not bubble:
+            return
+        try:
+            self.msg_canvas.update_idletasks()
+            total = max(1, self.msg_inner.winfo_height())
+            self.msg_canvas.yview_moveto(bubble.widget().winfo_y() / total)
+            canvas = bubble.widget()
+            old_bg = canvas.cget('bg')
+            canvas.config(bg=self._theme.get('selection') or self._theme.get('accent'))
+            self.root.after(1200, lambda: canvas.winfo_exists() and canvas.config(bg=old_bg))
+        except Exception:
+            pass
+
     def handle_send(self):
         if getattr(self, '_input_area', None):
             prompt = self._input_area.get_text()
@@ -410,13 +504,16 @@ class AppUI:
             self.input_text.delete("1.0", tk.END)
 
     def _on_bubble_delete(self, idx: int):
-        """回调：消息气泡请求删除指定索引的消息。"""
+        """回调：消息气泡请求删除指定索引的消息（优先按气泡上的消息 id 删除）。"""
         try:
             if not self.c or not self.c.current_session:
                 return
-            self.c.on_delete_message(self.c.current_session, idx)
-            # 刷新显示
-            self.show_messages(self.c.storage.get_session(self.c.current_session).get('messages', []))
+            ids = self._message_list.get_message_ids([idx]) if self._message_list else [None]
+            if ids[0] is not None:
+                self.c.on_delete_message_ids(self.c.current_session, ids)
+            else:
+                self.c.on_delete_message(self.c.current_session, idx)
+            # 控制器删除后会重绘当前窗口，这里无需再加载整个会话
         except Exception:
             pass
 
@@ -465,6 +562,7 @@ class AppUI:
             self.root.protocol("WM_DELETE_WINDOW", self._on_close)
             # 启动队列检查循环
             self._check_result_queue()
+            self._poll_storage_changes()
         self.root.mainloop()
 
     def load_config(self):
@@ -488,34 +586,68 @@ class AppUI:
                 self.c.on_update_config({"window_width": width, "window_height": height, "theme": self._theme_name})
         except Exception:
             pass
+        try:
+            # 退出前等待后台写入线程把排队中的消息落盘
+            if self.c and getattr(self.c, 'storage', None):
+                self.c.storage.flush(timeout=5)
+        except Exception:
+            pass
         self.root.destroy()
 
     def _check_result_queue(self):
         """定期检查结果队列，如果有结果则更新UI"""
         if self.c:
+            streamed = False
             try:
                 # 非阻塞检查队列
                 while True:
                     reply = self.c.result_queue.get_nowait()
                     # 处理结果：移除临时气泡并显示回复
                     self.remove_temp_bubble()
+                    # 流式回复：本轮收到的增量合并后只重绘一次
+                    if isinstance(reply, tuple):
+                        kind, text = reply[:2]
+                        session_id = reply[2] if len(reply) > 2 else self.c.current_session
+                        if kind == 'delta':
+                            self._stream_parts.append(text)
+                            if session_id == self.c.current_session:
+                                streamed = True
+                            else:
+                                # 已切换到其它会话：旧气泡随会话视图一起被替换，切回时重新创建
+                                self._stream_bubble = None
+                        elif kind == 'reply':
+                            # 非流式回复（含错误提示）
+                            self._update_ui_with_reply(text, session_id)
+                        else:
+                            streamed = False
+                            self._finish_stream_reply(text, session_id)
+                        continue
                     # 如果 reply 是 dict（包含 role/content/timestamp) 兼容旧版本
                     if isinstance(reply, dict):
                         role = reply.get('role', 'assistant')
                         content = reply.get('content', '')
-                        self.add_message_bubble(role, content)
-                        # 保存到 storage
+                        # 保存到 storage（获得消息 id 后再渲染气泡）
+                        msg_id = None
                         if self.c and getattr(self.c, 'current_session', None):
-                            self.c.storage.append_message(self.c.current_session, role, content)
+                            msg_id = self.c.storage.append_message(self.c.current_session, role, content)
+                        self.add_message_bubble(role, content, msg_id=msg_id)
                     else:
                         self._update_ui_with_reply(reply)
             except queue.Empty:
                 # 队列为空，继续
                 pass
+            if streamed:
+                self._render_stream_reply()
 
         # 每100ms检查一次队列
         self.root.after(100, self._check_result_queue)
 
+    def _poll_storage_changes(self):
+        """每秒检查一次其它进程对数据库的修改（无变化时只读一个 PRAGMA）"""
+        if self.c and hasattr(self.c, 'on_storage_changes'):
+            self.c.on_storage_changes()
+        self.root.after(1000, self._poll_storage_changes)
+
     def _show_notification(self, text: str, duration: int = 2000):
         """在 UI 中部短时显示通知（默认 2000ms）。"""
         try:
@@ -533,19 +665,72 @@ class AppUI:
         except Exception:
             pass
 
-    def _update_ui_with_reply(self, reply: str):
-        """在主线程中更新UI显示回复"""
-        # 使用气泡渲染回复并保存
+    def _render_stream_reply(self):
+        """首个增量替换“正在思考...”气泡，之后原地更新同一个气泡。"""
+        text = ''.join(self._stream_parts)
         try:
-            self.add_message_bubble('assistant', reply)
+            # 只有原本停在底部时才跟随滚动，不打断正在往上翻看的用户
+            at_bottom = self.msg_canvas.yview()[1] >= 0.99
         except Exception:
-            # 如果气泡渲染失败，回退到完整渲染
-            if self.c and self.c.current_session:
-                self.show_messages(self.c.storage.get_session(self.c.current_session).get("messages", []) + [{'role':'assistant','content':reply}])
+            at_bottom = True
+        try:
+            if self._stream_bubble is None:
+                self._stream_bubble = self._message_list.append_message('assistant', text)
+            else:
+                self._stream_bubble.set_content(text)
+        except Exception:
+            return
+        if at_bottom:
+            try:
+                self.root.after(50, lambda: self.msg_canvas.yview_moveto(1.0))
+            except Exception:
+                pass
 
-        # 保存回复到存储
-        if self.c and self.c.current_session:
-            self.c.storage.append_message(self.c.current_session, "assistant", reply)
+    def _finish_stream_reply(self, reply: str, session_id: str | None = None):
+        """流式回复结束：完整文本只保存一次（保存到发起请求的会话），并把消息 id 交给气泡。"""
+        bubble = self._stream_bubble
+        self._stream_bubble = None
+        self._stream_parts = []
+        current = self.c.current_session if self.c else None
+        session_id = session_id or current
+        if session_id != current:
+            # 等待回复期间切换了会话：只保存，不渲染到当前会话
+            if self.c and session_id:
+                self.c.storage.append_message(session_id, "assistant", reply)
+            return
+        if bubble is None:
+            # 没有收到任何增量（立即出错或空回复），按普通回复处理
+            self._update_ui_with_reply(reply, session_id)
+            return
+        msg_id = None
+        if self.c and session_id:
+            msg_id = self.c.storage.append_message(session_id, "assistant", reply)
+        try:
+            if bubble.content != reply:
+                bubble.set_content(reply)
+            bubble.set_message_id(msg_id)
+        except Exception:
+            pass
+
+    def _update_ui_with_reply(self, reply: str, session_id: str | None = None):
+        """在主线程中更新UI显示回复；session_id 为发起请求的会话（默认当前会话）"""
+        current = self.c.current_session if self.c else None
+        session_id = session_id or current
+        # 先保存回复到存储以获得消息 id
+        msg_id = None
+        if self.c and session_id:
+            msg_id = self.c.storage.append_message(session_id, "assistant", reply)
+        if session_id != current:
+            # 等待回复期间切换了会话：只保存，不渲染到当前会话
+            return
+
+        # 使用气泡渲染回复
+        try:
+            self.add_message_bubble('assistant', reply, msg_id=msg_id)
+        except Exception:
+            # 如果气泡渲染失败，回退到重绘当前窗口
+            if self.c and self.c.current_session:
+                self.c._refresh_window()
 
         # 自动滚动到底部
         try:
@@ -796,9 +981,8 @@ class AppUI:
             return
         if not self._selected_msg_indices:
             return
-        sess = self.c.storage.get_session(self.c.current_session)
-        msgs = sess.get('messages', [])
-        contents = [msgs[i].get('content','') for i in sorted(self._selected_msg_indices) if 0<=i<len(msgs)]
+        # 直接取气泡内容，分页后气泡索引只对应已加载的窗口
+        contents = self._message_list.get_contents(sorted(self._selected_msg_indices)) if self._message_list else []
         if not contents:
             return
         text = '\n\n'.join(contents)
@@ -818,7 +1002,12 @@ class AppUI:
         if not messagebox.askyesno('确认', '删除所选消息？'):
             return
         indices = sorted(list(self._selected_msg_indices))
-        self.c.on_delete_messages(self.c.current_session, indices)
+        ids = self._message_list.get_message_ids(indices) if self._message_list else []
+        if ids and None not in ids:
+            # 所有选中气泡都有消息 id：一条 DELETE 语句完成批量删除
+            self.c.on_delete_message_ids(self.c.current_session, ids)
+        else:
+            self.c.on_delete_messages(self.c.current_session, indices)
         self._selected_msg_indices.clear()
 
     def handle_export_selected(self):
@@ -8,10 +8,12 @@ from .selection import create_selection_rect
 
 
 class MessageBubble:
-    def __init__(self, parent: tk.Frame, role: str, content: str, theme: dict, on_copy: Callable | None = None, on_delete: Callable | None = None, on_select: Callable | None = None):
+    def __init__(self, parent: tk.Frame, role: str, content: str, theme: dict, on_copy: Callable | None = None, on_delete: Callable | None = None, on_select: Callable | None = None, msg_id: int | None = None):
         self.parent = parent
         self.role = role
         self.content = content
+        # 存储层中的稳定消息 id（未落盘的临时气泡为 None）
+        self.msg_id = msg_id
         self.theme = theme
         self.on_copy = on_copy
         self.on_delete = on_delete
@@ -174,6 +176,24 @@ class MessageBubble:
         except Exception:
             pass
 
+    def set_message_id(self, msg_id: int | None):
+        self.msg_id = msg_id
+
+    def set_content(self, content: str):
+        """替换气泡文本并原地重绘（流式回复逐段更新同一个气泡）。"""
+        self.content = content
+        selected = self._selected
+        try:
+            for child in self.canvas.winfo_children():
+                child.destroy()
+            self.canvas.delete('all')
+        except Exception:
+            pass
+        self._sel_check = None
+        self._render()
+        if selected:
+            self.set_selected(True)
+
     def set_selected(self, selected: bool):
         try:
             self._selected = selected
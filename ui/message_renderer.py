@@ -27,19 +27,46 @@ class MessageList:
         for idx, m in enumerate(messages):
             role = m.get('role', 'assistant')
             content = m.get('content', '')
-            b = MessageBubble(self.parent, role, content, self.theme, on_copy=self._on_copy, on_delete=lambda i=idx: self._on_delete(i), on_select=self._on_select)
+            b = MessageBubble(self.parent, role, content, self.theme, on_copy=self._on_copy, on_delete=lambda i=idx: self._on_delete(i), on_select=self._on_select, msg_id=m.get('id'))
             b.set_index(idx)
             b.pack(fill='x', pady=6, padx=0, anchor='w' if role!='user' else 'e')
             self._bubbles.append(b)
 
-    def append_message(self, role: str, content: str):
+    def append_message(self, role: str, content: str, msg_id: int | None = None):
         idx = len(self._bubbles)
-        b = MessageBubble(self.parent, role, content, self.theme, on_copy=self._on_copy, on_delete=lambda i=idx: self._on_delete(i), on_select=self._on_select)
+        b = MessageBubble(self.parent, role, content, self.theme, on_copy=self._on_copy, on_delete=lambda i=idx: self._on_delete(i), on_select=self._on_select, msg_id=msg_id)
         b.set_index(idx)
         b.pack(fill='x', pady=6, padx=0, anchor='w' if role!='user' else 'e')
         self._bubbles.append(b)
         return b
 
+    def prepend_messages(self, messages: List[Dict[str, str]]):
+        """在顶部插入更早的一页消息（分页加载），并重新编号所有气泡。"""
+        if not messages:
+            return
+        anchor = self._bubbles[0].widget() if self._bubbles else None
+        new_bubbles = []
+        for m in messages:
+            role = m.get('role', 'assistant')
+            b = MessageBubble(self.parent, role, m.get('content', ''), self.theme, on_copy=self._on_copy, on_select=self._on_select, msg_id=m.get('id'))
+            opts = {'fill': 'x', 'pady': 6, 'padx': 0, 'anchor': 'w' if role != 'user' else 'e'}
+            if anchor is not None:
+                opts['before'] = anchor
+            b.pack(**opts)
+            new_bubbles.append(b)
+        self._bubbles = new_bubbles + self._bubbles
+        self._reindex()
+
+    def _reindex(self):
+        # 删除回调按索引绑定，插入后需要同步更新
+        for i, b in enumerate(self._bubbles):
+            b.set_index(i)
+            b.on_delete = lambda i=i: self._on_delete(i)
+
+    def get_contents(self, indices) -> List[str]:
+        """返回指定气泡索引对应的消息内容。"""
+        return [self._bubbles[i].content for i in indices if 0 <= i < len(self._bubbles)]
+
     def _on_copy(self, text: str):
         # For individual copy actions, show a simple confirmation instead of the content
         if self.on_copy:
@@ -77,6 +104,17 @@ class MessageList:
     def get_bubbles(self):
         return list(self._bubbles)
 
+    def get_message_ids(self, indices) -> List:
+        """返回指定气泡索引对应的消息 id（无 id 的位置为 None）。"""
+        return [self._bubbles[i].msg_id if 0 <= i < len(self._bubbles) else None for i in indices]
+
+    def find_bubble(self, msg_id: int):
+        """按消息 id 查找气泡，找不到返回 None。"""
+        for b in self._bubbles:
+            if b.msg_id is not None and b.msg_id == msg_id:
+                return b
+        return None
+
     def set_theme(self, theme: dict):
         self.theme = theme
         # re-render not implemented here
@@ -142,7 +142,8 @@ class ModelSelectionWindow:
                 info = f"名称: {model_name}\n"
                 info += f"Base URL: {model_config.get('base_url', '')}\n"
                 info += f"API Key: {'*' * len(model_config.get('api_key', ''))}\n"
-                info += f"模型名称: {model_config.get('model', '')}"
+                info += f"模型名称: {model_config.get('model', '')}\n"
+                info += f"线路状态: {self._breaker_text(model_config.get('base_url', ''))}"
                 self.info_text.insert(1.0, info)
             else:
                 self.info_text.insert(1.0, "模型配置不存在")
@@ -151,6 +152,21 @@ class ModelSelectionWindow:
 
         self.info_text.config(state='disabled')
 
+    def _breaker_text(self, base_url: str) -> str:
+        """该端点熔断器的状态说明（请求失败时的重试与快速失败见 api.resilience）。"""
+        try:
+            from api.resilience import HALF_OPEN, OPEN, shared_breakers
+            snap = shared_breakers().snapshot(base_url)
+        except Exception:
+            return "未知"
+        if snap['state'] == OPEN:
+            return f"已熔断（连续失败 {snap['failures']} 次，{snap['retry_in']:.0f} 秒后试探）: {snap['last_error'][:60]}"
+        if snap['state'] == HALF_OPEN:
+            return "半开（下一次请求将作为试探）"
+        if snap['failures']:
+            return f"正常（最近连续失败 {snap['failures']} 次）"
+        return "正常"
+
     def _on_model_selected(self, event=None):
         """模型选择变化"""
         model_name = self.model_var.get()
@@ -175,6 +191,12 @@ class ModelSelectionWindow:
                 'model': model
             }
             config.save_model(name, model_config)
+            # 配置已修改，之前的失败不再代表新配置：关闭该端点的熔断
+            try:
+                from api.resilience import shared_breakers
+                shared_breakers().get(base_url).reset()
+            except Exception:
+                pass
 
             # 刷新列表
             self._load_models()
@@ -290,6 +312,8 @@ class ModelSelectionWindow:
     def _handle_test_result(self, success: bool, message: str):
         """处理测试结果"""
         self.test_btn.config(state='normal')
+        # 测试结果会改变熔断器状态，刷新信息区
+        self._display_model_info(self.model_var.get() or None)
         if success:
             self.status_var.set("✓ 连接成功")
             self.status_label.config(fg='green')
@@ -0,0 +1,102 @@
+import tkinter as tk
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SearchWindow:
+    """全文搜索窗口：输入即搜索，双击或回车跳转到命中的消息"""
+
+    DEBOUNCE_MS = 150
+
+    def __init__(self, parent: tk.Widget, theme: dict):
+        self.parent = parent
+        self.theme = theme
+        self._results: List[Dict[str, Any]] = []
+        self._pending: Optional[str] = None
+
+        # 回调：on_search(query) -> 结果列表；on_open(session_id, message_id)
+        self.on_search: Optional[Callable[[str], List[Dict[str, Any]]]] = None
+        self.on_open: Optional[Callable[[str, int], None]] = None
+
+        self.window = tk.Toplevel(parent)
+        self.window.title("搜索消息")
+        self.window.geometry("560x420")
+        self.window.transient(parent)
+        self.window.configure(bg=theme.get('bg', '#ffffff'))
+
+        self.query_var = tk.StringVar()
+        self.entry = tk.Entry(self.window, textvariable=self.query_var)
+        self.entry.pack(fill='x', padx=10, pady=(10, 4))
+        self.status = tk.Label(self.window, anchor='w', bg=theme.get('bg', '#ffffff'), fg=theme.get('muted', '#888888'))
+        self.status.pack(fill='x', padx=10)
+        self.listbox = tk.Listbox(self.window, activestyle='none')
+        self.listbox.pack(fill='both', expand=True, padx=10, pady=(4, 10))
+        try:
+            self.listbox.config(bg=theme.get('bg'), fg=theme.get('text'), selectbackground=theme.get('accent'))
+        except Exception:
+            pass
+
+        self.query_var.trace_add('write', lambda *args: self._schedule_search())
+        self.entry.bind('<Return>', lambda e: self._open_selected(first=True))
+        self.entry.bind('<Down>', lambda e: self._focus_results())
+        self.entry.bind('<Escape>', lambda e: self.close())
+        self.listbox.bind('<Double-Button-1>', lambda e: self._open_selected())
+        self.listbox.bind('<Return>', lambda e: self._open_selected())
+        self.listbox.bind('<Escape>', lambda e: self.close())
+        self.entry.focus_set()
+
+    def _schedule_search(self):
+        # 输入防抖：停止输入一小段时间后再查询
+        if self._pending:
+            try:
+                self.window.after_cancel(self._pending)
+            except Exception:
+                pass
+        self._pending = self.window.after(self.DEBOUNCE_MS, self._run_search)
+
+    def _run_search(self):
+        self._pending = None
+        query = self.query_var.get().strip()
+        results: List[Dict[str, Any]] = []
+        if query and self.on_search:
+            try:
+                results = self.on_search(query) or []
+            except Exception:
+                results = []
+        self.set_results(results)
+
+    def set_results(self, results: List[Dict[str, Any]]):
+        self._results = list(results)
+        self.listbox.delete(0, tk.END)
+        for r in self._results:
+            title = r.get('title') or ''
+            snippet = (r.get('snippet') or '').replace('\n', ' ')
+            self.listbox.insert(tk.END, f"[{title}] {snippet}")
+        if self.query_var.get().strip():
+            self.status.config(text=f"{len(self._results)} 条结果" if self._results else "无匹配结果")
+        else:
+            self.status.config(text='')
+
+    def _focus_results(self):
+        if self._results:
+            self.listbox.focus_set()
+            self.listbox.selection_clear(0, tk.END)
+            self.listbox.selection_set(0)
+            self.listbox.activate(0)
+
+    def _open_selected(self, first: bool = False):
+        sel = self.listbox.curselection()
+        idx = sel[0] if sel else (0 if first else None)
+        if idx is None or idx >= len(self._results):
+            return
+        hit = self._results[idx]
+        if self.on_open:
+            try:
+                self.on_open(hit.get('session_id'), hit.get('message_id'))
+            except Exception:
+                pass
+
+    def close(self):
+        try:
+            self.window.destroy()
+        except Exception:
+            pass
@@ -1,5 +1,28 @@
+import datetime
 import tkinter as tk
-from typing import Callable, Optional, List, Dict
+from typing import Any, Callable, Optional, List, Dict
+
+
+def _relative_time(ts: Optional[str]) -> str:
+    """ISO 时间戳 -> "刚刚" / "5分钟前" / "3天前" / 日期"""
+    if not ts:
+        return ''
+    try:
+        when = datetime.datetime.fromisoformat(ts)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=datetime.UTC)
+        secs = (datetime.datetime.now(datetime.UTC) - when).total_seconds()
+    except Exception:
+        return ''
+    if secs < 60:
+        return '刚刚'
+    if secs < 3600:
+        return f'{int(secs // 60)}分钟前'
+    if secs < 86400:
+        return f'{int(secs // 3600)}小时前'
+    if secs < 86400 * 30:
+        return f'{int(secs // 86400)}天前'
+    return when.astimezone().strftime('%Y-%m-%d')
 
 class SessionList:
     """封装会话列表与右键菜单功能"""
@@ -7,10 +30,14 @@ class SessionList:
         self.parent = parent
         self.frame = tk.Frame(parent)
         self.listbox = tk.Listbox(self.frame, width=30)
+        # 悬停 / 选中行的最后一条消息预览
+        self.preview = tk.Label(self.frame, text='', anchor='w', justify='left', wraplength=220, fg='gray')
+        self.preview.pack(side='bottom', fill='x')
         self.listbox.pack(side='left', fill='y')
         # current theme (optional)
         self._theme = None
         self._session_ids: List[str] = []
+        self._previews: List[str] = []
 
         self.menu = tk.Menu(self.frame, tearoff=0)
         self.menu.add_command(label="重命名", command=self._on_rename)
@@ -28,6 +55,8 @@ class SessionList:
         self.on_export: Optional[Callable[[str, str], None]] = None
 
         self.listbox.bind('<<ListboxSelect>>', self._handle_select)
+        self.listbox.bind('<Motion>', self._on_hover)
+        self.listbox.bind('<Leave>', lambda e: self._show_preview(self._selected_index()))
 
     def pack(self, **kwargs):
         self.frame.pack(**kwargs)
@@ -35,21 +64,56 @@ class SessionList:
     def grid(self, **kwargs):
         self.frame.grid(**kwargs)
 
-    def set_sessions(self, sessions: List[Dict[str, str]]):
+    def set_sessions(self, sessions: List[Dict[str, Any]]):
+        """sessions 来自 Storage.list_sessions()：计数/时间/预览均为汇总表字段，不读取消息"""
         self.listbox.delete(0, tk.END)
         self._session_ids = []
+        self._previews = []
         for s in sessions:
-            title = s.get('title', '')
             # sessions use 'session_id' as key
             sid = s.get('session_id') or s.get('id')
             self._session_ids.append(sid)
-            self.listbox.insert(tk.END, title)
+            self._previews.append(s.get('last_preview') or '')
+            self.listbox.insert(tk.END, self._format_row(s))
+        self._show_preview(None)
+
+    @staticmethod
+    def _format_row(s: Dict[str, Any]) -> str:
+        title = s.get('title', '')
+        info = []
+        if s.get('message_count') is not None:
+            info.append(f"{s['message_count']}条")
+        when = _relative_time(s.get('last_message_at') or s.get('updated_at'))
+        if when:
+            info.append(when)
+        if s.get('archived'):
+            info.append('已归档')
+        return f"{title}  · {' · '.join(info)}" if info else title
+
+    def _show_preview(self, idx: Optional[int]):
+        text = ''
+        if idx is not None and 0 <= idx < len(self._previews):
+            text = ' '.join(self._previews[idx].split())
+        try:
+            self.preview.config(text=text)
+        except Exception:
+            pass
+
+    def _on_hover(self, event):
+        if not self._previews:
+            return
+        self._show_preview(self.listbox.nearest(event.y))
+
+    def _selected_index(self) -> Optional[int]:
+        sel = self.listbox.curselection()
+        return sel[-1] if sel else None
 
     def _handle_select(self, event):
         sel = self.listbox.curselection()
         if not sel:
             return
         idx = sel[0]
+        self._show_preview(idx)
         if idx < len(self._session_ids) and self.on_select:
             try:
                 self.on_select(self._session_ids[idx])
@@ -70,6 +134,10 @@ class SessionList:
             self.listbox.config(selectbackground=sel_bg)
         except Exception:
             pass
+        try:
+            self.preview.config(bg=theme.get('bg'), fg=theme.get('muted') or theme.get('text'))
+        except Exception:
+            pass
 
     def _show_menu(self, event):
         try: